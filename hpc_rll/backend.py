@@ -0,0 +1,59 @@
+import importlib
+
+# the cuda extension (e.g. hpc_rl_utils) and the cpu extension (e.g. hpc_rl_utils_cpu) share the same interface,
+# hpc modules choose one of them by the device of input tensors
+
+_extensions = {}
+
+
+def _load_extension(name):
+    if name not in _extensions:
+        try:
+            _extensions[name] = importlib.import_module(name)
+        except ImportError:
+            _extensions[name] = None
+    return _extensions[name]
+
+
+def get_backend(name, x):
+    r"""
+    Overview:
+        get the compiled extension which can handle the tensor x
+    Arguments:
+        - name (:obj:`str`): name of the cuda extension, the cpu one is suffixed with '_cpu'
+        - x (:obj:`torch.Tensor`): input tensor, decides which device is used
+    Returns:
+        - backend (:obj:`module`): extension module
+    """
+    if not x.is_cuda:
+        name = name + '_cpu'
+    backend = _load_extension(name)
+    if backend is None:
+        raise ImportError("extension {} is not compiled, which is required by {} tensor".format(name, x.device))
+    return backend
+
+
+_accumulate_modes = {'float': 0, 'kahan': 1, 'double': 2}
+
+
+def accumulate_mode(precision):
+    r"""
+    Overview:
+        map the precision name of a module to the accumulate mode of the extension
+    Arguments:
+        - precision (:obj:`str`): 'float' (plain recursion), 'kahan' (compensated fp32 recursion) or 'double'\
+        (recursion in float64), only the carried sums of the long recursions are affected, not the storage
+    Returns:
+        - mode (:obj:`int`): accumulate mode passed to the forward of the extension
+    """
+    if precision not in _accumulate_modes:
+        raise ValueError("precision should be one of {}, but got {}".format(list(_accumulate_modes), precision))
+    return _accumulate_modes[precision]
+
+
+def rl_utils_backend(x):
+    return get_backend('hpc_rl_utils', x)
+
+
+def network_backend(x):
+    return get_backend('hpc_torch_utils_network', x)
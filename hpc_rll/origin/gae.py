@@ -3,7 +3,7 @@ import torch
 
 gae_data = namedtuple('gae_data', ['value', 'reward'])
 
-def gae(data: namedtuple, gamma: float = 0.99, lambda_: float = 0.97) -> torch.FloatTensor:
+def gae(data: namedtuple, gamma: float = 0.99, lambda_: float = 0.97, done=None, lengths=None) -> torch.FloatTensor:
     """
     Overview:
         Implementation of Generalized Advantage Estimator (arXiv:1506.02438)
@@ -13,18 +13,24 @@ def gae(data: namedtuple, gamma: float = 0.99, lambda_: float = 0.97) -> torch.F
         - gamma (:obj:`float`): the future discount factor, should be in [0, 1], defaults to 0.99.
         - lambda (:obj:`float`): the gae parameter lambda, should be in [0, 1], defaults to 0.97, when lambda -> 0,\
         it induces bias, but when lambda -> 1, it has high variance due to the sum of terms.
+        - done (:obj:`torch.Tensor` or None): whether the episode ends at this step
+        - lengths (:obj:`torch.LongTensor` or None): valid length of each column
     Returns:
         - adv (:obj:`torch.FloatTensor`): the calculated advantage
     Shapes:
         - value (:obj:`torch.FloatTensor`): :math:`(T+1, B)`, where T is trajectory length and B is batch size
         - reward (:obj:`torch.FloatTensor`): :math:`(T, B)`
         - adv (:obj:`torch.FloatTensor`): :math:`(T, B)`
+        - done (:obj:`torch.Tensor`): :math:`(T, B)`
+        - lengths (:obj:`torch.LongTensor`): :math:`(B, )`
 
     .. note::
         value_{T+1} should be 0 if this trajectory reached a terminal state(done=True), otherwise we use value
         function, this operation is implemented in collector for packing trajectory.
     """
     value, reward = data
+    if done is not None or lengths is not None:
+        return masked_gae(value, reward, gamma, lambda_, done, lengths)
     delta = reward + gamma * value[1:] - value[:-1]
     factor = gamma * lambda_
     adv = torch.zeros_like(reward)
@@ -36,3 +42,21 @@ def gae(data: namedtuple, gamma: float = 0.99, lambda_: float = 0.97) -> torch.F
         adv[t] += gae_item / denom
     return adv
 
+
+def masked_gae(value, reward, gamma, lambda_, done=None, lengths=None):
+    T, B = reward.shape
+    not_done = torch.ones_like(reward) if done is None else 1 - done.float()
+    if lengths is None:
+        mask = torch.ones_like(reward)
+    else:
+        mask = (torch.arange(T, device=reward.device).unsqueeze(1) < lengths.unsqueeze(0)).float()
+    delta = reward + gamma * value[1:] * not_done - value[:-1]
+    factor = gamma * lambda_
+    adv = torch.zeros_like(reward)
+    gae_item = torch.zeros_like(reward[0])
+    denom = torch.zeros_like(reward[0])
+    for t in reversed(range(T)):
+        denom = (1 + lambda_ * denom * not_done[t]) * mask[t]
+        gae_item = (denom * delta[t] + factor * not_done[t] * gae_item) * mask[t]
+        adv[t] = torch.where(mask[t] > 0, gae_item / denom.clamp(min=1), torch.zeros_like(gae_item))
+    return adv
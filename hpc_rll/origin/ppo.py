@@ -1,5 +1,5 @@
 from collections import namedtuple
-from typing import Optional, Tuple
+from typing import Optional, Tuple, List
 import torch
 from torch.distributions import Independent, Normal
 
@@ -10,11 +10,33 @@ ppo_loss = namedtuple('ppo_loss', ['policy_loss', 'value_loss', 'entropy_loss'])
 ppo_info = namedtuple('ppo_info', ['approx_kl', 'clipfrac'])
 
 
+def categorical_log_prob_entropy(logit: torch.Tensor, action: torch.Tensor,
+        heads: Optional[List[int]] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+        Overview:
+            log prob of action and entropy of a categorical distribution, or the joint ones of independent
+            categorical heads over the concatenated logit (multi-discrete action space), which are the sums over heads
+        Shapes:
+            - logit (:obj:`torch.FloatTensor`): :math:`(*, N)`, N is sum(heads) if heads is given
+            - action (:obj:`torch.LongTensor`): :math:`(*, )`, or :math:`(*, H)` if heads is given
+    """
+    if heads is None:
+        dist = torch.distributions.categorical.Categorical(logits=logit)
+        return dist.log_prob(action), dist.entropy()
+    log_prob, entropy = 0, 0
+    for h, head_logit in enumerate(torch.split(logit, heads, dim=-1)):
+        dist = torch.distributions.categorical.Categorical(logits=head_logit)
+        log_prob = log_prob + dist.log_prob(action[..., h])
+        entropy = entropy + dist.entropy()
+    return log_prob, entropy
+
+
 def ppo_error(
         data: namedtuple,
         clip_ratio: float = 0.2,
         use_value_clip: bool = True,
-        dual_clip: Optional[float] = None
+        dual_clip: Optional[float] = None,
+        heads: Optional[List[int]] = None
 ) -> Tuple[namedtuple, namedtuple]:
     """
         Overview:
@@ -25,13 +47,15 @@ def ppo_error(
             - use_value_clip (:obj:`bool`): whether to use clip in value loss with the same ratio as policy
             - dual_clip (:obj:`float`): a parameter c mentioned in arXiv:1912.09729 Equ. 5, shoule be in [1, inf),\
             defaults to 5.0, if you don't want to use it, set this parameter to None
+            - heads (:obj:`list` or None): sizes of the independent categorical heads of a multi-discrete action
+            space, the logits are concatenated along N, defaults to None, a single head
         Returns:
             - ppo_loss (:obj:`namedtuple`): the ppo loss item, all of them are the differentiable 0-dim tensor
             - ppo_info (:obj:`namedtuple`): the ppo optim information for monitoring, all of them are Python scalar
         Shapes:
             - logit_new (:obj:`torch.FloatTensor`): :math:`(B, N)`, where B is batch size and N is action dim
             - logit_old (:obj:`torch.FloatTensor`): :math:`(B, N)`
-            - action (:obj:`torch.LongTensor`): :math:`(B, )`
+            - action (:obj:`torch.LongTensor`): :math:`(B, )`, or :math:`(B, H)` with H heads
             - value_new (:obj:`torch.FloatTensor`): :math:`(B, )`
             - value_old (:obj:`torch.FloatTensor`): :math:`(B, )`
             - adv (:obj:`torch.FloatTensor`): :math:`(B, )`
@@ -51,8 +75,80 @@ def ppo_error(
     logit_new, logit_old, action, value_new, value_old, adv, return_, weight = data
     if weight is None:
         weight = torch.ones_like(adv)
-    dist_new = torch.distributions.categorical.Categorical(logits=logit_new)
-    dist_old = torch.distributions.categorical.Categorical(logits=logit_old)
+    logp_new, entropy_new = categorical_log_prob_entropy(logit_new, action, heads)
+    logp_old, _ = categorical_log_prob_entropy(logit_old, action, heads)
+    entropy_loss = (entropy_new * weight).mean()
+    # policy_loss
+    ratio = torch.exp(logp_new - logp_old)
+    surr1 = ratio * adv
+    surr2 = ratio.clamp(1 - clip_ratio, 1 + clip_ratio) * adv
+    if dual_clip is not None:
+        policy_loss = (-torch.max(torch.min(surr1, surr2), dual_clip * adv) * weight).mean()
+    else:
+        policy_loss = (-torch.min(surr1, surr2) * weight).mean()
+    with torch.no_grad():
+        approx_kl = (logp_old - logp_new).mean().item()
+        clipped = ratio.gt(1 + clip_ratio) | ratio.lt(1 - clip_ratio)
+        clipfrac = torch.as_tensor(clipped).float().mean().item()
+    # value_loss
+    if use_value_clip:
+        value_clip = value_old + (value_new - value_old).clamp(-clip_ratio, clip_ratio)
+        v1 = (return_ - value_new).pow(2)
+        v2 = (return_ - value_clip).pow(2)
+        value_loss = 0.5 * (torch.max(v1, v2) * weight).mean()
+    else:
+        value_loss = 0.5 * ((return_ - value_new).pow(2) * weight).mean()
+
+    return ppo_loss(policy_loss, value_loss, entropy_loss), ppo_info(approx_kl, clipfrac)
+
+
+
+ppo_data_continuous = namedtuple(
+    'ppo_data_continuous',
+    ['mu_sigma_new', 'mu_sigma_old', 'action', 'value_new', 'value_old', 'adv', 'return_', 'weight']
+)
+
+
+def ppo_error_continuous(
+        data: namedtuple,
+        clip_ratio: float = 0.2,
+        use_value_clip: bool = True,
+        dual_clip: Optional[float] = None
+) -> Tuple[namedtuple, namedtuple]:
+    """
+        Overview:
+            Implementation of Proximal Policy Optimization (arXiv:1707.06347) with value_clip and dual_clip\
+            for diagonal gaussian policy
+        Arguments:
+            - data (:obj:`namedtuple`): the ppo input data with fieids shown in ``ppo_data_continuous``
+            - clip_ratio (:obj:`float`): the ppo clip ratio for the constraint of policy update, defaults to 0.2
+            - use_value_clip (:obj:`bool`): whether to use clip in value loss with the same ratio as policy
+            - dual_clip (:obj:`float`): a parameter c mentioned in arXiv:1912.09729 Equ. 5, shoule be in [1, inf),\
+            defaults to 5.0, if you don't want to use it, set this parameter to None
+        Returns:
+            - ppo_loss (:obj:`namedtuple`): the ppo loss item, all of them are the differentiable 0-dim tensor
+            - ppo_info (:obj:`namedtuple`): the ppo optim information for monitoring, all of them are Python scalar
+        Shapes:
+            - mu_sigma_new (:obj:`dict`): mu and sigma of the new policy, both :math:`(B, N)`, where B is batch size\
+            and N is action dim
+            - mu_sigma_old (:obj:`dict`): mu and sigma of the old policy, both :math:`(B, N)`
+            - action (:obj:`torch.FloatTensor`): :math:`(B, N)`
+            - value_new (:obj:`torch.FloatTensor`): :math:`(B, )`
+            - value_old (:obj:`torch.FloatTensor`): :math:`(B, )`
+            - adv (:obj:`torch.FloatTensor`): :math:`(B, )`
+            - return (:obj:`torch.FloatTensor`): :math:`(B, )`
+            - weight (:obj:`torch.FloatTensor` or :obj:`None`): :math:`(B, )`
+            - policy_loss (:obj:`torch.FloatTensor`): :math:`()`, 0-dim tensor
+            - value_loss (:obj:`torch.FloatTensor`): :math:`()`
+    """
+    assert dual_clip is None or dual_clip > 1.0, "dual_clip value must be greater than 1.0, but get value: {}".format(
+        dual_clip
+    )
+    mu_sigma_new, mu_sigma_old, action, value_new, value_old, adv, return_, weight = data
+    if weight is None:
+        weight = torch.ones_like(adv)
+    dist_new = Independent(Normal(mu_sigma_new['mu'], mu_sigma_new['sigma']), 1)
+    dist_old = Independent(Normal(mu_sigma_old['mu'], mu_sigma_old['sigma']), 1)
     logp_new = dist_new.log_prob(action)
     logp_old = dist_old.log_prob(action)
     entropy_loss = (dist_new.entropy() * weight).mean()
@@ -78,4 +174,3 @@ def ppo_error(
         value_loss = 0.5 * ((return_ - value_new).pow(2) * weight).mean()
 
     return ppo_loss(policy_loss, value_loss, entropy_loss), ppo_info(approx_kl, clipfrac)
-
@@ -340,6 +340,50 @@ def q_nstep_td_error_with_rescale(
     return (td_error_per_sample * weight).mean(), td_error_per_sample
 
 
+retrace_data = namedtuple(
+    'retrace_data', ['q', 'target_q', 'action', 'reward', 'done', 'target_prob', 'behaviour_prob', 'weight']
+)
+
+
+def retrace_error(data: namedtuple, gamma: float = 0.99, lambda_: float = 1.0, c_clip_ratio: float = 1.0):
+    """
+    Overview:
+        Retrace(lambda) td_error, Q(lambda) if behaviour_prob is None
+    Shapes:
+        - q (:obj:`torch.FloatTensor`): :math:`(T, B, N)`
+        - target_q (:obj:`torch.FloatTensor`): :math:`(T + 1, B, N)`
+        - action (:obj:`torch.LongTensor`): :math:`(T, B)`
+        - reward (:obj:`torch.FloatTensor`): :math:`(T, B)`
+        - done (:obj:`torch.BoolTensor` or None): :math:`(T, B)`
+        - target_prob (:obj:`torch.FloatTensor`): :math:`(T + 1, B, N)`
+        - behaviour_prob (:obj:`torch.FloatTensor` or None): :math:`(T, B, N)`
+        - weight (:obj:`torch.FloatTensor` or None): :math:`(T, B)`
+    """
+    q, target_q, action, reward, done, target_prob, behaviour_prob, weight = data
+    T, B = reward.shape
+    if done is None:
+        done = torch.zeros_like(reward)
+    if weight is None:
+        weight = torch.ones_like(reward)
+    with torch.no_grad():
+        v = (target_prob * target_q).sum(-1)
+        next_action = action[1:].unsqueeze(-1)
+        next_qa = target_q[1:T].gather(-1, next_action).squeeze(-1)
+        if behaviour_prob is None:
+            c = lambda_ * torch.ones_like(next_qa)
+        else:
+            ratio = target_prob[1:T].gather(-1, next_action) / behaviour_prob[1:].gather(-1, next_action)
+            c = lambda_ * ratio.squeeze(-1).clamp(max=c_clip_ratio)
+        gammas = gamma * (1 - done.float())
+        ret = torch.empty_like(reward)
+        ret[-1] = reward[-1] + gammas[-1] * v[-1]
+        for t in reversed(range(T - 1)):
+            ret[t] = reward[t] + gammas[t] * (v[t + 1] + c[t] * (ret[t + 1] - next_qa[t]))
+    q_s_a = q.gather(-1, action.unsqueeze(-1)).squeeze(-1)
+    td_error_per_sample = (q_s_a - ret) ** 2
+    return (td_error_per_sample * weight).mean(), td_error_per_sample
+
+
 nstep_return_data = namedtuple('nstep_return_data', ['reward', 'next_value', 'done'])
 
 def nstep_return(data: namedtuple, gamma: float, nstep: int):
@@ -354,6 +398,35 @@ def nstep_return(data: namedtuple, gamma: float, nstep: int):
     return return_
 
 
+def sliding_nstep_return(reward: torch.Tensor, done: torch.Tensor, gamma: float, nstep: int):
+    """
+    Overview:
+        nstep return of every step of a (T, B) trajectory, the window is cut by done and by the end of trajectory
+    Returns:
+        - ret (:obj:`torch.FloatTensor`): :math:`(T, B)`
+        - index (:obj:`torch.LongTensor`): :math:`(T, B)`, the step to bootstrap from
+        - discount (:obj:`torch.FloatTensor`): :math:`(T, B)`, 0 if the episode ends inside the window
+    """
+    T, B = reward.shape
+    if done is None:
+        done = torch.zeros_like(reward, dtype=torch.bool)
+    done = done.bool()
+    ret = torch.zeros_like(reward)
+    index = torch.zeros_like(reward, dtype=torch.long)
+    discount = torch.zeros_like(reward)
+    for t in range(T):
+        alive = torch.ones_like(done[0])
+        factor = torch.ones_like(reward[0])
+        index[t] = t
+        for k in range(min(nstep, T - t)):
+            ret[t] += alive * factor * reward[t + k]
+            index[t] += alive.long()
+            factor = torch.where(alive, factor * gamma, factor)
+            alive = alive & ~done[t + k]
+        discount[t] = factor * alive
+    return ret, index, discount
+
+
 iqn_nstep_td_data = namedtuple(
     'iqn_nstep_td_data', ['q', 'next_n_q', 'action', 'next_n_action', 'reward', 'done', 'replay_quantiles', 'weight']
 )
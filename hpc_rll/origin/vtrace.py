@@ -1,14 +1,27 @@
 import torch
 import torch.nn.functional as F
 from collections import namedtuple
+from .ppo import categorical_log_prob_entropy
 
-def vtrace_nstep_return(clipped_rhos, clipped_cs, reward, bootstrap_values, gamma=0.99, lambda_=0.95):
+def vtrace_discount(gamma, done=None, discount=None):
+    # gamma scaled by the per step discount and cut at the end of episodes
+    if discount is not None:
+        gamma = gamma * discount
+    if done is not None:
+        gamma = gamma * (1 - done.float())
+    return gamma
+
+
+def vtrace_nstep_return(clipped_rhos, clipped_cs, reward, bootstrap_values, gamma=0.99, lambda_=0.95,
+        done=None, discount=None):
+    gamma = vtrace_discount(gamma, done, discount)
     deltas = clipped_rhos * (reward + gamma * bootstrap_values[1:] - bootstrap_values[:-1])
     factor = gamma * lambda_
     result = bootstrap_values[:-1].clone()
     vtrace_item = 0.
     for t in reversed(range(reward.size()[0])):
-        vtrace_item = deltas[t] + factor * clipped_cs[t] * vtrace_item
+        factor_t = factor[t] if isinstance(factor, torch.Tensor) else factor
+        vtrace_item = deltas[t] + factor_t * clipped_cs[t] * vtrace_item
         result[t] += vtrace_item
     return result
 
@@ -17,6 +30,18 @@ def vtrace_advantage(clipped_pg_rhos, reward, return_, bootstrap_values, gamma):
     return clipped_pg_rhos * (reward + gamma * return_ - bootstrap_values)
 
 
+def vtrace_returns(log_rhos, discounts, rewards, values, bootstrap, lambda_=1.0,
+        rho_clip_ratio=1.0, c_clip_ratio=1.0, rho_pg_clip_ratio=1.0):
+    with torch.no_grad():
+        rhos = torch.exp(log_rhos)
+        bootstrap_values = torch.cat([values, bootstrap.unsqueeze(0)], dim=0)
+        vs = vtrace_nstep_return(rhos.clamp(max=rho_clip_ratio), rhos.clamp(max=c_clip_ratio), rewards,
+                bootstrap_values, 1.0, lambda_, discount=discounts)
+        vs_tp1 = torch.cat([vs[1:], bootstrap.unsqueeze(0)], dim=0)
+        pg_advantages = vtrace_advantage(rhos.clamp(max=rho_pg_clip_ratio), rewards, vs_tp1, values, discounts)
+    return vs, pg_advantages
+
+
 vtrace_data = namedtuple('vtrace_data', ['target_output', 'behaviour_output', 'action', 'value', 'reward', 'weight'])
 vtrace_loss = namedtuple('vtrace_loss', ['policy_loss', 'value_loss', 'entropy_loss'])
 
@@ -27,7 +52,10 @@ def vtrace_error(
     lambda_: float = 0.95,
     rho_clip_ratio: float = 1.0,
     c_clip_ratio: float = 1.0,
-    rho_pg_clip_ratio: float = 1.0
+    rho_pg_clip_ratio: float = 1.0,
+    heads=None,
+    done=None,
+    discount=None
 ):
     """
     Overview:
@@ -49,36 +77,41 @@ def vtrace_error(
             the baseline targets (vs)
         - rho_pg_clip_ratio (:obj:`float`): the clipping threshold for importance weights (rho) when calculating\
             the policy gradient advantage
+        - heads (:obj:`list` or None): sizes of the independent categorical heads of a multi-discrete action space,\
+            the outputs are concatenated along N, defaults to None, a single head
+        - done (:obj:`torch.Tensor` or None): :math:`(T, B)`, whether the episode ends at this step, then the next\
+            value is not bootstrapped and the trace restarts, defaults to None
+        - discount (:obj:`torch.Tensor` or None): :math:`(T, B)`, per step discount which scales gamma, defaults to None
     Returns:
         - trace_loss (:obj:`namedtuple`): the vtrace loss item, all of them are the differentiable 0-dim tensor
     Shapes:
         - target_output (:obj:`torch.FloatTensor`): :math:`(T, B, N)`, where T is timestep, B is batch size and\
             N is action dim
         - behaviour_output (:obj:`torch.FloatTensor`): :math:`(T, B, N)`
-        - action (:obj:`torch.LongTensor`): :math:`(T, B)`
+        - action (:obj:`torch.LongTensor`): :math:`(T, B)`, or :math:`(T, B, H)` with H heads
         - value (:obj:`torch.FloatTensor`): :math:`(T+1, B)`
         - reward (:obj:`torch.LongTensor`): :math:`(T, B)`
         - weight (:obj:`torch.LongTensor`): :math:`(T, B)`
     """
     target_output, behaviour_output, action, value, reward, weight = data
     with torch.no_grad():
-        IS = compute_importance_weights(target_output, behaviour_output, action)
+        IS = compute_importance_weights(target_output, behaviour_output, action, heads=heads)
         rhos = torch.clamp(IS, max=rho_clip_ratio)
         cs = torch.clamp(IS, max=c_clip_ratio)
-        return_ = vtrace_nstep_return(rhos, cs, reward, value, gamma, lambda_)
+        return_ = vtrace_nstep_return(rhos, cs, reward, value, gamma, lambda_, done, discount)
         pg_rhos = torch.clamp(IS, max=rho_pg_clip_ratio)
         return_t_plus_1 = torch.cat([return_[1:], value[-1:]], 0)
-        adv = vtrace_advantage(pg_rhos, reward, return_t_plus_1, value[:-1], gamma)
+        adv = vtrace_advantage(pg_rhos, reward, return_t_plus_1, value[:-1], vtrace_discount(gamma, done, discount))
 
     if weight is None:
         weight = torch.ones_like(reward)
-    dist_target = torch.distributions.Categorical(logits=target_output)
-    pg_loss = -(dist_target.log_prob(action) * adv * weight).mean()
+    log_prob, entropy = categorical_log_prob_entropy(target_output, action, heads)
+    pg_loss = -(log_prob * adv * weight).mean()
     value_loss = (F.mse_loss(value[:-1], return_, reduction='none') * weight).mean()
-    entropy_loss = (dist_target.entropy() * weight).mean()
+    entropy_loss = (entropy * weight).mean()
     return vtrace_loss(pg_loss, value_loss, entropy_loss)
 
-def compute_importance_weights(target_output, behaviour_output, action, requires_grad=False):
+def compute_importance_weights(target_output, behaviour_output, action, requires_grad=False, heads=None):
     """
     Overview:
         Computing importance sampling weight with given output and action
@@ -90,6 +123,7 @@ def compute_importance_weights(target_output, behaviour_output, action, requires
         - action (:obj:`torch.Tensor`): the chosen action(index for the discrete action space) in trajectory,\
             i.e.: behaviour_action
         - requires_grad (:obj:`bool`): whether requires grad computation
+        - heads (:obj:`list` or None): sizes of the independent categorical heads, defaults to None, a single head
     Returns:
         - rhos (:obj:`torch.Tensor`): Importance sampling weight
     Shapes:
@@ -104,9 +138,9 @@ def compute_importance_weights(target_output, behaviour_output, action, requires
     device = action.device
 
     with grad_context:
-        dist_target = torch.distributions.Categorical(logits=target_output)
-        dist_behaviour = torch.distributions.Categorical(logits=behaviour_output)
-        rhos = dist_target.log_prob(action) - dist_behaviour.log_prob(action)
+        target_log_prob, _ = categorical_log_prob_entropy(target_output, action, heads)
+        behaviour_log_prob, _ = categorical_log_prob_entropy(behaviour_output, action, heads)
+        rhos = target_log_prob - behaviour_log_prob
         rhos = torch.exp(rhos)
         return rhos
 
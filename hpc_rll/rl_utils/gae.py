@@ -1,21 +1,23 @@
 import torch
-import hpc_rl_utils
+from hpc_rll.backend import rl_utils_backend, accumulate_mode
+from hpc_rll.workspace import Workspace
 
-# hpc version only support cuda
+# hpc version supports cuda and cpu, the backend is chosen by the device of input tensors
 
 class GAEFunction(torch.autograd.Function):
     @staticmethod
-    def forward(ctx, value, reward, gamma, lambda_, adv):
+    def forward(ctx, value, reward, done, lengths, gamma, lambda_, adv, mode):
 
-        inputs = [value, reward]
+        inputs = [value, reward, done, lengths]
         outputs = [adv]
-        hpc_rl_utils.GaeForward(inputs, outputs, gamma, lambda_)
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.GaeForward(inputs, outputs, gamma, lambda_, mode)
 
         return adv
 
     @staticmethod
     def backward(ctx, grad_adv):
-        return None, None, None, None, None
+        return None, None, None, None, None, None, None, None
 
 class GAE(torch.nn.Module):
     """
@@ -25,7 +27,7 @@ class GAE(torch.nn.Module):
     Interface:
         __init__, forward
     """
-    def __init__(self, T, B):
+    def __init__(self, T, B, precision: str = 'float'):
         r"""
         Overview
             initialization of gae
@@ -33,12 +35,19 @@ class GAE(torch.nn.Module):
         Arguments:
             - T (:obj:`int`): trajectory length
             - B (:obj:`int`): batch size
+            - precision (:obj:`str`): accumulation of the estimator, 'float', 'kahan' (compensated fp32) or\
+            'double' (float64), the inputs and outputs keep their dtype, defaults to 'float'
+
+        .. note::
+            T and B are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
         """
 
         super().__init__()
-        self.register_buffer('adv', torch.zeros(T, B))
+        self.workspace = Workspace()
+        self.mode = accumulate_mode(precision)
 
-    def forward(self, value, reward, gamma: float = 0.99, lambda_: float = 0.97) -> torch.FloatTensor:
+    def forward(self, value, reward, gamma: float = 0.99, lambda_: float = 0.97,
+            done = None, lengths = None) -> torch.FloatTensor:
         """
         Overview:
             forward of gae
@@ -48,15 +57,121 @@ class GAE(torch.nn.Module):
             - gamma (:obj:`float`): the future discount factor, should be in [0, 1], defaults to 0.99.
             - lambda (:obj:`float`): the gae parameter lambda, should be in [0, 1], defaults to 0.97, when lambda -> 0,\
             it induces bias, but when lambda -> 1, it has high variance due to the sum of terms.
+            - done (:obj:`torch.BoolTensor` or :obj:`torch.FloatTensor` or None): :math:`(T, B)`, whether the episode\
+            ends at this step, then the next value is not bootstrapped and the estimator restarts, defaults to None
+            - lengths (:obj:`torch.LongTensor` or None): :math:`(B, )`, valid length of each column, steps after it\
+            are padding and get zero advantage, value[lengths[b], b] is used as bootstrap value, defaults to None
         Returns:
             - adv (:obj:`torch.FloatTensor`): :math:`(T, B)`, the calculated advantage
-    
+
         .. note::
             value_{T+1} should be 0 if this trajectory reached a terminal state(done=True), otherwise we use value
-            function, this operation is implemented in actor for packing trajectory.
+            function, this operation is implemented in actor for packing trajectory. With done, packed multi-episode
+            rollouts can be passed in one call. value can be float, double, half or bfloat16, adv has the same dtype
+            and the estimator is accumulated in float for half and bfloat16.
+        """
+        assert(reward.device == value.device)
+        reward = reward.to(value.dtype)
+        if done is None:
+            done = value.new_empty(0)
+        else:
+            assert(done.device == value.device)
+            done = done.to(value.dtype)
+        if lengths is None:
+            lengths = value.new_empty(0, dtype=torch.long)
+        else:
+            assert(lengths.device == value.device)
+            lengths = lengths.long()
+
+        T, B = reward.shape
+        adv = self.workspace.get('adv', (T, B), value, value.dtype)
+
+        return GAEFunction.apply(value, reward, done, lengths, gamma, lambda_, adv, self.mode)
+
+class GAENormFunction(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, value, reward, done, lengths, gamma, lambda_, eps, adv, return_, norm_adv, stat, mode):
+
+        inputs = [value, reward, done, lengths]
+        outputs = [adv, return_, norm_adv, stat]
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.GaeNormForward(inputs, outputs, gamma, lambda_, eps, mode)
+
+        return adv, return_, norm_adv
+
+    @staticmethod
+    def backward(ctx, grad_adv, grad_return, grad_norm_adv):
+        return None, None, None, None, None, None, None, None, None, None, None, None
+
+class GAENorm(torch.nn.Module):
+    """
+    Overview:
+        Fused Generalized Advantage Estimator, which also returns the value target (adv + value) and
+        the normalized advantage, so the whole advantage pipeline of PPO is done in one call
+
+    Interface:
+        __init__, forward
+    """
+    def __init__(self, T, B, precision: str = 'float'):
+        r"""
+        Overview
+            initialization of gae with return and advantage normalization
+
+        Arguments:
+            - T (:obj:`int`): trajectory length
+            - B (:obj:`int`): batch size
+            - precision (:obj:`str`): accumulation of the estimator, 'float', 'kahan' (compensated fp32) or\
+            'double' (float64), the inputs and outputs keep their dtype, defaults to 'float'
+
+        .. note::
+            T and B are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
+        """
+
+        super().__init__()
+        self.workspace = Workspace()
+        self.mode = accumulate_mode(precision)
+
+    def forward(self, value, reward, gamma: float = 0.99, lambda_: float = 0.97,
+            done = None, lengths = None, eps: float = 1e-8):
+        """
+        Overview:
+            forward of gae with return and advantage normalization
+        Arguments:
+            - value (:obj:`torch.FloatTensor`): :math:`(T + 1, B)`, gae input data
+            - reward (:obj:`torch.FloatTensor`): :math:`(T, B)`, gae input data
+            - gamma (:obj:`float`): the future discount factor, should be in [0, 1], defaults to 0.99.
+            - lambda (:obj:`float`): the gae parameter lambda, should be in [0, 1], defaults to 0.97
+            - done (:obj:`torch.BoolTensor` or :obj:`torch.FloatTensor` or None): :math:`(T, B)`, same as GAE
+            - lengths (:obj:`torch.LongTensor` or None): :math:`(B, )`, same as GAE, padding steps are excluded from\
+            the statistics and get zero return and normalized advantage
+            - eps (:obj:`float`): added to the std of advantage, defaults to 1e-8
+        Returns:
+            - adv (:obj:`torch.FloatTensor`): :math:`(T, B)`, the calculated advantage
+            - return_ (:obj:`torch.FloatTensor`): :math:`(T, B)`, adv + value[:-1]
+            - norm_adv (:obj:`torch.FloatTensor`): :math:`(T, B)`, (adv - adv.mean()) / (adv.std() + eps)
+
+        .. note::
+            The std is unbiased, the same as torch.std. The sum of adv, the sum of adv^2 and the number of valid
+            steps are kept in the float64 workspace buffer ``stat`` after the call. The outputs have the dtype of value.
         """
-        assert(value.is_cuda)
-        assert(reward.is_cuda)
+        assert(reward.device == value.device)
+        reward = reward.to(value.dtype)
+        if done is None:
+            done = value.new_empty(0)
+        else:
+            assert(done.device == value.device)
+            done = done.to(value.dtype)
+        if lengths is None:
+            lengths = value.new_empty(0, dtype=torch.long)
+        else:
+            assert(lengths.device == value.device)
+            lengths = lengths.long()
 
-        return GAEFunction.apply(value, reward, gamma, lambda_, self.adv)
+        T, B = reward.shape
+        adv = self.workspace.get('adv', (T, B), value, value.dtype)
+        return_ = self.workspace.get('return_', (T, B), value, value.dtype)
+        norm_adv = self.workspace.get('norm_adv', (T, B), value, value.dtype)
+        stat = self.workspace.get('stat', (3, ), value, torch.float64)
 
+        return GAENormFunction.apply(value, reward, done, lengths, gamma, lambda_, eps,
+                adv, return_, norm_adv, stat, self.mode)
@@ -1,30 +1,100 @@
 from fcntl import DN_DELETE
 from typing import Tuple, List, Union
 from functools import reduce
+from collections import namedtuple
 import torch
+import torch.nn.functional as F
 import numpy as np
-import hpc_rl_utils
+from hpc_rll.backend import rl_utils_backend
 import pdb
 
-# hpc version only support cuda
+# hpc version supports both cpu and cuda, the extension is chosen by the device of inputs
+
+# group_mode:
+#   sample: split at randomly sampled inputs, the sampling is seeded by generator (the default torch generator if
+#       it is None), so it is reproducible with torch.manual_seed
+#   quantile: split at the quantiles of the input sizes, deterministic
+#   oracle: split with the minimal number of padded elements, O(group * n^2)
+#   fast_oracle: the same cost as oracle in O(group * n * log(n)), only for 1D inputs since the divide-and-conquer
+#       split is not optimal for 2D/3D inputs, Padding2D and Padding3D reject it
+
+# ragged inputs: n tensors of the same number of dims stored in one buffer
+#   values: 1-dim float tensor, all the tensors flattened and concatenated
+#   offsets: 1-dim int64 tensor [n + 1], tensor i is values[offsets[i]:offsets[i + 1]]
+#   shapes: 2-dim int64 tensor [n, dim], shape of each tensor
+# offsets and shapes are on the same device as values
+hpc_ragged = namedtuple('hpc_ragged', ['values', 'offsets', 'shapes'])
+
 
 def cum(t: List[int]) -> int:
     return reduce(lambda x, y: x * y, t)
 
-def Padding1D(inputs: List[torch.Tensor], mode='constant', value: int = 0, group: int = 1, group_mode='sample'):
+
+def ragged_offsets(shapes: torch.Tensor) -> torch.Tensor:
+    return F.pad(shapes.prod(1).cumsum(0), (1, 0))
+
+
+def to_ragged(inputs: List[torch.Tensor]) -> hpc_ragged:
+    r"""
+    Overview:
+        copy a list of tensors into one ragged buffer, producers which can write the flattened values directly should
+        build hpc_ragged(values, ragged_offsets(shapes), shapes) instead
+    """
+    values = torch.cat([t.reshape(-1) for t in inputs])
+    shapes = torch.tensor([list(t.shape) for t in inputs], dtype=torch.int64, device=values.device)
+    return hpc_ragged(values, ragged_offsets(shapes), shapes)
+
+
+def ragged_views(x: hpc_ragged) -> List[torch.Tensor]:
+    r"""
+    Overview:
+        list of the tensors in x, they are views of x.values and no data is copied
+    """
+    shapes = x.shapes.tolist()
+    numels = [cum(s) for s in shapes]
+    return [t.view(s) for t, s in zip(x.values.split(numels), shapes)]
+
+
+def _split_group(inputs: List[torch.Tensor], group: int, group_mode: str, generator: torch.Generator = None):
+    backend = rl_utils_backend(inputs[0])
+    if group_mode == 'sample':
+        seed = int(torch.randint(2 ** 62, (1, ), generator=generator))
+        res = backend.sample_split_group(inputs, group, seed)
+    elif group_mode == 'quantile':
+        res = backend.quantile_split_group(inputs, group)
+    elif group_mode == 'oracle':
+        res = backend.oracle_split_group(inputs, group)
+    elif group_mode == 'fast_oracle':
+        res = backend.fast_oracle_split_group(inputs, group)
+    return res[:-1], res[-1]
+
+
+def _pad_ragged(inputs: hpc_ragged, dim: int, value: int, group: int):
+    assert group == 1, "ragged inputs only support group = 1, but get {}".format(group)
+    assert inputs.shapes.dim() == 2 and inputs.shapes.shape[1] == dim, inputs.shapes.shape
+    values, offsets, shapes = [t.contiguous() for t in inputs]
+    new_x, mask = rl_utils_backend(values).PadRaggedForward(values, offsets, shapes, value)
+    return new_x, mask, shapes
+
+
+def _unpad_ragged(x: torch.Tensor, shapes: torch.Tensor) -> hpc_ragged:
+    x = x.contiguous()
+    shapes = shapes.contiguous()
+    offsets = ragged_offsets(shapes)
+    values = rl_utils_backend(x).UnpadRaggedForward(x, offsets, shapes)
+    return hpc_ragged(values, offsets, shapes)
+
+
+def Padding1D(inputs: Union[List[torch.Tensor], hpc_ragged], mode='constant', value: int = 0, group: int = 1,
+              group_mode='sample', generator: torch.Generator = None):
     assert mode in ['constant'], mode
-    assert group_mode in ['sample', 'oracle'], group_mode
+    if isinstance(inputs, hpc_ragged):
+        return _pad_ragged(inputs, 1, value, group)
+    assert group_mode in ['sample', 'quantile', 'oracle', 'fast_oracle'], group_mode
     assert group >= 1, group
     if group > 1:
         inputs = sorted(inputs, key=lambda t: cum(t.shape))
-        if group_mode == 'sample':
-            res = hpc_rl_utils.sample_split_group(inputs, group)
-            group_idx = res[-1]
-            group_shape = res[:-1]
-        elif group_mode == 'oracle':
-            res = hpc_rl_utils.oracle_split_group(inputs, group)
-            group_idx = res[-1]
-            group_shape = res[:-1]
+        group_shape, group_idx = _split_group(inputs, group, group_mode, generator)
         assert len(group_idx) == len(group_shape) + 1
         max_shape = [s[0] for s in group_shape]
         group_num = [(group_idx[i+1] - group_idx[i]) for i in range(len(group_shape))]
@@ -39,42 +109,43 @@ def Padding1D(inputs: List[torch.Tensor], mode='constant', value: int = 0, group
                 k = k + 1
             shapes.append(shape)
         assert len(group_id) == len(inputs)
-        result = hpc_rl_utils.GroupPad1DForward(inputs, group_num, max_shape, group_id, group_idx, value)
+        result = rl_utils_backend(inputs[0]).GroupPad1DForward(inputs, group_num, max_shape, group_id, group_idx, value)
         new_x = result[0]
         mask = result[1]
         return [tuple(new_x), tuple(mask), tuple(shapes)]
     else:
         shapes = [t.shape[0] for t in inputs]
-        result = hpc_rl_utils.Pad1DForward(inputs, value)
+        result = rl_utils_backend(inputs[0]).Pad1DForward(inputs, value)
         new_x = result[0]
         mask = result[1]
         return new_x, mask, shapes
 
 
 def UnPadding1D(x: Union[torch.Tensor, List[torch.Tensor]],
-                shapes: Union[List, List[List]]) -> List[torch.Tensor]:
+                shapes: Union[List, List[List], torch.Tensor]) -> Union[List[torch.Tensor], hpc_ragged]:
+    if isinstance(shapes, torch.Tensor):
+        # shapes returned by padding ragged inputs, the result is ragged too
+        return _unpad_ragged(x, shapes)
     if isinstance(x, torch.Tensor):
-        return hpc_rl_utils.Unpad1DForward(x, shapes)
+        return rl_utils_backend(x).Unpad1DForward(x, shapes)
     else:
         ret = []
         for t, s in zip(x, shapes):
-            ret.append(hpc_rl_utils.Unpad1DForward(t, s))
+            ret.append(rl_utils_backend(t).Unpad1DForward(t, s))
         return sum(ret, [])
 
-def Padding2D(inputs: List[torch.Tensor], mode='constant', value: int = 0, group: int = 1, group_mode='sample'):
+def Padding2D(inputs: Union[List[torch.Tensor], hpc_ragged], mode='constant', value: int = 0, group: int = 1,
+              group_mode='sample', generator: torch.Generator = None):
     assert mode in ['constant'], mode
-    assert group_mode in ['sample', 'oracle'], group_mode
+    if isinstance(inputs, hpc_ragged):
+        return _pad_ragged(inputs, 2, value, group)
+    assert group_mode in ['sample', 'quantile', 'oracle'], \
+        "group_mode of Padding2D should be in ['sample', 'quantile', 'oracle'], fast_oracle only supports 1D " \
+        "inputs, but get {}".format(group_mode)
     assert group >= 1, group
     if group > 1:
         inputs = sorted(inputs, key=lambda t: cum(t.shape))
-        if group_mode == 'sample':
-            res = hpc_rl_utils.sample_split_group(inputs, group)
-            group_idx = res[-1]
-            group_shape = res[:-1]
-        elif group_mode == 'oracle':
-            res = hpc_rl_utils.oracle_split_group(inputs, group)
-            group_idx = res[-1]
-            group_shape = res[:-1]
+        group_shape, group_idx = _split_group(inputs, group, group_mode, generator)
         assert len(group_idx) == len(group_shape) + 1
         max_shape = []
         for s in group_shape:
@@ -93,7 +164,7 @@ def Padding2D(inputs: List[torch.Tensor], mode='constant', value: int = 0, group
                 k = k + 1
             shapes.append(shape)
         assert len(group_id) == len(inputs)
-        result = hpc_rl_utils.GroupPad2DForward(inputs, group_cnt, max_shape, group_id, group_idx, value)
+        result = rl_utils_backend(inputs[0]).GroupPad2DForward(inputs, group_cnt, max_shape, group_id, group_idx, value)
         new_x = result[0]
         mask = result[1]
         return [tuple(new_x), tuple(mask), tuple(shapes)]
@@ -102,36 +173,37 @@ def Padding2D(inputs: List[torch.Tensor], mode='constant', value: int = 0, group
         for t in inputs:
             shapes.append(t.shape[0])
             shapes.append(t.shape[1])
-        result = hpc_rl_utils.Pad2DForward(inputs, value)
+        result = rl_utils_backend(inputs[0]).Pad2DForward(inputs, value)
         new_x = result[0]
         mask = result[1]
         return new_x, mask, shapes
 
 
 def UnPadding2D(x: Union[torch.Tensor, List[torch.Tensor]],
-                shapes: Union[List, List[List]]) -> List[torch.Tensor]:
+                shapes: Union[List, List[List], torch.Tensor]) -> Union[List[torch.Tensor], hpc_ragged]:
+    if isinstance(shapes, torch.Tensor):
+        # shapes returned by padding ragged inputs, the result is ragged too
+        return _unpad_ragged(x, shapes)
     if isinstance(x, torch.Tensor):
-        return hpc_rl_utils.Unpad2DForward(x, shapes)
+        return rl_utils_backend(x).Unpad2DForward(x, shapes)
     else:
         ret = []
         for t, s in zip(x, shapes):
-            ret.append(hpc_rl_utils.Unpad2DForward(t, s))
+            ret.append(rl_utils_backend(t).Unpad2DForward(t, s))
         return sum(ret, [])
 
-def Padding3D(inputs: List[torch.Tensor], mode='constant', value: int = 0, group: int = 1, group_mode='sample'):
+def Padding3D(inputs: Union[List[torch.Tensor], hpc_ragged], mode='constant', value: int = 0, group: int = 1,
+              group_mode='sample', generator: torch.Generator = None):
     assert mode in ['constant'], mode
-    assert group_mode in ['sample', 'oracle'], group_mode
+    if isinstance(inputs, hpc_ragged):
+        return _pad_ragged(inputs, 3, value, group)
+    assert group_mode in ['sample', 'quantile', 'oracle'], \
+        "group_mode of Padding3D should be in ['sample', 'quantile', 'oracle'], fast_oracle only supports 1D " \
+        "inputs, but get {}".format(group_mode)
     assert group >= 1, group
     if group > 1:
         inputs = sorted(inputs, key=lambda t: cum(t.shape))
-        if group_mode == 'sample':
-            res = hpc_rl_utils.sample_split_group(inputs, group)
-            group_idx = res[-1]
-            group_shape = res[:-1]
-        elif group_mode == 'oracle':
-            res = hpc_rl_utils.oracle_split_group(inputs, group)
-            group_idx = res[-1]
-            group_shape = res[:-1]
+        group_shape, group_idx = _split_group(inputs, group, group_mode, generator)
         assert len(group_idx) == len(group_shape) + 1
         max_shape = []
         for s in group_shape:
@@ -153,7 +225,7 @@ def Padding3D(inputs: List[torch.Tensor], mode='constant', value: int = 0, group
                 k = k + 1
             shapes.append(shape)
         assert len(group_id) == len(inputs)
-        result = hpc_rl_utils.GroupPad3DForward(inputs, group_cnt, max_shape, group_id, group_idx, value)
+        result = rl_utils_backend(inputs[0]).GroupPad3DForward(inputs, group_cnt, max_shape, group_id, group_idx, value)
         new_x = result[0]
         mask = result[1]
         return [tuple(new_x), tuple(mask), tuple(shapes)]
@@ -163,20 +235,23 @@ def Padding3D(inputs: List[torch.Tensor], mode='constant', value: int = 0, group
             shapes.append(t.shape[0])
             shapes.append(t.shape[1])
             shapes.append(t.shape[2])
-        result = hpc_rl_utils.Pad3DForward(inputs, value)
+        result = rl_utils_backend(inputs[0]).Pad3DForward(inputs, value)
         new_x = result[0]
         mask = result[1]
         return new_x, mask, shapes
 
 
 def UnPadding3D(x: Union[torch.Tensor, List[torch.Tensor]],
-                shapes: Union[List, List[List]]) -> List[torch.Tensor]:
+                shapes: Union[List, List[List], torch.Tensor]) -> Union[List[torch.Tensor], hpc_ragged]:
+    if isinstance(shapes, torch.Tensor):
+        # shapes returned by padding ragged inputs, the result is ragged too
+        return _unpad_ragged(x, shapes)
     if isinstance(x, torch.Tensor):
-        return hpc_rl_utils.Unpad3DForward(x, shapes)
+        return rl_utils_backend(x).Unpad3DForward(x, shapes)
     else:
         ret = []
         for t, s in zip(x, shapes):
-            ret.append(hpc_rl_utils.Unpad3DForward(t, s))
+            ret.append(rl_utils_backend(t).Unpad3DForward(t, s))
         return sum(ret, [])
 
 
@@ -1,21 +1,76 @@
 import torch
 import torch.nn.functional as F
-from typing import Optional
+from typing import Optional, List
 from collections import namedtuple
-import hpc_rl_utils
+from hpc_rll.backend import rl_utils_backend
+from hpc_rll.workspace import Workspace, WorkspaceArena
 
-# hpc version only support cuda
+# hpc version supports cuda and cpu, the backend is chosen by the device of input tensors
 
 hpc_ppo_loss = namedtuple('hpc_ppo_loss', ['policy_loss', 'value_loss', 'entropy_loss'])
 hpc_ppo_info = namedtuple('hpc_ppo_info', ['approx_kl', 'clipfrac'])
 
+
+def _ppo_info(approx_kl, clipfrac, info_tensor):
+    # .item() synchronizes with the device, the tensors are copied out of the workspace instead, which is async
+    if info_tensor:
+        return hpc_ppo_info(approx_kl.detach().reshape(()).clone(), clipfrac.detach().reshape(()).clone())
+    return hpc_ppo_info(approx_kl.item(), clipfrac.item())
+
+
+class PPOInfoAccumulator(object):
+    """
+    Overview:
+        Running mean of the ppo info across minibatches, the sums are kept on the device of the info, so updating
+        it does not synchronize, and the statistics are read once, e.g. per epoch
+
+    Interface:
+        __init__, update, read, reset
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sum = None
+        self.count = 0
+
+    def update(self, info):
+        """
+        Overview:
+            add the info of one minibatch
+        Arguments:
+            - info (:obj:`namedtuple`): ``hpc_ppo_info`` returned by PPO or PPOContinuous with ``info_tensor=True``
+        """
+        stat = torch.stack([info.approx_kl, info.clipfrac]).float()
+        if self.sum is None:
+            self.sum = torch.zeros_like(stat)
+        self.sum += stat
+        self.count += 1
+
+    def read(self, reset: bool = True):
+        """
+        Overview:
+            get the mean of the info since the last reset, which synchronizes with the device once
+        Arguments:
+            - reset (:obj:`bool`): whether to reset the accumulator after reading, defaults to True
+        Returns:
+            - ppo_info (:obj:`namedtuple`): ``hpc_ppo_info`` of Python scalars, None if nothing is accumulated
+        """
+        if self.count == 0:
+            return None
+        approx_kl, clipfrac = (self.sum / self.count).tolist()
+        if reset:
+            self.reset()
+        return hpc_ppo_info(approx_kl, clipfrac)
+
 class PPOFunction(torch.autograd.Function):
     @staticmethod
     def forward(ctx, logits_new, logits_old, action, value_new, value_old, adv, return_, weight,
             clip_ratio, use_value_clip, dual_clip, logits_new_prob, logits_new_entropy, logits_new_grad_logits,
             logits_new_grad_prob, logits_new_grad_entropy, logit_old_prob,
             grad_policy_loss_buf, grad_value_loss_buf, grad_entropy_loss_buf,
-            policy_loss, value_loss, entropy_loss, approx_kl, clipfrac, grad_value, grad_logits_new):
+            policy_loss, value_loss, entropy_loss, approx_kl, clipfrac, grad_value, grad_logits_new, workspace, heads):
 
         inputs = [logits_new, logits_old, action, value_new, value_old, adv, return_, weight]
         outputs = [logits_new_prob, logits_new_entropy, logits_new_grad_logits,
@@ -23,13 +78,16 @@ class PPOFunction(torch.autograd.Function):
                 grad_policy_loss_buf, grad_value_loss_buf, grad_entropy_loss_buf,
                 policy_loss, value_loss, entropy_loss, approx_kl, clipfrac]
 
-        hpc_rl_utils.PPOForward(inputs, outputs, use_value_clip, clip_ratio, dual_clip)
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.PPOForward(inputs, outputs, use_value_clip, clip_ratio, dual_clip, heads)
 
         bp_inputs = [grad_policy_loss_buf, grad_value_loss_buf, grad_entropy_loss_buf,
                 logits_new_grad_logits, logits_new_grad_prob, logits_new_grad_entropy]
         bp_outputs = [grad_value, grad_logits_new]
         ctx.bp_inputs = bp_inputs
         ctx.bp_outputs = bp_outputs
+        ctx.workspace = workspace
+        ctx.heads = heads
 
         return policy_loss, value_loss, entropy_loss, approx_kl, clipfrac
 
@@ -40,11 +98,12 @@ class PPOFunction(torch.autograd.Function):
             inputs.append(var)
         outputs = ctx.bp_outputs
 
-        hpc_rl_utils.PPOBackward(inputs, outputs)
+        ctx.backend.PPOBackward(inputs, outputs, ctx.heads)
+        ctx.workspace.give_back(*ctx.bp_inputs)
 
         grad_value = outputs[0]
         grad_logits_new = outputs[1]
-        return grad_logits_new, None, None, grad_value, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
+        return grad_logits_new, None, None, grad_value, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
 
 class PPO(torch.nn.Module):
     """
@@ -55,7 +114,7 @@ class PPO(torch.nn.Module):
         __init__, forward
     """
 
-    def __init__(self, B, N):
+    def __init__(self, B, N, arena: WorkspaceArena = None, info_tensor: bool = False, heads: Optional[List[int]] = None):
         r"""
         Overview
             initialization of PPO
@@ -63,28 +122,22 @@ class PPO(torch.nn.Module):
         Arguments:
             - B (:obj:`int`): batch size
             - N (:obj:`int`): number of output
+            - arena (:obj:`WorkspaceArena` or None): shared arena to borrow scratch buffers from, defaults to None
+            - info_tensor (:obj:`bool`): return approx_kl and clipfrac as 0-dim tensors on the device instead of\
+            Python scalars, so forward does not synchronize, see ``PPOInfoAccumulator``, defaults to False
+            - heads (:obj:`list` or None): sizes of the independent categorical heads of a multi-discrete action\
+            space, the logits of the heads are concatenated along N, so sum(heads) should be N, defaults to None,\
+            a single head
+
+        .. note::
+            B and N are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
         """
 
         super().__init__()
-        self.register_buffer('weight', torch.ones(B))
-        self.register_buffer('logits_new_prob', torch.zeros(B))
-        self.register_buffer('logits_new_entropy', torch.zeros(B))
-        self.register_buffer('logits_new_grad_logits', torch.zeros(B, N))
-        self.register_buffer('logits_new_grad_prob', torch.zeros(B, N))
-        self.register_buffer('logits_new_grad_entropy', torch.zeros(B, N))
-        self.register_buffer('logit_old_prob', torch.zeros(B))
-        self.register_buffer('grad_policy_loss_buf', torch.zeros(B))
-        self.register_buffer('grad_value_loss_buf', torch.zeros(B))
-        self.register_buffer('grad_entropy_loss_buf', torch.zeros(B))
-
-        self.register_buffer('policy_loss', torch.zeros(1))
-        self.register_buffer('value_loss', torch.zeros(1))
-        self.register_buffer('entropy_loss', torch.zeros(1))
-        self.register_buffer('approx_kl', torch.zeros(1))
-        self.register_buffer('clipfrac', torch.zeros(1))
-
-        self.register_buffer('grad_value', torch.zeros(B))
-        self.register_buffer('grad_logits_new', torch.zeros(B, N))
+        self.workspace = Workspace(arena=arena)
+        self.info_tensor = info_tensor
+        self.heads = [int(h) for h in heads] if heads is not None else []
+        assert all([h > 0 for h in self.heads]), "size of each head should be positive, but get {}".format(self.heads)
 
     def forward(self, logits_new, logits_old, action, value_new, value_old, adv, return_,
             weight = None,
@@ -96,9 +149,10 @@ class PPO(torch.nn.Module):
         Overview:
             forward of PPO
         Arguments:
-            - logit_new (:obj:`torch.FloatTensor`): :math:`(B, N)`, where B is batch size and N is action dim
-            - logit_old (:obj:`torch.FloatTensor`): :math:`(B, N)`
-            - action (:obj:`torch.LongTensor`): :math:`(B, )`
+            - logit_new (:obj:`torch.Tensor`): :math:`(B, N)`, where B is batch size and N is action dim, float,\
+            double, half or bfloat16
+            - logit_old (:obj:`torch.Tensor`): :math:`(B, N)`, converted to the dtype of logit_new
+            - action (:obj:`torch.LongTensor`): :math:`(B, )`, or :math:`(B, H)` with H heads
             - value_new (:obj:`torch.FloatTensor`): :math:`(B, )`
             - value_old (:obj:`torch.FloatTensor`): :math:`(B, )`
             - adv (:obj:`torch.FloatTensor`): :math:`(B, )`
@@ -111,39 +165,229 @@ class PPO(torch.nn.Module):
 
         Returns:
             - ppo_loss (:obj:`namedtuple`): the ppo loss item, all of them are the differentiable 0-dim tensor
-            - ppo_info (:obj:`namedtuple`): the ppo optim information for monitoring, all of them are Python scalar
+            - ppo_info (:obj:`namedtuple`): the ppo optim information for monitoring, all of them are Python scalar,\
+            or 0-dim tensors if info_tensor is set
 
         .. note::
             adv is already normalized value (adv - adv.mean()) / (adv.std() + 1e-8), and there are many
             ways to calculate this mean and std, like among data buffer or train batch, so we don't couple
             this part into ppo_error, you can refer to our examples for different ways.
+
+            The reductions are accumulated in float for half and bfloat16 logits, the :math:`(B, )` inputs and the
+            losses are float, and the grad of logit_new has the dtype of logit_new.
+
+            With heads, the log prob and entropy of a sample are the sums over its heads, i.e. the joint ones of
+            independent heads, and all heads are handled in the same kernel launch.
         """
 
-        assert(logits_new.is_cuda)
-        assert(logits_old.is_cuda)
-        assert(action.is_cuda)
-        assert(value_new.is_cuda)
-        assert(value_old.is_cuda)
-        assert(adv.is_cuda)
-        assert(return_.is_cuda)
+        assert(logits_old.device == logits_new.device)
+        assert(action.device == logits_new.device)
+        assert(value_new.device == logits_new.device)
+        assert(value_old.device == logits_new.device)
+        assert(adv.device == logits_new.device)
+        assert(return_.device == logits_new.device)
+        B, N = logits_new.shape
+        if self.heads:
+            H = len(self.heads)
+            assert sum(self.heads) == N, "sum of heads should be {}, but get {}".format(N, sum(self.heads))
+            assert action.shape == (B, H), "action should be ({}, {}), but get {}".format(B, H, tuple(action.shape))
+        # action is indexed as a dense buffer by the kernels
+        action = action.contiguous()
+        # one log prob and entropy per head, they are summed in the loss kernel
+        prob_shape = (B, len(self.heads)) if self.heads else (B, )
+        ws = self.workspace
         if weight is None:
-            weight = self.weight
+            weight = ws.get('weight', (B, ), logits_new, fill=1.0)
         else:
-            assert(weight.is_cuda)
+            assert(weight.device == logits_new.device)
+            weight = weight.float()
+        # the logits stay in their own dtype, the per sample inputs are cheap to convert
+        dtype = logits_new.dtype
+        logits_old = logits_old.to(dtype)
+        value_new, value_old, adv, return_ = value_new.float(), value_old.float(), adv.float(), return_.float()
 
         assert dual_clip is None or dual_clip > 1.0, "dual_clip value must be greater than 1.0, but get value: {}".format(dual_clip)
 
         if dual_clip is None:
             dual_clip = 0.0;
 
+        # the probs and entropy are only used in forward, the grad bufs are saved for backward
+        logits_new_prob = ws.borrow('logits_new_prob', prob_shape, logits_new)
+        logits_new_entropy = ws.borrow('logits_new_entropy', prob_shape, logits_new)
+        logit_old_prob = ws.borrow('logit_old_prob', prob_shape, logits_new)
+        bp_bufs = [ws.borrow('grad_policy_loss_buf', (B, ), logits_new), ws.borrow('grad_value_loss_buf', (B, ), logits_new),
+                ws.borrow('grad_entropy_loss_buf', (B, ), logits_new), ws.borrow('logits_new_grad_logits', (B, N), logits_new, dtype),
+                ws.borrow('logits_new_grad_prob', (B, N), logits_new, dtype),
+                ws.borrow('logits_new_grad_entropy', (B, N), logits_new, dtype)]
+
         policy_loss, value_loss, entropy_loss, approx_kl, clipfrac = PPOFunction.apply(
                 logits_new, logits_old, action, value_new, value_old, adv, return_, weight,
                 clip_ratio, use_value_clip, dual_clip,
-                self.logits_new_prob, self.logits_new_entropy, self.logits_new_grad_logits,
-                self.logits_new_grad_prob, self.logits_new_grad_entropy, self.logit_old_prob,
-                self.grad_policy_loss_buf, self.grad_value_loss_buf, self.grad_entropy_loss_buf,
-                self.policy_loss, self.value_loss, self.entropy_loss, self.approx_kl, self.clipfrac,
-                self.grad_value, self.grad_logits_new)
+                logits_new_prob, logits_new_entropy, bp_bufs[3], bp_bufs[4], bp_bufs[5], logit_old_prob,
+                bp_bufs[0], bp_bufs[1], bp_bufs[2],
+                ws.get('policy_loss', (1, ), logits_new), ws.get('value_loss', (1, ), logits_new),
+                ws.get('entropy_loss', (1, ), logits_new), ws.get('approx_kl', (1, ), logits_new),
+                ws.get('clipfrac', (1, ), logits_new),
+                ws.get('grad_value', (B, ), logits_new), ws.get('grad_logits_new', (B, N), logits_new, dtype), ws,
+                self.heads)
+
+        ws.give_back(logits_new_prob, logits_new_entropy, logit_old_prob)
+        if policy_loss.grad_fn is None:
+            ws.give_back(*bp_bufs)
+
+        return hpc_ppo_loss(policy_loss, value_loss, entropy_loss), _ppo_info(approx_kl, clipfrac, self.info_tensor)
+
+
+class PPOContinuousFunction(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, mu_new, sigma_new, mu_old, sigma_old, action, value_new, value_old, adv, return_, weight,
+            clip_ratio, use_value_clip, dual_clip, new_prob, new_entropy, grad_mu_prob, grad_sigma_prob,
+            grad_sigma_entropy, old_prob, grad_policy_loss_buf, grad_value_loss_buf, grad_entropy_loss_buf,
+            policy_loss, value_loss, entropy_loss, approx_kl, clipfrac, grad_value, grad_mu_new, grad_sigma_new,
+            workspace):
+
+        inputs = [mu_new, sigma_new, mu_old, sigma_old, action, value_new, value_old, adv, return_, weight]
+        outputs = [new_prob, new_entropy, grad_mu_prob, grad_sigma_prob, grad_sigma_entropy, old_prob,
+                grad_policy_loss_buf, grad_value_loss_buf, grad_entropy_loss_buf,
+                policy_loss, value_loss, entropy_loss, approx_kl, clipfrac]
+
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.PPOContinuousForward(inputs, outputs, use_value_clip, clip_ratio, dual_clip)
+
+        bp_inputs = [grad_policy_loss_buf, grad_value_loss_buf, grad_entropy_loss_buf,
+                grad_mu_prob, grad_sigma_prob, grad_sigma_entropy]
+        bp_outputs = [grad_value, grad_mu_new, grad_sigma_new]
+        ctx.bp_inputs = bp_inputs
+        ctx.bp_outputs = bp_outputs
+        ctx.workspace = workspace
+
+        return policy_loss, value_loss, entropy_loss, approx_kl, clipfrac
+
+    @staticmethod
+    def backward(ctx, grad_policy_loss, grad_value_loss, grad_entropy_loss, grad_approx_kl, grad_clipfrac):
+        inputs = [grad_policy_loss, grad_value_loss, grad_entropy_loss]
+        for var in ctx.bp_inputs:
+            inputs.append(var)
+        outputs = ctx.bp_outputs
+
+        ctx.backend.PPOContinuousBackward(inputs, outputs)
+        ctx.workspace.give_back(*ctx.bp_inputs)
+
+        grad_value, grad_mu_new, grad_sigma_new = outputs
+        return grad_mu_new, grad_sigma_new, None, None, None, grad_value, None, None, None, None, None, None, None, \
+            None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
+
+class PPOContinuous(torch.nn.Module):
+    """
+    Overview:
+        Implementation of Proximal Policy Optimization (arXiv:1707.06347) with value_clip and dual_clip
+        for diagonal gaussian policy, the log prob, entropy, ratio and losses are fused in one operator
+
+    Interface:
+        __init__, forward
+    """
+
+    def __init__(self, B, N, arena: WorkspaceArena = None, info_tensor: bool = False):
+        r"""
+        Overview
+            initialization of PPOContinuous
+
+        Arguments:
+            - B (:obj:`int`): batch size
+            - N (:obj:`int`): action dim
+            - arena (:obj:`WorkspaceArena` or None): shared arena to borrow scratch buffers from, defaults to None
+            - info_tensor (:obj:`bool`): the same as PPO, defaults to False
+
+        .. note::
+            B and N are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
+        """
+
+        super().__init__()
+        self.workspace = Workspace(arena=arena)
+        self.info_tensor = info_tensor
+
+    def forward(self, mu_new, sigma_new, mu_old, sigma_old, action, value_new, value_old, adv, return_,
+            weight = None,
+            clip_ratio: float = 0.2,
+            use_value_clip: bool = True,
+            dual_clip: Optional[float] = None
+            ):
+        """
+        Overview:
+            forward of PPOContinuous
+        Arguments:
+            - mu_new (:obj:`torch.Tensor`): :math:`(B, N)`, mean of the new policy, where B is batch size and N is\
+            action dim, float, double, half or bfloat16
+            - sigma_new (:obj:`torch.Tensor`): :math:`(B, N)`, std of the new policy
+            - mu_old (:obj:`torch.Tensor`): :math:`(B, N)`, mean of the old policy
+            - sigma_old (:obj:`torch.Tensor`): :math:`(B, N)`, std of the old policy
+            - action (:obj:`torch.Tensor`): :math:`(B, N)`, the continuous action
+            - value_new (:obj:`torch.FloatTensor`): :math:`(B, )`
+            - value_old (:obj:`torch.FloatTensor`): :math:`(B, )`
+            - adv (:obj:`torch.FloatTensor`): :math:`(B, )`
+            - return (:obj:`torch.FloatTensor`): :math:`(B, )`
+            - weight (:obj:`torch.FloatTensor` or :obj:`None`): :math:`(B, )`
+            - clip_ratio (:obj:`float`): the ppo clip ratio for the constraint of policy update, defaults to 0.2
+            - use_value_clip (:obj:`bool`): whether to use clip in value loss with the same ratio as policy
+            - dual_clip (:obj:`float`): a parameter c mentioned in arXiv:1912.09729 Equ. 5, shoule be in [1, inf),\
+            defaults to 5.0, if you don't want to use it, set this parameter to None
+
+        Returns:
+            - ppo_loss (:obj:`namedtuple`): the ppo loss item, all of them are the differentiable 0-dim tensor
+            - ppo_info (:obj:`namedtuple`): the ppo optim information for monitoring, all of them are Python scalar,\
+            or 0-dim tensors if info_tensor is set
+
+        .. note::
+            The log prob and entropy are the sums over the action dim, the same as ``Independent(Normal(mu, sigma), 1)``.
+            mu_old, sigma_old and action are converted to the dtype of mu_new, the :math:`(B, )` inputs and the
+            losses are float, and the grads of mu_new and sigma_new have the dtype of mu_new.
+        """
+
+        assert(sigma_new.device == mu_new.device)
+        assert(mu_old.device == mu_new.device)
+        assert(sigma_old.device == mu_new.device)
+        assert(action.device == mu_new.device)
+        assert(value_new.device == mu_new.device)
+        assert(value_old.device == mu_new.device)
+        assert(adv.device == mu_new.device)
+        assert(return_.device == mu_new.device)
+        B, N = mu_new.shape
+        ws = self.workspace
+        if weight is None:
+            weight = ws.get('weight', (B, ), mu_new, fill=1.0)
+        else:
+            assert(weight.device == mu_new.device)
+            weight = weight.float()
+        dtype = mu_new.dtype
+        sigma_new, mu_old, sigma_old, action = sigma_new.to(dtype), mu_old.to(dtype), sigma_old.to(dtype), action.to(dtype)
+        value_new, value_old, adv, return_ = value_new.float(), value_old.float(), adv.float(), return_.float()
+
+        assert dual_clip is None or dual_clip > 1.0, "dual_clip value must be greater than 1.0, but get value: {}".format(dual_clip)
+
+        if dual_clip is None:
+            dual_clip = 0.0;
+
+        # the probs and entropy are only used in forward, the grad bufs are saved for backward
+        new_prob = ws.borrow('new_prob', (B, ), mu_new)
+        new_entropy = ws.borrow('new_entropy', (B, ), mu_new)
+        old_prob = ws.borrow('old_prob', (B, ), mu_new)
+        bp_bufs = [ws.borrow('grad_policy_loss_buf', (B, ), mu_new), ws.borrow('grad_value_loss_buf', (B, ), mu_new),
+                ws.borrow('grad_entropy_loss_buf', (B, ), mu_new), ws.borrow('grad_mu_prob', (B, N), mu_new, dtype),
+                ws.borrow('grad_sigma_prob', (B, N), mu_new, dtype),
+                ws.borrow('grad_sigma_entropy', (B, N), mu_new, dtype)]
+
+        policy_loss, value_loss, entropy_loss, approx_kl, clipfrac = PPOContinuousFunction.apply(
+                mu_new, sigma_new, mu_old, sigma_old, action, value_new, value_old, adv, return_, weight,
+                clip_ratio, use_value_clip, dual_clip,
+                new_prob, new_entropy, bp_bufs[3], bp_bufs[4], bp_bufs[5], old_prob,
+                bp_bufs[0], bp_bufs[1], bp_bufs[2],
+                ws.get('policy_loss', (1, ), mu_new), ws.get('value_loss', (1, ), mu_new),
+                ws.get('entropy_loss', (1, ), mu_new), ws.get('approx_kl', (1, ), mu_new),
+                ws.get('clipfrac', (1, ), mu_new), ws.get('grad_value', (B, ), mu_new),
+                ws.get('grad_mu_new', (B, N), mu_new, dtype), ws.get('grad_sigma_new', (B, N), mu_new, dtype), ws)
 
-        return hpc_ppo_loss(policy_loss, value_loss, entropy_loss), hpc_ppo_info(approx_kl.item(), clipfrac.item())
+        ws.give_back(new_prob, new_entropy, old_prob)
+        if policy_loss.grad_fn is None:
+            ws.give_back(*bp_bufs)
 
+        return hpc_ppo_loss(policy_loss, value_loss, entropy_loss), _ppo_info(approx_kl, clipfrac, self.info_tensor)
@@ -1,19 +1,25 @@
 import torch
-import hpc_rl_utils
+from hpc_rll.backend import rl_utils_backend, accumulate_mode
+from hpc_rll.workspace import Workspace, WorkspaceArena
 from typing import Optional
+from collections import namedtuple
 
-# hpc version only support cuda
+# hpc version supports cuda and cpu, the backend is chosen by the device of input tensors
+
+hpc_nstep_return = namedtuple('hpc_nstep_return', ['return_', 'bootstrap_index', 'bootstrap_discount'])
 
 class DistNStepTDFunction(torch.autograd.Function):
     @staticmethod
     def forward(ctx, dist, next_n_dist, action, next_n_action, reward, done, weight, gamma, v_min, v_max,
-            td_err, loss, buf, grad_dist):
+            td_err, loss, buf, grad_dist, workspace):
         inputs = [dist, next_n_dist, action, next_n_action, reward, done, weight]
         outputs = [td_err, loss, buf]
-        hpc_rl_utils.DistNStepTdForward(inputs, outputs, gamma, v_min, v_max)
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.DistNStepTdForward(inputs, outputs, gamma, v_min, v_max)
 
         ctx.bp_inputs = [buf, action]
         ctx.bp_outputs = [grad_dist]
+        ctx.workspace = workspace
 
         return loss, td_err
 
@@ -24,9 +30,10 @@ class DistNStepTDFunction(torch.autograd.Function):
             inputs.append(var)
         outputs = ctx.bp_outputs
 
-        hpc_rl_utils.DistNStepTdBackward(inputs, outputs)
+        ctx.backend.DistNStepTdBackward(inputs, outputs)
+        ctx.workspace.give_back(ctx.bp_inputs[0])
         grad_dist = outputs[0]
-        return grad_dist, None, None, None, None, None, None, None, None, None, None, None, None, None
+        return grad_dist, None, None, None, None, None, None, None, None, None, None, None, None, None, None
 
 
 class DistNStepTD(torch.nn.Module):
@@ -38,7 +45,7 @@ class DistNStepTD(torch.nn.Module):
         __init__, forward
     """
 
-    def __init__(self, T, B, N, n_atom):
+    def __init__(self, T, B, N, n_atom, arena: WorkspaceArena = None):
         r"""
         Overview
             initialization of dist_nstep_td_error
@@ -48,17 +55,15 @@ class DistNStepTD(torch.nn.Module):
             - B (:obj:`int`): batch size
             - N (:obj:`int`): action dim
             - n_atom (:obj:`int`): the number of atom sample point
+            - arena (:obj:`WorkspaceArena` or None): shared arena to borrow scratch buffers from, defaults to None
+
+        .. note::
+            the shapes are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
         """
 
         super().__init__()
         self.n_atom = n_atom
-
-        self.register_buffer('weight', torch.ones(B))
-        self.register_buffer('td_error_per_sample', torch.zeros(B))
-        self.register_buffer('loss', torch.zeros(1))
-        # B for reward x fp reward_factor, (B * n_atom) for fp proj_dist, and the same (B * n_atom) for bp grad
-        self.register_buffer('buf', torch.zeros(B + B * n_atom))
-        self.register_buffer('grad_dist', torch.zeros(B, N, n_atom))
+        self.workspace = Workspace(arena=arena)
 
     def forward(self, dist, next_n_dist, action, next_n_action, reward, done, weight,
             gamma: float,
@@ -87,23 +92,29 @@ class DistNStepTD(torch.nn.Module):
             - criterion (:obj:`torch.nn.modules`): loss function criterion, default set to MSELoss(reduction='none')
         """
 
-        assert(dist.is_cuda)
-        assert(next_n_dist.is_cuda)
-        assert(action.is_cuda)
-        assert(next_n_action.is_cuda)
-        assert(reward.is_cuda)
-        assert(done.is_cuda)
+        assert(next_n_dist.device == dist.device)
+        assert(action.device == dist.device)
+        assert(next_n_action.device == dist.device)
+        assert(reward.device == dist.device)
+        assert(done.device == dist.device)
+        B, N, n_atom = dist.shape
+        ws = self.workspace
         if weight is None:
-            weight = self.weight
+            weight = ws.get('weight', (B, ), dist, fill=1.0)
         else:
-            assert(weight.is_cuda)
+            assert(weight.device == dist.device)
 
         batch_size = action.shape[0]
         batch_range = torch.arange(batch_size)
         assert (dist[batch_range, action] > 0.0).all(), ("dist act", dist[batch_range, action], "dist:", dist)
 
+        # B for reward x fp reward_factor, (B * n_atom) for fp proj_dist, and the same (B * n_atom) for bp grad
+        buf = ws.borrow('buf', (B + B * n_atom, ), dist)
         loss, td_err = DistNStepTDFunction.apply(dist, next_n_dist, action, next_n_action, reward, done, weight, gamma, v_min, v_max,
-                self.td_error_per_sample, self.loss, self.buf, self.grad_dist)
+                ws.get('td_error_per_sample', (B, ), dist), ws.get('loss', (1, ), dist),
+                buf, ws.get('grad_dist', (B, N, n_atom), dist), ws)
+        if loss.grad_fn is None:
+            ws.give_back(buf)
 
         return loss, td_err
 
@@ -111,13 +122,15 @@ class DistNStepTD(torch.nn.Module):
 class TDLambdaFunction(torch.autograd.Function):
     @staticmethod
     def forward(ctx, value, reward, weight, gamma, lambda_,
-            loss, grad_buf, grad_value):
+            loss, grad_buf, grad_value, workspace, mode):
         inputs = [value, reward, weight]
         outputs = [loss, grad_buf]
-        hpc_rl_utils.TdLambdaForward(inputs, outputs, gamma, lambda_)
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.TdLambdaForward(inputs, outputs, gamma, lambda_, mode)
 
         ctx.bp_inputs = [grad_buf]
         ctx.bp_outputs = [grad_value]
+        ctx.workspace = workspace
         ctx.gamma = gamma
         ctx.lambda_ = lambda_
 
@@ -130,9 +143,10 @@ class TDLambdaFunction(torch.autograd.Function):
             inputs.append(var)
         outputs = ctx.bp_outputs
 
-        hpc_rl_utils.TdLambdaBackward(inputs, outputs)
+        ctx.backend.TdLambdaBackward(inputs, outputs)
+        ctx.workspace.give_back(ctx.bp_inputs[0])
         grad_value = outputs[0]
-        return grad_value, None, None, None, None, None, None, None
+        return grad_value, None, None, None, None, None, None, None, None, None
 
 
 class TDLambda(torch.nn.Module):
@@ -146,7 +160,7 @@ class TDLambda(torch.nn.Module):
     Interface:
         __init__, forward
     """
-    def __init__(self, T, B):
+    def __init__(self, T, B, arena: WorkspaceArena = None, precision: str = 'float'):
         r"""
         Overview
             initialization of TD(lambda)
@@ -154,13 +168,17 @@ class TDLambda(torch.nn.Module):
         Arguments:
             - T (:obj:`int`): trajectory length
             - B (:obj:`int`): batch size
+            - arena (:obj:`WorkspaceArena` or None): shared arena to borrow scratch buffers from, defaults to None
+            - precision (:obj:`str`): accumulation of the lambda return, 'float', 'kahan' (compensated fp32) or\
+            'double' (float64), the inputs and outputs keep their dtype, defaults to 'float'
+
+        .. note::
+            the shapes are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
         """
 
         super().__init__()
-        self.register_buffer('weight', torch.ones(B))
-        self.register_buffer('loss', torch.zeros(1))
-        self.register_buffer('grad_buf', torch.zeros(T, B))
-        self.register_buffer('grad_value', torch.zeros(T + 1, B))
+        self.workspace = Workspace(arena=arena)
+        self.mode = accumulate_mode(precision)
 
     def forward(self, value, reward, weight = None, gamma: float = 0.9, lambda_: float = 0.8) -> torch.Tensor:
         """
@@ -169,34 +187,103 @@ class TDLambda(torch.nn.Module):
         Arguments:
             - value (:obj:`torch.FloatTensor`): :math:`(T + 1, B)`, the estimation of the state value at step 0 to T
             - reward (:obj:`torch.FloatTensor`): :math:`(T, B)`, the returns from time step 0 to T-1
-            - weight (:obj:`torch.FloatTensor` or None): :math:`(B, )`, the training sample weight
+            - weight (:obj:`torch.FloatTensor` or None): :math:`(T, B)`, the training sample weight
             - gamma (:obj:`float`): constant discount factor gamma, should be in [0, 1], defaults to 0.9
             - lambda (:obj:`float`): constant lambda, should be in [0, 1], defaults to 0.8
         Returns:
             - loss (:obj:`torch.Tensor`): :math:`()`, 0-dim tensor, computed MSE loss, averaged over the batch
         """
-        assert(value.is_cuda)
-        assert(reward.is_cuda)
+        assert(reward.device == value.device)
+        T, B = reward.shape
+        ws = self.workspace
         if weight is None:
-            weight = self.weight
+            weight = ws.get('weight', (T, B), value, fill=1.0)
         else:
-            assert(weight.is_cuda)
+            assert(weight.device == value.device)
 
+        grad_buf = ws.borrow('grad_buf', (T, B), value)
         loss = TDLambdaFunction.apply(value, reward, weight, gamma, lambda_,
-                self.loss, self.grad_buf, self.grad_value)
+                ws.get('loss', (1, ), value), grad_buf, ws.get('grad_value', (T + 1, B), value), ws, self.mode)
+        if loss.grad_fn is None:
+            ws.give_back(grad_buf)
         return loss
 
 
+class LambdaReturnFunction(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, value, reward, gammas, lambdas, gamma, lambda_, mode):
+        inputs = [value, reward, gammas, lambdas]
+        ret = reward.new_empty(reward.shape)
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.LambdaReturnForward(inputs, [ret], gamma, lambda_, mode)
+
+        ctx.save_for_backward(gammas, lambdas)
+        ctx.gamma = gamma
+        ctx.lambda_ = lambda_
+
+        return ret
+
+    @staticmethod
+    def backward(ctx, grad_ret):
+        gammas, lambdas = ctx.saved_tensors
+        T, B = grad_ret.shape
+        grad_value = grad_ret.new_empty((T + 1, B))
+        ctx.backend.LambdaReturnBackward([grad_ret.contiguous(), gammas, lambdas], [grad_value], ctx.gamma, ctx.lambda_)
+        return grad_value, None, None, None, None, None, None
+
+
+def lambda_returns(values, rewards, gammas = 1.0, lambdas = 1.0, precision: str = 'float') -> torch.Tensor:
+    """
+    Overview:
+        Generalized lambda return (trfl.value_ops.generalized_lambda_returns), the one scan shared by TD(lambda),\
+        UPGO and other lambda return style targets, differentiable w.r.t. values
+        ``ret[t] = rewards[t] + gammas[t] * (lambdas[t] * ret[t + 1] + (1 - lambdas[t]) * values[t + 1])``
+    Arguments:
+        - values (:obj:`torch.FloatTensor`): :math:`(T + 1, B)`, estimation of the state value at step 0 to T
+        - rewards (:obj:`torch.FloatTensor`): :math:`(T, B)`, the rewards from time step 0 to T-1
+        - gammas (:obj:`torch.FloatTensor` or :obj:`float`): :math:`(T, B)`, discount factor of each step,\
+        a float is used for all the steps, defaults to 1.0
+        - lambdas (:obj:`torch.FloatTensor` or :obj:`torch.BoolTensor` or :obj:`float`): :math:`(T, B)`, mix of\
+        bootstrapping and further accumulation at each step, lambdas[T - 1] is ignored, defaults to 1.0
+        - precision (:obj:`str`): accumulation of the return, 'float', 'kahan' or 'double', defaults to 'float'
+    Returns:
+        - ret (:obj:`torch.FloatTensor`): :math:`(T, B)`, the lambda return of each step, with the dtype of values
+
+    .. note::
+        gammas and lambdas are treated as constants, and the grad of rewards is not computed.
+    """
+    assert(rewards.device == values.device)
+    T, B = rewards.shape
+    assert(values.shape == (T + 1, B))
+    values = values.contiguous()
+    rewards = rewards.detach().to(values.dtype).contiguous()
+    gamma, lambda_ = 1.0, 1.0
+    if isinstance(gammas, torch.Tensor):
+        assert(gammas.device == values.device and gammas.shape == (T, B))
+        gammas = gammas.detach().to(values.dtype).contiguous()
+    else:
+        gamma, gammas = gammas, values.new_empty(0)
+    if isinstance(lambdas, torch.Tensor):
+        assert(lambdas.device == values.device and lambdas.shape == (T, B))
+        lambdas = lambdas.detach().to(values.dtype).contiguous()
+    else:
+        lambda_, lambdas = lambdas, values.new_empty(0)
+
+    return LambdaReturnFunction.apply(values, rewards, gammas, lambdas, gamma, lambda_, accumulate_mode(precision))
+
+
 class QNStepTDFunction(torch.autograd.Function):
     @staticmethod
     def forward(ctx, q, next_n_q, action, next_n_action, reward, done, weight, gamma,
-            td_err, loss, grad_buf, grad_q):
+            td_err, loss, grad_buf, grad_q, workspace):
         inputs = [q, next_n_q, action, next_n_action, reward, done, weight]
         outputs = [td_err, loss, grad_buf]
-        hpc_rl_utils.QNStepTdForward(inputs, outputs, gamma)
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.QNStepTdForward(inputs, outputs, gamma)
 
         ctx.bp_inputs = [grad_buf, action]
         ctx.bp_outputs = [grad_q]
+        ctx.workspace = workspace
 
         return loss, td_err
 
@@ -207,9 +294,10 @@ class QNStepTDFunction(torch.autograd.Function):
             inputs.append(var)
         outputs = ctx.bp_outputs
 
-        hpc_rl_utils.QNStepTdBackward(inputs, outputs)
+        ctx.backend.QNStepTdBackward(inputs, outputs)
+        ctx.workspace.give_back(ctx.bp_inputs[0])
         grad_q = outputs[0]
-        return grad_q, None, None, None, None, None, None, None, None, None, None, None
+        return grad_q, None, None, None, None, None, None, None, None, None, None, None, None
 
 
 class QNStepTD(torch.nn.Module):
@@ -221,7 +309,7 @@ class QNStepTD(torch.nn.Module):
         __init__, forward
     """
 
-    def __init__(self, T, B, N):
+    def __init__(self, T, B, N, arena: WorkspaceArena = None):
         r"""
         Overview
             initialization of q_nstep_td_error
@@ -230,14 +318,14 @@ class QNStepTD(torch.nn.Module):
             - T (:obj:`int`): trajectory length
             - B (:obj:`int`): batch size
             - N (:obj:`int`): action dim
+            - arena (:obj:`WorkspaceArena` or None): shared arena to borrow scratch buffers from, defaults to None
+
+        .. note::
+            the shapes are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
         """
 
         super().__init__()
-        self.register_buffer('weight', torch.ones(B))
-        self.register_buffer('td_error_per_sample', torch.zeros(B))
-        self.register_buffer('loss', torch.zeros(1))
-        self.register_buffer('grad_buf', torch.zeros(B))
-        self.register_buffer('grad_q', torch.zeros(B, N))
+        self.workspace = Workspace(arena=arena)
 
     def forward(self, q, next_n_q, action, next_n_action, reward, done, weight, gamma: float) -> torch.Tensor:
         """
@@ -260,33 +348,219 @@ class QNStepTD(torch.nn.Module):
             - criterion (:obj:`torch.nn.modules`): loss function criterion, default set to MSELoss(reduction='none')
         """
 
-        assert(q.is_cuda)
-        assert(next_n_q.is_cuda)
-        assert(action.is_cuda)
-        assert(next_n_action.is_cuda)
-        assert(reward.is_cuda)
-        assert(done.is_cuda)
+        assert(next_n_q.device == q.device)
+        assert(action.device == q.device)
+        assert(next_n_action.device == q.device)
+        assert(reward.device == q.device)
+        assert(done.device == q.device)
+        B, N = q.shape
+        ws = self.workspace
         if weight is None:
-            weight = self.weight
+            weight = ws.get('weight', (B, ), q, fill=1.0)
         else:
-            assert(weight.is_cuda)
+            assert(weight.device == q.device)
 
+        grad_buf = ws.borrow('grad_buf', (B, ), q)
         loss, td_err = QNStepTDFunction.apply(q, next_n_q, action, next_n_action, reward, done, weight, gamma,
-                self.td_error_per_sample, self.loss, self.grad_buf, self.grad_q)
+                ws.get('td_error_per_sample', (B, ), q), ws.get('loss', (1, ), q),
+                grad_buf, ws.get('grad_q', (B, N), q), ws)
+        if loss.grad_fn is None:
+            ws.give_back(grad_buf)
+
+        return loss, td_err
+
+
+def nstep_returns(reward, done = None, gamma: float = 0.99, nstep: int = 1, precision: str = 'float'):
+    """
+    Overview:
+        Sliding window nstep returns of a whole trajectory, the nstep target of every step is computed in one\
+        backward scan, so the nstep rewards need not be gathered per sample before QNStepTD and the other nstep\
+        td errors. No autograd state is kept
+    Arguments:
+        - reward (:obj:`torch.FloatTensor`): :math:`(T, B)`
+        - done (:obj:`torch.BoolTensor` or :obj:`torch.FloatTensor` or None): :math:`(T, B)`, whether the episode\
+        ends at this step, then the window is cut there and the step is not bootstrapped, defaults to None
+        - gamma (:obj:`float`): discount factor, defaults to 0.99
+        - nstep (:obj:`int`): window size, defaults to 1
+        - precision (:obj:`str`): accumulation of the window sum, 'float', 'kahan' or 'double', defaults to 'float'
+    Returns:
+        - return_ (:obj:`torch.FloatTensor`): :math:`(T, B)`, sum of gamma^k * reward[t + k] over the window of t
+        - bootstrap_index (:obj:`torch.LongTensor`): :math:`(T, B)`, t + m, the step to bootstrap from, where m is\
+        the window size cut by the end of the episode or of the trajectory, T means the value after the trajectory
+        - bootstrap_discount (:obj:`torch.FloatTensor`): :math:`(T, B)`, gamma^m, or 0 if the episode ends inside\
+        the window
+
+    .. note::
+        The nstep target is return_ + bootstrap_discount * value[bootstrap_index], with value of shape (T + 1, B),\
+        e.g. ``value.gather(0, bootstrap_index)``. The outputs have the dtype of reward.
+    """
+    assert(reward.dim() == 2)
+    reward = reward.detach().contiguous()
+    if done is None:
+        done = reward.new_empty(0)
+    else:
+        assert(done.device == reward.device and done.shape == reward.shape)
+        done = done.detach().to(reward.dtype).contiguous()
+
+    return_ = torch.empty_like(reward)
+    bootstrap_index = torch.empty_like(reward, dtype=torch.long)
+    bootstrap_discount = torch.empty_like(reward)
+    rl_utils_backend(reward).NStepReturnForward([reward, done], [return_, bootstrap_index, bootstrap_discount],
+            gamma, nstep, accumulate_mode(precision))
+
+    return hpc_nstep_return(return_, bootstrap_index, bootstrap_discount)
+
+
+class RetraceFunction(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, q, target_q, action, reward, done, target_prob, behaviour_prob, weight,
+            gamma, lambda_, c_clip_ratio, q_retrace, td_err, loss, grad_buf, grad_q, workspace, mode):
+        inputs = [q, target_q, action, reward, done, target_prob, behaviour_prob, weight]
+        outputs = [q_retrace, td_err, loss, grad_buf]
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.RetraceForward(inputs, outputs, gamma, lambda_, c_clip_ratio, mode)
+
+        ctx.bp_inputs = [grad_buf, action]
+        ctx.bp_outputs = [grad_q]
+        ctx.workspace = workspace
+
+        return loss, td_err
+
+    @staticmethod
+    def backward(ctx, grad_loss, grad_td_err):
+        inputs = [grad_loss]
+        for var in ctx.bp_inputs:
+            inputs.append(var)
+        outputs = ctx.bp_outputs
+
+        ctx.backend.RetraceBackward(inputs, outputs)
+        ctx.workspace.give_back(ctx.bp_inputs[0])
+        grad_q = outputs[0]
+        return grad_q, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
+
+
+class Retrace(torch.nn.Module):
+    """
+    Overview:
+        Retrace(lambda) td_error for off-policy q-learning (arXiv:1606.02647), the retrace target of a (T, B)\
+        trajectory is computed with one backward scan and the q values of the taken actions are regressed to it
+
+    Interface:
+        __init__, forward
+    """
+
+    def __init__(self, T, B, N, arena: WorkspaceArena = None, precision: str = 'float'):
+        r"""
+        Overview
+            initialization of retrace
+
+        Arguments:
+            - T (:obj:`int`): trajectory length
+            - B (:obj:`int`): batch size
+            - N (:obj:`int`): action dim
+            - arena (:obj:`WorkspaceArena` or None): shared arena to borrow scratch buffers from, defaults to None
+            - precision (:obj:`str`): accumulation of the retrace target, 'float', 'kahan' (compensated fp32) or\
+            'double' (float64), the inputs and outputs keep their dtype, defaults to 'float'
+
+        .. note::
+            the shapes are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
+        """
+
+        super().__init__()
+        self.workspace = Workspace(arena=arena)
+        self.mode = accumulate_mode(precision)
+
+    def forward(self, q, target_q, action, reward, target_prob, behaviour_prob, done = None, weight = None,
+            gamma: float = 0.99, lambda_: float = 1.0, c_clip_ratio: float = 1.0):
+        """
+        Overview:
+            forward of retrace
+        Arguments:
+            - q (:obj:`torch.FloatTensor`): :math:`(T, B, N)`, q values of the online network at step 0 to T-1
+            - target_q (:obj:`torch.FloatTensor`): :math:`(T + 1, B, N)`, q values of the target network at step 0 to T
+            - action (:obj:`torch.LongTensor`): :math:`(T, B)`, the action taken
+            - reward (:obj:`torch.FloatTensor`): :math:`(T, B)`
+            - target_prob (:obj:`torch.FloatTensor`): :math:`(T + 1, B, N)`, probs of the target policy at step 0 to T
+            - behaviour_prob (:obj:`torch.FloatTensor` or None): :math:`(T, B, N)`, probs of the behaviour policy,\
+            None means the trace is not cut by the importance ratio, i.e. Q(lambda)
+            - done (:obj:`torch.BoolTensor` or :obj:`torch.FloatTensor` or None): :math:`(T, B)`, whether the episode\
+            ends at this step, then the next step is not bootstrapped, defaults to None
+            - weight (:obj:`torch.FloatTensor` or None): :math:`(T, B)`, the training sample weight
+            - gamma (:obj:`float`): discount factor, defaults to 0.99
+            - lambda_ (:obj:`float`): trace decay, defaults to 1.0
+            - c_clip_ratio (:obj:`float`): clip ratio of the importance ratio in the trace, defaults to 1.0
+        Returns:
+            - loss (:obj:`torch.Tensor`): :math:`()`, 0-dim tensor, weighted square error averaged over T and B
+            - td_error_per_sample (:obj:`torch.Tensor`): :math:`(T, B)`, square error of each step
+
+        .. note::
+            ret[t] = r[t] + gamma * (V(s[t+1]) + c[t+1] * (ret[t+1] - Q'(s[t+1], a[t+1]))), where V is the\
+            expectation of target_q under target_prob and c = lambda * min(c_clip_ratio, pi / mu), the last step\
+            bootstraps from V(s[T]). The target is not differentiable, only q gets the grad.
+        """
+        assert(target_q.device == q.device)
+        assert(action.device == q.device)
+        assert(reward.device == q.device)
+        assert(target_prob.device == q.device)
+        T, B, N = q.shape
+        ws = self.workspace
+        if behaviour_prob is None:
+            behaviour_prob = q.new_empty(0)
+        else:
+            assert(behaviour_prob.device == q.device)
+        if done is None:
+            done = q.new_empty(0)
+        else:
+            assert(done.device == q.device)
+            done = done.float()
+        if weight is None:
+            weight = ws.get('weight', (T, B), q, fill=1.0)
+        else:
+            assert(weight.device == q.device)
+
+        q_retrace = ws.borrow('q_retrace', (T, B), q)
+        grad_buf = ws.borrow('grad_buf', (T, B), q)
+        loss, td_err = RetraceFunction.apply(q, target_q, action, reward, done, target_prob, behaviour_prob, weight,
+                gamma, lambda_, c_clip_ratio, q_retrace, ws.get('td_error_per_sample', (T, B), q),
+                ws.get('loss', (1, ), q), grad_buf, ws.get('grad_q', (T, B, N), q), ws, self.mode)
+        ws.give_back(q_retrace)
+        if loss.grad_fn is None:
+            ws.give_back(grad_buf)
 
         return loss, td_err
 
 
+class QLambda(Retrace):
+    """
+    Overview:
+        Q(lambda) td_error (arXiv:1602.04951), the same as Retrace with the trace coefficient fixed to lambda,\
+        so no behaviour policy is needed
+
+    Interface:
+        __init__, forward
+    """
+
+    def forward(self, q, target_q, action, reward, target_prob, done = None, weight = None,
+            gamma: float = 0.99, lambda_: float = 0.8):
+        """
+        Overview:
+            forward of Q(lambda), the arguments and returns are the same as Retrace without behaviour_prob
+        """
+        return super().forward(q, target_q, action, reward, target_prob, None, done, weight, gamma, lambda_)
+
+
 class QNStepTDRescaleFunction(torch.autograd.Function):
     @staticmethod
     def forward(ctx, q, next_n_q, action, next_n_action, reward, done, weight, gamma,
-            td_err, loss, grad_buf, grad_q):
+            td_err, loss, grad_buf, grad_q, workspace):
         inputs = [q, next_n_q, action, next_n_action, reward, done, weight]
         outputs = [td_err, loss, grad_buf]
-        hpc_rl_utils.QNStepTdRescaleForward(inputs, outputs, gamma)
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.QNStepTdRescaleForward(inputs, outputs, gamma)
 
         ctx.bp_inputs = [grad_buf, action]
         ctx.bp_outputs = [grad_q]
+        ctx.workspace = workspace
 
         return loss, td_err
 
@@ -297,9 +571,10 @@ class QNStepTDRescaleFunction(torch.autograd.Function):
             inputs.append(var)
         outputs = ctx.bp_outputs
 
-        hpc_rl_utils.QNStepTdRescaleBackward(inputs, outputs)
+        ctx.backend.QNStepTdRescaleBackward(inputs, outputs)
+        ctx.workspace.give_back(ctx.bp_inputs[0])
         grad_q = outputs[0]
-        return grad_q, None, None, None, None, None, None, None, None, None, None, None
+        return grad_q, None, None, None, None, None, None, None, None, None, None, None, None
 
 
 class QNStepTDRescale(torch.nn.Module):
@@ -311,7 +586,7 @@ class QNStepTDRescale(torch.nn.Module):
         __init__, forward
     """
 
-    def __init__(self, T, B, N):
+    def __init__(self, T, B, N, arena: WorkspaceArena = None):
         r"""
         Overview
             initialization of q_nstep_td_error_with_rescale
@@ -320,14 +595,14 @@ class QNStepTDRescale(torch.nn.Module):
             - T (:obj:`int`): trajectory length
             - B (:obj:`int`): batch size
             - N (:obj:`int`): action dim
+            - arena (:obj:`WorkspaceArena` or None): shared arena to borrow scratch buffers from, defaults to None
+
+        .. note::
+            the shapes are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
         """
 
         super().__init__()
-        self.register_buffer('weight', torch.ones(B))
-        self.register_buffer('td_error_per_sample', torch.zeros(B))
-        self.register_buffer('loss', torch.zeros(1))
-        self.register_buffer('grad_buf', torch.zeros(B))
-        self.register_buffer('grad_q', torch.zeros(B, N))
+        self.workspace = Workspace(arena=arena)
 
     def forward(self, q, next_n_q, action, next_n_action, reward, done, weight, gamma: float) -> torch.Tensor:
         """
@@ -354,19 +629,24 @@ class QNStepTDRescale(torch.nn.Module):
                 (refer to hpc_rl/origin/td.py)
         """
 
-        assert(q.is_cuda)
-        assert(next_n_q.is_cuda)
-        assert(action.is_cuda)
-        assert(next_n_action.is_cuda)
-        assert(reward.is_cuda)
-        assert(done.is_cuda)
+        assert(next_n_q.device == q.device)
+        assert(action.device == q.device)
+        assert(next_n_action.device == q.device)
+        assert(reward.device == q.device)
+        assert(done.device == q.device)
+        B, N = q.shape
+        ws = self.workspace
         if weight is None:
-            weight = self.weight
+            weight = ws.get('weight', (B, ), q, fill=1.0)
         else:
-            assert(weight.is_cuda)
+            assert(weight.device == q.device)
 
+        grad_buf = ws.borrow('grad_buf', (B, ), q)
         loss, td_err = QNStepTDRescaleFunction.apply(q, next_n_q, action, next_n_action, reward, done, weight, gamma,
-                self.td_error_per_sample, self.loss, self.grad_buf, self.grad_q)
+                ws.get('td_error_per_sample', (B, ), q), ws.get('loss', (1, ), q),
+                grad_buf, ws.get('grad_q', (B, N), q), ws)
+        if loss.grad_fn is None:
+            ws.give_back(grad_buf)
 
         return loss, td_err
 
@@ -374,13 +654,15 @@ class QNStepTDRescale(torch.nn.Module):
 class IQNNStepTDErrorFunction(torch.autograd.Function):
     @staticmethod
     def forward(ctx, q, next_n_q, action, next_n_action, reward, done, replay_quantiles, weight, value_gamma, gamma, kappa,
-            loss, td_err_per_sample, bellman_err_buf, quantile_huber_loss_buf, grad_buf, grad_q):
+            loss, td_err_per_sample, bellman_err_buf, quantile_huber_loss_buf, grad_buf, grad_q, workspace):
         inputs = [q, next_n_q, action, next_n_action, reward, done, replay_quantiles, weight, value_gamma]
         outputs = [loss, td_err_per_sample, bellman_err_buf, quantile_huber_loss_buf, grad_buf]
-        hpc_rl_utils.IQNNStepTDErrorForward(inputs, outputs, gamma, kappa)
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.IQNNStepTDErrorForward(inputs, outputs, gamma, kappa)
 
         ctx.bp_inputs = [grad_buf, weight, action]
         ctx.bp_outputs = [grad_q]
+        ctx.workspace = workspace
 
         return loss, td_err_per_sample
 
@@ -391,9 +673,10 @@ class IQNNStepTDErrorFunction(torch.autograd.Function):
             inputs.append(var)
         outputs = ctx.bp_outputs
 
-        hpc_rl_utils.IQNNStepTDErrorBackward(inputs, outputs)
+        ctx.backend.IQNNStepTDErrorBackward(inputs, outputs)
+        ctx.workspace.give_back(ctx.bp_inputs[0])
         grad_q = outputs[0]
-        return grad_q, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
+        return grad_q, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
 
 
 class IQNNStepTDError(torch.nn.Module):
@@ -407,7 +690,7 @@ class IQNNStepTDError(torch.nn.Module):
         __init__, forward
     """
 
-    def __init__(self, tau, tauPrime, T, B, N):
+    def __init__(self, tau, tauPrime, T, B, N, arena: WorkspaceArena = None):
         r"""
         Overview
             initialization of iqn_nstep_td_error
@@ -419,6 +702,10 @@ class IQNNStepTDError(torch.nn.Module):
             - B (:obj:`int`): batch size
             - N (:obj:`int`): action dim
             - gamma (:obj:`float`): discount factor
+            - arena (:obj:`WorkspaceArena` or None): shared arena to borrow scratch buffers from, defaults to None
+
+        .. note::
+            the shapes are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
         """
 
         super().__init__()
@@ -427,14 +714,7 @@ class IQNNStepTDError(torch.nn.Module):
         self.T = T
         self.B = B
         self.N = N
-        self.register_buffer('weight', torch.ones(B))
-        self.register_buffer('td_error_per_sample', torch.zeros(B))
-        self.register_buffer('loss', torch.zeros(1))
-        self.register_buffer('value_gamma', torch.zeros(B))
-        self.register_buffer('bellman_err_buf', torch.zeros(B, tauPrime, tau))
-        self.register_buffer('quantile_huber_loss_buf', torch.zeros(B, tauPrime, tau))
-        self.register_buffer('grad_buf', torch.zeros(B, tauPrime, tau))
-        self.register_buffer('grad_q', torch.zeros(tau, B, N))
+        self.workspace = Workspace(arena=arena)
 
     def forward(self, q, next_n_q, action, next_n_action, reward, done, replay_quantiles,
             gamma: float, kappa: float = 1.0,
@@ -461,26 +741,36 @@ class IQNNStepTDError(torch.nn.Module):
             - td_error_per_sample (:obj:`torch.Tensor`): :math:`(B, )`, iqn nstep td error per sample
         """
 
-        assert(q.is_cuda)
-        assert(next_n_q.is_cuda)
-        assert(action.is_cuda)
-        assert(next_n_action.is_cuda)
-        assert(reward.is_cuda)
-        assert(done.is_cuda)
-        assert(replay_quantiles.is_cuda)
+        assert(next_n_q.device == q.device)
+        assert(action.device == q.device)
+        assert(next_n_action.device == q.device)
+        assert(reward.device == q.device)
+        assert(done.device == q.device)
+        assert(replay_quantiles.device == q.device)
+        tau, B, N = q.shape
+        tauPrime = next_n_q.shape[0]
+        T = reward.shape[0]
+        ws = self.workspace
         if weight is None:
-            weight = self.weight
+            weight = ws.get('weight', (B, ), q, fill=1.0)
         else:
-            assert(weight.is_cuda)
+            assert(weight.device == q.device)
         if value_gamma is None:
-            self.value_gamma.fill_(gamma ** self.T)
-            value_gamma = self.value_gamma
+            value_gamma = ws.get('value_gamma', (B, ), q, fill=gamma ** T)
         else:
-            assert(value_gamma.is_cuda)
+            assert(value_gamma.device == q.device)
 
+        # the bellman error and huber loss are only used in forward, grad_buf is saved for backward
+        fp_bufs = [ws.borrow('bellman_err_buf', (B, tauPrime, tau), q), ws.borrow('quantile_huber_loss_buf', (B, tauPrime, tau), q)]
+        grad_buf = ws.borrow('grad_buf', (B, tauPrime, tau), q)
         loss, td_err_per_sample = IQNNStepTDErrorFunction.apply(q, next_n_q, action, next_n_action,
                 reward, done, replay_quantiles, weight, value_gamma, gamma, kappa,
-                self.loss, self.td_error_per_sample, self.bellman_err_buf, self.quantile_huber_loss_buf, self.grad_buf, self.grad_q)
+                ws.get('loss', (1, ), q), ws.get('td_error_per_sample', (B, ), q),
+                fp_bufs[0], fp_bufs[1], grad_buf, ws.get('grad_q', (tau, B, N), q), ws)
+
+        ws.give_back(*fp_bufs)
+        if loss.grad_fn is None:
+            ws.give_back(grad_buf)
 
         return loss, td_err_per_sample
 
@@ -488,13 +778,15 @@ class IQNNStepTDError(torch.nn.Module):
 class QRDQNNStepTDErrorFunction(torch.autograd.Function):
     @staticmethod
     def forward(ctx, q, next_n_q, action, next_n_action, reward, done, weight, value_gamma, gamma,
-            loss, td_err_per_sample, bellman_err_buf, quantile_huber_loss_buf, grad_buf, grad_q):
+            loss, td_err_per_sample, bellman_err_buf, quantile_huber_loss_buf, grad_buf, grad_q, workspace):
         inputs = [q, next_n_q, action, next_n_action, reward, done, weight, value_gamma]
         outputs = [loss, td_err_per_sample, bellman_err_buf, quantile_huber_loss_buf, grad_buf]
-        hpc_rl_utils.QRDQNNStepTDErrorForward(inputs, outputs, gamma)
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.QRDQNNStepTDErrorForward(inputs, outputs, gamma)
 
         ctx.bp_inputs = [grad_buf, weight, action]
         ctx.bp_outputs = [grad_q]
+        ctx.workspace = workspace
 
         return loss, td_err_per_sample
 
@@ -505,9 +797,10 @@ class QRDQNNStepTDErrorFunction(torch.autograd.Function):
             inputs.append(var)
         outputs = ctx.bp_outputs
 
-        hpc_rl_utils.QRDQNNStepTDErrorBackward(inputs, outputs)
+        ctx.backend.QRDQNNStepTDErrorBackward(inputs, outputs)
+        ctx.workspace.give_back(ctx.bp_inputs[0])
         grad_q = outputs[0]
-        return grad_q, None, None, None, None, None, None, None, None, None, None, None, None, None, None
+        return grad_q, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
 
 
 class QRDQNNStepTDError(torch.nn.Module):
@@ -519,7 +812,7 @@ class QRDQNNStepTDError(torch.nn.Module):
         __init__, forward
     """
 
-    def __init__(self, tau, T, B, N):
+    def __init__(self, tau, T, B, N, arena: WorkspaceArena = None):
         r"""
         Overview
             initialization of qrdqn_nstep_td_error
@@ -530,6 +823,10 @@ class QRDQNNStepTDError(torch.nn.Module):
             - B (:obj:`int`): batch size
             - N (:obj:`int`): action dim
             - gamma (:obj:`float`): discount factor
+            - arena (:obj:`WorkspaceArena` or None): shared arena to borrow scratch buffers from, defaults to None
+
+        .. note::
+            the shapes are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
         """
 
         super().__init__()
@@ -537,14 +834,7 @@ class QRDQNNStepTDError(torch.nn.Module):
         self.T = T
         self.B = B
         self.N = N
-        self.register_buffer('weight', torch.ones(B))
-        self.register_buffer('td_error_per_sample', torch.zeros(B))
-        self.register_buffer('loss', torch.zeros(1))
-        self.register_buffer('value_gamma', torch.zeros(B))
-        self.register_buffer('bellman_err_buf', torch.zeros(B, tau, tau))
-        self.register_buffer('quantile_huber_loss_buf', torch.zeros(B, tau, tau))
-        self.register_buffer('grad_buf', torch.zeros(B, tau))
-        self.register_buffer('grad_q', torch.zeros(B, N, tau))
+        self.workspace = Workspace(arena=arena)
 
     def forward(self, q, next_n_q, action, next_n_action, reward, done,
             gamma: float,
@@ -569,25 +859,34 @@ class QRDQNNStepTDError(torch.nn.Module):
             - td_error_per_sample (:obj:`torch.Tensor`): :math:`(B, )`, qrdqn nstep td error per sample
         """
 
-        assert(q.is_cuda)
-        assert(next_n_q.is_cuda)
-        assert(action.is_cuda)
-        assert(next_n_action.is_cuda)
-        assert(reward.is_cuda)
-        assert(done.is_cuda)
+        assert(next_n_q.device == q.device)
+        assert(action.device == q.device)
+        assert(next_n_action.device == q.device)
+        assert(reward.device == q.device)
+        assert(done.device == q.device)
+        B, N, tau = q.shape
+        T = reward.shape[0]
+        ws = self.workspace
         if weight is None:
-            weight = self.weight
+            weight = ws.get('weight', (B, ), q, fill=1.0)
         else:
-            assert(weight.is_cuda)
+            assert(weight.device == q.device)
         if value_gamma is None:
-            self.value_gamma.fill_(gamma ** self.T)
-            value_gamma = self.value_gamma
+            value_gamma = ws.get('value_gamma', (B, ), q, fill=gamma ** T)
         else:
-            assert(value_gamma.is_cuda)
+            assert(value_gamma.device == q.device)
 
+        # the bellman error and huber loss are only used in forward, grad_buf is saved for backward
+        fp_bufs = [ws.borrow('bellman_err_buf', (B, tau, tau), q), ws.borrow('quantile_huber_loss_buf', (B, tau, tau), q)]
+        grad_buf = ws.borrow('grad_buf', (B, tau, tau), q)
         loss, td_err_per_sample = QRDQNNStepTDErrorFunction.apply(q, next_n_q, action, next_n_action,
                 reward, done, weight, value_gamma, gamma,
-                self.loss, self.td_error_per_sample, self.bellman_err_buf, self.quantile_huber_loss_buf, self.grad_buf, self.grad_q)
+                ws.get('loss', (1, ), q), ws.get('td_error_per_sample', (B, ), q),
+                fp_bufs[0], fp_bufs[1], grad_buf, ws.get('grad_q', (B, N, tau), q), ws)
+
+        ws.give_back(*fp_bufs)
+        if loss.grad_fn is None:
+            ws.give_back(grad_buf)
 
         return loss, td_err_per_sample
 
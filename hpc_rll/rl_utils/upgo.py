@@ -1,18 +1,21 @@
 import torch
-import hpc_rl_utils
+from hpc_rll.backend import rl_utils_backend, accumulate_mode
+from hpc_rll.workspace import Workspace, WorkspaceArena
 
-# hpc version only support cuda
+# hpc version supports cuda and cpu, the backend is chosen by the device of input tensors
 # 需排除spe2d case
 
 class UpgoFunction(torch.autograd.Function):
     @staticmethod
-    def forward(ctx, target_output, rho, action, reward, value, advantage, metric, loss, grad_buf, grad_target_output):
+    def forward(ctx, target_output, rho, action, reward, value, advantage, metric, loss, grad_buf, grad_target_output, workspace, mode):
         inputs = [target_output, rho, action, reward, value]
         outputs = [advantage, metric, loss, grad_buf]
-        hpc_rl_utils.UpgoForward(inputs, outputs)
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.UpgoForward(inputs, outputs, mode)
 
         ctx.bp_inputs = [grad_buf, advantage]
         ctx.bp_outputs = [grad_target_output]
+        ctx.workspace = workspace
 
         return loss
 
@@ -23,9 +26,10 @@ class UpgoFunction(torch.autograd.Function):
             inputs.append(var)
         outputs = ctx.bp_outputs
 
-        hpc_rl_utils.UpgoBackward(inputs, outputs)
+        ctx.backend.UpgoBackward(inputs, outputs)
+        ctx.workspace.give_back(*ctx.bp_inputs)
         grad_target_output = outputs[0]
-        return grad_target_output, None, None, None, None, None, None, None, None, None
+        return grad_target_output, None, None, None, None, None, None, None, None, None, None, None
 
 class UPGO(torch.nn.Module):
     """
@@ -37,7 +41,7 @@ class UPGO(torch.nn.Module):
         __init__, forward
     """
 
-    def __init__(self, T, B, N):
+    def __init__(self, T, B, N, arena: WorkspaceArena = None, precision: str = 'float'):
         r"""
         Overview
             initialization of UPGO
@@ -46,14 +50,17 @@ class UPGO(torch.nn.Module):
             - T (:obj:`int`): trajectory length
             - B (:obj:`int`): batch size
             - N (:obj:`int`): number of output
+            - arena (:obj:`WorkspaceArena` or None): shared arena to borrow scratch buffers from, defaults to None
+            - precision (:obj:`str`): accumulation of the upgo return, 'float', 'kahan' (compensated fp32) or\
+            'double' (float64), the inputs and outputs keep their dtype, defaults to 'float'
+
+        .. note::
+            T, B and N are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
         """
 
         super().__init__()
-        self.register_buffer('loss', torch.zeros(1))
-        self.register_buffer('advantage', torch.zeros(T, B))
-        self.register_buffer('metric', torch.zeros(T, B))
-        self.register_buffer('grad_buf', torch.zeros(T, B, N))
-        self.register_buffer('grad_target_output', torch.zeros(T, B, N))
+        self.workspace = Workspace(arena=arena)
+        self.mode = accumulate_mode(precision)
 
     def forward(self, target_output, rhos, action, rewards, bootstrap_values):
         """
@@ -68,13 +75,21 @@ class UPGO(torch.nn.Module):
         Returns:
             - loss (:obj:`torch.Tensor`): :math:`()`, 0-dim tensor, Computed importance sampled UPGO loss, averaged over the samples
         """
-        assert(target_output.is_cuda)
-        assert(rhos.is_cuda)
-        assert(action.is_cuda)
-        assert(rewards.is_cuda)
-        assert(bootstrap_values.is_cuda)
+        assert(rhos.device == target_output.device)
+        assert(action.device == target_output.device)
+        assert(rewards.device == target_output.device)
+        assert(bootstrap_values.device == target_output.device)
 
+        T, B, N = target_output.shape
+        ws = self.workspace
+        metric = ws.borrow('metric', (T, B), target_output)
+        bp_bufs = [ws.borrow('grad_buf', (T, B, N), target_output), ws.borrow('advantage', (T, B), target_output)]
         loss = UpgoFunction.apply(target_output, rhos, action, rewards, bootstrap_values,
-                self.advantage, self.metric, self.loss, self.grad_buf, self.grad_target_output)
+                bp_bufs[1], metric, ws.get('loss', (1, ), target_output), bp_bufs[0],
+                ws.get('grad_target_output', (T, B, N), target_output), ws, self.mode)
+
+        ws.give_back(metric)
+        if loss.grad_fn is None:
+            ws.give_back(*bp_bufs)
         return loss
 
@@ -1,31 +1,38 @@
 import torch
 import torch.nn.functional as F
 from collections import namedtuple
-import hpc_rl_utils
+from typing import Optional, List
+from hpc_rll.backend import rl_utils_backend, accumulate_mode
+from hpc_rll.workspace import Workspace, WorkspaceArena
 
-# hpc version only support cuda
+# hpc version supports cuda and cpu, the backend is chosen by the device of input tensors
 
 hpc_vtrace_loss = namedtuple('hpc_vtrace_loss', ['policy_loss', 'value_loss', 'entropy_loss'])
+hpc_vtrace_returns = namedtuple('hpc_vtrace_returns', ['vs', 'pg_advantages'])
 
 class VtraceFunction(torch.autograd.Function):
     @staticmethod
     def forward(ctx, target_output, behaviour_output,
-            action, value, reward, weight, gamma, lambda_, rho_clip_ratio, c_clip_ratio, rho_pg_clip_ratio,
+            action, value, reward, weight, done, discount, gamma, lambda_, rho_clip_ratio, c_clip_ratio, rho_pg_clip_ratio,
             target_output_prob, target_output_entropy,
             target_output_grad_logits, target_output_grad_prob, target_output_grad_entropy, behaviour_output_prob,
-            importance_weights, returns, advantages, pg_loss, value_loss, entropy_loss, grad_value, grad_target_output):
+            importance_weights, returns, advantages, pg_loss, value_loss, entropy_loss, grad_value, grad_target_output, workspace,
+            mode, heads):
 
-        inputs = [target_output, behaviour_output, action, value, reward, weight]
+        inputs = [target_output, behaviour_output, action, value, reward, weight, done, discount]
         outputs = [target_output_prob, target_output_entropy,
             target_output_grad_logits, target_output_grad_prob, target_output_grad_entropy, behaviour_output_prob,
             importance_weights, returns, advantages, pg_loss, value_loss, entropy_loss]
 
-        hpc_rl_utils.VTraceForward(inputs, outputs, gamma, lambda_, rho_clip_ratio, c_clip_ratio, rho_pg_clip_ratio)
+        ctx.backend = rl_utils_backend(inputs[0])
+        ctx.backend.VTraceForward(inputs, outputs, gamma, lambda_, rho_clip_ratio, c_clip_ratio, rho_pg_clip_ratio, mode, heads)
 
         bp_inputs = [value, action, weight, returns, advantages, target_output_grad_logits, target_output_grad_prob, target_output_grad_entropy]
         bp_outputs = [grad_value, grad_target_output]
         ctx.bp_inputs = bp_inputs
         ctx.bp_outputs = bp_outputs
+        ctx.workspace = workspace
+        ctx.heads = heads
 
         return pg_loss, value_loss, entropy_loss
 
@@ -36,11 +43,12 @@ class VtraceFunction(torch.autograd.Function):
             inputs.append(var)
         outputs = ctx.bp_outputs
 
-        hpc_rl_utils.VTraceBackward(inputs, outputs)
+        ctx.backend.VTraceBackward(inputs, outputs, ctx.heads)
+        ctx.workspace.give_back(*ctx.bp_inputs[3:])
 
         grad_value = outputs[0]
         grad_target_output = outputs[1]
-        return grad_target_output, None, None, grad_value, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
+        return grad_target_output, None, None, grad_value, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
 
 class VTrace(torch.nn.Module):
     """
@@ -52,7 +60,8 @@ class VTrace(torch.nn.Module):
         __init__, forward
     """
 
-    def __init__(self, T, B, N):
+    def __init__(self, T, B, N, arena: WorkspaceArena = None, precision: str = 'float',
+            heads: Optional[List[int]] = None):
         r"""
         Overview
             initialization of Vtrace
@@ -61,24 +70,22 @@ class VTrace(torch.nn.Module):
             - T (:obj:`int`): trajectory length
             - B (:obj:`int`): batch size
             - N (:obj:`int`): number of output
+            - arena (:obj:`WorkspaceArena` or None): shared arena to borrow scratch buffers from, defaults to None
+            - precision (:obj:`str`): accumulation of the vtrace return, 'float', 'kahan' (compensated fp32) or\
+            'double' (float64), the inputs and outputs keep their dtype, defaults to 'float'
+            - heads (:obj:`list` or None): sizes of the independent categorical heads of a multi-discrete action\
+            space, the outputs of the heads are concatenated along N, so sum(heads) should be N, defaults to None,\
+            a single head
+
+        .. note::
+            T, B and N are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
         """
 
         super().__init__()
-        self.register_buffer('weight', torch.ones(T, B))
-        self.register_buffer('target_output_prob', torch.zeros(T, B))
-        self.register_buffer('target_output_entropy', torch.zeros(T, B))
-        self.register_buffer('target_output_grad_logits', torch.zeros(T, B, N))
-        self.register_buffer('target_output_grad_prob', torch.zeros(T, B, N))
-        self.register_buffer('target_output_grad_entropy', torch.zeros(T, B, N))
-        self.register_buffer('behaviour_output_prob', torch.zeros(T, B))
-        self.register_buffer('importance_weights', torch.zeros(T, B))
-        self.register_buffer('returns', torch.zeros(T, B))
-        self.register_buffer('advantages', torch.zeros(T, B))
-        self.register_buffer('pg_loss', torch.zeros(1))
-        self.register_buffer('value_loss', torch.zeros(1))
-        self.register_buffer('entropy_loss', torch.zeros(1))
-        self.register_buffer('grad_value', torch.zeros(T + 1, B))
-        self.register_buffer('grad_target_output', torch.zeros(T, B, N))
+        self.workspace = Workspace(arena=arena)
+        self.mode = accumulate_mode(precision)
+        self.heads = [int(h) for h in heads] if heads is not None else []
+        assert all([h > 0 for h in self.heads]), "size of each head should be positive, but get {}".format(self.heads)
 
     def forward(self, target_output, behaviour_output, action, value, reward,
             weight = None,
@@ -86,7 +93,9 @@ class VTrace(torch.nn.Module):
             lambda_: float = 0.95,
             rho_clip_ratio: float = 1.0,
             c_clip_ratio: float = 1.0,
-            rho_pg_clip_ratio: float = 1.0
+            rho_pg_clip_ratio: float = 1.0,
+            done = None,
+            discount = None
             ):
         """
         Overview:
@@ -97,7 +106,7 @@ class VTrace(torch.nn.Module):
             - behaviour_output (:obj:`torch.Tensor`): :math:`(T, B, N)`, the output taking the action by the behaviour policy network,\
                 usually this output is network output logit, which is used to produce the trajectory(actor)
             - action (:obj:`torch.Tensor`): :math:`(T, B)`, the chosen action(index for the discrete action space) in trajectory,\
-                i.e.: behaviour_action
+                i.e.: behaviour_action, :math:`(T, B, H)` with H heads
             - value (:obj:`torch.Tensor`): :math:`(T + 1, B)`, estimation of the state value at step 0 to T
             - reward (:obj:`torch.Tensor`): :math:`(T, B)`, the returns from time step 0 to T-1
             - gamma: (:obj:`float`): the future discount factor, defaults to 0.95
@@ -108,26 +117,117 @@ class VTrace(torch.nn.Module):
                 the baseline targets (vs)
             - rho_pg_clip_ratio (:obj:`float`): the clipping threshold for importance weights (rho) when calculating\
                 the policy gradient advantage
+            - done (:obj:`torch.BoolTensor` or :obj:`torch.FloatTensor` or None): :math:`(T, B)`, whether the episode\
+                ends at this step, then the next value is not bootstrapped and the trace restarts, defaults to None
+            - discount (:obj:`torch.FloatTensor` or None): :math:`(T, B)`, per step discount, which scales gamma,\
+                defaults to None
 
         Returns:
             - trace_loss (:obj:`namedtuple`): the vtrace loss item, all of them are the differentiable 0-dim tensor
+
+        .. note::
+            With heads, the log prob and entropy of a step are the sums over its heads, i.e. the joint ones of
+            independent heads, so the importance weight is the product of the per head ratios.
+
+            The discount of step t is gamma * discount[t] * (1 - done[t]), it is applied to both the bootstrap and the
+            trace, so fixed-length unrolls that cross episode resets can be passed without cutting them.
         """
 
-        assert(target_output.is_cuda)
-        assert(behaviour_output.is_cuda)
-        assert(action.is_cuda)
-        assert(value.is_cuda)
-        assert(reward.is_cuda)
+        assert(behaviour_output.device == target_output.device)
+        assert(action.device == target_output.device)
+        assert(value.device == target_output.device)
+        assert(reward.device == target_output.device)
+        T, B, N = target_output.shape
+        if self.heads:
+            H = len(self.heads)
+            assert sum(self.heads) == N, "sum of heads should be {}, but get {}".format(N, sum(self.heads))
+            assert action.shape == (T, B, H), "action should be ({}, {}, {}), but get {}".format(T, B, H, tuple(action.shape))
+        # action is indexed as a dense buffer by the kernels
+        action = action.contiguous()
+        # one log prob and entropy per head, they are summed in the importance weight and loss kernels
+        prob_shape = (T, B, len(self.heads)) if self.heads else (T, B)
+        ws = self.workspace
         if weight is None:
-            weight = self.weight
+            weight = ws.get('weight', (T, B), target_output, fill=1.0)
+        else:
+            assert(weight.device == target_output.device)
+        if done is None:
+            done = target_output.new_empty(0)
         else:
-            assert(weight.is_cuda)
+            assert(done.device == target_output.device)
+            done = done.float()
+        if discount is None:
+            discount = target_output.new_empty(0)
+        else:
+            assert(discount.device == target_output.device)
+            discount = discount.float()
+
+        # the probs, entropy and importance weights are only used in forward, the others are saved for backward
+        fp_bufs = [ws.borrow('target_output_prob', prob_shape, target_output), ws.borrow('target_output_entropy', prob_shape, target_output),
+                ws.borrow('behaviour_output_prob', prob_shape, target_output), ws.borrow('importance_weights', (T, B), target_output)]
+        bp_bufs = [ws.borrow('returns', (T, B), target_output), ws.borrow('advantages', (T, B), target_output),
+                ws.borrow('target_output_grad_logits', (T, B, N), target_output),
+                ws.borrow('target_output_grad_prob', (T, B, N), target_output),
+                ws.borrow('target_output_grad_entropy', (T, B, N), target_output)]
 
         pg_loss, value_loss, entropy_loss = VtraceFunction.apply(target_output, behaviour_output,
-                action, value, reward, weight, gamma, lambda_, rho_clip_ratio, c_clip_ratio, rho_pg_clip_ratio,
-                self.target_output_prob, self.target_output_entropy,
-                self.target_output_grad_logits, self.target_output_grad_prob, self.target_output_grad_entropy, self.behaviour_output_prob,
-                self.importance_weights, self.returns, self.advantages,
-                self.pg_loss, self.value_loss, self.entropy_loss, self.grad_value, self.grad_target_output)
+                action, value, reward, weight, done, discount, gamma, lambda_, rho_clip_ratio, c_clip_ratio, rho_pg_clip_ratio,
+                fp_bufs[0], fp_bufs[1], bp_bufs[2], bp_bufs[3], bp_bufs[4], fp_bufs[2],
+                fp_bufs[3], bp_bufs[0], bp_bufs[1],
+                ws.get('pg_loss', (1, ), target_output), ws.get('value_loss', (1, ), target_output),
+                ws.get('entropy_loss', (1, ), target_output),
+                ws.get('grad_value', (T + 1, B), target_output), ws.get('grad_target_output', (T, B, N), target_output), ws,
+                self.mode, self.heads)
+
+        ws.give_back(*fp_bufs)
+        if pg_loss.grad_fn is None:
+            ws.give_back(*bp_bufs)
 
         return hpc_vtrace_loss(pg_loss, value_loss, entropy_loss)
+
+
+def vtrace_returns(log_rhos, discounts, rewards, values, bootstrap, lambda_: float = 1.0,
+        rho_clip_ratio: float = 1.0, c_clip_ratio: float = 1.0, rho_pg_clip_ratio: float = 1.0,
+        precision: str = 'float'):
+    """
+    Overview:
+        V-trace targets and policy gradient advantages from log importance weights (arXiv:1802.01561), without\
+        the policy and the loss. It keeps no autograd state, so it can be called under torch.no_grad to build\
+        targets for off-policy or R2D2 style pipelines
+    Arguments:
+        - log_rhos (:obj:`torch.FloatTensor`): :math:`(T, B)`, log(pi(a|x) / mu(a|x)) of the taken actions
+        - discounts (:obj:`torch.FloatTensor` or :obj:`float`): :math:`(T, B)`, discount of each step, which\
+        should already be 0 at the end of an episode, a float is used for all the steps
+        - rewards (:obj:`torch.FloatTensor`): :math:`(T, B)`
+        - values (:obj:`torch.FloatTensor`): :math:`(T, B)`, value estimation of each step
+        - bootstrap (:obj:`torch.FloatTensor`): :math:`(B, )`, value estimation after the last step
+        - lambda_ (:obj:`float`): mix of the importance weighted nstep return and 1 step return, defaults to 1.0
+        - rho_clip_ratio (:obj:`float`): clip ratio of rho in the temporal difference, defaults to 1.0
+        - c_clip_ratio (:obj:`float`): clip ratio of the trace coefficient c, defaults to 1.0
+        - rho_pg_clip_ratio (:obj:`float`): clip ratio of rho in the policy gradient advantage, defaults to 1.0
+        - precision (:obj:`str`): accumulation of the trace, 'float', 'kahan' or 'double', defaults to 'float'
+    Returns:
+        - vs (:obj:`torch.FloatTensor`): :math:`(T, B)`, the v-trace targets
+        - pg_advantages (:obj:`torch.FloatTensor`): :math:`(T, B)`, rho_pg * (r + discount * vs_{t+1} - v)
+
+    .. note::
+        The outputs are new tensors with the dtype of values and never require grad, the inputs are detached.
+    """
+    values = values.detach().contiguous()
+    assert(values.dim() == 2)
+    T, B = values.shape
+    if not isinstance(discounts, torch.Tensor):
+        discounts = torch.full_like(values, discounts)
+    inputs = [log_rhos, discounts, rewards, values, bootstrap]
+    for i, x in enumerate(inputs):
+        assert(x.device == values.device)
+        inputs[i] = x.detach().to(values.dtype).contiguous()
+    assert(inputs[0].shape == (T, B) and inputs[1].shape == (T, B) and inputs[2].shape == (T, B))
+    assert(inputs[4].shape == (B, ))
+
+    vs = torch.empty_like(values)
+    pg_advantages = torch.empty_like(values)
+    rl_utils_backend(values).VTraceReturnsForward(inputs, [vs, pg_advantages], lambda_,
+            rho_clip_ratio, c_clip_ratio, rho_pg_clip_ratio, accumulate_mode(precision))
+
+    return hpc_vtrace_returns(vs, pg_advantages)
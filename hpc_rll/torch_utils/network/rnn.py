@@ -3,25 +3,30 @@ import math
 import torch
 import torch.nn as nn
 
-import hpc_torch_utils_network
-
-# hpc version only support cuda
+from hpc_rll.backend import network_backend
+from hpc_rll.workspace import Workspace, WorkspaceArena
 
 class HPCLSTMFunction(torch.autograd.Function):
     @staticmethod
 
     def forward(ctx, x, wx, wh, bias, ln_gamma, ln_beta, h0, c0, xbuf, hbuf, hn, cn, ifog, ym,
-        ln_in, ln_mean, ln_rstd, dropout_mask, dropout_threshold, dgate, dx, dwx, dwh, dbias, d_ln_gamma, d_ln_beta):
+        ln_in, ln_mean, ln_rstd, dropout_threshold, seed, batch_sizes, dx, dwx, dwh, dbias, d_ln_gamma, d_ln_beta,
+        workspace):
 
         inputs = [x, h0, c0, wx, wh, bias, ln_gamma, ln_beta]
-        outputs = [xbuf, hbuf, hn, cn, ifog, ym, ln_in, ln_mean, ln_rstd, dropout_mask]
-        hpc_torch_utils_network.LstmForward(inputs, outputs, dropout_threshold)
+        outputs = [xbuf, hbuf, hn, cn, ifog, ym, ln_in, ln_mean, ln_rstd]
+        backend = network_backend(x)
+        backend.LstmForward(inputs, outputs, dropout_threshold, seed, batch_sizes)
 
-        bp_inputs = [x, h0, c0, wx, wh, hn, cn, ifog, ym, ln_in, ln_mean, ln_rstd, ln_gamma, dropout_mask]
-        bp_outputs = [dgate, xbuf, hbuf, dx, dwx, dwh, dbias, d_ln_gamma, d_ln_beta]
+        bp_inputs = [x, h0, c0, wx, wh, hn, cn, ifog, ym, ln_in, ln_mean, ln_rstd, ln_gamma]
+        bp_outputs = [xbuf, hbuf, dx, dwx, dwh, dbias, d_ln_gamma, d_ln_beta]
         ctx.bp_inputs = bp_inputs
         ctx.bp_outputs = bp_outputs
         ctx.dropout_threshold = dropout_threshold
+        ctx.seed = seed
+        ctx.batch_sizes = batch_sizes
+        ctx.backend = backend
+        ctx.workspace = workspace
 
         seq_len = x.size(0)
         num_layers = h0.size(0)
@@ -33,13 +38,21 @@ class HPCLSTMFunction(torch.autograd.Function):
     @staticmethod
     def backward(ctx, dy, dh, dc):
         inputs = ctx.bp_inputs
-        outputs = ctx.bp_outputs
-        outputs.append(dy)
+        x, h0 = inputs[0], inputs[1]
+        seq_len, batch_size = x.size(0), x.size(1)
+        num_layers, hidden_size = h0.size(0), h0.size(2)
+        # dgate is only used in backward, so it is not borrowed until now
+        dgate = ctx.workspace.borrow('dgate', (num_layers, seq_len, batch_size, hidden_size * 4), x)
+        outputs = [dgate] + ctx.bp_outputs
+        # dy is used as scratch of the gradient of each layer's output
+        outputs.append(dy.contiguous())
         outputs.append(dh)
         outputs.append(dc)
         dropout_threshold = ctx.dropout_threshold
 
-        hpc_torch_utils_network.LstmBackward(inputs, outputs, dropout_threshold)
+        ctx.backend.LstmBackward(inputs, outputs, dropout_threshold, ctx.seed, ctx.batch_sizes)
+        # xbuf, hbuf, ifog, ln_in, ln_mean and ln_rstd
+        ctx.workspace.give_back(dgate, outputs[1], outputs[2], inputs[7], *inputs[9:12])
 
         dx = outputs[3]
         dwx = outputs[4]
@@ -47,7 +60,7 @@ class HPCLSTMFunction(torch.autograd.Function):
         dbias = outputs[6]
         d_ln_gamma = outputs[7]
         d_ln_beta = outputs[8]
-        return dx, dwx, dwh, dbias, d_ln_gamma, d_ln_beta, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
+        return dx, dwx, dwh, dbias, d_ln_gamma, d_ln_beta, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
 
 class LSTM(nn.Module):
     r"""
@@ -58,9 +71,10 @@ class LSTM(nn.Module):
             for begainners, you can reference <https://zhuanlan.zhihu.com/p/32085405> to learn the basics about lstm
 
     Interface:
-        __init__, forward
+        __init__, forward, step, reset_state
     """
-    def __init__(self, seq_len, batch_size, input_size, hidden_size, num_layers = 1, norm_type='LN', dropout=0.0):
+    def __init__(self, seq_len, batch_size, input_size, hidden_size, num_layers = 1, norm_type='LN', dropout=0.0,
+            arena: WorkspaceArena = None):
         r"""
         Overview:
             initializate the LSTM cell
@@ -72,7 +86,18 @@ class LSTM(nn.Module):
             - hidden_size (:obj:`int`): size of the hidden state vector
             - num_layers (:obj:`int`): number of lstm layers
             - norm_type (:obj:`str`): type of the normaliztion, (default: LN)
-            - dropout (:obj:float):  dropout rate, default set to .0
+            - dropout (:obj:float):  dropout rate, default set to .0. The dropout masks are generated by a counter-based\
+            rng from a seed drawn from the torch generator, so they are reproducible with torch.manual_seed and are\
+            regenerated in backward instead of being stored. Dropout is only applied in training mode
+            - arena (:obj:`WorkspaceArena` or None): shared arena to borrow scratch buffers from, defaults to None
+
+        .. note::
+            seq_len and batch_size are kept for compatibility, the workspace is sized by the inputs, so other shapes\
+            are accepted
+
+        .. note::
+            when grad is disabled (e.g. under torch.no_grad) and dropout is not applied, forward runs in inference\
+            mode, which saves no activation for backward and only uses the per layer projection buffers
         """
         super().__init__()
 
@@ -117,29 +142,18 @@ class LSTM(nn.Module):
         # Note: only use to validation
         #self.load_params()
 
-        # init buffers
+        # init buffers, the ones depend on seq_len and batch_size are in the workspace
+        self.workspace = Workspace(arena=arena)
 
-        self.register_buffer('xbuf', torch.zeros(seq_len, batch_size, hidden_size * 4))
-        self.register_buffer('hbuf', torch.zeros(batch_size, hidden_size * 4))
-        self.register_buffer('ifog', torch.zeros(num_layers, seq_len, batch_size, hidden_size * 4))
-        self.register_buffer('hn', torch.zeros(seq_len, num_layers, batch_size, hidden_size))
-        self.register_buffer('cn', torch.zeros(seq_len, num_layers, batch_size, hidden_size))
-        self.register_buffer('ym', torch.zeros(num_layers, seq_len, batch_size, hidden_size))
-
-        self.register_buffer('ln_in', torch.zeros(num_layers, seq_len, batch_size, hidden_size * 4 * 2))
-        self.register_buffer('ln_mean', torch.zeros(num_layers, seq_len, batch_size, batch_size * 2))
-        self.register_buffer('ln_rstd', torch.zeros(num_layers, seq_len, batch_size * 2))
-
-        self.register_buffer('dropout_mask', torch.zeros((num_layers - 1, seq_len, batch_size, hidden_size), dtype=torch.int32))
-
-        self.register_buffer('dgate', torch.zeros(num_layers, seq_len, batch_size, hidden_size * 4))
-        self.register_buffer('dx', torch.zeros(seq_len, batch_size, input_size))
         self.register_buffer('dwx', torch.zeros_like(self.wx))
         self.register_buffer('dwh', torch.zeros_like(self.wh))
         self.register_buffer('dbias', torch.zeros_like(self.bias))
         self.register_buffer('d_ln_gamma', torch.zeros_like(self.ln_gamma))
         self.register_buffer('d_ln_beta', torch.zeros_like(self.ln_beta))
 
+        # h and c kept between the calls of step, both are (num_layers, batch_size, hidden_size)
+        self.state = None
+
 
     def load_params(self):
         input_dict = torch.load('origin.input')
@@ -151,34 +165,158 @@ class LSTM(nn.Module):
         self.bias.data.copy_(bias.data)
 
 
-    def forward(self, inputs, prev_state):
+    def forward(self, inputs, prev_state, lengths=None):
         r"""
         Overview:
             Take the previous state and the input and calculate the output and the nextstate
         Arguments:
             - inputs (:obj:`tensor`): :math: `(seq_len, batch_size, input_size)`, input vector of cell
             - prev_state (:obj:`tensor`): None or two tensors of :math: `(num_layers, batch_size, hidden_size)`, for h0 and c0
+            - lengths (:obj:`tensor` or :obj:`list`): None or :math: `(batch_size, )`, length of each sequence, the\
+            timesteps after the end of a sequence are padding, which are skipped instead of computed
         Returns:
-            - output (:obj:`tensor`): :math: `(seq_len, batch_size, hidden_size)`, output from lstm
-            - next_state (:obj:`tensor`): two tensors of :math: `(num_layers, batch_size, hidden_size)`, hidden state from lstm
+            - output (:obj:`tensor`): :math: `(seq_len, batch_size, hidden_size)`, output from lstm, it is zero at\
+            the padding timesteps
+            - next_state (:obj:`tensor`): two tensors of :math: `(num_layers, batch_size, hidden_size)`, hidden state from lstm,\
+            it is the state of the last valid timestep of each sequence
         """
+        if lengths is not None:
+            return self._forward_lengths(inputs, prev_state, lengths)
+        return self._forward(inputs, prev_state, [])
+
+    def _forward_lengths(self, inputs, prev_state, lengths):
+        # the kernels shrink the batch to the samples still active at each timestep, which needs the samples to be
+        # sorted by length in descending order, the same as torch.nn.utils.rnn.pack_padded_sequence
+        seq_len, batch_size = inputs.shape[:2]
+        lengths = torch.as_tensor(lengths, dtype=torch.long).cpu().view(-1)
+        assert lengths.numel() == batch_size, "lengths should have batch_size elements"
+        assert lengths.min() >= 0 and lengths.max() <= seq_len, "lengths should be in [0, seq_len]"
+        order = None
+        if batch_size > 1 and (lengths[1:] > lengths[:-1]).any():
+            lengths, order = torch.sort(lengths, descending=True, stable=True)
+            order = order.to(inputs.device)
+            inputs = inputs.index_select(1, order)
+            if prev_state is not None:
+                prev_state = [s.index_select(1, order) for s in prev_state]
+        batch_sizes = (lengths.view(1, -1) > torch.arange(seq_len).view(-1, 1)).sum(dim=1).tolist()
+
+        output, next_state = self._forward(inputs, prev_state, batch_sizes)
+        if order is not None:
+            inverse = torch.empty_like(order)
+            inverse[order] = torch.arange(batch_size, device=order.device)
+            output = output.index_select(1, inverse)
+            next_state = [s.index_select(1, inverse) for s in next_state]
+        return output, next_state
 
-        assert(inputs.is_cuda)
-
+    def _forward(self, inputs, prev_state, batch_sizes):
+        seq_len, batch_size, input_size = inputs.shape
+        num_layers = self.num_layers
+        hidden_size = self.hidden_size
         if prev_state is None:
             num_directions = 1
-            zeros = torch.zeros(num_directions * self.num_layers, self.batch_size, self.hidden_size, dtype=inputs.dtype, device=inputs.device)
+            zeros = torch.zeros(num_directions * num_layers, batch_size, hidden_size, dtype=inputs.dtype, device=inputs.device)
             prev_state = (zeros, zeros)
 
         h0, c0 = prev_state
-        assert(h0.is_cuda)
-        assert(c0.is_cuda)
+        assert h0.device == inputs.device and c0.device == inputs.device
+        # the kernels index the raw memory, and the recurrence is kept in float, so half or bfloat16 inputs from an
+        # autocast region are converted at the boundary and the outputs are converted back
+        dtype = inputs.dtype
+        inputs, h0, c0 = inputs.float().contiguous(), h0.float().contiguous(), c0.float().contiguous()
+
+        ws = self.workspace
+        dropout = self.dropout if self.training else 0.
+        if not torch.is_grad_enabled() and dropout == 0:
+            h = ws.get('h', (num_layers, batch_size, hidden_size), inputs)
+            c = ws.get('c', (num_layers, batch_size, hidden_size), inputs)
+            h.copy_(h0)
+            c.copy_(c0)
+            output = self._inference(inputs, h, c, batch_sizes)
+            return output.to(dtype), [h.to(dtype), c.to(dtype)]
+
+        # hn, cn and ym are viewed by the outputs, so they are owned by the module, the others are scratch saved for
+        # backward. hbuf is per layer, since the layers of different timesteps run concurrently
+        hn = ws.get('hn', (seq_len, num_layers, batch_size, hidden_size), inputs)
+        cn = ws.get('cn', (seq_len, num_layers, batch_size, hidden_size), inputs)
+        ym = ws.get('ym', (num_layers, seq_len, batch_size, hidden_size), inputs)
+        dx = ws.get('dx', (seq_len, batch_size, input_size), inputs)
+        bp_bufs = [ws.borrow('xbuf', (seq_len, batch_size, hidden_size * 4), inputs),
+                ws.borrow('hbuf', (num_layers, batch_size, hidden_size * 4), inputs),
+                ws.borrow('ifog', (num_layers, seq_len, batch_size, hidden_size * 4), inputs),
+                ws.borrow('ln_in', (num_layers, seq_len, batch_size, hidden_size * 4 * 2), inputs),
+                ws.borrow('ln_mean', (num_layers, seq_len, batch_size * 2), inputs),
+                ws.borrow('ln_rstd', (num_layers, seq_len, batch_size * 2), inputs)]
+        xbuf, hbuf, ifog, ln_in, ln_mean, ln_rstd = bp_bufs
+        seed = int(torch.randint(2 ** 62, (1, ))) if dropout > 0 else 0
 
         y, h, c = HPCLSTMFunction.apply(inputs, self.wx, self.wh, self.bias, self.ln_gamma, self.ln_beta, h0, c0,
-                self.xbuf, self.hbuf, self.hn, self.cn, self.ifog, self.ym,
-                self.ln_in, self.ln_mean, self.ln_rstd, self.dropout_mask, self.dropout,
-                self.dgate, self.dx, self.dwx, self.dwh, self.dbias, self.d_ln_gamma, self.d_ln_beta)
-        output = y
-        next_state = [h, c]
+                xbuf, hbuf, hn, cn, ifog, ym, ln_in, ln_mean, ln_rstd, dropout, seed, batch_sizes,
+                dx, self.dwx, self.dwh, self.dbias, self.d_ln_gamma, self.d_ln_beta, ws)
+        if y.grad_fn is None:
+            ws.give_back(*bp_bufs)
+        output = y.to(dtype)
+        next_state = [h.to(dtype), c.to(dtype)]
         return output, next_state
 
+    def _inference(self, inputs, h, c, batch_sizes):
+        # h and c hold the initial state and are updated in place to the final state
+        seq_len, batch_size, _ = inputs.shape
+        ws = self.workspace
+        y = ws.get('y', (seq_len, batch_size, self.hidden_size), inputs)
+        xbuf = ws.borrow('xbuf', (seq_len, batch_size, self.hidden_size * 4), inputs)
+        hbuf = ws.borrow('hbuf', (batch_size, self.hidden_size * 4), inputs)
+        inputs = [inputs.contiguous(), self.wx, self.wh, self.bias, self.ln_gamma, self.ln_beta]
+        outputs = [h, c, y, xbuf, hbuf]
+        network_backend(h).LstmInferenceForward(inputs, outputs, batch_sizes)
+        ws.give_back(xbuf, hbuf)
+        return y
+
+    @torch.no_grad()
+    def step(self, inputs, done=None):
+        r"""
+        Overview:
+            Stateful inference of one timestep for actors, h and c are kept in the module (``self.state``) and \
+            updated in place, no activation is saved for backward. Dropout is not applied
+        Arguments:
+            - inputs (:obj:`tensor`): :math: `(batch_size, input_size)`, input vector of this timestep
+            - done (:obj:`tensor` or None): :math: `(batch_size, )`, if not None, the state of the samples whose done\
+            is True is reset to zeros before this timestep, i.e. they start new episodes
+        Returns:
+            - output (:obj:`tensor`): :math: `(batch_size, hidden_size)`, output of the last layer, it is overwritten\
+            by the next call
+        """
+        batch_size = inputs.size(0)
+        if self.state is None or self.state[0].size(1) != batch_size or self.state[0].device != inputs.device:
+            self.reset_state(batch_size, inputs.device)
+        elif done is not None:
+            self.reset_state(done=done)
+        h, c = self.state
+        output = self._inference(inputs.float().unsqueeze(0), h, c, [])
+        return output[0].to(inputs.dtype)
+
+    def reset_state(self, batch_size=None, device=None, done=None):
+        r"""
+        Overview:
+            Reset the state used by step to zeros
+        Arguments:
+            - batch_size (:obj:`int` or None): if not None, the state is resized to this batch size
+            - device (:obj:`torch.device` or None): device of the resized state, defaults to the device of wx
+            - done (:obj:`tensor` or None): :math: `(batch_size, )`, if not None, only the samples whose done is True\
+            are reset
+        """
+        if batch_size is not None:
+            device = self.wx.device if device is None else device
+            like = self.wx.new_empty(0, device=device)
+            h = self.workspace.get('state_h', (self.num_layers, batch_size, self.hidden_size), like)
+            c = self.workspace.get('state_c', (self.num_layers, batch_size, self.hidden_size), like)
+            self.state = (h, c)
+        if self.state is None:
+            return
+        h, c = self.state
+        if done is None:
+            h.zero_()
+            c.zero_()
+        else:
+            keep = (~done.bool()).to(h.dtype).view(1, -1, 1)
+            h.mul_(keep)
+            c.mul_(keep)
@@ -1,6 +1,7 @@
 import torch
 from typing import Tuple
 import hpc_torch_utils_network
+from hpc_rll.workspace import Workspace
 
 # hpc version only support cuda
 
@@ -51,6 +52,9 @@ class ScatterConnection(torch.nn.Module):
             - W (:obj:`int`): width of spatial feature
             - scatter_type (:obj:`str`): add or cover, if two entities have same location, scatter type decides the
                 first one should be covered or added to second one
+
+        .. note::
+            B, M and N are kept for compatibility, the workspace is sized by the inputs, so other shapes are accepted
         """
 
         super().__init__()
@@ -62,8 +66,7 @@ class ScatterConnection(torch.nn.Module):
         self.scatter_type = scatter_type
         assert self.scatter_type in ['cover', 'add']
 
-        self.register_buffer('output', torch.zeros(B, N, H, W))
-        self.register_buffer('grad_in', torch.zeros(B, M, N))
+        self.workspace = Workspace()
 
     def forward(self, x: torch.Tensor, location: torch.Tensor) -> torch.Tensor:
         """
@@ -83,6 +86,9 @@ class ScatterConnection(torch.nn.Module):
         assert(x.is_cuda)
         assert(location.is_cuda)
 
-        output = ScatterConnectionFunction.apply(x, location, self.output, self.grad_in, self.scatter_type)
+        B, M, N = x.shape
+        output = self.workspace.get('output', (B, N, self.H, self.W), x)
+        grad_in = self.workspace.get('grad_in', (B, M, N), x)
+        output = ScatterConnectionFunction.apply(x, location, output, grad_in, self.scatter_type)
         return output
 
@@ -0,0 +1,180 @@
+import torch
+
+# hpc modules keep their intermediate and gradient buffers in a Workspace, the buffers are sized by the input
+# tensors of each call instead of the shape given in __init__, so one module instance serves all batch sizes.
+# Scratch buffers can optionally be borrowed from a WorkspaceArena shared by several modules, then they only live
+# from forward to backward instead of the whole lifetime of the module.
+
+
+class WorkspaceArena(object):
+    r"""
+    Overview:
+        pool of scratch storages shared by hpc modules. A module borrows its scratch buffers in forward and gives
+        them back when they are not used any more (the end of forward, or the end of backward for the buffers saved
+        for backward), so the modules of a learner reuse the same memory instead of each keeping its own.
+
+        .. note::
+            the content of a borrowed buffer is undefined. Backward of a module which borrows from an arena can only
+            be called once, because the saved buffers are given back after it.
+
+    Interface:
+        __init__, acquire, release, nbytes, clear
+    """
+
+    def __init__(self):
+        self._free = {}
+        # storages lent by acquire, keyed by their data pointer, so release gets back the same tensor
+        self._lent = {}
+
+    def acquire(self, numel, device, dtype=torch.float32) -> torch.Tensor:
+        r"""
+        Overview:
+            take the smallest free storage which has at least numel elements, allocate one if there is no such storage
+        Returns:
+            - storage (:obj:`torch.Tensor`): 1-dim tensor whose size is at least numel
+        """
+        pool = self._free.setdefault((torch.device(device), dtype), [])
+        best = None
+        for i, storage in enumerate(pool):
+            if storage.numel() >= numel and (best is None or storage.numel() < pool[best].numel()):
+                best = i
+        if best is not None:
+            storage = pool.pop(best)
+        else:
+            # none is large enough, drop the largest one so the pool does not keep too small storages forever
+            if len(pool) > 0:
+                pool.remove(max(pool, key=lambda x: x.numel()))
+            storage = torch.empty(numel, dtype=dtype, device=device)
+        self._lent[storage.data_ptr()] = storage
+        return storage
+
+    def release(self, buf: torch.Tensor) -> None:
+        r"""
+        Overview:
+            give back a buffer got from acquire (or a view of it), its whole storage becomes free
+        """
+        # untyped_storage only exists since torch 2.0, storage is the same pointer on the older versions
+        data_ptr = buf.untyped_storage().data_ptr() if hasattr(buf, 'untyped_storage') else buf.storage().data_ptr()
+        storage = self._lent.pop(data_ptr, None)
+        if storage is not None:
+            self._free.setdefault((storage.device, storage.dtype), []).append(storage)
+
+    def nbytes(self) -> int:
+        r"""
+        Overview:
+            total bytes of the free storages kept by the arena
+        """
+        return sum([s.numel() * s.element_size() for pool in self._free.values() for s in pool])
+
+    def clear(self) -> None:
+        r"""
+        Overview:
+            release all the free storages
+        """
+        self._free.clear()
+
+
+class Workspace(object):
+    r"""
+    Overview:
+        named scratch buffers of a hpc module. Each buffer is a flat storage viewed as the requested shape, it is
+        allocated lazily on the device of the inputs, grows geometrically when a larger shape comes and is reused
+        by smaller shapes, so changing the batch size does not reallocate memory every call.
+
+        .. note::
+            the content of a buffer is kept between calls, the same as a registered buffer, so it should be fully
+            written by the kernel which owns it. Buffers requested with ``fill`` are constant inputs (e.g. the
+            default weight) and must not be written.
+
+    Interface:
+        __init__, get, borrow, give_back, nbytes, clear
+    """
+
+    def __init__(self, growth: float = 2.0, arena: WorkspaceArena = None):
+        r"""
+        Overview:
+            initialization of workspace
+
+        Arguments:
+            - growth (:obj:`float`): the storage is enlarged to at least growth times of its old size when \
+            it is too small, should be >= 1.0
+            - arena (:obj:`WorkspaceArena` or None): if not None, scratch buffers are borrowed from it, defaults to None
+        """
+        assert growth >= 1.0, "growth should be >= 1.0, but get value: {}".format(growth)
+        self.growth = growth
+        self.arena = arena
+        self._storage = {}
+        self._fill = {}
+
+    def get(self, name, shape, like, dtype=torch.float32, fill=None) -> torch.Tensor:
+        r"""
+        Overview:
+            get the buffer called name with the given shape, on the device of like
+        Arguments:
+            - name (:obj:`str`): name of the buffer
+            - shape (:obj:`tuple`): shape of the buffer
+            - like (:obj:`torch.Tensor`): the buffer is put on the same device as like
+            - dtype (:obj:`torch.dtype`): data type of the buffer, defaults to torch.float32
+            - fill (:obj:`float` or None): if not None, the buffer is filled with this value
+        Returns:
+            - buf (:obj:`torch.Tensor`): contiguous view of the storage
+        """
+        numel = 1
+        for s in shape:
+            numel *= s
+        storage = self._storage.get(name)
+        if storage is not None and (storage.device != like.device or storage.dtype != dtype):
+            storage = None
+        if storage is None or storage.numel() < numel:
+            capacity = numel if storage is None else max(numel, int(storage.numel() * self.growth))
+            storage = torch.zeros(capacity, dtype=dtype, device=like.device)
+            self._storage[name] = storage
+            self._fill.pop(name, None)
+        if fill is not None and self._fill.get(name) != fill:
+            storage.fill_(fill)
+            self._fill[name] = fill
+        return storage[:numel].view(shape)
+
+    def borrow(self, name, shape, like, dtype=torch.float32) -> torch.Tensor:
+        r"""
+        Overview:
+            get a scratch buffer, which is borrowed from the arena if there is one, otherwise it is the same as get
+        Arguments:
+            - name (:obj:`str`): name of the buffer, only used without arena
+            - shape (:obj:`tuple`): shape of the buffer
+            - like (:obj:`torch.Tensor`): the buffer is put on the same device as like
+            - dtype (:obj:`torch.dtype`): data type of the buffer, defaults to torch.float32
+        Returns:
+            - buf (:obj:`torch.Tensor`): contiguous scratch buffer, should be given back by give_back
+        """
+        if self.arena is None:
+            return self.get(name, shape, like, dtype)
+        numel = 1
+        for s in shape:
+            numel *= s
+        return self.arena.acquire(numel, like.device, dtype)[:numel].view(shape)
+
+    def give_back(self, *bufs) -> None:
+        r"""
+        Overview:
+            give back the scratch buffers got from borrow, it does nothing without arena
+        """
+        if self.arena is None:
+            return
+        for buf in bufs:
+            self.arena.release(buf)
+
+    def nbytes(self) -> int:
+        r"""
+        Overview:
+            total bytes allocated by the workspace, the buffers borrowed from the arena are not included
+        """
+        return sum([s.numel() * s.element_size() for s in self._storage.values()])
+
+    def clear(self) -> None:
+        r"""
+        Overview:
+            release all the buffers, they will be allocated again by the next call
+        """
+        self._storage.clear()
+        self._fill.clear()
@@ -0,0 +1,77 @@
+#ifndef HPC_RLL_CPU_ACCUMULATE_H_
+#define HPC_RLL_CPU_ACCUMULATE_H_
+
+#include "hpc/rll/cpu/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// accumulation modes of the long recursions (discounted returns and advantages over T steps),
+// the storage of the inputs and outputs is not changed, only the carried sum
+enum AccumulateMode {
+    ACCUMULATE_FLOAT = 0,   // plain recursion in the compute type of the inputs
+    ACCUMULATE_KAHAN = 1,   // compensated recursion, the rounding error is carried in a second term
+    ACCUMULATE_DOUBLE = 2,  // recursion in double
+};
+
+// rounding error of p = a * b, exact for float since the product fits in a double
+inline float productError(float a, float b, float p) {
+    return (float)((double)a * b - p);
+}
+
+inline double productError(double a, double b, double p) {
+    return std::fma(a, b, -p);
+}
+
+// s = a * s + b in T
+template <typename T>
+struct Accumulator {
+    using type = T;
+    T s = 0;
+
+    inline void mulAdd(T a, T b) { s = a * s + b; }
+    inline void reset(T v) { s = v; }
+    inline T value() const { return s; }
+};
+
+// s = a * s + b, the rounding error of the product and of the sum (by two-sum) is carried in c, i.e. a
+// compensated horner step, so the result is about as accurate as the recursion done in twice the precision.
+// the error terms are only right without fma contraction or reassociation, setup.py builds with -ffp-contract=off
+#ifdef __FAST_MATH__
+#error "KahanAccumulator is broken by -ffast-math, build the cpu extensions without it"
+#endif
+template <typename T>
+struct KahanAccumulator {
+    using type = T;
+    T s = 0;
+    T c = 0;
+
+    inline void mulAdd(T a, T b) {
+        T p = a * s;
+        T pe = productError(a, s, p);
+        T sum = p + b;
+        T z = sum - p;
+        T se = (p - (sum - z)) + (b - z);
+        c = a * c + (pe + se);
+        s = sum;
+    }
+    inline void reset(T v) { s = v; c = 0; }
+    inline T value() const { return s + c; }
+};
+
+// call f(acc) with a zero accumulator of the mode, T is the compute type of the float and kahan modes
+template <typename T, typename F>
+inline void dispatchAccumulateMode(int mode, const F& f) {
+    switch (mode) {
+        case ACCUMULATE_KAHAN: f(KahanAccumulator<T>()); break;
+        case ACCUMULATE_DOUBLE: f(Accumulator<double>()); break;
+        default: f(Accumulator<T>());
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_ACCUMULATE_H_
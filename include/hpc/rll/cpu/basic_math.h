@@ -0,0 +1,31 @@
+#ifndef HPC_RLL_CPU_BASIC_MATH_H_
+#define HPC_RLL_CPU_BASIC_MATH_H_
+
+#include <float.h>
+#include <math.h>
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+template<typename T>
+inline T clamp(T in, T min, T max)  {
+    if (in < min)
+        return min;
+    else if (in <= max)
+        return in;
+    else
+        return max;
+}
+
+template<typename T>
+inline T sigmoid(T in)  {
+    T one = static_cast<T>(1.0);
+    return one / (one + std::exp(-in));
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_BASIC_MATH_H_
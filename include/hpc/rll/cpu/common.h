@@ -0,0 +1,36 @@
+#ifndef HPC_RLL_CPU_COMMON_H_
+#define HPC_RLL_CPU_COMMON_H_
+
+#include <float.h>
+#include <math.h>
+#include <vector>
+#include <algorithm>
+
+#include <torch/types.h>
+#include <ATen/Parallel.h>
+#include <ATen/Dispatch.h>
+#include <ATen/OpMathType.h>
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+#define CHECK_CPU(x) TORCH_CHECK(!x.is_cuda(), #x " must be a CPU tensor")
+
+const float CPU_FLOAT_INF_POS = FLT_MAX;
+const float CPU_FLOAT_INF_NEG = -FLT_MAX;
+
+// keep the same epsilon as the cuda version
+const float EPSILON = 1e-5;
+
+// number of work items handled by one task of at::parallel_for,
+// so that each task touches about at::internal::GRAIN_SIZE elements
+inline int64_t GetGrainSize(int64_t work_per_item) {
+    return std::max<int64_t>(1, at::internal::GRAIN_SIZE / std::max<int64_t>(1, work_per_item));
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_COMMON_H_
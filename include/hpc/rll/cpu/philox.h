@@ -0,0 +1,43 @@
+#ifndef HPC_RLL_CPU_PHILOX_H_
+#define HPC_RLL_CPU_PHILOX_H_
+
+#include <stdint.h>
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// Philox4x32-10 counter-based random number generator, the same as hpc/rll/cuda/philox.h,
+// so the cpu and cuda versions produce the same random numbers for the same (counter, key)
+
+inline void philoxRound(uint32_t* ctr, const uint32_t* key) {
+    const uint64_t p0 = (uint64_t)0xD2511F53 * ctr[0];
+    const uint64_t p1 = (uint64_t)0xCD9E8D57 * ctr[2];
+    const uint32_t c1 = ctr[1];
+    const uint32_t c3 = ctr[3];
+    ctr[0] = (uint32_t)(p1 >> 32) ^ c1 ^ key[0];
+    ctr[1] = (uint32_t)p1;
+    ctr[2] = (uint32_t)(p0 >> 32) ^ c3 ^ key[1];
+    ctr[3] = (uint32_t)p0;
+}
+
+// 4 random uint32 for the counter (c0, c1, c2, c3) with the 64-bit seed as key, written to out
+inline void philox4x32(uint32_t c0, uint32_t c1, uint32_t c2, uint32_t c3, uint64_t seed, uint32_t* out) {
+    uint32_t key[2] = {(uint32_t)seed, (uint32_t)(seed >> 32)};
+    out[0] = c0;
+    out[1] = c1;
+    out[2] = c2;
+    out[3] = c3;
+    for (int r = 0; r < 9; r++) {
+        philoxRound(out, key);
+        key[0] += 0x9E3779B9;
+        key[1] += 0xBB67AE85;
+    }
+    philoxRound(out, key);
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_PHILOX_H_
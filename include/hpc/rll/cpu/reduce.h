@@ -0,0 +1,45 @@
+#ifndef HPC_RLL_CPU_REDUCE_H_
+#define HPC_RLL_CPU_REDUCE_H_
+
+#include <array>
+
+#include "hpc/rll/cpu/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// Calculate K sums over the range [0, n) in parallel.
+// f(begin, end, acc) handles the items [begin, end) and adds its K partial values into acc.
+// The partial results are combined in a fixed order, so the sums are reproducible for a fixed thread number.
+template <int K, typename T = float, typename F>
+std::array<T, K> parallelReduceRangeSum(int64_t n, int64_t grain_size, const F& f) {
+    std::array<T, K> zeros;
+    zeros.fill(0);
+    return at::parallel_reduce(0, n, grain_size, zeros,
+        [&](int64_t begin, int64_t end, std::array<T, K> acc) {
+            f(begin, end, acc);
+            return acc;
+        },
+        [](std::array<T, K> a, const std::array<T, K>& b) {
+            for (int k = 0; k < K; k++)
+                a[k] += b[k];
+            return a;
+        });
+}
+
+// Calculate K sums over the items [0, n) in parallel.
+// f(i, acc) handles item i and adds its K partial values into acc.
+template <int K, typename T = float, typename F>
+std::array<T, K> parallelReduceSum(int64_t n, int64_t grain_size, const F& f) {
+    return parallelReduceRangeSum<K, T>(n, grain_size, [&](int64_t begin, int64_t end, std::array<T, K>& acc) {
+        for (int64_t i = begin; i < end; i++)
+            f(i, acc);
+    });
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_REDUCE_H_
@@ -0,0 +1,159 @@
+#ifndef HPC_RLL_CPU_CATEGORICAL_KERNEL_H_
+#define HPC_RLL_CPU_CATEGORICAL_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// log(sum(exp(x))), also output max_x and sum(exp(x - max_x)).
+// x may be half or bfloat16, the sums are accumulated in acc_t (float for the reduced types)
+template <typename scalar_t, typename acc_t = at::opmath_type<scalar_t>>
+inline acc_t logSumExp(unsigned int num, const scalar_t* x, acc_t& max_x, acc_t& sum_exp_x) {
+    max_x = CPU_FLOAT_INF_NEG;
+    for (unsigned int i = 0; i < num; ++i) {
+        max_x = std::max<acc_t>(max_x, x[i]);
+    }
+    sum_exp_x = 0;
+    for (unsigned int i = 0; i < num; ++i) {
+        sum_exp_x += std::exp(static_cast<acc_t>(x[i]) - max_x);
+    }
+    return std::log(sum_exp_x) + max_x;
+}
+
+// handle one row of x, output log prob of action, entropy and the intermediate grads.
+// x and the grads are scalar_t, prob and entropy are per sample and kept in float
+template <typename scalar_t>
+inline void categoricalProbEntropy(unsigned int num_output, const scalar_t* x, int64_t action,
+        float* prob, float* entropy, scalar_t* grad_logits, scalar_t* grad_prob, scalar_t* grad_entropy) {
+    using acc_t = at::opmath_type<scalar_t>;
+    // step 1: logits = x - logsumexp(x)
+    acc_t max_x, sum_exp_x;
+    acc_t log_sum_exp_x = logSumExp(num_output, x, max_x, sum_exp_x);
+
+    // step 2: entropy = -sum(logits * softmax(logits))
+    acc_t max_logits = CPU_FLOAT_INF_NEG;
+    for (unsigned int i = 0; i < num_output; ++i) {
+        max_logits = std::max<acc_t>(max_logits, x[i] - log_sum_exp_x);
+    }
+    acc_t sum_exp_logits = 0;
+    for (unsigned int i = 0; i < num_output; ++i) {
+        sum_exp_logits += std::exp(x[i] - log_sum_exp_x - max_logits);
+    }
+    acc_t sum_entropy_val = 0;
+    for (unsigned int i = 0; i < num_output; ++i) {
+        acc_t logits = x[i] - log_sum_exp_x;
+        sum_entropy_val += logits * std::exp(logits - max_logits) / sum_exp_logits;
+    }
+
+    // step 3. output
+    // grad_entropy[i] = (-1) * softmax(logits[i]) * (1 + logits[i] - sum(logits * softmax(logits)))
+    *prob = x[action] - log_sum_exp_x;
+    *entropy = -sum_entropy_val;
+    for (unsigned int i = 0; i < num_output; ++i) {
+        bool flag = (i == action);
+        acc_t logits = x[i] - log_sum_exp_x;
+        acc_t softmax_logits = std::exp(logits - max_logits) / sum_exp_logits;
+
+        // grad of logsumexp(x)
+        acc_t grad = std::exp(x[i] - max_x) / sum_exp_x;
+        grad_logits[i] = grad;
+
+        // grad of x - logsumexp(x)
+        grad_prob[i] = (flag ? 1 : 0) - grad;
+
+        // grad of -sum(logits * softmax(logits))
+        grad_entropy[i] = -softmax_logits * (1 + logits - sum_entropy_val);
+    }
+}
+
+// handle one row of x, return log prob of action
+template <typename scalar_t>
+inline float categoricalProb(unsigned int num_output, const scalar_t* x, int64_t action) {
+    at::opmath_type<scalar_t> max_x, sum_exp_x;
+    return x[action] - logSumExp(num_output, x, max_x, sum_exp_x);
+}
+
+// handle one row of x, output log softmax of target and its grad
+inline void crossEntropy(unsigned int num, const float* input, int64_t target, float* output, float* grad) {
+    float max_x, sum_exp_x;
+    logSumExp(num, input, max_x, sum_exp_x);
+    for (unsigned int i = 0; i < num; ++i) {
+        bool flag = (i == target);
+        float softmax_data = std::exp(input[i] - max_x) / sum_exp_x;
+        if (flag)
+            *output = std::log(softmax_data);
+        grad[i] = flag ? (1 - softmax_data) : (-softmax_data);
+    }
+}
+
+// handle one row, back propagate the grad of entropy and log prob to x
+template <typename scalar_t>
+inline void categoricalBackward(unsigned int num_output, float pre_entropy_grad, float pre_prob_grad,
+        const scalar_t* grad_logits, const scalar_t* grad_prob, const scalar_t* grad_entropy, scalar_t* grad_x) {
+    using acc_t = at::opmath_type<scalar_t>;
+    acc_t grad_entropy_val = 0;
+    for (unsigned int i = 0; i < num_output; ++i) {
+        grad_entropy_val += pre_entropy_grad * static_cast<acc_t>(grad_entropy[i]);
+    }
+    for (unsigned int i = 0; i < num_output; ++i) {
+        acc_t prob_bp = pre_prob_grad * static_cast<acc_t>(grad_prob[i]);
+        // bp of: x - logsumexp(x), is: b_i - grad_logsumexp_i * sum_b
+        acc_t entropy_bp = pre_entropy_grad * static_cast<acc_t>(grad_entropy[i])
+            - static_cast<acc_t>(grad_logits[i]) * grad_entropy_val;
+        grad_x[i] = entropy_bp + prob_bp;
+    }
+}
+
+// offsets of the independent categorical heads over a concatenated row of logits (multi-discrete action space),
+// head h owns [offset[h], offset[h + 1]) of the row. An empty heads means a single head over the whole row
+inline std::vector<int64_t> categoricalHeadOffsets(const std::vector<int64_t>& heads, unsigned int num_output) {
+    if (heads.empty()) {
+        return {0, num_output};
+    }
+    std::vector<int64_t> offset(heads.size() + 1, 0);
+    for (size_t h = 0; h < heads.size(); ++h) {
+        TORCH_CHECK(heads[h] > 0, "size of head ", h, " should be positive, but get ", heads[h]);
+        offset[h + 1] = offset[h] + heads[h];
+    }
+    TORCH_CHECK(offset.back() == num_output, "sum of heads should be ", num_output, ", but get ", offset.back());
+    return offset;
+}
+
+// handle one row of concatenated heads, action, prob and entropy have one entry per head
+template <typename scalar_t>
+inline void multiCategoricalProbEntropy(const std::vector<int64_t>& offset, const scalar_t* x, const int64_t* action,
+        float* prob, float* entropy, scalar_t* grad_logits, scalar_t* grad_prob, scalar_t* grad_entropy) {
+    for (size_t h = 0; h + 1 < offset.size(); ++h) {
+        int64_t begin = offset[h];
+        categoricalProbEntropy(offset[h + 1] - begin, x + begin, action[h], prob + h, entropy + h,
+                grad_logits + begin, grad_prob + begin, grad_entropy + begin);
+    }
+}
+
+// handle one row of concatenated heads, output log prob of action per head
+template <typename scalar_t>
+inline void multiCategoricalProb(const std::vector<int64_t>& offset, const scalar_t* x, const int64_t* action,
+        float* prob) {
+    for (size_t h = 0; h + 1 < offset.size(); ++h) {
+        prob[h] = categoricalProb(offset[h + 1] - offset[h], x + offset[h], action[h]);
+    }
+}
+
+// handle one row of concatenated heads, the heads share the grads of the joint log prob and entropy
+template <typename scalar_t>
+inline void multiCategoricalBackward(const std::vector<int64_t>& offset, float pre_entropy_grad, float pre_prob_grad,
+        const scalar_t* grad_logits, const scalar_t* grad_prob, const scalar_t* grad_entropy, scalar_t* grad_x) {
+    for (size_t h = 0; h + 1 < offset.size(); ++h) {
+        int64_t begin = offset[h];
+        categoricalBackward(offset[h + 1] - begin, pre_entropy_grad, pre_prob_grad,
+                grad_logits + begin, grad_prob + begin, grad_entropy + begin, grad_x + begin);
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_CATEGORICAL_KERNEL_H_
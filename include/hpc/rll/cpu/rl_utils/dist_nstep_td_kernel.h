@@ -0,0 +1,86 @@
+#ifndef HPC_RLL_CPU_DIST_NSTEP_TD_KERNEL_H_
+#define HPC_RLL_CPU_DIST_NSTEP_TD_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+inline float distNStepTdRewardKernel(unsigned int time_step, unsigned int batch_size, float gamma,
+        const float* reward, int64_t batch_id) {
+    float sum_reward = 0;
+    float factor = 1;
+    for (int t = 0; t < time_step; ++t) {
+        float rw = reward[t * batch_size + batch_id];
+        sum_reward += (factor * rw);
+        factor *= gamma;
+    }
+    return sum_reward;
+}
+
+// project the target distribution of one sample onto the support, proj_dist must be zero before
+inline void distNStepTdProjKernel(unsigned int action_dim, unsigned int n_atom,
+        float gamma_nstep, float v_min, float v_max, float delta,
+        const float* next_n_dist, const int64_t* next_n_action,
+        float reward, const float* done, float* proj_dist, int64_t batch_id) {
+    unsigned int next_n_action_id = next_n_action[batch_id];
+    const float* target_dist = next_n_dist + batch_id * action_dim * n_atom + next_n_action_id * n_atom;
+    float* proj = proj_dist + batch_id * n_atom;
+    for (unsigned int atom_id = 0; atom_id < n_atom; ++atom_id) {
+        float support = v_min + atom_id * delta;
+        float target = reward + (1 - done[batch_id]) * gamma_nstep * support;
+        target = std::min(v_max, target);
+        target = std::max(v_min, target);
+
+        float local_box_id = (target - v_min) / delta;
+        unsigned int local_box_id_l = std::floor(local_box_id);
+        unsigned int local_box_id_u = std::ceil(local_box_id);
+
+        float target_dist_sa = target_dist[atom_id];
+        proj[local_box_id_l] += target_dist_sa * ((float)local_box_id_u - local_box_id);
+        proj[local_box_id_u] += target_dist_sa * (local_box_id - (float)local_box_id_l);
+    }
+}
+
+// grad_buf may alias proj_dist, return the weighted sum of log_p * proj
+inline float distNStepTdLossKernel(unsigned int batch_size, unsigned int action_dim, unsigned int n_atom,
+        const float* dist, const int64_t* action, const float* proj_dist, const float* weight,
+        float* td_err, float* grad_buf, int64_t batch_id) {
+    unsigned int action_id = action[batch_id];
+    float w = weight[batch_id];
+    float sum_val = 0;
+    float sum_td_err = 0;
+    for (unsigned int atom_id = 0; atom_id < n_atom; ++atom_id) {
+        float dist_sa = dist[batch_id * action_dim * n_atom + action_id * n_atom + atom_id];
+        float log_p = std::log(dist_sa);
+
+        float proj = proj_dist[batch_id * n_atom + atom_id];
+        sum_val += log_p * proj * w;
+        sum_td_err += log_p * proj;
+
+        grad_buf[batch_id * n_atom + atom_id] = (-1.f) / (float)batch_size * w * proj * (1.f / dist_sa);
+    }
+    td_err[batch_id] = sum_td_err * (-1.f);
+    return sum_val;
+}
+
+inline void distNStepTdBackwardKernel(unsigned int action_dim, unsigned int n_atom,
+        const float* grad_loss, const float* grad_buf, const int64_t* action, float* grad_dist, int64_t batch_id) {
+    for (unsigned int action_id = 0; action_id < action_dim; ++action_id) {
+        float* out = grad_dist + (batch_id * action_dim + action_id) * n_atom;
+        if (action_id == action[batch_id]) {
+            for (unsigned int atom_id = 0; atom_id < n_atom; ++atom_id)
+                out[atom_id] = (*grad_loss) * grad_buf[batch_id * n_atom + atom_id];
+        } else {
+            for (unsigned int atom_id = 0; atom_id < n_atom; ++atom_id)
+                out[atom_id] = 0.f;
+        }
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_DIST_NSTEP_TD_KERNEL_H_
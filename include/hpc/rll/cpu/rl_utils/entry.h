@@ -0,0 +1,260 @@
+#ifndef HPC_RLL_CPU_LOSS_H_
+#define HPC_RLL_CPU_LOSS_H_
+
+#include "hpc/rll/cpu/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// gae
+void GaeForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    int accumulate_mode);
+
+// gae + return + advantage normalization
+void GaeNormForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    float eps,
+    int accumulate_mode);
+
+// td_lambda
+void TdLambdaForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    int accumulate_mode);
+
+void TdLambdaBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs);
+
+// lambda_return
+void LambdaReturnForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    int accumulate_mode);
+
+void LambdaReturnBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda);
+
+// dist_nstep_td
+void DistNStepTdForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float v_min,
+    float v_max);
+
+void DistNStepTdBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs);
+
+// q_nstep_td
+void QNStepTdForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma);
+
+void QNStepTdBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs);
+
+// nstep_return
+void NStepReturnForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    int nstep,
+    int accumulate_mode);
+
+// retrace
+void RetraceForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    float c_clip_ratio,
+    int accumulate_mode);
+
+void RetraceBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs);
+
+// q_nstep_td_with_rescale
+void QNStepTdRescaleForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma);
+
+void QNStepTdRescaleBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs);
+
+// upgo
+void UpgoForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    int accumulate_mode);
+
+void UpgoBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs);
+
+// vtrace
+void VTraceForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    float rho_clip_ratio,
+    float c_clip_ratio,
+    float rho_pg_clip_ratio,
+    int accumulate_mode,
+    const std::vector<int64_t>& heads);
+
+void VTraceBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    const std::vector<int64_t>& heads);
+
+// vtrace returns and pg advantages from log importance weights, without loss and autograd
+void VTraceReturnsForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float lambda,
+    float rho_clip_ratio,
+    float c_clip_ratio,
+    float rho_pg_clip_ratio,
+    int accumulate_mode);
+
+// ppo, heads are the sizes of the independent categorical heads over the concatenated logits
+void PPOForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    bool use_value_clip,
+    float clip_ratio,
+    float dual_clip,
+    const std::vector<int64_t>& heads);
+
+void PPOBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    const std::vector<int64_t>& heads);
+
+// ppo with diagonal gaussian policy
+void PPOContinuousForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    bool use_value_clip,
+    float clip_ratio,
+    float dual_clip);
+
+void PPOContinuousBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs);
+
+// iqn_nstep_td_error
+void IQNNStepTDErrorForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float kappa);
+
+void IQNNStepTDErrorBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs);
+
+// qrdqn_nstep_td_error
+void QRDQNNStepTDErrorForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma);
+
+void QRDQNNStepTDErrorBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs);
+
+// padding
+std::vector<std::vector<int>> sample_split_group(const std::vector<torch::Tensor>& x, int group, int64_t seed);
+std::vector<std::vector<int>> quantile_split_group(const std::vector<torch::Tensor>& x, int group);
+std::vector<std::vector<int>> oracle_split_group(const std::vector<torch::Tensor>& x, int group);
+std::vector<std::vector<int>> fast_oracle_split_group(const std::vector<torch::Tensor>& x, int group);
+
+std::vector<torch::Tensor> Pad1DForward(
+    const std::vector<torch::Tensor>& inputs,
+    const int& value);
+
+std::vector<std::vector<torch::Tensor>> GroupPad1DForward(
+    const std::vector<torch::Tensor>& inputs,
+    const std::vector<int>& group_cnt,
+    const std::vector<int>& max_shape,
+    const std::vector<int>& group_id,
+    const std::vector<int>& group_idx,
+    const int& value);
+
+std::vector<torch::Tensor> Unpad1DForward(
+    const torch::Tensor& inputs,
+    const std::vector<int>& shape);
+
+std::vector<torch::Tensor> Pad2DForward(
+    const std::vector<torch::Tensor>& inputs,
+    const int& value);
+
+std::vector<std::vector<torch::Tensor>> GroupPad2DForward(
+    const std::vector<torch::Tensor>& inputs,
+    const std::vector<int>& group_cnt,
+    const std::vector<int>& max_shape,
+    const std::vector<int>& group_id,
+    const std::vector<int>& group_idx,
+    const int& value);
+
+std::vector<torch::Tensor> Unpad2DForward(
+    const torch::Tensor& inputs,
+    const std::vector<int>& shape);
+
+std::vector<torch::Tensor> Pad3DForward(
+    const std::vector<torch::Tensor>& inputs,
+    const int& value);
+
+std::vector<std::vector<torch::Tensor>> GroupPad3DForward(
+    const std::vector<torch::Tensor>& inputs,
+    const std::vector<int>& group_cnt,
+    const std::vector<int>& max_shape,
+    const std::vector<int>& group_id,
+    const std::vector<int>& group_idx,
+    const int& value);
+
+std::vector<torch::Tensor> Unpad3DForward(
+    const torch::Tensor& inputs,
+    const std::vector<int>& shape);
+
+// padding with ragged inputs: values is the flattened tensors, offsets [n + 1] and shapes [n, dim] are int64
+std::vector<torch::Tensor> PadRaggedForward(
+    const torch::Tensor& values,
+    const torch::Tensor& offsets,
+    const torch::Tensor& shapes,
+    const int& value);
+
+torch::Tensor UnpadRaggedForward(
+    const torch::Tensor& inputs,
+    const torch::Tensor& offsets,
+    const torch::Tensor& shapes);
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_LOSS_H_
@@ -0,0 +1,104 @@
+#ifndef HPC_RLL_CPU_GAE_KERNEL_H_
+#define HPC_RLL_CPU_GAE_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+#include "hpc/rll/cpu/accumulate.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// minimum number of columns handled by one task, keeps each row sweep at least one cache line wide
+const int64_t GAE_MIN_LANES = 16;
+
+// handle the columns [batch_begin, batch_end), ret = adv + value is also written if ret is not nullptr.
+// value and reward are row major (T, B), so the columns are swept as contiguous lanes for each timestep,
+// and t is walked backwards. denom only depends on t, so it is shared by all the lanes.
+// The estimator is carried in the accumulator Acc (see accumulate.h), whose compute type is at least float,
+// so half and bfloat16 inputs only round the stored adv and ret
+template <typename scalar_t, typename Acc>
+inline void gaeForwardKernel(unsigned int time_step, unsigned int batch_size, float gamma, float lambda,
+        const scalar_t* value, const scalar_t* reward, scalar_t* adv, scalar_t* ret,
+        int64_t batch_begin, int64_t batch_end) {
+    using T = typename Acc::type;
+    const int64_t lanes = batch_end - batch_begin;
+    std::vector<Acc> gae_item(lanes);
+    Acc* item = gae_item.data();
+    T factor = (T)gamma * (T)lambda;
+    Acc denom;
+    for (int t = time_step - 1; t >= 0; --t) {
+        denom.mulAdd(lambda, 1);
+        T d = denom.value();
+        T inv_denom = 1 / d;
+        const scalar_t* reward_row = reward + (int64_t)t * batch_size + batch_begin;
+        const scalar_t* value_row = value + (int64_t)t * batch_size + batch_begin;
+        const scalar_t* next_value_row = value_row + batch_size;
+        scalar_t* adv_row = adv + (int64_t)t * batch_size + batch_begin;
+        scalar_t* ret_row = (ret != nullptr) ? ret + (int64_t)t * batch_size + batch_begin : nullptr;
+#pragma omp simd
+        for (int64_t i = 0; i < lanes; ++i) {
+            T delta = static_cast<T>(reward_row[i]) + (T)gamma * static_cast<T>(next_value_row[i])
+                - static_cast<T>(value_row[i]);
+            item[i].mulAdd(factor, d * delta);
+            adv_row[i] = item[i].value() * inv_denom;
+        }
+        if (ret_row != nullptr) {
+#pragma omp simd
+            for (int64_t i = 0; i < lanes; ++i) {
+                ret_row[i] = item[i].value() * inv_denom + static_cast<T>(value_row[i]);
+            }
+        }
+    }
+}
+
+// the same as gaeForwardKernel, with optional done (T, B) and lengths (B, ), pass nullptr if not used.
+// done[t] = 1 means t is the last step of an episode, so v[t + 1] is not bootstrapped and the estimator restarts,
+// steps after lengths[b] are padding, and v[lengths[b]] is used as the bootstrap value.
+// denom is reset per lane here, so it is kept in a lane buffer as well as gae_item.
+template <typename scalar_t, typename Acc>
+inline void gaeMaskedForwardKernel(unsigned int time_step, unsigned int batch_size, float gamma, float lambda,
+        const scalar_t* value, const scalar_t* reward, const scalar_t* done, const int64_t* lengths,
+        scalar_t* adv, scalar_t* ret, int64_t batch_begin, int64_t batch_end) {
+    using T = typename Acc::type;
+    const int64_t lanes = batch_end - batch_begin;
+    std::vector<Acc> buf(lanes * 2);
+    Acc* item = buf.data();
+    Acc* denom = buf.data() + lanes;
+    T factor = (T)gamma * (T)lambda;
+    for (int t = time_step - 1; t >= 0; --t) {
+        const scalar_t* reward_row = reward + (int64_t)t * batch_size + batch_begin;
+        const scalar_t* value_row = value + (int64_t)t * batch_size + batch_begin;
+        const scalar_t* next_value_row = value_row + batch_size;
+        const scalar_t* done_row = (done != nullptr) ? done + (int64_t)t * batch_size + batch_begin : nullptr;
+        const int64_t* length = (lengths != nullptr) ? lengths + batch_begin : nullptr;
+        scalar_t* adv_row = adv + (int64_t)t * batch_size + batch_begin;
+        scalar_t* ret_row = (ret != nullptr) ? ret + (int64_t)t * batch_size + batch_begin : nullptr;
+#pragma omp simd
+        for (int64_t i = 0; i < lanes; ++i) {
+            T not_done = (done_row != nullptr) ? (1 - static_cast<T>(done_row[i])) : 1;
+            bool valid = (length == nullptr) || (t < length[i]);
+            Acc g = item[i];
+            Acc d = denom[i];
+            d.mulAdd((T)lambda * not_done, 1);
+            T delta = static_cast<T>(reward_row[i]) + (T)gamma * static_cast<T>(next_value_row[i]) * not_done
+                - static_cast<T>(value_row[i]);
+            g.mulAdd(factor * not_done, d.value() * delta);
+            item[i] = valid ? g : Acc();
+            denom[i] = valid ? d : Acc();
+            adv_row[i] = valid ? g.value() / d.value() : 0;
+        }
+        if (ret_row != nullptr) {
+#pragma omp simd
+            for (int64_t i = 0; i < lanes; ++i) {
+                bool valid = (length == nullptr) || (t < length[i]);
+                ret_row[i] = valid ? item[i].value() / denom[i].value() + static_cast<T>(value_row[i]) : 0;
+            }
+        }
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_GAE_KERNEL_H_
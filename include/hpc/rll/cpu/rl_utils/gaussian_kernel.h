@@ -0,0 +1,71 @@
+#ifndef HPC_RLL_CPU_GAUSSIAN_KERNEL_H_
+#define HPC_RLL_CPU_GAUSSIAN_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// 0.5 * log(2 * pi)
+const float HALF_LOG_2PI = 0.9189385332046727f;
+
+// handle one row of a diagonal gaussian, output log prob of action, entropy and the intermediate grads.
+// mu, sigma, action and the grads are scalar_t, prob and entropy are per sample and kept in float
+// log_prob = sum(-0.5 * z^2 - log(sigma) - 0.5 * log(2 * pi)), z = (action - mu) / sigma
+// entropy = sum(0.5 + 0.5 * log(2 * pi) + log(sigma))
+template <typename scalar_t>
+inline void gaussianProbEntropy(unsigned int num_output, const scalar_t* mu, const scalar_t* sigma,
+        const scalar_t* action, float* prob, float* entropy,
+        scalar_t* grad_mu_prob, scalar_t* grad_sigma_prob, scalar_t* grad_sigma_entropy) {
+    using acc_t = at::opmath_type<scalar_t>;
+    acc_t sum_prob = 0;
+    acc_t sum_log_sigma = 0;
+    for (unsigned int i = 0; i < num_output; ++i) {
+        acc_t s = sigma[i];
+        acc_t inv_s = 1 / s;
+        acc_t z = (static_cast<acc_t>(action[i]) - static_cast<acc_t>(mu[i])) * inv_s;
+        acc_t log_s = std::log(s);
+        sum_prob += -0.5f * z * z - log_s;
+        sum_log_sigma += log_s;
+
+        // grad of log_prob w.r.t. mu and sigma, grad of entropy w.r.t. sigma
+        grad_mu_prob[i] = z * inv_s;
+        grad_sigma_prob[i] = (z * z - 1) * inv_s;
+        grad_sigma_entropy[i] = inv_s;
+    }
+    *prob = sum_prob - num_output * HALF_LOG_2PI;
+    *entropy = sum_log_sigma + num_output * (0.5f + HALF_LOG_2PI);
+}
+
+// handle one row of a diagonal gaussian, return log prob of action
+template <typename scalar_t>
+inline float gaussianProb(unsigned int num_output, const scalar_t* mu, const scalar_t* sigma, const scalar_t* action) {
+    using acc_t = at::opmath_type<scalar_t>;
+    acc_t sum_prob = 0;
+    for (unsigned int i = 0; i < num_output; ++i) {
+        acc_t s = sigma[i];
+        acc_t z = (static_cast<acc_t>(action[i]) - static_cast<acc_t>(mu[i])) / s;
+        sum_prob += -0.5f * z * z - std::log(s);
+    }
+    return sum_prob - num_output * HALF_LOG_2PI;
+}
+
+// handle one row, back propagate the grad of entropy and log prob to mu and sigma
+template <typename scalar_t>
+inline void gaussianBackward(unsigned int num_output, float pre_entropy_grad, float pre_prob_grad,
+        const scalar_t* grad_mu_prob, const scalar_t* grad_sigma_prob, const scalar_t* grad_sigma_entropy,
+        scalar_t* grad_mu, scalar_t* grad_sigma) {
+    using acc_t = at::opmath_type<scalar_t>;
+    for (unsigned int i = 0; i < num_output; ++i) {
+        grad_mu[i] = pre_prob_grad * static_cast<acc_t>(grad_mu_prob[i]);
+        grad_sigma[i] = pre_prob_grad * static_cast<acc_t>(grad_sigma_prob[i])
+            + pre_entropy_grad * static_cast<acc_t>(grad_sigma_entropy[i]);
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_GAUSSIAN_KERNEL_H_
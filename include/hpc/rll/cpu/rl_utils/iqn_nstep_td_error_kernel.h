@@ -0,0 +1,80 @@
+#ifndef HPC_RLL_CPU_IQN_NSTEP_TD_ERROR_KERNEL_H_
+#define HPC_RLL_CPU_IQN_NSTEP_TD_ERROR_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// handle one sample, return the mean quantile huber loss over tau_prime
+inline float iqnNStepTdErrorKernel(unsigned int tau, unsigned int tau_prime,
+        unsigned int time_step, unsigned int batch_size, unsigned int action_dim, float gamma, float kappa,
+        const float* q, const float* next_n_q, const int64_t* action, const int64_t* next_n_action,
+        const float* reward, const float* done, const float* replay_quantiles, const float* value_gamma,
+        float* bellman_err_buf, float* quantile_huber_loss_buf, float* grad_buf, int64_t batch_id) {
+    int64_t action_data = action[batch_id];
+    int64_t next_n_action_data = next_n_action[batch_id];
+    float value_gamma_data = value_gamma[batch_id];
+    float not_done_data = 1.f - done[batch_id];
+
+    float reward_factor = 1;
+    float reward_data = 0;
+    for (int t = 0; t < time_step; t++) {
+        reward_data += reward_factor * reward[t * batch_size + batch_id];
+        reward_factor *= gamma;
+    }
+
+    float sum_huber = 0.f;
+    for (unsigned int t = 0; t < tau_prime; t++) {
+        float target_qsa = next_n_q[t * batch_size * action_dim + batch_id * action_dim + next_n_action_data];
+        float target_qsa_transform = reward_data + value_gamma_data * target_qsa * not_done_data;
+        for (unsigned int i = 0; i < tau; i++) {
+            unsigned int index = batch_id * tau_prime * tau + t * tau + i;
+            float qsa = q[i * batch_size * action_dim + batch_id * action_dim + action_data];
+            float bellman_error_data = target_qsa_transform - qsa;
+
+            float huber_loss_data = 0.f;
+            float grad_buf_data = 0.f;
+            if (std::abs(bellman_error_data) <= kappa) {
+                huber_loss_data = 0.5 * bellman_error_data * bellman_error_data;
+                grad_buf_data = bellman_error_data;
+            } else {
+                huber_loss_data = kappa * (std::abs(bellman_error_data) - 0.5 * kappa);
+                grad_buf_data = (bellman_error_data >= 0) ? kappa : (-kappa);
+            }
+
+            float r_q_data = replay_quantiles[i * batch_size + batch_id];
+            float tmp = std::abs(r_q_data - ((bellman_error_data < 0) ? 1.f : 0.f)) / kappa;
+
+            bellman_err_buf[index] = bellman_error_data;
+            quantile_huber_loss_buf[index] = tmp * huber_loss_data;
+            grad_buf[index] = grad_buf_data * tmp;
+            sum_huber += tmp * huber_loss_data;
+        }
+    }
+    return sum_huber / tau_prime;
+}
+
+inline void iqnNStepTdErrorBackwardKernel(unsigned int tau, unsigned int tau_prime, unsigned int batch_size,
+        unsigned int action_dim, const float* grad_loss, const float* grad_buf,
+        const float* weight, const int64_t* action, float* grad_q, int64_t batch_id) {
+    float factor = -1.f * (grad_loss[0] / batch_size * weight[batch_id] / tau_prime); // mean, weight, mean, target_qsa - qsa
+    for (unsigned int i = 0; i < tau; i++) {
+        float* out = grad_q + i * batch_size * action_dim + batch_id * action_dim;
+        for (unsigned int a = 0; a < action_dim; a++)
+            out[a] = 0.f;
+
+        float grad_data = 0.f;
+        for (unsigned int t = 0; t < tau_prime; t++) {
+            grad_data += grad_buf[batch_id * tau_prime * tau + t * tau + i];
+        }
+        out[action[batch_id]] = grad_data * factor;
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_IQN_NSTEP_TD_ERROR_KERNEL_H_
@@ -0,0 +1,82 @@
+#ifndef HPC_RLL_CPU_LAMBDA_RETURN_KERNEL_H_
+#define HPC_RLL_CPU_LAMBDA_RETURN_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+#include "hpc/rll/cpu/accumulate.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// minimum number of columns handled by one task, same as GAE_MIN_LANES
+const int64_t LAMBDA_RETURN_MIN_LANES = 16;
+
+// one backward step of the lambda return carried in ret, shared by TD(lambda), UPGO and the generic lambda return.
+// ret = reward + gamma * (lambda * ret + (1 - lambda) * next_value), the trace is cut at the last step and
+// when lambda is 0, so ret restarts from the bootstrap value
+template <typename Acc>
+inline void lambdaReturnStep(Acc& ret, bool last, typename Acc::type gamma, typename Acc::type lambda,
+        typename Acc::type reward, typename Acc::type next_value) {
+    using T = typename Acc::type;
+    if (last || lambda == (T)0) {
+        ret.reset(reward + gamma * next_value);
+    } else {
+        ret.mulAdd(gamma * lambda, reward + gamma * (1 - lambda) * next_value);
+    }
+}
+
+// handle the columns [batch_begin, batch_end) of the generalized lambda return, value is (T + 1, B),
+// gamma and lambda are the optional per step (T, B) factors, pass nullptr to use the scalar ones.
+// The columns are swept as contiguous lanes and t is walked backwards
+template <typename scalar_t, typename Acc>
+inline void lambdaReturnForwardKernel(unsigned int time_step, unsigned int batch_size, float gamma, float lambda,
+        const scalar_t* value, const scalar_t* reward, const scalar_t* gammas, const scalar_t* lambdas,
+        scalar_t* ret, int64_t batch_begin, int64_t batch_end) {
+    using T = typename Acc::type;
+    const int64_t lanes = batch_end - batch_begin;
+    std::vector<Acc> ret_item(lanes);
+    Acc* item = ret_item.data();
+    for (int t = time_step - 1; t >= 0; --t) {
+        int64_t row = (int64_t)t * batch_size + batch_begin;
+        bool last = (t == time_step - 1);
+        for (int64_t i = 0; i < lanes; ++i) {
+            T gamma_data = (gammas != nullptr) ? static_cast<T>(gammas[row + i]) : (T)gamma;
+            T lambda_data = (lambdas != nullptr) ? static_cast<T>(lambdas[row + i]) : (T)lambda;
+            lambdaReturnStep(item[i], last, gamma_data, lambda_data,
+                    static_cast<T>(reward[row + i]), static_cast<T>(value[row + batch_size + i]));
+            ret[row + i] = item[i].value();
+        }
+    }
+}
+
+// backward of the lambda return w.r.t. value for the columns [batch_begin, batch_end), t is walked forwards.
+// the grad reaching ret[t] is grad_ret[t] + gamma[t - 1] * lambda[t - 1] * (grad of ret[t - 1]),
+// and it flows to value[t + 1] with gamma[t] * (1 - lambda[t]), lambda is taken as 0 at the last step
+template <typename scalar_t>
+inline void lambdaReturnBackwardKernel(unsigned int time_step, unsigned int batch_size, float gamma, float lambda,
+        const scalar_t* grad_ret, const scalar_t* gammas, const scalar_t* lambdas, scalar_t* grad_value,
+        int64_t batch_begin, int64_t batch_end) {
+    using T = at::opmath_type<scalar_t>;
+    const int64_t lanes = batch_end - batch_begin;
+    std::vector<T> trace(lanes, 0);
+    for (int64_t i = 0; i < lanes; ++i) {
+        grad_value[batch_begin + i] = 0;
+    }
+    for (unsigned int t = 0; t < time_step; ++t) {
+        int64_t row = (int64_t)t * batch_size + batch_begin;
+        bool last = (t == time_step - 1);
+        for (int64_t i = 0; i < lanes; ++i) {
+            T gamma_data = (gammas != nullptr) ? static_cast<T>(gammas[row + i]) : (T)gamma;
+            T lambda_data = last ? (T)0 : ((lambdas != nullptr) ? static_cast<T>(lambdas[row + i]) : (T)lambda);
+            T grad = static_cast<T>(grad_ret[row + i]) + trace[i];
+            grad_value[row + batch_size + i] = grad * gamma_data * (1 - lambda_data);
+            trace[i] = grad * gamma_data * lambda_data;
+        }
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_LAMBDA_RETURN_KERNEL_H_
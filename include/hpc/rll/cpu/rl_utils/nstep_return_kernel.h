@@ -0,0 +1,60 @@
+#ifndef HPC_RLL_CPU_NSTEP_RETURN_KERNEL_H_
+#define HPC_RLL_CPU_NSTEP_RETURN_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+#include "hpc/rll/cpu/accumulate.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// minimum number of columns handled by one task, same as GAE_MIN_LANES
+const int64_t NSTEP_RETURN_MIN_LANES = 16;
+
+// sliding window nstep return of the columns [batch_begin, batch_end), t is walked backwards.
+// the window of t covers m = min(nstep, length) steps, where length counts the steps from t to the end of its episode
+// (done, optional and nullptr if not used) or of the trajectory. The window sum slides as
+// ret[t] = gamma * ret[t + 1] + reward[t] - gamma^nstep * reward[t + nstep] while the window is full, and is carried
+// in the accumulator Acc. bootstrap_index is t + m, and bootstrap_discount is gamma^m, or 0 if the episode ends
+// inside the window
+template <typename scalar_t, typename Acc>
+inline void nstepReturnKernel(unsigned int time_step, unsigned int batch_size, float gamma, unsigned int nstep,
+        const scalar_t* reward, const scalar_t* done, scalar_t* ret, int64_t* bootstrap_index,
+        scalar_t* bootstrap_discount, int64_t batch_begin, int64_t batch_end) {
+    using T = typename Acc::type;
+    const int64_t lanes = batch_end - batch_begin;
+    std::vector<Acc> ret_item(lanes);
+    Acc* item = ret_item.data();
+    // steps to the end of the episode, and whether the episode is ended by done rather than the trajectory
+    std::vector<unsigned int> length(lanes, 0);
+    std::vector<char> terminal(lanes, 0);
+    T gamma_n = std::pow((T)gamma, (T)nstep);
+    for (int t = time_step - 1; t >= 0; --t) {
+        int64_t row = (int64_t)t * batch_size + batch_begin;
+        for (int64_t i = 0; i < lanes; ++i) {
+            T reward_data = reward[row + i];
+            if (done != nullptr && static_cast<T>(done[row + i]) != (T)0) {
+                length[i] = 1;
+                terminal[i] = 1;
+                item[i].reset(reward_data);
+            } else if (length[i] >= nstep) {
+                // the window of t + 1 is full, drop reward[t + nstep] out of it
+                length[i] += 1;
+                item[i].mulAdd(gamma, reward_data - gamma_n * static_cast<T>(reward[row + (int64_t)nstep * batch_size + i]));
+            } else {
+                length[i] += 1;
+                item[i].mulAdd(gamma, reward_data);
+            }
+            unsigned int m = std::min(length[i], nstep);
+            ret[row + i] = item[i].value();
+            bootstrap_index[row + i] = t + m;
+            bootstrap_discount[row + i] = (terminal[i] && length[i] <= nstep) ? (T)0 : std::pow((T)gamma, (T)m);
+        }
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_NSTEP_RETURN_KERNEL_H_
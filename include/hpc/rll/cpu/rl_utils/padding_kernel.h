@@ -0,0 +1,56 @@
+#ifndef HPC_RLL_CPU_PADDING_KERNEL_H_
+#define HPC_RLL_CPU_PADDING_KERNEL_H_
+
+#include <string.h>
+
+#include "hpc/rll/cpu/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// shapes of less than 3 dims are handled as 3 dims with leading 1, e.g. (s0, s1) is (1, s0, s1),
+// so that the last dim is always contiguous in both the tensor and the padded block
+
+// copy one tensor of shape (shape0, shape1, shape2) into its padded block of shape
+// (max_shape0, max_shape1, max_shape2) row by row, the rest of the block and the mask is filled with value
+inline void padBlockKernel(const float* input, int64_t shape0, int64_t shape1, int64_t shape2,
+        float* new_x, int* mask, int64_t max_shape0, int64_t max_shape1, int64_t max_shape2, int value) {
+    for (int64_t i0 = 0; i0 < max_shape0; ++i0) {
+        for (int64_t i1 = 0; i1 < max_shape1; ++i1) {
+            int64_t len = (i0 < shape0 && i1 < shape1) ? shape2 : 0;
+            float* new_x_row = new_x + (i0 * max_shape1 + i1) * max_shape2;
+            int* mask_row = mask + (i0 * max_shape1 + i1) * max_shape2;
+            if (len > 0)
+                memcpy(new_x_row, input + (i0 * shape1 + i1) * shape2, len * sizeof(float));
+            std::fill(new_x_row + len, new_x_row + max_shape2, static_cast<float>(value));
+            std::fill(mask_row, mask_row + len, 1);
+            std::fill(mask_row + len, mask_row + max_shape2, value);
+        }
+    }
+}
+
+// copy the valid part of one padded block back to a contiguous tensor of shape (shape0, shape1, shape2)
+inline void unpadBlockKernel(const float* input, int64_t max_shape1, int64_t max_shape2,
+        float* output, int64_t shape0, int64_t shape1, int64_t shape2) {
+    for (int64_t i0 = 0; i0 < shape0; ++i0) {
+        for (int64_t i1 = 0; i1 < shape1; ++i1) {
+            memcpy(output + (i0 * shape1 + i1) * shape2, input + (i0 * max_shape1 + i1) * max_shape2,
+                    shape2 * sizeof(float));
+        }
+    }
+}
+
+// read the shape of one tensor from the [n, dim] shape table, padded to 3 dims with leading 1
+inline void getBlockShape(const int64_t* shape, int dim, int64_t* shape3) {
+    for (int i = 0; i < 3 - dim; ++i)
+        shape3[i] = 1;
+    for (int i = 0; i < dim; ++i)
+        shape3[3 - dim + i] = shape[i];
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_PADDING_KERNEL_H_
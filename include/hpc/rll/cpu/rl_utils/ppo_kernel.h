@@ -0,0 +1,94 @@
+#ifndef HPC_RLL_CPU_PPO_KERNEL_H_
+#define HPC_RLL_CPU_PPO_KERNEL_H_
+
+#include <array>
+
+#include "hpc/rll/cpu/common.h"
+#include "hpc/rll/cpu/basic_math.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// handle one sample, add policy/value/entropy loss, approx_kl and clipfrac into acc.
+// the per (sample, head) log probs and entropies are summed over num_heads, the joint values of independent heads
+inline void ppoLoss(unsigned int batch_size, unsigned int num_heads, const float* value_new, const float* value_old,
+        const float* logits_new_prob, const float* logits_old_prob, const float* logits_new_entropy,
+        const float* advantage, const float* return_, const float* weight,
+        bool use_value_clip, float clip_ratio, float dual_clip,
+        float* grad_policy_loss_buf, float* grad_value_loss_buf, float* grad_entropy_loss_buf,
+        std::array<float, 5>& acc, int64_t gid) {
+    float scale = 1.f / batch_size;
+    float w = weight[gid];
+    float adv = advantage[gid];
+
+    float diff_prob = 0.f;
+    float new_entropy = 0.f;
+    for (unsigned int h = 0; h < num_heads; ++h) {
+        diff_prob += logits_new_prob[gid * num_heads + h] - logits_old_prob[gid * num_heads + h];
+        new_entropy += logits_new_entropy[gid * num_heads + h];
+    }
+
+    // entropy loss
+    acc[2] += new_entropy * w;
+    grad_entropy_loss_buf[gid] = w * scale;
+
+    // policy_loss
+    float ratio = std::exp(diff_prob);
+    bool ratio_clamp_flag = (ratio >= (1 - clip_ratio) && ratio <= (1 + clip_ratio));
+
+    float surr1 = ratio * adv;
+    float surr2 = clamp(ratio, 1 - clip_ratio, 1 + clip_ratio) * adv;
+
+    float grad_ratio = ratio;
+    float grad_surr1 = grad_ratio * adv;
+    float grad_surr2 = grad_ratio * adv * ratio_clamp_flag;
+
+    float min_surr = (surr1 <= surr2) ? surr1 : surr2;
+    float grad_min_surr = (surr1 <= surr2) ? grad_surr1 : grad_surr2;
+    if (dual_clip < 1.f) {
+        acc[0] += -min_surr * w;
+        grad_policy_loss_buf[gid] = (-grad_min_surr) * w * scale;
+    } else {
+        float dual_clip_adv = dual_clip * adv;
+        float max_val = std::max(min_surr, dual_clip_adv);
+        acc[0] += -max_val * w;
+        if (min_surr >= dual_clip_adv) {
+            grad_policy_loss_buf[gid] = (-grad_min_surr) * w * scale;
+        } else {
+            grad_policy_loss_buf[gid] = 0;
+        }
+    }
+
+    // monitor info
+    acc[3] += -diff_prob;
+    if (!ratio_clamp_flag) acc[4] += 1.f;
+
+    // value loss
+    float diff_v_r = value_new[gid] - return_[gid];
+    float v_r_squre = diff_v_r * diff_v_r;
+    if (use_value_clip) {
+        float value_diff = value_new[gid] - value_old[gid];
+        float value_clip = value_old[gid] + clamp(value_diff, -clip_ratio, clip_ratio);
+        bool value_diff_clamp_flag = (value_diff >= -clip_ratio && value_diff <= clip_ratio);
+
+        float diff_vclip_r = value_clip - return_[gid];
+        float vclip_r_squre = diff_vclip_r * diff_vclip_r;
+        acc[1] += 0.5 * (std::max(v_r_squre, vclip_r_squre) * w);
+
+        if (v_r_squre >= vclip_r_squre) {
+            grad_value_loss_buf[gid] = 0.5 * (2 * diff_v_r) * w * scale;
+        } else {
+            grad_value_loss_buf[gid] = 0.5 * (2 * diff_vclip_r * value_diff_clamp_flag) * w * scale;
+        }
+    } else {
+        acc[1] += 0.5 * v_r_squre * w;
+        grad_value_loss_buf[gid] = 0.5 * (2 * diff_v_r) * w * scale;
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_PPO_KERNEL_H_
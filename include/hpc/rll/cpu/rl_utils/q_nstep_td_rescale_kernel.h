@@ -0,0 +1,63 @@
+#ifndef HPC_RLL_CPU_Q_NSTEP_TD_RESCALE_KERNEL_H_
+#define HPC_RLL_CPU_Q_NSTEP_TD_RESCALE_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// handle one sample, return the weighted square error
+inline float qNStepTdRescaleForwardKernel(unsigned int time_step, unsigned int batch_size, unsigned int num_output, float gamma,
+        const float* q, const float* next_n_q, const int64_t* action, const int64_t* next_n_action,
+        const float* reward, const float* done, const float* weight,
+        float* td_err, float* grad_buf, int64_t batch_id) {
+    unsigned int num_out_id = action[batch_id];
+
+    float qsa = q[batch_id * num_output + num_out_id];
+    unsigned int next_n_num_out_id = next_n_action[batch_id];
+    float target_qsa = next_n_q[batch_id * num_output + next_n_num_out_id];
+
+    // value_inv_transform
+    float eps = 1e-2;
+    float sign = (target_qsa > 0.f ? 1.f : (target_qsa < 0.f ? -1.f : 0.f));
+    float tmp = (std::sqrt(1.f + 4.f * eps * (std::abs(target_qsa) + 1.f + eps)) - 1) / (2 * eps);
+    target_qsa = sign * (tmp * tmp - 1);
+
+    // nstep_return
+    float sum_reward = 0;
+    float factor = 1;
+    for (int t = 0; t < time_step; ++t) {
+        float rw = reward[t * batch_size + batch_id];
+        sum_reward += (factor * rw);
+        factor *= gamma;
+    }
+    float done_ = done[batch_id];
+    target_qsa = sum_reward + factor * target_qsa * (1.f - done_);
+
+    // value_transform
+    sign = (target_qsa > 0.f ? 1.f : (target_qsa < 0.f ? -1.f : 0.f));
+    target_qsa = sign * (std::sqrt(std::abs(target_qsa) + 1) - 1) + eps * target_qsa;
+
+    float diff = qsa - target_qsa;
+    float sum_square = diff * diff;
+    td_err[batch_id] = sum_square;
+
+    float w = weight[batch_id];
+    grad_buf[batch_id] = 1.f / batch_size * (2.f * diff) * w;
+    return sum_square * w;
+}
+
+inline void qNStepTdRescaleBackwardKernel(unsigned int batch_size, unsigned int num_output,
+        const float* grad_loss, const float* grad_buf, const int64_t* action, float* grad_q, int64_t batch_id) {
+    for (unsigned int i = 0; i < num_output; ++i) {
+        float grad = (i == action[batch_id]) ? grad_buf[batch_id] : 0;
+        grad_q[batch_id * num_output + i] = (*grad_loss) * grad;
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_Q_NSTEP_TD_RESCALE_KERNEL_H_
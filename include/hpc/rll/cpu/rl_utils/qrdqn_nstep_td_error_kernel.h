@@ -0,0 +1,81 @@
+#ifndef HPC_RLL_CPU_QRDQN_NSTEP_TD_ERROR_KERNEL_H_
+#define HPC_RLL_CPU_QRDQN_NSTEP_TD_ERROR_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// handle one sample, return the mean quantile huber loss over tau
+inline float qrdqnNStepTdErrorKernel(unsigned int tau, unsigned int time_step, unsigned int batch_size,
+        unsigned int action_dim, float gamma,
+        const float* q, const float* next_n_q, const int64_t* action, const int64_t* next_n_action,
+        const float* reward, const float* done, const float* value_gamma,
+        float* bellman_err_buf, float* quantile_huber_loss_buf, float* grad_buf, int64_t batch_id) {
+    int64_t action_data = action[batch_id];
+    int64_t next_n_action_data = next_n_action[batch_id];
+    float value_gamma_data = value_gamma[batch_id];
+    float not_done_data = 1.f - done[batch_id];
+
+    float reward_factor = 1;
+    float reward_data = 0;
+    for (int t = 0; t < time_step; t++) {
+        reward_data += reward_factor * reward[t * batch_size + batch_id];
+        reward_factor *= gamma;
+    }
+
+    const float* qsa = q + batch_id * action_dim * tau + action_data * tau;
+    const float* target_qsa = next_n_q + batch_id * action_dim * tau + next_n_action_data * tau;
+    float sum_huber = 0.f;
+    for (unsigned int t = 0; t < tau; t++) {
+        for (unsigned int i = 0; i < tau; i++) {
+            unsigned int index = batch_id * tau * tau + t * tau + i;
+            float target_qsa_transform = reward_data + value_gamma_data * target_qsa[i] * not_done_data;
+            float bellman_error_data = target_qsa_transform - qsa[t];
+
+            float huber_loss_data = 0.f;
+            float grad_buf_data = 0.f;
+            if (std::abs(bellman_error_data) < 1) {
+                huber_loss_data = 0.5f * bellman_error_data * bellman_error_data;
+                grad_buf_data = bellman_error_data;
+            } else {
+                huber_loss_data = (std::abs(bellman_error_data) - 0.5f);
+                grad_buf_data = (bellman_error_data >= 0) ? 1.f : (-1.f);
+            }
+
+            float tmp1 = tau - ((bellman_error_data <= 0) ? 1.f : 0.f);
+            float tmp2 = huber_loss_data * tmp1;
+            float quantile_huber_loss_data = std::abs(tmp2);
+            grad_buf_data *= (tmp2 >= 0 ? tmp1 : -tmp1);
+
+            bellman_err_buf[index] = bellman_error_data;
+            quantile_huber_loss_buf[index] = quantile_huber_loss_data;
+            grad_buf[index] = grad_buf_data;
+            sum_huber += quantile_huber_loss_data;
+        }
+    }
+    return sum_huber / tau;
+}
+
+inline void qrdqnNStepTdErrorBackwardKernel(unsigned int tau, unsigned int batch_size, unsigned int action_dim,
+        const float* grad_loss, const float* grad_buf,
+        const float* weight, const int64_t* action, float* grad_q, int64_t batch_id) {
+    float factor = -1.f * (grad_loss[0] / batch_size * weight[batch_id] / tau); // mean, weight, mean, target_qsa - qsa
+    float* out = grad_q + batch_id * action_dim * tau;
+    std::fill(out, out + action_dim * tau, 0.f);
+    out += action[batch_id] * tau;
+    for (unsigned int i = 0; i < tau; i++) {
+        float grad_data = 0.f;
+        for (unsigned int t = 0; t < tau; t++) {
+            grad_data += grad_buf[batch_id * tau * tau + i * tau + t];
+        }
+        out[i] = grad_data * factor;
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_QRDQN_NSTEP_TD_ERROR_KERNEL_H_
@@ -0,0 +1,86 @@
+#ifndef HPC_RLL_CPU_RETRACE_KERNEL_H_
+#define HPC_RLL_CPU_RETRACE_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+#include "hpc/rll/cpu/accumulate.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// bootstrap term and trace coefficient of step t of one column, so that ret[t] = bootstrap + coef * ret[t + 1].
+// bootstrap = reward[t] + gamma_t * (v[t + 1] - c[t + 1] * target_q[t + 1, a[t + 1]]), coef = gamma_t * c[t + 1],
+// v[t + 1] = sum_a target_prob[t + 1, a] * target_q[t + 1, a] and gamma_t = gamma * (1 - done[t]).
+// c[t + 1] = lambda * min(c_clip_ratio, target_prob / behaviour_prob) of the taken action for retrace, and lambda
+// for Q(lambda) (behaviour_prob is nullptr), the trace is cut at the last step. done is nullptr if not used
+inline void retraceStep(unsigned int time_step, unsigned int batch_size, unsigned int num_output,
+        float gamma, float lambda, float c_clip_ratio, const float* target_q, const int64_t* action,
+        const float* reward, const float* done, const float* target_prob, const float* behaviour_prob,
+        unsigned int t, int64_t batch_id, float* bootstrap, float* coef) {
+    int64_t index = (int64_t)t * batch_size + batch_id;
+    int64_t next_index = index + batch_size;
+    const float* next_q = target_q + next_index * num_output;
+    const float* next_prob = target_prob + next_index * num_output;
+
+    float next_v = 0;
+    for (unsigned int i = 0; i < num_output; ++i) {
+        next_v += next_prob[i] * next_q[i];
+    }
+    float c = 0;
+    float next_qa = 0;
+    if (t + 1 < time_step) {
+        int64_t next_action = action[next_index];
+        next_qa = next_q[next_action];
+        c = lambda;
+        if (behaviour_prob != nullptr) {
+            c *= std::min(c_clip_ratio, next_prob[next_action] / behaviour_prob[next_index * num_output + next_action]);
+        }
+    }
+    float gamma_t = (done != nullptr) ? gamma * (1.f - done[index]) : gamma;
+    *bootstrap = reward[index] + gamma_t * (next_v - c * next_qa);
+    *coef = gamma_t * c;
+}
+
+// handle one column, return the weighted sum of square error.
+// the retrace target is walked backwards and carried in the accumulator Acc
+template <typename Acc>
+inline float retraceForwardKernel(unsigned int time_step, unsigned int batch_size, unsigned int num_output,
+        float gamma, float lambda, float c_clip_ratio,
+        const float* q, const float* target_q, const int64_t* action, const float* reward, const float* done,
+        const float* target_prob, const float* behaviour_prob, const float* weight,
+        float* q_retrace, float* td_err, float* grad_buf, int64_t batch_id) {
+    using T = typename Acc::type;
+    Acc ret;
+    Acc sum_square;
+    float grad_mean = 1.f / (time_step * batch_size);
+    for (int t = time_step - 1; t >= 0; --t) {
+        int64_t index = (int64_t)t * batch_size + batch_id;
+        float bootstrap, coef;
+        retraceStep(time_step, batch_size, num_output, gamma, lambda, c_clip_ratio, target_q, action,
+                reward, done, target_prob, behaviour_prob, t, batch_id, &bootstrap, &coef);
+        ret.mulAdd(coef, bootstrap);
+        T ret_data = ret.value();
+        q_retrace[index] = ret_data;
+
+        T diff = (T)q[index * num_output + action[index]] - ret_data;
+        T weight_data = weight[index];
+        td_err[index] = diff * diff;
+        grad_buf[index] = grad_mean * (2 * diff) * weight_data;
+        sum_square.mulAdd(1, diff * diff * weight_data);
+    }
+    return sum_square.value();
+}
+
+inline void retraceBackwardKernel(unsigned int num_output,
+        const float* grad_loss, const float* grad_buf, const int64_t* action, float* grad_q, int64_t tb_id) {
+    for (unsigned int i = 0; i < num_output; ++i) {
+        float grad = (i == action[tb_id]) ? grad_buf[tb_id] : 0;
+        grad_q[tb_id * num_output + i] = (*grad_loss) * grad;
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_RETRACE_KERNEL_H_
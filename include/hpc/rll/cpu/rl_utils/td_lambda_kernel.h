@@ -0,0 +1,50 @@
+#ifndef HPC_RLL_CPU_TD_LAMBDA_KERNEL_H_
+#define HPC_RLL_CPU_TD_LAMBDA_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+#include "hpc/rll/cpu/accumulate.h"
+#include "hpc/rll/cpu/rl_utils/lambda_return_kernel.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// handle one column, return the weighted sum of square error.
+// rt = reward + gamma * (lambda * rt + (1 - lambda) * next_value) is carried in the accumulator Acc
+template <typename Acc>
+inline float tdLambdaForwardKernel(unsigned int time_step, unsigned int batch_size, float gamma, float lambda,
+        const float* value, const float* reward, const float* weight, float* grad_buf, int64_t batch_id) {
+    using T = typename Acc::type;
+    Acc sum_square;
+    Acc rt;
+    for (int t = time_step - 1; t >= 0; --t) {
+        unsigned int index = t * batch_size + batch_id;
+
+        T value_data = value[index];
+        T next_value_data = value[index + batch_size];
+        T reward_data = reward[index];
+        T weight_data = weight[index];
+
+        lambdaReturnStep(rt, t == time_step - 1, (T)gamma, (T)lambda, reward_data, next_value_data);
+
+        T loss = (rt.value() - value_data);
+        grad_buf[index] = weight_data * (2 * loss * (-1));
+        sum_square.mulAdd(1, loss * loss * weight_data);
+    }
+    return sum_square.value();
+}
+
+inline void tdLambdaBackwardKernel(unsigned int time_step, unsigned int batch_size,
+        const float* grad_loss, const float* grad_buf, float* grad_value, int64_t begin, int64_t end) {
+    float grad = *grad_loss;
+    float grad_mean = 1.f / (time_step * batch_size);
+    for (int64_t i = begin; i < end; ++i) {
+        grad_value[i] = (i < time_step * batch_size) ? (grad * 0.5 * grad_mean * grad_buf[i]) : 0.f;
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_TD_LAMBDA_KERNEL_H_
@@ -0,0 +1,55 @@
+#ifndef HPC_RLL_CPU_UPGO_KERNEL_H_
+#define HPC_RLL_CPU_UPGO_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+#include "hpc/rll/cpu/accumulate.h"
+#include "hpc/rll/cpu/rl_utils/lambda_return_kernel.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// handle one column, the bootstrapped return is carried in the accumulator Acc
+template <typename Acc>
+inline void upgoAdvantageKernel(unsigned int time_step, unsigned int batch_size,
+        const float* rho, const float* reward, const float* value, float* advantage, int64_t batch_id) {
+    using T = typename Acc::type;
+    Acc item;
+    for (int t = time_step - 1; t >= 0; --t) {
+        unsigned int index = t * batch_size + batch_id;
+
+        float rho_data = rho[index];
+
+        float reward_data0 = reward[index];
+        // Note: when t == time_step - 1, reward_data1 is not used. Just avoid accessing out of memory bound.
+        float reward_data1 = (t == time_step - 1) ? 0.f : reward[index + batch_size];
+
+        float value0 = value[index];
+        float value1 = value[index + batch_size];
+        // Note: when t == time_step - 1, value2 is not used. Just avoid accessing out of memory bound.
+        float value2 = (t == time_step - 1) ? 0.f : value[index + batch_size * 2];
+
+        // upgo return is the lambda return with gamma 1, the trace keeps chaining (lambda 1) while the next step
+        // is better than its value, otherwise it bootstraps from value1 (lambda 0)
+        bool chain = !(reward_data1 + value2 < value1);
+        lambdaReturnStep(item, t == time_step - 1, (T)1, (T)(chain ? 1 : 0), (T)reward_data0, (T)value1);
+        advantage[index] = (item.value() - (T)value0) * rho_data;
+    }
+}
+
+inline void upgoBackwardKernel(unsigned int time_step, unsigned int batch_size, unsigned int num_output,
+        const float* grad_loss, const float* grad_buf,
+        const float* advantages, float* grad_target_output, int64_t tb_id) {
+    float grad = (*grad_loss);
+    float grad_mean = 1.f / (time_step * batch_size);
+    float factor = grad * (-1.f) * grad_mean * advantages[tb_id];
+    for (unsigned int i = tb_id * num_output; i < (tb_id + 1) * num_output; ++i) {
+        grad_target_output[i] = factor * grad_buf[i];
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_UPGO_KERNEL_H_
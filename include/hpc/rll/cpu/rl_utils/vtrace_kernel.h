@@ -0,0 +1,96 @@
+#ifndef HPC_RLL_CPU_VTRACE_KERNEL_H_
+#define HPC_RLL_CPU_VTRACE_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+#include "hpc/rll/cpu/accumulate.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// minimum number of columns handled by one task of vtraceReturnsKernel, same as GAE_MIN_LANES
+const int64_t VTRACE_MIN_LANES = 16;
+
+// discount of one step, gamma scaled by the optional per step discount (T, B) and cut by the optional done (T, B),
+// pass nullptr if not used. done[t] = 1 means t is the last step of an episode, so v[t + 1] is not bootstrapped
+// and the trace restarts, which lets an unroll span several episodes
+inline float vtraceDiscount(float gamma, const float* done, const float* discount, int64_t index) {
+    float d = gamma;
+    if (discount != nullptr) d *= discount[index];
+    if (done != nullptr) d *= (1.f - done[index]);
+    return d;
+}
+
+// handle one column, the return minus value is carried in the accumulator Acc
+template <typename Acc>
+inline void vtraceNStepReturn(unsigned int time_step, unsigned int batch_size,
+        float gamma, float lambda, float rho_clip_ratio, float c_clip_ratio,
+        const float* is, const float* reward, const float* value, const float* done, const float* discount,
+        float* ret, int64_t batch_id) {
+    using T = typename Acc::type;
+    Acc item;
+    for (int t = time_step - 1; t >= 0; --t) {
+        int64_t index = t * batch_size + batch_id;
+        float is_data = is[index];
+        T clipped_rho = std::min(is_data, rho_clip_ratio);
+        T clipped_c = std::min(is_data, c_clip_ratio);
+        T gamma_t = vtraceDiscount(gamma, done, discount, index);
+        T reward_data = reward[index];
+        T value_data = value[index];
+        T value_plus1_data = value[index + batch_size];
+        T delta = clipped_rho * (reward_data + gamma_t * value_plus1_data - value_data);
+        item.mulAdd(gamma_t * (T)lambda * clipped_c, delta);
+        ret[index] = value_data + item.value();
+    }
+}
+
+// handle one column
+inline void vtraceAdvantage(unsigned int time_step, unsigned int batch_size, float gamma, float rho_pg_clip_ratio,
+        const float* is, const float* reward, const float* value, const float* done, const float* discount,
+        const float* ret, float* adv, int64_t batch_id) {
+    for (unsigned int t = 0; t < time_step; ++t) {
+        unsigned int index = t * batch_size + batch_id;
+        float clipped_pg_rho = std::min(is[index], rho_pg_clip_ratio);
+        float ret_data = (t == (time_step - 1)) ? value[index + batch_size] : ret[index + batch_size];
+        adv[index] = clipped_pg_rho * (reward[index] + vtraceDiscount(gamma, done, discount, index) * ret_data - value[index]);
+    }
+}
+
+// vtrace targets of the columns [batch_begin, batch_end) from the log importance weights, without any loss.
+// discount (T, B) already contains the episode ends, bootstrap (B, ) is the value after the last step.
+// The rows are swept as contiguous lanes and t is walked backwards, vs - v is carried in the accumulator Acc
+template <typename scalar_t, typename Acc>
+inline void vtraceReturnsKernel(unsigned int time_step, unsigned int batch_size,
+        float lambda, float rho_clip_ratio, float c_clip_ratio, float rho_pg_clip_ratio,
+        const scalar_t* log_rho, const scalar_t* discount, const scalar_t* reward, const scalar_t* value,
+        const scalar_t* bootstrap, scalar_t* vs, scalar_t* pg_adv, int64_t batch_begin, int64_t batch_end) {
+    using T = typename Acc::type;
+    const int64_t lanes = batch_end - batch_begin;
+    std::vector<Acc> vtrace_item(lanes);
+    Acc* item = vtrace_item.data();
+    // value and vs of the next step, both are the bootstrap value after the last step
+    std::vector<T> next_value(bootstrap + batch_begin, bootstrap + batch_end);
+    std::vector<T> next_vs(next_value);
+    for (int t = time_step - 1; t >= 0; --t) {
+        int64_t row = (int64_t)t * batch_size + batch_begin;
+        for (int64_t i = 0; i < lanes; ++i) {
+            T rho = std::exp(static_cast<T>(log_rho[row + i]));
+            T discount_data = discount[row + i];
+            T reward_data = reward[row + i];
+            T value_data = value[row + i];
+            T delta = std::min(rho, (T)rho_clip_ratio) * (reward_data + discount_data * next_value[i] - value_data);
+            item[i].mulAdd(discount_data * (T)lambda * std::min(rho, (T)c_clip_ratio), delta);
+            T vs_data = value_data + item[i].value();
+            vs[row + i] = vs_data;
+            pg_adv[row + i] = std::min(rho, (T)rho_pg_clip_ratio) * (reward_data + discount_data * next_vs[i] - value_data);
+            next_value[i] = value_data;
+            next_vs[i] = vs_data;
+        }
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_VTRACE_KERNEL_H_
@@ -0,0 +1,36 @@
+#ifndef HPC_RLL_CPU_NETWORK_H_
+#define HPC_RLL_CPU_NETWORK_H_
+
+#include "hpc/rll/cpu/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// lstm, batch_sizes[s] is the number of the active samples at timestep s, the samples are sorted by length in
+// descending order. It is empty if all the sequences have the full length
+void LstmForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float dropout_threshold,
+    int64_t seed,
+    const std::vector<int>& batch_sizes);
+
+void LstmBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float dropout_threshold,
+    int64_t seed,
+    const std::vector<int>& batch_sizes);
+
+// lstm inference, no activation is saved for backward and h, c are updated in place
+void LstmInferenceForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    const std::vector<int>& batch_sizes);
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_NETWORK_H_
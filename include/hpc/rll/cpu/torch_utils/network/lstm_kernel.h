@@ -0,0 +1,141 @@
+#ifndef HPC_RLL_CPU_LSTM_KERNEL_H_
+#define HPC_RLL_CPU_LSTM_KERNEL_H_
+
+#include "hpc/rll/cpu/common.h"
+#include "hpc/rll/cpu/basic_math.h"
+#include "hpc/rll/cpu/philox.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// mean and reciprocal std of one row
+inline void layernormStat(unsigned int n, const float* x, float* mean, float* rstd) {
+    float sum = 0.f;
+    for (unsigned int i = 0; i < n; ++i)
+        sum += x[i];
+    float m = sum / n;
+    float sum_square = 0.f;
+    for (unsigned int i = 0; i < n; ++i)
+        sum_square += (x[i] - m) * (x[i] - m);
+    *mean = m;
+    *rstd = 1.f / std::sqrt(sum_square / n + EPSILON);
+}
+
+// one batch row of a timestep: layernorm of the x and h projections, bias and the gate activations are fused,
+// the normalized projections are not stored. ifog is nullptr in inference, h and c may be the same as pre_h and pre_c
+inline void lstmCellForwardKernel(unsigned int hidden_size, const float* ln_x, const float* ln_h,
+        const float* gamma_x, const float* beta_x, const float* gamma_h, const float* beta_h, const float* bias,
+        const float* pre_c, float* mean_x, float* rstd_x, float* mean_h, float* rstd_h,
+        float* h, float* c, float* ifog, float* output) {
+    layernormStat(hidden_size * 4, ln_x, mean_x, rstd_x);
+    layernormStat(hidden_size * 4, ln_h, mean_h, rstd_h);
+    const float mx = *mean_x, rx = *rstd_x, mh = *mean_h, rh = *rstd_h;
+    for (unsigned int j = 0; j < hidden_size; ++j) {
+        float val[4];
+        for (int g = 0; g < 4; ++g) {
+            unsigned int k = g * hidden_size + j;
+            val[g] = (ln_x[k] - mx) * rx * gamma_x[k] + beta_x[k] + (ln_h[k] - mh) * rh * gamma_h[k] + beta_h[k]
+                + bias[k];
+        }
+        float i = sigmoid(val[0]);
+        float f = sigmoid(val[1]);
+        float o = sigmoid(val[2]);
+        float g = std::tanh(val[3]);
+        float new_c = f * pre_c[j] + i * g;
+        float new_h = o * std::tanh(new_c);
+
+        h[j] = new_h;
+        c[j] = new_c;
+        if (ifog != nullptr) {
+            ifog[hidden_size * 0 + j] = i;
+            ifog[hidden_size * 1 + j] = f;
+            ifog[hidden_size * 2 + j] = o;
+            ifog[hidden_size * 3 + j] = g;
+        }
+        output[j] = new_h;
+    }
+}
+
+// elements [begin, end) of the output of one layer, the random numbers of element e are the word e % 4 of
+// philox(e / 4, layer) keyed by seed, the same as the cuda version. The element is kept if its random number > threshold
+inline void dropoutKernel(int64_t begin, int64_t end, uint32_t threshold, float scale, uint64_t seed, uint32_t layer,
+        float* data) {
+    uint32_t rand[4];
+    for (int64_t gid = begin / 4; gid * 4 < end; ++gid) {
+        philox4x32(gid, layer, 0, 0, seed, rand);
+        for (int64_t e = std::max(gid * 4, begin); e < std::min(gid * 4 + 4, end); ++e) {
+            data[e] = data[e] * (rand[e - gid * 4] > threshold) * scale;
+        }
+    }
+}
+
+// one batch row of a timestep, dh and dc carry the gradient to the previous timestep
+inline void lstmCellBackwardKernel(unsigned int hidden_size, const float* dy, const float* c, const float* pre_c,
+        const float* ifog, float* dgate, float* dh, float* dc) {
+    for (unsigned int j = 0; j < hidden_size; ++j) {
+        float i = ifog[hidden_size * 0 + j];
+        float f = ifog[hidden_size * 1 + j];
+        float o = ifog[hidden_size * 2 + j];
+        float g = ifog[hidden_size * 3 + j];
+        float tanh_c = std::tanh(c[j]);
+
+        float dhdata = dh[j] + dy[j];
+        float dcdata = dc[j] + dhdata * o * (1 - tanh_c * tanh_c);
+
+        dgate[hidden_size * 0 + j] = dcdata * g * i * (1 - i);
+        dgate[hidden_size * 1 + j] = dcdata * pre_c[j] * f * (1 - f);
+        dgate[hidden_size * 2 + j] = dhdata * tanh_c * o * (1 - o);
+        dgate[hidden_size * 3 + j] = dcdata * i * (1 - g * g);
+
+        dc[j] = dcdata * f;
+        dh[j] = dhdata;
+    }
+}
+
+// gradient of the layernorm input of one row, the gradient of gamma and beta is reduced separately
+inline void layernormBackwardKernel(unsigned int n, const float* dy, const float* x, float mean, float rstd,
+        const float* gamma, float* dx) {
+    float ds = 0.f;
+    float db = 0.f;
+    for (unsigned int i = 0; i < n; ++i) {
+        ds += dy[i] * x[i] * gamma[i];
+        db += dy[i] * gamma[i];
+    }
+    float scale = 1.f / n;
+    float a = (db * mean - ds) * rstd * rstd * rstd * scale;
+    float b = -a * mean - db * rstd * scale;
+    for (unsigned int i = 0; i < n; ++i) {
+        dx[i] = rstd * dy[i] * gamma[i] + a * x[i] + b;
+    }
+}
+
+// dgamma and dbeta of the columns [begin, end) summed over the rows of the active samples of all the timesteps,
+// the rows are visited in order, so the sums are reproducible. batch_sizes is nullptr if all the samples are active
+inline void layernormParamBackwardKernel(unsigned int seq_len, unsigned int batch_size, const int* batch_sizes,
+        unsigned int n, const float* dy, const float* x, const float* mean, const float* rstd,
+        float* dgamma, float* dbeta, int64_t begin, int64_t end) {
+    for (int64_t i = begin; i < end; ++i) {
+        dgamma[i] = 0.f;
+        dbeta[i] = 0.f;
+    }
+    for (unsigned int s = 0; s < seq_len; ++s) {
+        const int64_t active = (batch_sizes == nullptr ? batch_size : batch_sizes[s]);
+        for (int64_t r = s * batch_size; r < s * batch_size + active; ++r) {
+            const float* dy_row = dy + r * n;
+            const float* x_row = x + r * n;
+            const float m = mean[r];
+            const float rs = rstd[r];
+            for (int64_t i = begin; i < end; ++i) {
+                dgamma[i] += dy_row[i] * (x_row[i] - m) * rs;
+                dbeta[i] += dy_row[i];
+            }
+        }
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CPU_LSTM_KERNEL_H_
@@ -0,0 +1,71 @@
+#ifndef HPC_RLL_CUDA_ACCUMULATE_H_
+#define HPC_RLL_CUDA_ACCUMULATE_H_
+
+#include "hpc/rll/cuda/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cuda {
+
+// accumulation modes of the long recursions (discounted returns and advantages over T steps),
+// the storage of the inputs and outputs is not changed, only the carried sum
+enum AccumulateMode {
+    ACCUMULATE_FLOAT = 0,   // plain recursion in the compute type of the inputs
+    ACCUMULATE_KAHAN = 1,   // compensated recursion, the rounding error is carried in a second term
+    ACCUMULATE_DOUBLE = 2,  // recursion in double
+};
+
+// the products and sums of the error-free transforms must not be contracted into fma by nvcc
+__forceinline__ __device__ float mulRn(float a, float b) { return __fmul_rn(a, b); }
+__forceinline__ __device__ double mulRn(double a, double b) { return __dmul_rn(a, b); }
+__forceinline__ __device__ float addRn(float a, float b) { return __fadd_rn(a, b); }
+__forceinline__ __device__ double addRn(double a, double b) { return __dadd_rn(a, b); }
+
+// s = a * s + b in T
+template <typename T>
+struct Accumulator {
+    using type = T;
+    T s = 0;
+
+    __forceinline__ __device__ void mulAdd(T a, T b) { s = a * s + b; }
+    __forceinline__ __device__ void reset(T v) { s = v; }
+    __forceinline__ __device__ T value() const { return s; }
+};
+
+// s = a * s + b, the rounding error of the product (by fma) and of the sum (by two-sum) is carried in c, i.e. a
+// compensated horner step, so the result is about as accurate as the recursion done in twice the precision
+template <typename T>
+struct KahanAccumulator {
+    using type = T;
+    T s = 0;
+    T c = 0;
+
+    __forceinline__ __device__ void mulAdd(T a, T b) {
+        T p = mulRn(a, s);
+        T pe = fma(a, s, -p);
+        T sum = addRn(p, b);
+        T z = addRn(sum, -p);
+        T se = addRn(addRn(p, -addRn(sum, -z)), addRn(b, -z));
+        c = a * c + (pe + se);
+        s = sum;
+    }
+    __forceinline__ __device__ void reset(T v) { s = v; c = 0; }
+    __forceinline__ __device__ T value() const { return s + c; }
+};
+
+// call f(acc) with a zero accumulator of the mode on the host, the kernels are instantiated with decltype(acc).
+// T is the compute type of the float and kahan modes
+template <typename T, typename F>
+inline void dispatchAccumulateMode(int mode, const F& f) {
+    switch (mode) {
+        case ACCUMULATE_KAHAN: f(KahanAccumulator<T>()); break;
+        case ACCUMULATE_DOUBLE: f(Accumulator<double>()); break;
+        default: f(Accumulator<T>());
+    }
+}
+
+}  // namespace cuda
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CUDA_ACCUMULATE_H_
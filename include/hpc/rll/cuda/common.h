@@ -7,6 +7,8 @@
 #include <fstream>
 
 #include <torch/types.h>
+#include <ATen/Dispatch.h>
+#include <ATen/OpMathType.h>
 
 #include "hpc/rll/cuda/status.h"
 
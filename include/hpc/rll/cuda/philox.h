@@ -0,0 +1,44 @@
+#ifndef HPC_RLL_CUDA_PHILOX_H_
+#define HPC_RLL_CUDA_PHILOX_H_
+
+#include <stdint.h>
+
+namespace hpc {
+namespace rll {
+namespace cuda {
+
+// Philox4x32-10 counter-based random number generator (Salmon et al., "Parallel Random Numbers: As Easy as 1, 2, 3").
+// The output only depends on (counter, key), so any element can be regenerated without storing it.
+
+__forceinline__ __device__
+uint4 philoxRound(uint4 ctr, uint2 key) {
+    const unsigned int M0 = 0xD2511F53;
+    const unsigned int M1 = 0xCD9E8D57;
+    unsigned int hi0 = __umulhi(M0, ctr.x);
+    unsigned int lo0 = M0 * ctr.x;
+    unsigned int hi1 = __umulhi(M1, ctr.z);
+    unsigned int lo1 = M1 * ctr.z;
+    return make_uint4(hi1 ^ ctr.y ^ key.x, lo1, hi0 ^ ctr.w ^ key.y, lo0);
+}
+
+// 4 random uint32 for the counter (c0, c1, c2, c3) with the 64-bit seed as key
+__forceinline__ __device__
+uint4 philox4x32(unsigned int c0, unsigned int c1, unsigned int c2, unsigned int c3, uint64_t seed) {
+    const unsigned int W0 = 0x9E3779B9;
+    const unsigned int W1 = 0xBB67AE85;
+    uint4 ctr = make_uint4(c0, c1, c2, c3);
+    uint2 key = make_uint2((unsigned int)seed, (unsigned int)(seed >> 32));
+    #pragma unroll
+    for (int r = 0; r < 9; r++) {
+        ctr = philoxRound(ctr, key);
+        key.x += W0;
+        key.y += W1;
+    }
+    return philoxRound(ctr, key);
+}
+
+}  // namespace cuda
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CUDA_PHILOX_H_
@@ -0,0 +1,45 @@
+#ifndef HPC_RLL_CUDA_CATEGORICAL_HEADS_H_
+#define HPC_RLL_CUDA_CATEGORICAL_HEADS_H_
+
+#include "hpc/rll/cuda/common.h"
+
+namespace hpc {
+namespace rll {
+namespace cuda {
+
+const unsigned int MAX_CATEGORICAL_HEADS = 32;
+
+// independent categorical heads over a concatenated row of logits (multi-discrete action space),
+// head h owns [offset[h], offset[h + 1]) of the row. It is small and passed to the kernels by value
+struct CategoricalHeads {
+    unsigned int num;
+    unsigned int offset[MAX_CATEGORICAL_HEADS + 1];
+};
+
+// an empty heads means a single head over the whole row
+inline CategoricalHeads makeCategoricalHeads(const std::vector<int64_t>& heads, unsigned int num_output) {
+    CategoricalHeads ret;
+    if (heads.empty()) {
+        ret.num = 1;
+        ret.offset[0] = 0;
+        ret.offset[1] = num_output;
+        return ret;
+    }
+    TORCH_CHECK(heads.size() <= MAX_CATEGORICAL_HEADS,
+            "at most ", MAX_CATEGORICAL_HEADS, " categorical heads are supported, but get ", heads.size());
+    ret.num = heads.size();
+    ret.offset[0] = 0;
+    for (unsigned int h = 0; h < ret.num; ++h) {
+        TORCH_CHECK(heads[h] > 0, "size of head ", h, " should be positive, but get ", heads[h]);
+        ret.offset[h + 1] = ret.offset[h] + heads[h];
+    }
+    TORCH_CHECK(ret.offset[ret.num] == num_output,
+            "sum of heads should be ", num_output, ", but get ", ret.offset[ret.num]);
+    return ret;
+}
+
+}  // namespace cuda
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CUDA_CATEGORICAL_HEADS_H_
@@ -7,8 +7,10 @@ namespace hpc {
 namespace rll {
 namespace cuda {
 
-std::vector<std::vector<int>> sample_split_group(const std::vector<torch::Tensor>& x, int group);
+std::vector<std::vector<int>> sample_split_group(const std::vector<torch::Tensor>& x, int group, int64_t seed);
+std::vector<std::vector<int>> quantile_split_group(const std::vector<torch::Tensor>& x, int group);
 std::vector<std::vector<int>> oracle_split_group(const std::vector<torch::Tensor>& x, int group);
+std::vector<std::vector<int>> fast_oracle_split_group(const std::vector<torch::Tensor>& x, int group);
 
 std::vector<torch::Tensor> Pad1DForward(
     const std::vector<torch::Tensor>& inputs, 
@@ -58,24 +60,61 @@ std::vector<torch::Tensor> Unpad3DForward(
     const torch::Tensor& inputs, 
     const std::vector<int>& shape);
 
+// ragged inputs: values is the flattened tensors, offsets [n + 1] and shapes [n, dim] are int64 on the same device
+std::vector<torch::Tensor> PadRaggedForward(
+    const torch::Tensor& values,
+    const torch::Tensor& offsets,
+    const torch::Tensor& shapes,
+    const int& value);
+
+torch::Tensor UnpadRaggedForward(
+    const torch::Tensor& inputs,
+    const torch::Tensor& offsets,
+    const torch::Tensor& shapes);
+
 // gae
 void GaeForward(
     const std::vector<torch::Tensor>& inputs,
     std::vector<torch::Tensor>& outputs,
     float gamma,
-    float lambda);
+    float lambda,
+    int accumulate_mode);
+
+// gae + return + advantage normalization
+void GaeNormForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    float eps,
+    int accumulate_mode);
 
 // td_lambda
 void TdLambdaForward(
     const std::vector<torch::Tensor>& inputs,
     std::vector<torch::Tensor>& outputs,
     float gamma,
-    float lambda);
+    float lambda,
+    int accumulate_mode);
 
 void TdLambdaBackward(
     const std::vector<torch::Tensor>& inputs,
     std::vector<torch::Tensor>& outputs);
 
+// lambda_return
+void LambdaReturnForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    int accumulate_mode);
+
+void LambdaReturnBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda);
+
 // dist_nstep_td
 void DistNStepTdForward(
     const std::vector<torch::Tensor>& inputs,
@@ -98,6 +137,27 @@ void QNStepTdBackward(
     const std::vector<torch::Tensor>& inputs,
     std::vector<torch::Tensor>& outputs);
 
+// nstep_return
+void NStepReturnForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    int nstep,
+    int accumulate_mode);
+
+// retrace
+void RetraceForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    float c_clip_ratio,
+    int accumulate_mode);
+
+void RetraceBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs);
+
 // q_nstep_td_with_rescale
 void QNStepTdRescaleForward(
     const std::vector<torch::Tensor>& inputs,
@@ -111,7 +171,8 @@ void QNStepTdRescaleBackward(
 // upgo
 void UpgoForward(
     const std::vector<torch::Tensor>& inputs,
-    std::vector<torch::Tensor>& outputs);
+    std::vector<torch::Tensor>& outputs,
+    int accumulate_mode);
 
 void UpgoBackward(
     const std::vector<torch::Tensor>& inputs,
@@ -125,21 +186,48 @@ void VTraceForward(
     float lambda,
     float rho_clip_ratio,
     float c_clip_ratio,
-    float rho_pg_clip_ratio);
+    float rho_pg_clip_ratio,
+    int accumulate_mode,
+    const std::vector<int64_t>& heads);
 
 void VTraceBackward(
     const std::vector<torch::Tensor>& inputs,
-    std::vector<torch::Tensor>& outputs);
+    std::vector<torch::Tensor>& outputs,
+    const std::vector<int64_t>& heads);
 
-// ppo
+// vtrace returns and pg advantages from log importance weights, without loss and autograd
+void VTraceReturnsForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float lambda,
+    float rho_clip_ratio,
+    float c_clip_ratio,
+    float rho_pg_clip_ratio,
+    int accumulate_mode);
+
+// ppo, heads are the sizes of the independent categorical heads over the concatenated logits
 void PPOForward(
     const std::vector<torch::Tensor>& inputs,
     std::vector<torch::Tensor>& outputs,
     bool use_value_clip,
     float clip_ratio,
-    float dual_clip);
+    float dual_clip,
+    const std::vector<int64_t>& heads);
 
 void PPOBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    const std::vector<int64_t>& heads);
+
+// ppo with diagonal gaussian policy
+void PPOContinuousForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    bool use_value_clip,
+    float clip_ratio,
+    float dual_clip);
+
+void PPOContinuousBackward(
     const std::vector<torch::Tensor>& inputs,
     std::vector<torch::Tensor>& outputs);
 
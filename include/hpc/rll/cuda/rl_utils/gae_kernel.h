@@ -2,29 +2,118 @@
 #define HPC_RLL_CUDA_GAE_KERNEL_H_
 
 #include "hpc/rll/cuda/common.h"
+#include "hpc/rll/cuda/reduce.h"
+#include "hpc/rll/cuda/accumulate.h"
 
 namespace hpc {
 namespace rll {
 namespace cuda {
 
+// done (T, B) and lengths (B, ) are optional, pass nullptr if not used.
+// done[t] = 1 means t is the last step of an episode, so v[t + 1] is not bootstrapped and the estimator restarts,
+// steps after lengths[b] are padding, and v[lengths[b]] is used as the bootstrap value.
+// The estimator is carried in the accumulator Acc (see accumulate.h), whose compute type is at least float,
+// so half and bfloat16 inputs only round the stored adv
+template <typename scalar_t, typename Acc>
 void __global__ gaeForwardKernel(unsigned int time_step, unsigned int batch_size, float gamma, float lambda,
-        const float* value, const float* reward, float* adv) {
+        const scalar_t* value, const scalar_t* reward, const scalar_t* done, const int64_t* lengths, scalar_t* adv) {
+    using T = typename Acc::type;
     unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
     if (gid < batch_size) {
-        float gae_item = 0;
-        float denom = 0;
-        float factor = gamma * lambda;
-        for (int t = time_step - 1; t >= 0; --t) {
+        Acc gae_item;
+        Acc denom;
+        T factor = (T)gamma * (T)lambda;
+        int length = (lengths != nullptr) ? max(min((int)lengths[gid], (int)time_step), 0) : time_step;
+        for (int t = time_step - 1; t >= length; --t) {
+            adv[t * batch_size + gid] = 0;
+        }
+        for (int t = length - 1; t >= 0; --t) {
+            unsigned int index = t * batch_size + gid;
+
+            T not_done = (done != nullptr) ? (1 - static_cast<T>(done[index])) : 1;
+            denom.mulAdd((T)lambda * not_done, 1);
+            T reward_data = reward[index];
+            T value_data = value[index];
+            T next_value_data = value[index + batch_size];
+            T delta = reward_data + (T)gamma * next_value_data * not_done - value_data;
+            gae_item.mulAdd(factor * not_done, denom.value() * delta);
+            adv[index] = gae_item.value() / denom.value();
+        }
+    }
+}
+
+// gae + return, and sum up adv, adv * adv and the valid count of each block into stat for normalization.
+// stat must be zero before, it is double for all the input types, so the sums and the count stay exact
+// past 2^24 steps, the same as the cpu version.
+template <typename scalar_t, typename Acc>
+void __global__ gaeReturnKernel(unsigned int time_step, unsigned int batch_size, float gamma, float lambda,
+        const scalar_t* value, const scalar_t* reward, const scalar_t* done, const int64_t* lengths,
+        scalar_t* adv, scalar_t* ret, double* stat) {
+    using T = typename Acc::type;
+    unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
+    double sum_adv = 0;
+    double sum_square_adv = 0;
+    double count = 0;
+    if (gid < batch_size) {
+        Acc gae_item;
+        Acc denom;
+        T factor = (T)gamma * (T)lambda;
+        int length = (lengths != nullptr) ? max(min((int)lengths[gid], (int)time_step), 0) : time_step;
+        for (int t = time_step - 1; t >= length; --t) {
+            adv[t * batch_size + gid] = 0;
+            ret[t * batch_size + gid] = 0;
+        }
+        for (int t = length - 1; t >= 0; --t) {
             unsigned int index = t * batch_size + gid;
 
-            denom = 1 + lambda * denom;
-            float reward_data = reward[index];
-            float value_data = value[index];
-            float next_value_data = value[index + batch_size];
-            float delta = reward_data + gamma * next_value_data - value_data;
-            gae_item = denom * delta + factor * gae_item;
-            adv[index] = gae_item / denom;
+            T not_done = (done != nullptr) ? (1 - static_cast<T>(done[index])) : 1;
+            denom.mulAdd((T)lambda * not_done, 1);
+            T reward_data = reward[index];
+            T value_data = value[index];
+            T next_value_data = value[index + batch_size];
+            T delta = reward_data + (T)gamma * next_value_data * not_done - value_data;
+            gae_item.mulAdd(factor * not_done, denom.value() * delta);
+            T adv_data = gae_item.value() / denom.value();
+            adv[index] = adv_data;
+            ret[index] = adv_data + value_data;
+
+            // sum up the stored adv, as the cpu version does
+            double a = static_cast<double>(adv[index]);
+            sum_adv += a;
+            sum_square_adv += a * a;
         }
+        count = length;
+    }
+
+    double reduced_sum_adv = blockReduceSum<double>(sum_adv);
+    __syncthreads();
+    double reduced_sum_square_adv = blockReduceSum<double>(sum_square_adv);
+    __syncthreads();
+    double reduced_count = blockReduceSum<double>(count);
+    if (threadIdx.x == 0) {
+        atomicAdd(&stat[0], reduced_sum_adv);
+        atomicAdd(&stat[1], reduced_sum_square_adv);
+        atomicAdd(&stat[2], reduced_count);
+    }
+}
+
+// norm_adv = (adv - mean) / (std + eps), std is unbiased as torch.std. padding steps get zero.
+template <typename scalar_t>
+void __global__ advNormKernel(unsigned int time_step, unsigned int batch_size, float eps,
+        const scalar_t* adv, const int64_t* lengths, const double* stat, scalar_t* norm_adv) {
+    unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
+    if (gid < time_step * batch_size) {
+        // the variance is formed in double, where sumsq - mean * sum does not cancel away as it does in float
+        double count = stat[2];
+        double mean_data = stat[0] / count;
+        double var = (stat[1] - mean_data * stat[0]) / max(count - 1., 1.);
+        float mean = mean_data;
+        float std = sqrt(max(var, 0.));
+
+        unsigned int t = gid / batch_size;
+        unsigned int b = gid % batch_size;
+        bool valid = (lengths == nullptr) || (t < lengths[b]);
+        norm_adv[gid] = valid ? (static_cast<float>(adv[gid]) - mean) / (std + eps) : 0.f;
     }
 }
 
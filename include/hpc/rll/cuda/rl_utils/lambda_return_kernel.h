@@ -0,0 +1,73 @@
+#ifndef HPC_RLL_CUDA_LAMBDA_RETURN_KERNEL_H_
+#define HPC_RLL_CUDA_LAMBDA_RETURN_KERNEL_H_
+
+#include "hpc/rll/cuda/common.h"
+#include "hpc/rll/cuda/accumulate.h"
+
+namespace hpc {
+namespace rll {
+namespace cuda {
+
+// one backward step of the lambda return carried in ret, shared by TD(lambda), UPGO and the generic lambda return.
+// ret = reward + gamma * (lambda * ret + (1 - lambda) * next_value), the trace is cut at the last step and
+// when lambda is 0, so ret restarts from the bootstrap value
+template <typename Acc>
+__forceinline__ __device__ void lambdaReturnStep(Acc& ret, bool last, typename Acc::type gamma,
+        typename Acc::type lambda, typename Acc::type reward, typename Acc::type next_value) {
+    using T = typename Acc::type;
+    if (last || lambda == (T)0) {
+        ret.reset(reward + gamma * next_value);
+    } else {
+        ret.mulAdd(gamma * lambda, reward + gamma * (1 - lambda) * next_value);
+    }
+}
+
+// generalized lambda return, one thread per column. value is (T + 1, B), gamma and lambda are the optional
+// per step (T, B) factors, pass nullptr to use the scalar ones
+template <typename scalar_t, typename Acc>
+void __global__ lambdaReturnForwardKernel(unsigned int time_step, unsigned int batch_size, float gamma, float lambda,
+        const scalar_t* value, const scalar_t* reward, const scalar_t* gammas, const scalar_t* lambdas,
+        scalar_t* ret) {
+    using T = typename Acc::type;
+    unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
+    if (gid < batch_size) {
+        Acc item;
+        for (int t = time_step - 1; t >= 0; --t) {
+            unsigned int index = t * batch_size + gid;
+            T gamma_data = (gammas != nullptr) ? static_cast<T>(gammas[index]) : (T)gamma;
+            T lambda_data = (lambdas != nullptr) ? static_cast<T>(lambdas[index]) : (T)lambda;
+            lambdaReturnStep(item, t == time_step - 1, gamma_data, lambda_data,
+                    static_cast<T>(reward[index]), static_cast<T>(value[index + batch_size]));
+            ret[index] = item.value();
+        }
+    }
+}
+
+// backward of the lambda return w.r.t. value, one thread per column and t is walked forwards.
+// the grad reaching ret[t] is grad_ret[t] + gamma[t - 1] * lambda[t - 1] * (grad of ret[t - 1]),
+// and it flows to value[t + 1] with gamma[t] * (1 - lambda[t]), lambda is taken as 0 at the last step
+template <typename scalar_t>
+void __global__ lambdaReturnBackwardKernel(unsigned int time_step, unsigned int batch_size, float gamma, float lambda,
+        const scalar_t* grad_ret, const scalar_t* gammas, const scalar_t* lambdas, scalar_t* grad_value) {
+    using T = at::opmath_type<scalar_t>;
+    unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
+    if (gid < batch_size) {
+        T trace = 0;
+        grad_value[gid] = 0;
+        for (unsigned int t = 0; t < time_step; ++t) {
+            unsigned int index = t * batch_size + gid;
+            T gamma_data = (gammas != nullptr) ? static_cast<T>(gammas[index]) : (T)gamma;
+            T lambda_data = (t == time_step - 1) ? (T)0
+                : ((lambdas != nullptr) ? static_cast<T>(lambdas[index]) : (T)lambda);
+            T grad = static_cast<T>(grad_ret[index]) + trace;
+            grad_value[index + batch_size] = grad * gamma_data * (1 - lambda_data);
+            trace = grad * gamma_data * lambda_data;
+        }
+    }
+}
+
+}  // namespace cuda
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_CUDA_LAMBDA_RETURN_KERNEL_H_
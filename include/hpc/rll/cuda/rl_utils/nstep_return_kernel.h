@@ -0,0 +1,55 @@
+#ifndef HPC_RLL_CUDA_NSTEP_RETURN_KERNEL_H_
+#define HPC_RLL_CUDA_NSTEP_RETURN_KERNEL_H_
+
+#include "hpc/rll/cuda/common.h"
+#include "hpc/rll/cuda/accumulate.h"
+
+namespace hpc {
+namespace rll {
+namespace cuda {
+
+// sliding window nstep return, one thread per column and t is walked backwards.
+// the window of t covers m = min(nstep, length) steps, where length counts the steps from t to the end of its episode
+// (done, optional and nullptr if not used) or of the trajectory. The window sum slides as
+// ret[t] = gamma * ret[t + 1] + reward[t] - gamma^nstep * reward[t + nstep] while the window is full, and is carried
+// in the accumulator Acc. bootstrap_index is t + m, and bootstrap_discount is gamma^m, or 0 if the episode ends
+// inside the window
+template <typename scalar_t, typename Acc>
+void __global__ nstepReturnKernel(unsigned int time_step, unsigned int batch_size, float gamma, unsigned int nstep,
+        const scalar_t* reward, const scalar_t* done, scalar_t* ret, int64_t* bootstrap_index,
+        scalar_t* bootstrap_discount) {
+    using T = typename Acc::type;
+    unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
+    if (gid < batch_size) {
+        Acc item;
+        // steps to the end of the episode, and whether the episode is ended by done rather than the trajectory
+        unsigned int length = 0;
+        bool terminal = false;
+        T gamma_n = pow((T)gamma, (T)nstep);
+        for (int t = time_step - 1; t >= 0; --t) {
+            unsigned int index = t * batch_size + gid;
+            T reward_data = reward[index];
+            if (done != nullptr && static_cast<T>(done[index]) != (T)0) {
+                length = 1;
+                terminal = true;
+                item.reset(reward_data);
+            } else if (length >= nstep) {
+                // the window of t + 1 is full, drop reward[t + nstep] out of it
+                length += 1;
+                item.mulAdd(gamma, reward_data - gamma_n * static_cast<T>(reward[index + nstep * batch_size]));
+            } else {
+                length += 1;
+                item.mulAdd(gamma, reward_data);
+            }
+            unsigned int m = min(length, nstep);
+            ret[index] = item.value();
+            bootstrap_index[index] = t + m;
+            bootstrap_discount[index] = (terminal && length <= nstep) ? (T)0 : pow((T)gamma, (T)m);
+        }
+    }
+}
+
+}  // namespace cuda
+}  // namespace rll
+}  // namespace hpc
+#endif // HPC_RLL_CUDA_NSTEP_RETURN_KERNEL_H_
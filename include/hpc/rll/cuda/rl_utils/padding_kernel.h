@@ -86,6 +86,28 @@ const int max_shape0                max dim in d0
 const int max_shape1                max dim in d1
 const int max_shape2                max dim in d2
 
+void PadRagged_kernel :
+const float* values,                all the inputs flattened into one buffer, [sum of numel]
+const int64_t* offsets,             start of each tensor in values, [n + 1]
+const int64_t* shape,               each tensor's dim, length = dim * n(num of input tensors)
+const int dim,                      num of dim, 1, 2 or 3
+float* new_x,                       output after padding, [n * max_shape0 * max_shape1 * max_shape2]
+int* mask,                          output mask, [n * max_shape0 * max_shape1 * max_shape2]
+const int max_shape0,               max dim in d0
+const int max_shape1,               max dim in d1, 1 if dim < 2
+const int max_shape2,               max dim in d2, 1 if dim < 3
+const int value = 0                 padding value
+
+void UnpadRagged_kernel :
+const float* inputs,                tensors after pad,
+const int64_t* offsets,             start of each tensor in outputs, [n + 1]
+const int64_t* ori_shape,           each tensor's dim, length = dim * n(num of input tensors)
+const int dim,                      num of dim, 1, 2 or 3
+float* outputs,                     all the tensors before padding flattened into one buffer, [sum of numel]
+const int max_shape0                max dim in d0
+const int max_shape1                max dim in d1, 1 if dim < 2
+const int max_shape2                max dim in d2, 1 if dim < 3
+
 
 */
 
@@ -247,6 +269,48 @@ __global__ void Unpad3D_kernel(float* inputs, const int* ori_shape, float** outp
 }
 
 
+// ragged version, the shape of each tensor is padded to 3 dims with 1
+__device__ __forceinline__ void GetRaggedShape(const int64_t* shape, const int dim, int& shape0, int& shape1, int& shape2) {
+    shape0 = shape[0];
+    shape1 = (dim > 1) ? shape[1] : 1;
+    shape2 = (dim > 2) ? shape[2] : 1;
+}
+
+__global__ void PadRagged_kernel(const float* values, const int64_t* offsets, const int64_t* shape, const int dim,
+                                 float* new_x, int* mask, const int max_shape0, const int max_shape1,
+                                 const int max_shape2, const int value = 0) {
+    int cur_shape0, cur_shape1, cur_shape2;
+    GetRaggedShape(shape + blockIdx.x * dim, dim, cur_shape0, cur_shape1, cur_shape2);
+    const float* cur_in = values + offsets[blockIdx.x];
+    const int numel = max_shape0 * max_shape1 * max_shape2;
+    const int64_t base = (int64_t)blockIdx.x * numel;
+    for(int tid = threadIdx.x; tid < numel; tid += blockDim.x) {
+        int tid_x = tid % max_shape2;
+        int tid_y = (tid / max_shape2) % max_shape1;
+        int tid_z = tid / (max_shape1 * max_shape2);
+        int offset_in = tid_z * cur_shape1 * cur_shape2 + tid_y * cur_shape2 + tid_x;
+        bool pred = (tid_x < cur_shape2 && tid_y < cur_shape1 && tid_z < cur_shape0);
+        new_x[base + tid] = pred ? __ldg(cur_in + offset_in) : value;
+        mask[base + tid] = pred ? 1 : value;
+    }
+}
+
+__global__ void UnpadRagged_kernel(const float* inputs, const int64_t* offsets, const int64_t* ori_shape, const int dim,
+                                   float* outputs, const int max_shape0, const int max_shape1, const int max_shape2) {
+    int cur_shape0, cur_shape1, cur_shape2;
+    GetRaggedShape(ori_shape + blockIdx.x * dim, dim, cur_shape0, cur_shape1, cur_shape2);
+    const float* cur_in = inputs + (int64_t)blockIdx.x * max_shape0 * max_shape1 * max_shape2;
+    float* cur_out = outputs + offsets[blockIdx.x];
+    const int numel = cur_shape0 * cur_shape1 * cur_shape2;
+    for(int tid = threadIdx.x; tid < numel; tid += blockDim.x) {
+        int tid_x = tid % cur_shape2;
+        int tid_y = (tid / cur_shape2) % cur_shape1;
+        int tid_z = tid / (cur_shape1 * cur_shape2);
+        int offset_in = tid_z * max_shape1 * max_shape2 + tid_y * max_shape2 + tid_x;
+        cur_out[tid] = __ldg(cur_in + offset_in);
+    }
+}
+
 }  // namespace cuda
 }  // namespace rll
 }  // namespace hpc
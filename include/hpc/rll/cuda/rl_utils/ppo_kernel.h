@@ -4,37 +4,44 @@
 #include "hpc/rll/cuda/common.h"
 #include "hpc/rll/cuda/reduce.h"
 #include "hpc/rll/cuda/basic_math.h"
+#include "hpc/rll/cuda/rl_utils/categorical_heads.h"
 
 namespace hpc {
 namespace rll {
 namespace cuda {
 
-__global__ void categoricalProbEntropy(unsigned int num_output, const float* x, const int64_t* action,
-        float* prob, float* entropy, float* grad_logits, float* grad_prob, float* grad_entropy) {
-	unsigned int block_start = blockIdx.x * num_output;
+// x and the grads are float, half or bfloat16, the reductions are done in acc_t (float for the reduced types),
+// prob and entropy are per (sample, head) and kept in float
+template <typename scalar_t, typename acc_t = at::opmath_type<scalar_t>>
+__global__ void categoricalProbEntropy(unsigned int num_output, CategoricalHeads heads,
+        const scalar_t* x, const int64_t* action,
+        float* prob, float* entropy, scalar_t* grad_logits, scalar_t* grad_prob, scalar_t* grad_entropy) {
+    // blockIdx.x is the row, blockIdx.y is the head
+	unsigned int block_start = blockIdx.x * num_output + heads.offset[blockIdx.y];
     unsigned int start = block_start + threadIdx.x;
-	unsigned int end = block_start + num_output;
+	unsigned int end = blockIdx.x * num_output + heads.offset[blockIdx.y + 1];
+    unsigned int head_id = blockIdx.x * heads.num + blockIdx.y;
 
     // step 1: logits = x - logsumexp(x)
 	// step 1.1 get max_x
-	float max_x = CUDA_FLOAT_INF_NEG;
+	acc_t max_x = CUDA_FLOAT_INF_NEG;
 	for (int i = start; i < end; i += blockDim.x) {
-        max_x = max(max_x, x[i]);
+        max_x = max(max_x, static_cast<acc_t>(x[i]));
 	}
-    static __shared__ float s_max_x;
-    float reduced_max_x = blockReduceMax<float>(max_x);
+    __shared__ acc_t s_max_x;
+    acc_t reduced_max_x = blockReduceMax<acc_t>(max_x);
 	if (threadIdx.x == 0) {
         s_max_x = reduced_max_x;
     }
 	__syncthreads();
 
 	// step 1.2 compute log(sum(exp(x - max_x))) + max_x
-    static __shared__ float s_sum_exp_x;
-	float sum_exp_x = 0.0;
+    __shared__ acc_t s_sum_exp_x;
+	acc_t sum_exp_x = 0.0;
 	for (int i = start; i < end; i += blockDim.x) {
-        sum_exp_x += std::exp(x[i] - s_max_x);
+        sum_exp_x += std::exp(static_cast<acc_t>(x[i]) - s_max_x);
 	}
-    float reduced_sum_exp_x = blockReduceSum<float>(sum_exp_x);
+    acc_t reduced_sum_exp_x = blockReduceSum<acc_t>(sum_exp_x);
     if (threadIdx.x == 0) {
         s_sum_exp_x = reduced_sum_exp_x;
     }
@@ -42,29 +49,29 @@ __global__ void categoricalProbEntropy(unsigned int num_output, const float* x,
 
 
     // step 2: entropy = -sum(logits * softmax(logits))
-    float log_sum_exp_x = std::log(s_sum_exp_x) + s_max_x;
+    acc_t log_sum_exp_x = std::log(s_sum_exp_x) + s_max_x;
 
 	// step 2.1 get max_logits
-	float max_logits = CUDA_FLOAT_INF_NEG;
+	acc_t max_logits = CUDA_FLOAT_INF_NEG;
     for (int i = start; i < end; i += blockDim.x) {
-        float logits = x[i] - log_sum_exp_x;
+        acc_t logits = static_cast<acc_t>(x[i]) - log_sum_exp_x;
         max_logits = max(max_logits, logits);
 	}
-    float reduced_max_logits = blockReduceMax<float>(max_logits);
-    static __shared__ float s_max_logits;
+    acc_t reduced_max_logits = blockReduceMax<acc_t>(max_logits);
+    __shared__ acc_t s_max_logits;
 	if (threadIdx.x == 0) {
         s_max_logits = reduced_max_logits;
     }
 	__syncthreads();
 
 	// step 2.2 compute sum(exp(logits - max_logits))
-	float sum_exp_logits = 0.0;
+	acc_t sum_exp_logits = 0.0;
 	for (int i = start; i < end; i += blockDim.x) {
-        float logits = x[i] - log_sum_exp_x;
+        acc_t logits = static_cast<acc_t>(x[i]) - log_sum_exp_x;
         sum_exp_logits += std::exp(logits - s_max_logits);
 	}
-    float reduced_sum_exp_logits = blockReduceSum<float>(sum_exp_logits);
-    static __shared__ float s_sum_exp_logits;
+    acc_t reduced_sum_exp_logits = blockReduceSum<acc_t>(sum_exp_logits);
+    __shared__ acc_t s_sum_exp_logits;
     if (threadIdx.x == 0) {
         s_sum_exp_logits = reduced_sum_exp_logits;
     }
@@ -72,14 +79,14 @@ __global__ void categoricalProbEntropy(unsigned int num_output, const float* x,
 
     // step 2.3 get sum(logits * softmax(logits))
     // softmax(logits) = std::exp(logits - s_max_logits) / s_sum_exp_logits
-    static __shared__ float s_sum_entropy_val;
-    float sum_entropy_val = 0.f;
+    __shared__ acc_t s_sum_entropy_val;
+    acc_t sum_entropy_val = 0.f;
 	for (int i = start; i < end; i += blockDim.x) {
-        float logits = x[i] - log_sum_exp_x;
-        float softmax_logits = std::exp(logits - s_max_logits) / s_sum_exp_logits;
+        acc_t logits = static_cast<acc_t>(x[i]) - log_sum_exp_x;
+        acc_t softmax_logits = std::exp(logits - s_max_logits) / s_sum_exp_logits;
         sum_entropy_val += logits * softmax_logits;
 	}
-    float reduced_sum_entropy_val = blockReduceSum<float>(sum_entropy_val);
+    acc_t reduced_sum_entropy_val = blockReduceSum<acc_t>(sum_entropy_val);
     if (threadIdx.x == 0) { 
         s_sum_entropy_val = reduced_sum_entropy_val;
     }
@@ -89,67 +96,113 @@ __global__ void categoricalProbEntropy(unsigned int num_output, const float* x,
     // output prob, entropy, grad_logits, grad_prob, grad_entropy
     // grad_entropy[i] = (-1) * softmax(logits[i]) * (1 + logits[i] - sum(logits * softmax(logits)))
 	for (int i = start; i < end; i += blockDim.x) {
-        bool flag = ((i - block_start) == action[blockIdx.x]);
-        float val = x[i];
-        float logits = val - log_sum_exp_x;
-        float softmax_logits = std::exp(logits - s_max_logits) / s_sum_exp_logits;
+        bool flag = ((i - block_start) == action[head_id]);
+        acc_t val = x[i];
+        acc_t logits = val - log_sum_exp_x;
+        acc_t softmax_logits = std::exp(logits - s_max_logits) / s_sum_exp_logits;
 
         if (flag)
-            prob[blockIdx.x] = val - log_sum_exp_x;
+            prob[head_id] = val - log_sum_exp_x;
 
-        entropy[blockIdx.x] = -s_sum_entropy_val;
+        entropy[head_id] = -s_sum_entropy_val;
 
         // grad of logsumexp(x)
-        float grad = std::exp(val - s_max_x) / s_sum_exp_x;
+        acc_t grad = std::exp(val - s_max_x) / s_sum_exp_x;
         grad_logits[i] = grad;
 
         // grad of x - logsumexp(x)
         grad_prob[i] = (flag ? 1 : 0) - grad;
 
         // grad of -sum(logits * softmax(logits))
-        grad_entropy[i] = (-1.f) * softmax_logits * (1 + logits - s_sum_entropy_val);
+        grad_entropy[i] = -softmax_logits * (1 + logits - s_sum_entropy_val);
     }
 }
 
-__global__ void categoricalProb(unsigned int num_output, const float* x, const int64_t* action, float* prob) {
-	unsigned int block_start = blockIdx.x * num_output;
+template <typename scalar_t, typename acc_t = at::opmath_type<scalar_t>>
+__global__ void categoricalProb(unsigned int num_output, CategoricalHeads heads,
+        const scalar_t* x, const int64_t* action, float* prob) {
+    // blockIdx.x is the row, blockIdx.y is the head
+	unsigned int block_start = blockIdx.x * num_output + heads.offset[blockIdx.y];
     unsigned int start = block_start + threadIdx.x;
-	unsigned int end = block_start + num_output;
+	unsigned int end = blockIdx.x * num_output + heads.offset[blockIdx.y + 1];
+    unsigned int head_id = blockIdx.x * heads.num + blockIdx.y;
 
 	// step 0. get max_x
-	float max_x = CUDA_FLOAT_INF_NEG;
+	acc_t max_x = CUDA_FLOAT_INF_NEG;
 	for (int i = start; i < end; i += blockDim.x) {
-        max_x = max(max_x, x[i]);
+        max_x = max(max_x, static_cast<acc_t>(x[i]));
 	}
 
-    static __shared__ float s_max_x;
-    float reduced_max_x = blockReduceMax<float>(max_x);
+    __shared__ acc_t s_max_x;
+    acc_t reduced_max_x = blockReduceMax<acc_t>(max_x);
 	if (threadIdx.x == 0) {
         s_max_x = reduced_max_x;
     }
 	__syncthreads();
 
 	// step 1. compute log(sum(exp(x - max_x))) + max_x
-    static __shared__ float s_sum_exp_x;
-	float sum_exp_x = 0.0;
+    __shared__ acc_t s_sum_exp_x;
+	acc_t sum_exp_x = 0.0;
 	for (int i = start; i < end; i += blockDim.x) {
-        sum_exp_x += std::exp(x[i] - s_max_x);
+        sum_exp_x += std::exp(static_cast<acc_t>(x[i]) - s_max_x);
 	}
-    float reduced_sum_exp_x = blockReduceSum<float>(sum_exp_x);
+    acc_t reduced_sum_exp_x = blockReduceSum<acc_t>(sum_exp_x);
     if (threadIdx.x == 0) {
         s_sum_exp_x = reduced_sum_exp_x;
     }
     __syncthreads();
 
 	for (int i = start; i < end; i += blockDim.x) {
-        if ((i - block_start) == action[blockIdx.x]) {
-            float log_sum_exp_x = std::log(s_sum_exp_x) + s_max_x;
-            prob[blockIdx.x] = x[i] - log_sum_exp_x;
+        if ((i - block_start) == action[head_id]) {
+            acc_t log_sum_exp_x = std::log(s_sum_exp_x) + s_max_x;
+            prob[head_id] = static_cast<acc_t>(x[i]) - log_sum_exp_x;
         }
     }
 }
 
-__global__ void ppoLoss(unsigned int batch_size, const float* value_new, const float* value_old,
+// 0.5 * log(2 * pi)
+constexpr float HALF_LOG_2PI = 0.9189385332046727f;
+
+// diagonal gaussian, one thread per sample since the action dim is small. mu, sigma, action and the grads are
+// float, half or bfloat16, prob and entropy are per sample and kept in float
+// log_prob = sum(-0.5 * z^2 - log(sigma) - 0.5 * log(2 * pi)), z = (action - mu) / sigma
+// entropy = sum(0.5 + 0.5 * log(2 * pi) + log(sigma))
+template <typename scalar_t, typename acc_t = at::opmath_type<scalar_t>>
+__global__ void gaussianProbEntropy(unsigned int batch_size, unsigned int num_output,
+        const scalar_t* mu_new, const scalar_t* sigma_new, const scalar_t* mu_old, const scalar_t* sigma_old,
+        const scalar_t* action, float* new_prob, float* new_entropy, float* old_prob,
+        scalar_t* grad_mu_prob, scalar_t* grad_sigma_prob, scalar_t* grad_sigma_entropy) {
+    unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x; // batch_size
+    if (gid < batch_size) {
+        acc_t sum_new_prob = 0;
+        acc_t sum_old_prob = 0;
+        acc_t sum_log_sigma = 0;
+        for (int i = gid * num_output; i < (gid + 1) * num_output; ++i) {
+            acc_t a = action[i];
+            acc_t s = sigma_new[i];
+            acc_t inv_s = 1 / s;
+            acc_t z = (a - static_cast<acc_t>(mu_new[i])) * inv_s;
+            acc_t log_s = std::log(s);
+            sum_new_prob += -0.5f * z * z - log_s;
+            sum_log_sigma += log_s;
+
+            // grad of log_prob w.r.t. mu and sigma, grad of entropy w.r.t. sigma
+            grad_mu_prob[i] = z * inv_s;
+            grad_sigma_prob[i] = (z * z - 1) * inv_s;
+            grad_sigma_entropy[i] = inv_s;
+
+            acc_t s_old = sigma_old[i];
+            acc_t z_old = (a - static_cast<acc_t>(mu_old[i])) / s_old;
+            sum_old_prob += -0.5f * z_old * z_old - std::log(s_old);
+        }
+        new_prob[gid] = sum_new_prob - num_output * HALF_LOG_2PI;
+        new_entropy[gid] = sum_log_sigma + num_output * (0.5f + HALF_LOG_2PI);
+        old_prob[gid] = sum_old_prob - num_output * HALF_LOG_2PI;
+    }
+}
+
+// the per (sample, head) log probs and entropies are summed over num_heads, the joint values of independent heads
+__global__ void ppoLoss(unsigned int batch_size, unsigned int num_heads, const float* value_new, const float* value_old,
         const float* logits_new_prob, const float* logits_old_prob, const float* logits_new_entropy,
         const float* advantage, const float* return_, const float* weight,
         bool use_value_clip, float clip_ratio, float dual_clip,
@@ -167,12 +220,18 @@ __global__ void ppoLoss(unsigned int batch_size, const float* value_new, const f
         float w = weight[gid];
         float adv = advantage[gid];
 
+        float diff_prob = 0.f;
+        float new_entropy = 0.f;
+        for (unsigned int h = 0; h < num_heads; ++h) {
+            diff_prob += logits_new_prob[gid * num_heads + h] - logits_old_prob[gid * num_heads + h];
+            new_entropy += logits_new_entropy[gid * num_heads + h];
+        }
+
         // entropy loss
-        entropy_loss_val = logits_new_entropy[gid] * w;
+        entropy_loss_val = new_entropy * w;
         grad_entropy_loss_buf[gid] = w * scale;
 
         // policy_loss
-        float diff_prob = logits_new_prob[gid] - logits_old_prob[gid];
         float ratio = std::exp(diff_prob);
         bool ratio_clamp_flag = (ratio >= (1 - clip_ratio) && ratio <= (1 + clip_ratio));
 
@@ -249,39 +308,59 @@ void __global__ ppoBackwardValueNew(unsigned int batch_size,
     }
 }
 
-void __global__ ppoBackwardLogitsNew(unsigned int batch_size, unsigned int num_output,
+template <typename scalar_t, typename acc_t = at::opmath_type<scalar_t>>
+void __global__ ppoBackwardLogitsNew(unsigned int batch_size, unsigned int num_output, CategoricalHeads heads,
         const float* grad_policy_loss, const float* grad_entropy_loss,
         const float* grad_policy_loss_buf, const float* grad_entropy_loss_buf,
-        const float* grad_logits, const float* grad_prob, const float* grad_entropy,
-        float* grad_logits_new) {
-	unsigned int block_start = blockIdx.x * num_output;
+        const scalar_t* grad_logits, const scalar_t* grad_prob, const scalar_t* grad_entropy,
+        scalar_t* grad_logits_new) {
+    // blockIdx.x is the row, blockIdx.y is the head
+	unsigned int block_start = blockIdx.x * num_output + heads.offset[blockIdx.y];
     unsigned int start = block_start + threadIdx.x;
-	unsigned int end = block_start + num_output;
+	unsigned int end = blockIdx.x * num_output + heads.offset[blockIdx.y + 1];
 
     float pre_entropy_grad = (*grad_entropy_loss) * grad_entropy_loss_buf[blockIdx.x];
     float pre_policy_grad = (*grad_policy_loss) * grad_policy_loss_buf[blockIdx.x];
 
 	// get sum_grad_entropy
     // grad: mean->multiply_weight->(-sum(x_multiply_softmax_x))
-	float grad_entropy_val = 0.f;
+	acc_t grad_entropy_val = 0;
 	for (int i = start; i < end; i += blockDim.x) {
-        grad_entropy_val += pre_entropy_grad * grad_entropy[i];
+        grad_entropy_val += pre_entropy_grad * static_cast<acc_t>(grad_entropy[i]);
 	}
-    static __shared__ float s_grad_entropy_val;
-    float reduced_grad_entropy_val = blockReduceSum<float>(grad_entropy_val);
+    __shared__ acc_t s_grad_entropy_val;
+    acc_t reduced_grad_entropy_val = blockReduceSum<acc_t>(grad_entropy_val);
 	if (threadIdx.x == 0) {
         s_grad_entropy_val = reduced_grad_entropy_val;
     }
 	__syncthreads();
 
 	for (int i = start; i < end; i += blockDim.x) {
-        float policy_bp = pre_policy_grad * grad_prob[i];
+        acc_t policy_bp = pre_policy_grad * static_cast<acc_t>(grad_prob[i]);
         // bp of: x - logsumexp(x), is: b_i - grad_logsumexp_i * sum_b
-        float entropy_bp = pre_entropy_grad * grad_entropy[i] - grad_logits[i] * s_grad_entropy_val;
+        acc_t entropy_bp = pre_entropy_grad * static_cast<acc_t>(grad_entropy[i])
+            - static_cast<acc_t>(grad_logits[i]) * s_grad_entropy_val;
         grad_logits_new[i] = entropy_bp + policy_bp;
     }
 }
 
+template <typename scalar_t, typename acc_t = at::opmath_type<scalar_t>>
+void __global__ ppoBackwardMuSigmaNew(unsigned int batch_size, unsigned int num_output,
+        const float* grad_policy_loss, const float* grad_entropy_loss,
+        const float* grad_policy_loss_buf, const float* grad_entropy_loss_buf,
+        const scalar_t* grad_mu_prob, const scalar_t* grad_sigma_prob, const scalar_t* grad_sigma_entropy,
+        scalar_t* grad_mu_new, scalar_t* grad_sigma_new) {
+    unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x; // batch_size * num_output
+    if (gid < batch_size * num_output) {
+        unsigned int batch_id = gid / num_output;
+        acc_t pre_entropy_grad = (*grad_entropy_loss) * grad_entropy_loss_buf[batch_id];
+        acc_t pre_policy_grad = (*grad_policy_loss) * grad_policy_loss_buf[batch_id];
+        grad_mu_new[gid] = pre_policy_grad * static_cast<acc_t>(grad_mu_prob[gid]);
+        grad_sigma_new[gid] = pre_policy_grad * static_cast<acc_t>(grad_sigma_prob[gid])
+            + pre_entropy_grad * static_cast<acc_t>(grad_sigma_entropy[gid]);
+    }
+}
+
 }  // namespace cuda
 }  // namespace rll
 }  // namespace hpc
@@ -0,0 +1,102 @@
+#ifndef HPC_RLL_CUDA_RETRACE_KERNEL_H_
+#define HPC_RLL_CUDA_RETRACE_KERNEL_H_
+
+#include "hpc/rll/cuda/common.h"
+#include "hpc/rll/cuda/reduce.h"
+#include "hpc/rll/cuda/accumulate.h"
+
+namespace hpc {
+namespace rll {
+namespace cuda {
+
+// one warp per (t, b), bootstrap term and trace coefficient of step t, so that ret[t] = bootstrap + coef * ret[t + 1].
+// bootstrap = reward[t] + gamma_t * (v[t + 1] - c[t + 1] * target_q[t + 1, a[t + 1]]), coef = gamma_t * c[t + 1],
+// v[t + 1] = sum_a target_prob[t + 1, a] * target_q[t + 1, a] and gamma_t = gamma * (1 - done[t]).
+// c[t + 1] = lambda * min(c_clip_ratio, target_prob / behaviour_prob) of the taken action for retrace, and lambda
+// for Q(lambda) (behaviour_prob is nullptr), the trace is cut at the last step. done is nullptr if not used.
+// They are written to the buffers of the retrace target and grad, and consumed by retraceForwardKernel
+void __global__ retraceStepKernel(unsigned int time_step, unsigned int batch_size, unsigned int num_output,
+        float gamma, float lambda, float c_clip_ratio, const float* target_q, const int64_t* action,
+        const float* reward, const float* done, const float* target_prob, const float* behaviour_prob,
+        float* bootstrap, float* coef) {
+    unsigned int lane = threadIdx.x % WARP_SIZE;
+    unsigned int index = (threadIdx.x + blockIdx.x * blockDim.x) / WARP_SIZE;
+    if (index >= time_step * batch_size) return;
+
+    unsigned int t = index / batch_size;
+    unsigned int next_index = index + batch_size;
+    const float* next_q = target_q + next_index * num_output;
+    const float* next_prob = target_prob + next_index * num_output;
+
+    float partial_v = 0;
+    for (unsigned int i = lane; i < num_output; i += WARP_SIZE) {
+        partial_v += next_prob[i] * next_q[i];
+    }
+    float next_v = warpReduceSum<float>(partial_v);
+
+    if (lane == 0) {
+        float c = 0;
+        float next_qa = 0;
+        if (t + 1 < time_step) {
+            int64_t next_action = action[next_index];
+            next_qa = next_q[next_action];
+            c = lambda;
+            if (behaviour_prob != nullptr) {
+                c *= min(c_clip_ratio, next_prob[next_action] / behaviour_prob[next_index * num_output + next_action]);
+            }
+        }
+        float gamma_t = (done != nullptr) ? gamma * (1.f - done[index]) : gamma;
+        bootstrap[index] = reward[index] + gamma_t * (next_v - c * next_qa);
+        coef[index] = gamma_t * c;
+    }
+}
+
+// one thread per column, the retrace target is walked backwards and carried in the accumulator Acc.
+// q_retrace and grad_buf hold the bootstrap and coef of retraceStepKernel on entry
+template <typename Acc>
+void __global__ retraceForwardKernel(unsigned int time_step, unsigned int batch_size, unsigned int num_output,
+        const float* q, const int64_t* action, const float* weight,
+        float* q_retrace, float* td_err, float* loss, float* grad_buf) {
+    using T = typename Acc::type;
+    unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
+
+    Acc sum_square;
+    if (gid < batch_size) {
+        Acc ret;
+        float grad_mean = 1.f / (time_step * batch_size);
+        for (int t = time_step - 1; t >= 0; --t) {
+            unsigned int index = t * batch_size + gid;
+            ret.mulAdd(grad_buf[index], q_retrace[index]);
+            T ret_data = ret.value();
+            q_retrace[index] = ret_data;
+
+            T diff = (T)q[index * num_output + action[index]] - ret_data;
+            T weight_data = weight[index];
+            td_err[index] = diff * diff;
+            grad_buf[index] = grad_mean * (2 * diff) * weight_data;
+            sum_square.mulAdd(1, diff * diff * weight_data);
+        }
+    }
+
+    float reduced_sum_square = blockReduceSum<float>(sum_square.value());
+    if (threadIdx.x == 0) {
+        atomicAdd(loss, reduced_sum_square / (time_step * batch_size));
+    }
+}
+
+void __global__ retraceBackwardKernel(unsigned int time_step, unsigned int batch_size, unsigned int num_output,
+        const float* grad_loss, const float* grad_buf, const int64_t* action, float* grad_q) {
+    unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
+
+    if (gid < time_step * batch_size * num_output) {
+        unsigned int tb_id = gid / num_output;
+        unsigned int i = gid % num_output;
+        float grad = (i == action[tb_id]) ? grad_buf[tb_id] : 0;
+        grad_q[gid] = (*grad_loss) * grad;
+    }
+}
+
+}  // namespace cuda
+}  // namespace rll
+}  // namespace hpc
+#endif // HPC_RLL_CUDA_RETRACE_KERNEL_H_
@@ -3,36 +3,40 @@
 
 #include "hpc/rll/cuda/common.h"
 #include "hpc/rll/cuda/reduce.h"
+#include "hpc/rll/cuda/accumulate.h"
+#include "hpc/rll/cuda/rl_utils/lambda_return_kernel.h"
 
 namespace hpc {
 namespace rll {
 namespace cuda {
 
+// rt = reward + gamma * (lambda * rt + (1 - lambda) * next_value) is carried in the accumulator Acc
+template <typename Acc>
 void __global__ tdLambdaForwardKernel(unsigned int time_step, unsigned int batch_size, float gamma, float lambda,
         const float* value, const float* reward, const float* weight, float* loss, float* grad_buf) {
+    using T = typename Acc::type;
     unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
-    
-    float sum_square = 0;
+
+    Acc sum_square;
     if (gid < batch_size) {
-        float rt = 0.f;
+        Acc rt;
         for (int t = time_step - 1; t >= 0; --t) {
             unsigned int index = t * batch_size + gid;
 
-            float value_data = value[index];
-            float next_value_data = value[index + batch_size];
-            float reward_data = reward[index];
-            float weight_data = weight[index];
+            T value_data = value[index];
+            T next_value_data = value[index + batch_size];
+            T reward_data = reward[index];
+            T weight_data = weight[index];
 
-            float tmp = (t == time_step - 1) ? next_value_data : (lambda * rt + (1.f - lambda) * next_value_data);
-            rt = reward_data + gamma * tmp;
+            lambdaReturnStep(rt, t == time_step - 1, (T)gamma, (T)lambda, reward_data, next_value_data);
 
-            float loss = (rt - value_data);
-            grad_buf[index] = weight_data * (2.f * loss * (-1.f));
-            sum_square += loss * loss * weight_data;
+            T loss = (rt.value() - value_data);
+            grad_buf[index] = weight_data * (2 * loss * (-1));
+            sum_square.mulAdd(1, loss * loss * weight_data);
         }
     }
 
-    float reduced_sum_square = blockReduceSum<float>(sum_square);
+    float reduced_sum_square = blockReduceSum<float>(sum_square.value());
     if (threadIdx.x == 0) {
         float mean_loss = 0.5 * reduced_sum_square / (time_step * batch_size);
         atomicAdd(loss, mean_loss);
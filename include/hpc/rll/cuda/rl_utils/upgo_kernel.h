@@ -3,17 +3,22 @@
 
 #include "hpc/rll/cuda/common.h"
 #include "hpc/rll/cuda/reduce.h"
+#include "hpc/rll/cuda/accumulate.h"
+#include "hpc/rll/cuda/rl_utils/lambda_return_kernel.h"
 
 namespace hpc {
 namespace rll {
 namespace cuda {
 
+// the bootstrapped return is carried in the accumulator Acc
+template <typename Acc>
 void __global__ upgoAdvantageKernel(unsigned int time_step, unsigned int batch_size,
         const float* rho, const float* reward, const float* value, float* advantage) {
+    using T = typename Acc::type;
     unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
 
     if (gid < batch_size) {
-        float item = 0;
+        Acc item;
         for (int t = time_step - 1; t >= 0; --t) {
             unsigned int index = t * batch_size + gid;
 
@@ -28,11 +33,11 @@ void __global__ upgoAdvantageKernel(unsigned int time_step, unsigned int batch_s
             // Note: when t == time_step - 1, value2 is not used. Just avoid accessing out of memory bound.
             float value2 = (t == time_step - 1) ? 0.f : value[index + batch_size * 2];
 
-            float value_data = ((t < time_step - 1) && (reward_data1 + value2 >= value1)) ? item : value1;
-
-            float rt = reward_data0 + value_data;
-            advantage[index] = (rt - value0) * rho_data;
-            item = rt;
+            // upgo return is the lambda return with gamma 1, the trace keeps chaining (lambda 1) while the next step
+            // is better than its value, otherwise it bootstraps from value1 (lambda 0)
+            bool chain = !(reward_data1 + value2 < value1);
+            lambdaReturnStep(item, t == time_step - 1, (T)1, (T)(chain ? 1 : 0), (T)reward_data0, (T)value1);
+            advantage[index] = (item.value() - (T)value0) * rho_data;
         }
     }
 }
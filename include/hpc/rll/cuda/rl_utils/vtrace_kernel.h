@@ -3,17 +3,21 @@
 
 #include "hpc/rll/cuda/common.h"
 #include "hpc/rll/cuda/reduce.h"
+#include "hpc/rll/cuda/accumulate.h"
+#include "hpc/rll/cuda/rl_utils/categorical_heads.h"
 
 namespace hpc {
 namespace rll {
 namespace cuda {
 
-__global__ void categoricalTarget(unsigned int num_output, const float* target, const int64_t* action,
+__global__ void categoricalTarget(unsigned int num_output, CategoricalHeads heads, const float* target, const int64_t* action,
         float* target_prob, float* target_entropy, float* target_grad_logits,
         float* target_grad_prob, float* target_grad_entropy) {
-	unsigned int block_start = blockIdx.x * num_output;
+    // blockIdx.x is the row, blockIdx.y is the head
+	unsigned int block_start = blockIdx.x * num_output + heads.offset[blockIdx.y];
     unsigned int start = block_start + threadIdx.x;
-	unsigned int end = block_start + num_output;
+	unsigned int end = blockIdx.x * num_output + heads.offset[blockIdx.y + 1];
+    unsigned int head_id = blockIdx.x * heads.num + blockIdx.y;
 
     // step 1: logits = x - logsumexp(x)
 	// step 1.1 get max_x
@@ -89,15 +93,15 @@ __global__ void categoricalTarget(unsigned int num_output, const float* target,
     // output prob, entropy, grad_logits, grad_prob, grad_entropy
     // grad_entropy[i] = (-1) * softmax(logits[i]) * (1 + logits[i] - sum(logits * softmax(logits)))
 	for (int i = start; i < end; i += blockDim.x) {
-        bool flag = ((i - block_start) == action[blockIdx.x]);
+        bool flag = ((i - block_start) == action[head_id]);
         float val = target[i];
         float logits = val - log_sum_exp_x;
         float softmax_logits = std::exp(logits - s_max_logits) / s_sum_exp_logits;
 
         if (flag)
-            target_prob[blockIdx.x] = val - log_sum_exp_x;
+            target_prob[head_id] = val - log_sum_exp_x;
 
-        target_entropy[blockIdx.x] = -s_sum_entropy_val;
+        target_entropy[head_id] = -s_sum_entropy_val;
 
         // grad of logsumexp(x)
         float grad = std::exp(val - s_max_x) / s_sum_exp_x;
@@ -111,11 +115,13 @@ __global__ void categoricalTarget(unsigned int num_output, const float* target,
     }
 }
 
-__global__ void categoricalBehaviour(unsigned int num_output,
+__global__ void categoricalBehaviour(unsigned int num_output, CategoricalHeads heads,
         const float* behaviour, const int64_t* action, float* behaviour_prob) {
-	unsigned int block_start = blockIdx.x * num_output;
+    // blockIdx.x is the row, blockIdx.y is the head
+	unsigned int block_start = blockIdx.x * num_output + heads.offset[blockIdx.y];
     unsigned int start = block_start + threadIdx.x;
-	unsigned int end = block_start + num_output;
+	unsigned int end = blockIdx.x * num_output + heads.offset[blockIdx.y + 1];
+    unsigned int head_id = blockIdx.x * heads.num + blockIdx.y;
 
 	// step 0. get max_x
 	float max_x = CUDA_FLOAT_INF_NEG;
@@ -143,44 +149,66 @@ __global__ void categoricalBehaviour(unsigned int num_output,
     __syncthreads();
 
 	for (int i = start; i < end; i += blockDim.x) {
-        if ((i - block_start) == action[blockIdx.x]) {
+        if ((i - block_start) == action[head_id]) {
             float log_sum_exp_x = std::log(s_sum_exp_x) + s_max_x;
-            behaviour_prob[blockIdx.x] = behaviour[i] - log_sum_exp_x;
+            behaviour_prob[head_id] = behaviour[i] - log_sum_exp_x;
         }
     }
 }
 
-__global__ void computeImportanceWeights(unsigned int time_step, unsigned int batch_size,
+// the joint log prob of the independent heads is the sum over heads
+__global__ void computeImportanceWeights(unsigned int time_step, unsigned int batch_size, unsigned int num_heads,
         const float* target_output_prob, const float* behaviour_output_prob, float* is) {
     unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
     if (gid < time_step * batch_size) {
-        is[gid] = std::exp(target_output_prob[gid] - behaviour_output_prob[gid]);
+        float diff_prob = 0.f;
+        for (unsigned int h = 0; h < num_heads; ++h) {
+            diff_prob += target_output_prob[gid * num_heads + h] - behaviour_output_prob[gid * num_heads + h];
+        }
+        is[gid] = std::exp(diff_prob);
     }
 }
 
+// discount of one step, gamma scaled by the optional per step discount (T, B) and cut by the optional done (T, B),
+// pass nullptr if not used. done[t] = 1 means t is the last step of an episode, so v[t + 1] is not bootstrapped
+// and the trace restarts, which lets an unroll span several episodes
+__forceinline__ __device__ float vtraceDiscount(float gamma, const float* done, const float* discount, unsigned int index) {
+    float d = gamma;
+    if (discount != nullptr) d *= discount[index];
+    if (done != nullptr) d *= (1.f - done[index]);
+    return d;
+}
+
+// the return minus value is carried in the accumulator Acc
+template <typename Acc>
 void __global__ vtraceNStepReturn(unsigned int time_step, unsigned int batch_size,
         float gamma, float lambda, float rho_clip_ratio, float c_clip_ratio,
-        const float* is, const float* reward, const float* value, float* ret) {
+        const float* is, const float* reward, const float* value, const float* done, const float* discount,
+        float* ret) {
+    using T = typename Acc::type;
     unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
 
     if (gid < batch_size) {
-        float item = 0;
+        Acc item;
         for (int t = time_step - 1; t >= 0; --t) {
-            float is_data = is[t * batch_size + gid];
-            float clipped_rho = min(is_data, rho_clip_ratio);
-            float clipped_c = min(is_data, c_clip_ratio);
-            float reward_data = reward[t * batch_size + gid];
-            float value_data = value[t * batch_size + gid];
-            float value_plus1_data = value[(t + 1) * batch_size + gid];
-            float delta = clipped_rho * (reward_data + gamma * value_plus1_data - value_data);
-            item = delta + gamma * lambda * clipped_c * item;
-            ret[t * batch_size + gid] = value_data + item;
+            unsigned int index = t * batch_size + gid;
+            float is_data = is[index];
+            T clipped_rho = min(is_data, rho_clip_ratio);
+            T clipped_c = min(is_data, c_clip_ratio);
+            T gamma_t = vtraceDiscount(gamma, done, discount, index);
+            T reward_data = reward[index];
+            T value_data = value[index];
+            T value_plus1_data = value[index + batch_size];
+            T delta = clipped_rho * (reward_data + gamma_t * value_plus1_data - value_data);
+            item.mulAdd(gamma_t * (T)lambda * clipped_c, delta);
+            ret[index] = value_data + item.value();
         }
     }
 }
 
 void __global__ vtraceAdvantage(unsigned int time_step, unsigned int batch_size, float gamma, float rho_pg_clip_ratio,
-        const float* is, const float* reward, const float* value, const float* ret, float* adv) {
+        const float* is, const float* reward, const float* value, const float* done, const float* discount,
+        const float* ret, float* adv) {
     unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
     unsigned int ts_id = gid / batch_size;
     unsigned int batch_id = gid % batch_size;
@@ -190,11 +218,11 @@ void __global__ vtraceAdvantage(unsigned int time_step, unsigned int batch_size,
         float reward_data = reward[gid];
         float value_data = value[gid];
         float ret_data = (ts_id == (time_step - 1)) ? value[time_step * batch_size + batch_id]: ret[(ts_id + 1) * batch_size + batch_id];
-        adv[gid] = clipped_pg_rho * (reward_data + gamma * ret_data - value_data);
+        adv[gid] = clipped_pg_rho * (reward_data + vtraceDiscount(gamma, done, discount, gid) * ret_data - value_data);
     }
 }
 
-void __global__ vtraceLoss(unsigned int time_step, unsigned int batch_size,
+void __global__ vtraceLoss(unsigned int time_step, unsigned int batch_size, unsigned int num_heads,
         const float* value, const float* target_output_prob, const float* entropy,
         const float* ret, const float* adv, const float* weight,
         float* pg_loss, float* value_loss, float* entropy_loss) {
@@ -204,12 +232,18 @@ void __global__ vtraceLoss(unsigned int time_step, unsigned int batch_size,
     float val = 0.f;
     float entr = 0.f;
     if (gid < time_step * batch_size) {
-        pg = -(target_output_prob[gid] * adv[gid] * weight[gid]);
+        float prob_data = 0.f;
+        float entropy_data = 0.f;
+        for (unsigned int h = 0; h < num_heads; ++h) {
+            prob_data += target_output_prob[gid * num_heads + h];
+            entropy_data += entropy[gid * num_heads + h];
+        }
+        pg = -(prob_data * adv[gid] * weight[gid]);
 
         float diff = value[gid] - ret[gid];
         val = diff * diff * weight[gid];
 
-        entr = entropy[gid] * weight[gid];
+        entr = entropy_data * weight[gid];
     }
     
     float sum_pg = blockReduceSum<float>(pg);
@@ -222,6 +256,37 @@ void __global__ vtraceLoss(unsigned int time_step, unsigned int batch_size,
     }
 }
 
+// vtrace targets from the log importance weights without any loss, one thread per column.
+// discount (T, B) already contains the episode ends, bootstrap (B, ) is the value after the last step,
+// vs - v is carried in the accumulator Acc
+template <typename scalar_t, typename Acc>
+void __global__ vtraceReturnsKernel(unsigned int time_step, unsigned int batch_size,
+        float lambda, float rho_clip_ratio, float c_clip_ratio, float rho_pg_clip_ratio,
+        const scalar_t* log_rho, const scalar_t* discount, const scalar_t* reward, const scalar_t* value,
+        const scalar_t* bootstrap, scalar_t* vs, scalar_t* pg_adv) {
+    using T = typename Acc::type;
+    unsigned int gid = threadIdx.x + blockIdx.x*blockDim.x;
+    if (gid < batch_size) {
+        Acc item;
+        T next_value = bootstrap[gid];
+        T next_vs = next_value;
+        for (int t = time_step - 1; t >= 0; --t) {
+            unsigned int index = t * batch_size + gid;
+            T rho = exp(static_cast<T>(log_rho[index]));
+            T discount_data = discount[index];
+            T reward_data = reward[index];
+            T value_data = value[index];
+            T delta = min(rho, (T)rho_clip_ratio) * (reward_data + discount_data * next_value - value_data);
+            item.mulAdd(discount_data * (T)lambda * min(rho, (T)c_clip_ratio), delta);
+            T vs_data = value_data + item.value();
+            vs[index] = vs_data;
+            pg_adv[index] = min(rho, (T)rho_pg_clip_ratio) * (reward_data + discount_data * next_vs - value_data);
+            next_value = value_data;
+            next_vs = vs_data;
+        }
+    }
+}
+
 void __global__ vtraceBackwardValue(unsigned int time_step, unsigned int batch_size,
         const float* grad_value_loss, const float* value,
         const float* ret, const float* weight, float* grad_value) {
@@ -232,13 +297,14 @@ void __global__ vtraceBackwardValue(unsigned int time_step, unsigned int batch_s
     }
 }
 
-void __global__ vtraceBackwardTargetOutput(unsigned int time_step, unsigned int batch_size, unsigned int num_output,
+void __global__ vtraceBackwardTargetOutput(unsigned int time_step, unsigned int batch_size, unsigned int num_output, CategoricalHeads heads,
         const float* grad_entropy_loss, const float* grad_pg_loss,
         const float* grad_logits, const float* grad_entropy, const float* grad_prob,
         const float* adv, const float* weight, float* grad_target_output) {
-	unsigned int block_start = blockIdx.x * num_output;
+    // blockIdx.x is the row, blockIdx.y is the head
+	unsigned int block_start = blockIdx.x * num_output + heads.offset[blockIdx.y];
     unsigned int start = block_start + threadIdx.x;
-	unsigned int end = block_start + num_output;
+	unsigned int end = blockIdx.x * num_output + heads.offset[blockIdx.y + 1];
 
     float weight_data = weight[blockIdx.x];
     float adv_data = adv[blockIdx.x];
@@ -7,16 +7,27 @@ namespace hpc {
 namespace rll {
 namespace cuda {
 
-// lstm
+// lstm, batch_sizes[s] is the number of the active samples at timestep s, the samples are sorted by length in
+// descending order. It is empty if all the sequences have the full length
 void LstmForward(
     const std::vector<torch::Tensor>& inputs,
     std::vector<torch::Tensor>& outputs,
-    float dropout_threshold);
+    float dropout_threshold,
+    int64_t seed,
+    const std::vector<int>& batch_sizes);
 
 void LstmBackward(
     const std::vector<torch::Tensor>& inputs,
     std::vector<torch::Tensor>& outputs,
-    float dropout_threshold);
+    float dropout_threshold,
+    int64_t seed,
+    const std::vector<int>& batch_sizes);
+
+// lstm inference, no activation is saved for backward and h, c are updated in place
+void LstmInferenceForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    const std::vector<int>& batch_sizes);
 
 // scatter_connection
 void ScatterConnectionForward(
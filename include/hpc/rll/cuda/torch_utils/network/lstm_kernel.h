@@ -4,11 +4,13 @@
 #include "hpc/rll/cuda/common.h"
 #include "hpc/rll/cuda/reduce.h"
 #include "hpc/rll/cuda/basic_math.h"
+#include "hpc/rll/cuda/philox.h"
 
 namespace hpc {
 namespace rll {
 namespace cuda {
 
+// x_mean and x_rstd are nullptr in inference, y may be the same as x
 __global__ void layernorm(unsigned int N, const float* x, const float* gamma, const float* beta,
         float* x_mean, float* x_rstd, float* y) {
 	unsigned int block_start = blockIdx.x * N;
@@ -41,7 +43,7 @@ __global__ void layernorm(unsigned int N, const float* x, const float* gamma, co
     }
 	__syncthreads();
 
-	if (threadIdx.x == 0) {
+	if (threadIdx.x == 0 && x_mean != nullptr) {
         x_mean[blockIdx.x] = s_mean;
         x_rstd[blockIdx.x] = s_rstd;
     }
@@ -52,6 +54,7 @@ __global__ void layernorm(unsigned int N, const float* x, const float* gamma, co
 	}
 }
 
+// ifogdata is nullptr in inference, h and c may be the same as pre_h and pre_c
 __global__ void activation(unsigned int batch_size, unsigned int hidden_size,
         const float* normx, const float* normh, const float* bias,
         const float* pre_h, const float* pre_c, float* h, float* c,
@@ -77,19 +80,30 @@ __global__ void activation(unsigned int batch_size, unsigned int hidden_size,
         h[gidy * hidden_size + gidx] = new_h;
         c[gidy * hidden_size + gidx] = new_c;
 
-        ifogdata[gidy * hidden_size * 4 + hidden_size * 0 + gidx] = i;
-        ifogdata[gidy * hidden_size * 4 + hidden_size * 1 + gidx] = f;
-        ifogdata[gidy * hidden_size * 4 + hidden_size * 2 + gidx] = o;
-        ifogdata[gidy * hidden_size * 4 + hidden_size * 3 + gidx] = g;
+        if (ifogdata != nullptr) {
+            ifogdata[gidy * hidden_size * 4 + hidden_size * 0 + gidx] = i;
+            ifogdata[gidy * hidden_size * 4 + hidden_size * 1 + gidx] = f;
+            ifogdata[gidy * hidden_size * 4 + hidden_size * 2 + gidx] = o;
+            ifogdata[gidy * hidden_size * 4 + hidden_size * 3 + gidx] = g;
+        }
         output[gidy * hidden_size + gidx] = new_h;
     }
 }
 
-__global__ void dropout(unsigned int stride, const unsigned int threshold,
-        const float scale, const unsigned int* mask, float* data) {
-    unsigned int gid = blockIdx.x * blockDim.x + threadIdx.x; // maskstride
-    if (gid < stride) {
-        data[gid] = data[gid] * (mask[gid] > threshold) * scale;
+// elements [begin, end) of the output of one layer, each thread handles 4 elements, whose random numbers are
+// philox(element / 4, layer) keyed by seed, so backward regenerates the same mask instead of storing it.
+// The element is kept if its random number > threshold
+__global__ void dropout(unsigned int begin, unsigned int end, const unsigned int threshold,
+        const float scale, uint64_t seed, unsigned int layer, float* data) {
+    unsigned int gid = begin / 4 + blockIdx.x * blockDim.x + threadIdx.x; // (end + 3) / 4 - begin / 4
+    unsigned int start = gid * 4;
+    if (start < end) {
+        uint4 rand = philox4x32(gid, layer, 0, 0, seed);
+        unsigned int r[4] = {rand.x, rand.y, rand.z, rand.w};
+        for (int k = 0; k < 4 && start + k < end; k++) {
+            if (start + k >= begin)
+                data[start + k] = data[start + k] * (r[k] > threshold) * scale;
+        }
     }
 }
 
@@ -174,14 +188,6 @@ __global__ void activation_backward(unsigned int batch_size, unsigned int hidden
     }
 }
 
-__global__ void dropout_backward(unsigned int stride, const unsigned int threshold,
-        const float scale, const unsigned int* mask, float* data) {
-    unsigned int gid = blockIdx.x * blockDim.x + threadIdx.x; // maskstride
-    if (gid < stride) {
-        data[gid] = data[gid] * (mask[gid] > threshold) * scale;
-    }
-}
-
 }  // namespace cuda
 }  // namespace rll
 }  // namespace hpc
@@ -0,0 +1,35 @@
+#ifndef HPC_RLL_HOST_RAGGED_H_
+#define HPC_RLL_HOST_RAGGED_H_
+
+#include <torch/extension.h>
+
+namespace hpc {
+namespace rll {
+namespace host {
+
+// check the ragged layout on the host before any kernel reads or writes through it:
+// offsets [n + 1] starts at 0, tensor i has prod(shapes[i]) = offsets[i + 1] - offsets[i] elements,
+// and the last offset is no more than numel. if max_shape is not nullptr, shapes[i] must fit in it.
+inline void CheckRagged(const int64_t* offsets, const int64_t* shapes, int64_t n, int dim, int64_t numel,
+        const int64_t* max_shape = nullptr) {
+    TORCH_CHECK(offsets[0] == 0, "offsets[0] should be 0, but get ", offsets[0]);
+    for (int64_t i = 0; i < n; ++i) {
+        int64_t size = 1;
+        for (int d = 0; d < dim; ++d) {
+            const int64_t s = shapes[i * dim + d];
+            TORCH_CHECK(s >= 0, "shapes[", i, "][", d, "] should be non-negative, but get ", s);
+            TORCH_CHECK(max_shape == nullptr || s <= max_shape[d],
+                    "shapes[", i, "][", d, "] = ", s, " is larger than the padded size ", max_shape[d]);
+            size *= s;
+        }
+        TORCH_CHECK(offsets[i + 1] - offsets[i] == size, "offsets[", i + 1, "] - offsets[", i, "] should be ",
+                size, " as the shapes, but get ", offsets[i + 1] - offsets[i]);
+    }
+    TORCH_CHECK(offsets[n] <= numel, "offsets[", n, "] = ", offsets[n], " is out of the ", numel, " values");
+}
+
+}  // namespace host
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_HOST_RAGGED_H_
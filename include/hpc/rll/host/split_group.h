@@ -0,0 +1,211 @@
+#ifndef HPC_RLL_HOST_SPLIT_GROUP_H_
+#define HPC_RLL_HOST_SPLIT_GROUP_H_
+
+#include <torch/extension.h>
+#include <algorithm>
+#include <limits>
+#include <numeric>
+#include <random>
+#include <vector>
+
+namespace hpc {
+namespace rll {
+namespace host {
+
+// host-only grouping of the sorted inputs for GroupPad, shared by the cpu and cuda extensions
+
+// max shape of any range [l, r] of the sorted inputs in O(1), the sparse table takes O(dim * N * log N) memory
+class RangeMaxShape {
+public:
+    explicit RangeMaxShape(const std::vector<torch::Tensor>& x) : n_(x.size()), dim_(x[0].dim()), log_(x.size() + 1, 0) {
+        for (int i = 2; i <= n_; i++)
+            log_[i] = log_[i / 2] + 1;
+        table_.emplace_back(n_ * dim_);
+        for (int i = 0; i < n_; i++)
+            for (int d = 0; d < dim_; d++)
+                table_[0][i * dim_ + d] = x[i].size(d);
+        for (int k = 1; (1 << k) <= n_; k++) {
+            const std::vector<int>& last = table_[k - 1];
+            std::vector<int> cur((n_ - (1 << k) + 1) * dim_);
+            for (int i = 0; i + (1 << k) <= n_; i++)
+                for (int d = 0; d < dim_; d++)
+                    cur[i * dim_ + d] = std::max(last[i * dim_ + d], last[(i + (1 << (k - 1))) * dim_ + d]);
+            table_.push_back(std::move(cur));
+        }
+    }
+
+    int shape(int l, int r, int d) const {
+        const int k = log_[r - l + 1];
+        return std::max(table_[k][l * dim_ + d], table_[k][(r - (1 << k) + 1) * dim_ + d]);
+    }
+
+    int64_t numel(int l, int r) const {
+        int64_t ret = 1;
+        for (int d = 0; d < dim_; d++)
+            ret *= shape(l, r, d);
+        return ret;
+    }
+
+    int dim() const { return dim_; }
+
+private:
+    int n_;
+    int dim_;
+    std::vector<int> log_;
+    std::vector<std::vector<int>> table_;
+};
+
+// group shapes followed by the start index of each group, the same format as sample_split_group
+inline std::vector<std::vector<int>> SplitGroupResult(const RangeMaxShape& range_max, const std::vector<int>& positions) {
+    std::vector<std::vector<int>> result;
+    for (size_t i = 1; i < positions.size(); i++) {
+        std::vector<int> res;
+        for (int d = 0; d < range_max.dim(); d++)
+            res.push_back(range_max.shape(positions[i - 1], positions[i] - 1, d));
+        result.push_back(res);
+    }
+    result.push_back(positions);
+    return result;
+}
+
+inline std::vector<int> SplitGroupPositions(const std::vector<std::vector<int>>& pos, int N, int M) {
+    std::vector<int> positions = {N};
+    int last_pos = N;
+    for (int j = M; j > 0; j--) {
+        last_pos = pos[j][last_pos];
+        positions.push_back(last_pos);
+    }
+    std::reverse(positions.begin(), positions.end());
+    return positions;
+}
+
+// split the sorted inputs after the given end indices, neighbouring groups of the same shape are merged
+inline std::vector<std::vector<int>> SplitGroupAtEnds(const std::vector<torch::Tensor>& x, std::vector<int> ends) {
+    const int N = x.size();
+    RangeMaxShape range_max(x);
+    auto same_shape = [&](int l0, int r0, int l1, int r1) {
+        for (int d = 0; d < range_max.dim(); d++)
+            if (range_max.shape(l0, r0, d) != range_max.shape(l1, r1, d))
+                return false;
+        return true;
+    };
+    ends.push_back(N - 1);
+    std::sort(ends.begin(), ends.end());
+    ends.erase(std::unique(ends.begin(), ends.end()), ends.end());
+    std::vector<int> positions = {0};
+    for (int end : ends) {
+        const int start = positions.back();
+        if (positions.size() > 1 && same_shape(positions[positions.size() - 2], start - 1, start, end))
+            positions.back() = end + 1;
+        else
+            positions.push_back(end + 1);
+    }
+    return SplitGroupResult(range_max, positions);
+}
+
+// split at group - 1 distinct inputs sampled by a generator seeded with seed, the same seed gives the same groups
+inline std::vector<std::vector<int>> sample_split_group(const std::vector<torch::Tensor>& x, int group, int64_t seed) {
+    const int N = x.size();
+    const int num = std::max(0, std::min(group - 1, N - 1));
+    // the output of mt19937_64 is fixed by the standard, unlike the distributions, so take it modulo the range
+    std::mt19937_64 gen(seed);
+    std::vector<int> candidates(N - 1);
+    std::iota(candidates.begin(), candidates.end(), 0);
+    for (int i = 0; i < num; i++) {
+        int j = i + gen() % (N - 1 - i);
+        std::swap(candidates[i], candidates[j]);
+    }
+    return SplitGroupAtEnds(x, std::vector<int>(candidates.begin(), candidates.begin() + num));
+}
+
+// split at the group-quantiles of the sorted sizes, inputs of the same size are always in the same group,
+// so a batch of similar size distribution gets the same group shapes
+inline std::vector<std::vector<int>> quantile_split_group(const std::vector<torch::Tensor>& x, int group) {
+    const int N = x.size();
+    std::vector<int64_t> sizes;
+    for (const auto& t : x)
+        sizes.push_back(t.numel());
+    std::vector<int> ends;
+    for (int g = 1; g < group; g++) {
+        const int idx = (int64_t)g * N / group - 1;
+        if (idx < 0)
+            continue;
+        const int end = std::upper_bound(sizes.begin(), sizes.end(), sizes[idx]) - sizes.begin() - 1;
+        if (end < N - 1)
+            ends.push_back(end);
+    }
+    return SplitGroupAtEnds(x, ends);
+}
+
+// cost of splitting the first i inputs into j groups is the total number of padded elements,
+// exact DP in O(M * N^2) time
+inline std::vector<std::vector<int>> oracle_split_group(const std::vector<torch::Tensor>& x, int group) {
+    const int N = x.size();
+    const int M = std::min(group, N);
+    const int64_t INF = std::numeric_limits<int64_t>::max();
+    RangeMaxShape range_max(x);
+    std::vector<std::vector<int64_t>> cost(M + 1, std::vector<int64_t>(N + 1, INF));
+    std::vector<std::vector<int>> pos(M + 1, std::vector<int>(N + 1, 0));
+    cost[0][0] = 0;
+    for (int j = 1; j <= M; j++) {
+        for (int i = j; i <= N; i++) {
+            for (int k = j - 1; k < i; k++) {
+                if (cost[j - 1][k] == INF)
+                    continue;
+                int64_t now_cost = cost[j - 1][k] + range_max.numel(k, i - 1) * (i - k);
+                if (now_cost < cost[j][i]) {
+                    cost[j][i] = now_cost;
+                    pos[j][i] = k;
+                }
+            }
+        }
+    }
+    return SplitGroupResult(range_max, SplitGroupPositions(pos, N, M));
+}
+
+// the best split point of each layer is monotone in i when the padded size of a group only grows with its last input,
+// which is always true for 1D sorted inputs, so divide-and-conquer optimization finds it in O(M * N * log N) time
+inline void FastOracleLayer(const RangeMaxShape& range_max, const std::vector<int64_t>& last_cost,
+        std::vector<int64_t>& cur_cost, std::vector<int>& cur_pos, int j, int lo, int hi, int opt_lo, int opt_hi) {
+    if (lo > hi)
+        return;
+    const int mid = (lo + hi) / 2;
+    int64_t best_cost = std::numeric_limits<int64_t>::max();
+    int best_pos = std::max(opt_lo, j - 1);
+    for (int k = std::max(opt_lo, j - 1); k <= std::min(mid - 1, opt_hi); k++) {
+        int64_t now_cost = last_cost[k] + range_max.numel(k, mid - 1) * (mid - k);
+        if (now_cost < best_cost) {
+            best_cost = now_cost;
+            best_pos = k;
+        }
+    }
+    cur_cost[mid] = best_cost;
+    cur_pos[mid] = best_pos;
+    FastOracleLayer(range_max, last_cost, cur_cost, cur_pos, j, lo, mid - 1, opt_lo, best_pos);
+    FastOracleLayer(range_max, last_cost, cur_cost, cur_pos, j, mid + 1, hi, best_pos, opt_hi);
+}
+
+// the same cost as oracle_split_group, only for 1D inputs since 2D/3D inputs break the monotonicity
+inline std::vector<std::vector<int>> fast_oracle_split_group(const std::vector<torch::Tensor>& x, int group) {
+    TORCH_CHECK(x[0].dim() == 1, "fast_oracle_split_group only supports 1D inputs, but get ", x[0].dim(),
+            " dims, use oracle_split_group instead");
+    const int N = x.size();
+    const int M = std::min(group, N);
+    RangeMaxShape range_max(x);
+    std::vector<int64_t> last_cost(N + 1);
+    std::vector<int64_t> cur_cost(N + 1);
+    std::vector<std::vector<int>> pos(M + 1, std::vector<int>(N + 1, 0));
+    for (int i = 1; i <= N; i++)
+        last_cost[i] = range_max.numel(0, i - 1) * i;
+    for (int j = 2; j <= M; j++) {
+        FastOracleLayer(range_max, last_cost, cur_cost, pos[j], j, j, N, j - 1, N - 1);
+        std::swap(last_cost, cur_cost);
+    }
+    return SplitGroupResult(range_max, SplitGroupPositions(pos, N, M));
+}
+
+}  // namespace host
+}  // namespace rll
+}  // namespace hpc
+
+#endif // HPC_RLL_HOST_SPLIT_GROUP_H_
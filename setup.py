@@ -4,7 +4,7 @@ import os
 import glob
 import torch
 import warnings
-from torch.utils.cpp_extension import BuildExtension, CUDAExtension
+from torch.utils.cpp_extension import BuildExtension, CppExtension, CUDAExtension, CUDA_HOME
 
 NAME = 'di_hpc_rll'
 VERSION = '0.0.2'
@@ -14,41 +14,79 @@ PACKAGES = ['hpc_rll', 'hpc_rll.origin', 'hpc_rll.rl_utils', 'hpc_rll.torch_util
 include_dirs = [os.path.join(os.getcwd(), 'include')]
 print('include_dirs', include_dirs)
 
+# the kahan accumulation relies on the exact rounding of each operation, so a * b + c must not be contracted into
+# fma or reassociated, the same as the __fadd_rn/__fmul_rn intrinsics of the cuda version. never add -ffast-math.
+cpu_compile_args = {'cxx': ['-O3', '-fopenmp', '-ffp-contract=off']}
+cpu_link_args = ['-fopenmp']
+
 ext_modules = []
 ext_modules.append(
-        CUDAExtension('hpc_rl_utils', sources=[
-            'src/rl_utils/entry.cpp',
-            'src/rl_utils/dist_nstep_td.cu',
-            'src/rl_utils/gae.cu',
-            'src/rl_utils/padding.cu',
-            'src/rl_utils/ppo.cu',
-            'src/rl_utils/q_nstep_td.cu',
-            'src/rl_utils/q_nstep_td_rescale.cu',
-            'src/rl_utils/td_lambda.cu',
-            'src/rl_utils/upgo.cu',
-            'src/rl_utils/vtrace.cu',
-            'src/rl_utils/iqn_nstep_td_error.cu',
-            'src/rl_utils/qrdqn_nstep_td_error.cu',
-            'src/models/actor_critic.cu',
-            ], include_dirs=include_dirs)
+        CppExtension('hpc_rl_utils_cpu', sources=[
+            'src/cpu/rl_utils/entry.cpp',
+            'src/cpu/rl_utils/dist_nstep_td.cpp',
+            'src/cpu/rl_utils/gae.cpp',
+            'src/cpu/rl_utils/padding.cpp',
+            'src/cpu/rl_utils/ppo.cpp',
+            'src/cpu/rl_utils/q_nstep_td.cpp',
+            'src/cpu/rl_utils/q_nstep_td_rescale.cpp',
+            'src/cpu/rl_utils/nstep_return.cpp',
+            'src/cpu/rl_utils/retrace.cpp',
+            'src/cpu/rl_utils/td_lambda.cpp',
+            'src/cpu/rl_utils/lambda_return.cpp',
+            'src/cpu/rl_utils/upgo.cpp',
+            'src/cpu/rl_utils/vtrace.cpp',
+            'src/cpu/rl_utils/iqn_nstep_td_error.cpp',
+            'src/cpu/rl_utils/qrdqn_nstep_td_error.cpp',
+            ], include_dirs=include_dirs, extra_compile_args=cpu_compile_args, extra_link_args=cpu_link_args)
         )
+
 ext_modules.append(
-        CUDAExtension('hpc_torch_utils_network', sources=[
-            'src/torch_utils/network/entry.cpp',
-            'src/torch_utils/network/lstm.cu',
-            'src/torch_utils/network/scatter_connection.cu'
-            ], include_dirs=include_dirs),
+        CppExtension('hpc_torch_utils_network_cpu', sources=[
+            'src/cpu/torch_utils/network/entry.cpp',
+            'src/cpu/torch_utils/network/lstm.cpp',
+            ], include_dirs=include_dirs, extra_compile_args=cpu_compile_args, extra_link_args=cpu_link_args)
         )
 
-if int("".join(list(filter(str.isdigit, torch.__version__)))) >= 120:
+if CUDA_HOME is None:
+    warnings.warn("CUDA toolkit is not found. Only the cpu extensions are compiled.")
+else:
     ext_modules.append(
-            CUDAExtension('hpc_models', sources=[
-                'src/models/entry.cpp',
+            CUDAExtension('hpc_rl_utils', sources=[
+                'src/rl_utils/entry.cpp',
+                'src/rl_utils/dist_nstep_td.cu',
+                'src/rl_utils/gae.cu',
+                'src/rl_utils/padding.cu',
+                'src/rl_utils/ppo.cu',
+                'src/rl_utils/q_nstep_td.cu',
+                'src/rl_utils/q_nstep_td_rescale.cu',
+                'src/rl_utils/nstep_return.cu',
+                'src/rl_utils/retrace.cu',
+                'src/rl_utils/td_lambda.cu',
+                'src/rl_utils/lambda_return.cu',
+                'src/rl_utils/upgo.cu',
+                'src/rl_utils/vtrace.cu',
+                'src/rl_utils/iqn_nstep_td_error.cu',
+                'src/rl_utils/qrdqn_nstep_td_error.cu',
                 'src/models/actor_critic.cu',
+                ], include_dirs=include_dirs)
+            )
+    ext_modules.append(
+            CUDAExtension('hpc_torch_utils_network', sources=[
+                'src/torch_utils/network/entry.cpp',
+                'src/torch_utils/network/lstm.cu',
+                'src/torch_utils/network/scatter_connection.cu'
                 ], include_dirs=include_dirs),
             )
-else:
-    warnings.warn("Torch version is less than 1.2. BoolTensor is not yet well implemented. Thus we skip the compiliation of hpc_models.")
+
+    if int("".join(list(filter(str.isdigit, torch.__version__)))) >= 120:
+        ext_modules.append(
+                CUDAExtension('hpc_models', sources=[
+                    'src/models/entry.cpp',
+                    'src/models/actor_critic.cu',
+                    ], include_dirs=include_dirs),
+                )
+    else:
+        warnings.warn("Torch version is less than 1.2. BoolTensor is not yet well implemented. Thus we skip the compiliation of hpc_models.")
 
 setup(
     name = NAME,
@@ -0,0 +1,87 @@
+#include "hpc/rll/cpu/rl_utils/entry.h"
+#include "hpc/rll/cpu/rl_utils/dist_nstep_td_kernel.h"
+#include "hpc/rll/cpu/reduce.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+void DistNStepTdForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float v_min,
+    float v_max) {
+
+    unsigned int index = 0;
+    const torch::Tensor& dist = inputs[index++];
+    const torch::Tensor& next_n_dist = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    const torch::Tensor& next_n_action = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& done = inputs[index++];
+    const torch::Tensor& weight = inputs[index++];
+    index = 0;
+    torch::Tensor& td_err = outputs[index++];
+    torch::Tensor& loss = outputs[index++];
+    torch::Tensor& buf = outputs[index++];
+
+    const unsigned int time_step = reward.size(0);
+    const unsigned int batch_size = dist.size(0);
+    const unsigned int action_dim = dist.size(1);
+    const unsigned int n_atom = dist.size(2);
+
+    // buf0: B for reward x fp reward_factor
+    // buf1: (B * n_atom) for fp proj_dist and bp grad
+    float* buf0 = (float*)(buf.data_ptr());
+    float* buf1 = (float*)(buf.data_ptr()) + batch_size;
+
+    float gamma_nstep = 1.f;
+    for (int t = 0; t < time_step; t++)
+        gamma_nstep *= gamma;
+    float delta = (v_max - v_min) / (n_atom - 1);
+
+    // each sample only touches its own projection, so the three passes are fused per sample
+    auto sum = parallelReduceSum<1>(batch_size, GetGrainSize(time_step + action_dim * n_atom),
+            [&](int64_t b, std::array<float, 1>& acc) {
+        buf0[b] = distNStepTdRewardKernel(time_step, batch_size, gamma, (float*)(reward.data_ptr()), b);
+        std::fill(buf1 + b * n_atom, buf1 + (b + 1) * n_atom, 0.f);
+        distNStepTdProjKernel(action_dim, n_atom, gamma_nstep, v_min, v_max, delta,
+                (float*)(next_n_dist.data_ptr()), (int64_t*)(next_n_action.data_ptr()),
+                buf0[b], (float*)(done.data_ptr()), buf1, b);
+        acc[0] += distNStepTdLossKernel(batch_size, action_dim, n_atom,
+                (float*)(dist.data_ptr()), (int64_t*)(action.data_ptr()),
+                (const float*)buf1, (float*)(weight.data_ptr()),
+                (float*)(td_err.data_ptr()), buf1, b);
+    });
+    ((float*)(loss.data_ptr()))[0] = sum[0] * (-1.f) / (float)batch_size;
+}
+
+void DistNStepTdBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs) {
+
+    unsigned int index = 0;
+    const torch::Tensor& grad_loss = inputs[index++];
+    const torch::Tensor& buf = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    index = 0;
+    torch::Tensor& grad_dist = outputs[index++];
+
+    const unsigned int batch_size = grad_dist.size(0);
+    const unsigned int action_dim = grad_dist.size(1);
+    const unsigned int n_atom = grad_dist.size(2);
+
+    // buf1: (B * n_atom) for fp proj_dist and bp grad, here used for bp grad
+    const float* grad_buf = (float*)(buf.data_ptr()) + batch_size;
+    at::parallel_for(0, batch_size, GetGrainSize(action_dim * n_atom), [&](int64_t begin, int64_t end) {
+        for (int64_t b = begin; b < end; ++b) {
+            distNStepTdBackwardKernel(action_dim, n_atom, (float*)(grad_loss.data_ptr()), grad_buf,
+                    (int64_t*)(action.data_ptr()), (float*)(grad_dist.data_ptr()), b);
+        }
+    });
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
@@ -0,0 +1,56 @@
+#include <torch/extension.h>
+#include "hpc/rll/cpu/rl_utils/entry.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
+    m.def("sample_split_group", &sample_split_group, "sample_split_group");
+    m.def("quantile_split_group", &quantile_split_group, "quantile_split_group");
+    m.def("oracle_split_group", &oracle_split_group, "oracle_split_group");
+    m.def("fast_oracle_split_group", &fast_oracle_split_group, "fast_oracle_split_group");
+    m.def("Pad1DForward", &Pad1DForward, "Pad1D forward (CPU)");
+    m.def("GroupPad1DForward", &GroupPad1DForward, "GroupPad1D forward (CPU)");
+    m.def("Unpad1DForward", &Unpad1DForward, "Unpad1D forward (CPU)");
+    m.def("Pad2DForward", &Pad2DForward, "Pad2D forward (CPU)");
+    m.def("GroupPad2DForward", &GroupPad2DForward, "GroupPad2D forward (CPU)");
+    m.def("Unpad2DForward", &Unpad2DForward, "Unpad2D forward (CPU)");
+    m.def("Pad3DForward", &Pad3DForward, "Pad3D forward (CPU)");
+    m.def("GroupPad3DForward", &GroupPad3DForward, "GroupPad3D forward (CPU)");
+    m.def("Unpad3DForward", &Unpad3DForward, "Unpad3D forward (CPU)");
+    m.def("PadRaggedForward", &PadRaggedForward, "PadRagged forward (CPU)");
+    m.def("UnpadRaggedForward", &UnpadRaggedForward, "UnpadRagged forward (CPU)");
+    m.def("DistNStepTdForward", &DistNStepTdForward, "dist_nstep_td forward (CPU)");
+    m.def("DistNStepTdBackward", &DistNStepTdBackward, "dist_nstep_td backward (CPU)");
+    m.def("GaeForward", &GaeForward, "gae forward (CPU)");
+    m.def("GaeNormForward", &GaeNormForward, "gae with return and advantage normalization forward (CPU)");
+    m.def("PPOForward", &PPOForward, "ppo forward (CPU)");
+    m.def("PPOBackward", &PPOBackward, "ppo backward (CPU)");
+    m.def("PPOContinuousForward", &PPOContinuousForward, "ppo continuous forward (CPU)");
+    m.def("PPOContinuousBackward", &PPOContinuousBackward, "ppo continuous backward (CPU)");
+    m.def("QNStepTdForward", &QNStepTdForward, "q_nstep_td forward (CPU)");
+    m.def("QNStepTdBackward", &QNStepTdBackward, "q_nstep_td backward (CPU)");
+    m.def("NStepReturnForward", &NStepReturnForward, "nstep_return forward (CPU)");
+    m.def("RetraceForward", &RetraceForward, "retrace forward (CPU)");
+    m.def("RetraceBackward", &RetraceBackward, "retrace backward (CPU)");
+    m.def("QNStepTdRescaleForward", &QNStepTdRescaleForward, "q_nstep_td_with_rescale forward (CPU)");
+    m.def("QNStepTdRescaleBackward", &QNStepTdRescaleBackward, "q_nstep_td_with_rescale backward (CPU)");
+    m.def("TdLambdaForward", &TdLambdaForward, "td_lambda forward (CPU)");
+    m.def("TdLambdaBackward", &TdLambdaBackward, "td_lambda backward (CPU)");
+    m.def("LambdaReturnForward", &LambdaReturnForward, "lambda_return forward (CPU)");
+    m.def("LambdaReturnBackward", &LambdaReturnBackward, "lambda_return backward (CPU)");
+    m.def("UpgoForward", &UpgoForward, "upgo forward (CPU)");
+    m.def("UpgoBackward", &UpgoBackward, "upgo backward (CPU)");
+    m.def("VTraceForward", &VTraceForward, "vtrace forward (CPU)");
+    m.def("VTraceBackward", &VTraceBackward, "vtrace backward (CPU)");
+    m.def("VTraceReturnsForward", &VTraceReturnsForward, "vtrace returns forward (CPU)");
+    m.def("IQNNStepTDErrorForward", &IQNNStepTDErrorForward, "iqn_nstep_td_error forward (CPU)");
+    m.def("IQNNStepTDErrorBackward", &IQNNStepTDErrorBackward, "iqn_nstep_td_error backward (CPU)");
+    m.def("QRDQNNStepTDErrorForward", &QRDQNNStepTDErrorForward, "qrdqn_nstep_td_error forward (CPU)");
+    m.def("QRDQNNStepTDErrorBackward", &QRDQNNStepTDErrorBackward, "qrdqn_nstep_td_error backward (CPU)");
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
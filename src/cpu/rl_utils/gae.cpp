@@ -0,0 +1,139 @@
+#include "hpc/rll/cpu/rl_utils/entry.h"
+#include "hpc/rll/cpu/rl_utils/gae_kernel.h"
+#include "hpc/rll/cpu/reduce.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+void GaeForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& value = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& done = inputs[index++];
+    const torch::Tensor& lengths = inputs[index++];
+    index = 0;
+    torch::Tensor& adv = outputs[index++];
+
+    const unsigned int time_step = reward.size(0);
+    const unsigned int batch_size = reward.size(1);
+
+    const int64_t* lengths_ptr = lengths.numel() > 0 ? (int64_t*)(lengths.data_ptr()) : nullptr;
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, value.scalar_type(),
+            "GaeForward", [&] {
+        const scalar_t* value_ptr = (scalar_t*)(value.data_ptr());
+        const scalar_t* reward_ptr = (scalar_t*)(reward.data_ptr());
+        const scalar_t* done_ptr = done.numel() > 0 ? (scalar_t*)(done.data_ptr()) : nullptr;
+        scalar_t* adv_ptr = (scalar_t*)(adv.data_ptr());
+        dispatchAccumulateMode<at::opmath_type<scalar_t>>(accumulate_mode, [&](auto mode) {
+            using Acc = decltype(mode);
+            // each task owns a chunk of contiguous columns
+            int64_t grain_size = std::max(GetGrainSize(time_step), GAE_MIN_LANES);
+            at::parallel_for(0, batch_size, grain_size, [&](int64_t begin, int64_t end) {
+                if (done_ptr == nullptr && lengths_ptr == nullptr) {
+                    gaeForwardKernel<scalar_t, Acc>(time_step, batch_size, gamma, lambda,
+                            value_ptr, reward_ptr, adv_ptr, nullptr, begin, end);
+                } else {
+                    gaeMaskedForwardKernel<scalar_t, Acc>(time_step, batch_size, gamma, lambda,
+                            value_ptr, reward_ptr, done_ptr, lengths_ptr, adv_ptr, nullptr, begin, end);
+                }
+            });
+        });
+    });
+}
+
+void GaeNormForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    float eps,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& value = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& done = inputs[index++];
+    const torch::Tensor& lengths = inputs[index++];
+    index = 0;
+    torch::Tensor& adv = outputs[index++];
+    torch::Tensor& ret = outputs[index++];
+    torch::Tensor& norm_adv = outputs[index++];
+    torch::Tensor& stat = outputs[index++];
+
+    const unsigned int time_step = reward.size(0);
+    const unsigned int batch_size = reward.size(1);
+
+    const int64_t* lengths_ptr = lengths.numel() > 0 ? (int64_t*)(lengths.data_ptr()) : nullptr;
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, value.scalar_type(),
+            "GaeNormForward", [&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        const scalar_t* value_ptr = (scalar_t*)(value.data_ptr());
+        const scalar_t* reward_ptr = (scalar_t*)(reward.data_ptr());
+        const scalar_t* done_ptr = done.numel() > 0 ? (scalar_t*)(done.data_ptr()) : nullptr;
+        scalar_t* adv_ptr = (scalar_t*)(adv.data_ptr());
+        scalar_t* ret_ptr = (scalar_t*)(ret.data_ptr());
+        scalar_t* norm_adv_ptr = (scalar_t*)(norm_adv.data_ptr());
+
+        // step 1: gae and return, then sum up adv and adv * adv of the chunk while it is still in cache
+        int64_t grain_size = std::max(GetGrainSize(time_step), GAE_MIN_LANES);
+        auto sum = parallelReduceRangeSum<3, double>(batch_size, grain_size,
+                [&](int64_t begin, int64_t end, std::array<double, 3>& acc) {
+            dispatchAccumulateMode<acc_t>(accumulate_mode, [&](auto mode) {
+                using Acc = decltype(mode);
+                if (done_ptr == nullptr && lengths_ptr == nullptr) {
+                    gaeForwardKernel<scalar_t, Acc>(time_step, batch_size, gamma, lambda,
+                            value_ptr, reward_ptr, adv_ptr, ret_ptr, begin, end);
+                } else {
+                    gaeMaskedForwardKernel<scalar_t, Acc>(time_step, batch_size, gamma, lambda,
+                            value_ptr, reward_ptr, done_ptr, lengths_ptr, adv_ptr, ret_ptr, begin, end);
+                }
+            });
+            for (unsigned int t = 0; t < time_step; ++t) {
+                const scalar_t* adv_row = adv_ptr + (int64_t)t * batch_size;
+                for (int64_t b = begin; b < end; ++b) {
+                    double a = static_cast<double>(adv_row[b]);
+                    acc[0] += a;
+                    acc[1] += a * a;
+                }
+            }
+            for (int64_t b = begin; b < end; ++b) {
+                acc[2] += (lengths_ptr != nullptr) ? std::min<int64_t>(std::max<int64_t>(lengths_ptr[b], 0), time_step)
+                    : time_step;
+            }
+        });
+
+        // step 2: normalization, std is unbiased as torch.std. padding steps get zero.
+        double count = sum[2];
+        double mean = sum[0] / count;
+        double var = (sum[1] - mean * sum[0]) / std::max(count - 1., 1.);
+        acc_t std_ = std::sqrt(std::max(var, 0.));
+        double* stat_ptr = (double*)(stat.data_ptr());
+        stat_ptr[0] = sum[0];
+        stat_ptr[1] = sum[1];
+        stat_ptr[2] = sum[2];
+
+        acc_t mean_ = mean;
+        acc_t scale = 1 / (std_ + eps);
+        at::parallel_for(0, time_step, GetGrainSize(batch_size), [&](int64_t begin, int64_t end) {
+            for (int64_t t = begin; t < end; ++t) {
+                const scalar_t* adv_row = adv_ptr + t * batch_size;
+                scalar_t* norm_adv_row = norm_adv_ptr + t * batch_size;
+                for (unsigned int b = 0; b < batch_size; ++b) {
+                    bool valid = (lengths_ptr == nullptr) || (t < lengths_ptr[b]);
+                    norm_adv_row[b] = valid ? (static_cast<acc_t>(adv_row[b]) - mean_) * scale : 0;
+                }
+            }
+        });
+    });
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
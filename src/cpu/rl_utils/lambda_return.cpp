@@ -0,0 +1,76 @@
+#include "hpc/rll/cpu/rl_utils/entry.h"
+#include "hpc/rll/cpu/rl_utils/lambda_return_kernel.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+void LambdaReturnForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& value = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& gammas = inputs[index++];
+    const torch::Tensor& lambdas = inputs[index++];
+    index = 0;
+    torch::Tensor& ret = outputs[index++];
+
+    const unsigned int time_step = reward.size(0);
+    const unsigned int batch_size = reward.size(1);
+
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, value.scalar_type(),
+            "LambdaReturnForward", [&] {
+        const scalar_t* value_ptr = (scalar_t*)(value.data_ptr());
+        const scalar_t* reward_ptr = (scalar_t*)(reward.data_ptr());
+        const scalar_t* gammas_ptr = gammas.numel() > 0 ? (scalar_t*)(gammas.data_ptr()) : nullptr;
+        const scalar_t* lambdas_ptr = lambdas.numel() > 0 ? (scalar_t*)(lambdas.data_ptr()) : nullptr;
+        scalar_t* ret_ptr = (scalar_t*)(ret.data_ptr());
+        dispatchAccumulateMode<at::opmath_type<scalar_t>>(accumulate_mode, [&](auto mode) {
+            // each task owns a chunk of contiguous columns
+            int64_t grain_size = std::max(GetGrainSize(time_step), LAMBDA_RETURN_MIN_LANES);
+            at::parallel_for(0, batch_size, grain_size, [&](int64_t begin, int64_t end) {
+                lambdaReturnForwardKernel<scalar_t, decltype(mode)>(time_step, batch_size, gamma, lambda,
+                        value_ptr, reward_ptr, gammas_ptr, lambdas_ptr, ret_ptr, begin, end);
+            });
+        });
+    });
+}
+
+void LambdaReturnBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda) {
+
+    unsigned int index = 0;
+    const torch::Tensor& grad_ret = inputs[index++];
+    const torch::Tensor& gammas = inputs[index++];
+    const torch::Tensor& lambdas = inputs[index++];
+    index = 0;
+    torch::Tensor& grad_value = outputs[index++];
+
+    const unsigned int time_step = grad_ret.size(0);
+    const unsigned int batch_size = grad_ret.size(1);
+
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, grad_value.scalar_type(),
+            "LambdaReturnBackward", [&] {
+        const scalar_t* grad_ret_ptr = (scalar_t*)(grad_ret.data_ptr());
+        const scalar_t* gammas_ptr = gammas.numel() > 0 ? (scalar_t*)(gammas.data_ptr()) : nullptr;
+        const scalar_t* lambdas_ptr = lambdas.numel() > 0 ? (scalar_t*)(lambdas.data_ptr()) : nullptr;
+        scalar_t* grad_value_ptr = (scalar_t*)(grad_value.data_ptr());
+        int64_t grain_size = std::max(GetGrainSize(time_step), LAMBDA_RETURN_MIN_LANES);
+        at::parallel_for(0, batch_size, grain_size, [&](int64_t begin, int64_t end) {
+            lambdaReturnBackwardKernel<scalar_t>(time_step, batch_size, gamma, lambda,
+                    grad_ret_ptr, gammas_ptr, lambdas_ptr, grad_value_ptr, begin, end);
+        });
+    });
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
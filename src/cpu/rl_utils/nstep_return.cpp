@@ -0,0 +1,47 @@
+#include "hpc/rll/cpu/rl_utils/entry.h"
+#include "hpc/rll/cpu/rl_utils/nstep_return_kernel.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+void NStepReturnForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    int nstep,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& done = inputs[index++];
+    index = 0;
+    torch::Tensor& ret = outputs[index++];
+    torch::Tensor& bootstrap_index = outputs[index++];
+    torch::Tensor& bootstrap_discount = outputs[index++];
+
+    TORCH_CHECK(nstep >= 1, "nstep should be at least 1, but get ", nstep);
+    const unsigned int time_step = reward.size(0);
+    const unsigned int batch_size = reward.size(1);
+
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, reward.scalar_type(),
+            "NStepReturnForward", [&] {
+        const scalar_t* reward_ptr = (scalar_t*)(reward.data_ptr());
+        const scalar_t* done_ptr = done.numel() > 0 ? (scalar_t*)(done.data_ptr()) : nullptr;
+        scalar_t* ret_ptr = (scalar_t*)(ret.data_ptr());
+        int64_t* bootstrap_index_ptr = (int64_t*)(bootstrap_index.data_ptr());
+        scalar_t* bootstrap_discount_ptr = (scalar_t*)(bootstrap_discount.data_ptr());
+        dispatchAccumulateMode<at::opmath_type<scalar_t>>(accumulate_mode, [&](auto mode) {
+            // each task owns a chunk of contiguous columns
+            int64_t grain_size = std::max(GetGrainSize(time_step), NSTEP_RETURN_MIN_LANES);
+            at::parallel_for(0, batch_size, grain_size, [&](int64_t begin, int64_t end) {
+                nstepReturnKernel<scalar_t, decltype(mode)>(time_step, batch_size, gamma, nstep,
+                        reward_ptr, done_ptr, ret_ptr, bootstrap_index_ptr, bootstrap_discount_ptr, begin, end);
+            });
+        });
+    });
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
@@ -0,0 +1,306 @@
+#include "hpc/rll/cpu/rl_utils/entry.h"
+#include "hpc/rll/cpu/rl_utils/padding_kernel.h"
+#include "hpc/rll/host/ragged.h"
+#include "hpc/rll/host/split_group.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+std::vector<std::vector<int>> sample_split_group(const std::vector<torch::Tensor>& x, int group, int64_t seed) {
+    return host::sample_split_group(x, group, seed);
+}
+
+std::vector<std::vector<int>> quantile_split_group(const std::vector<torch::Tensor>& x, int group) {
+    return host::quantile_split_group(x, group);
+}
+
+std::vector<std::vector<int>> oracle_split_group(const std::vector<torch::Tensor>& x, int group) {
+    return host::oracle_split_group(x, group);
+}
+
+std::vector<std::vector<int>> fast_oracle_split_group(const std::vector<torch::Tensor>& x, int group) {
+    return host::fast_oracle_split_group(x, group);
+}
+
+// shape of the padded block of each tensor, padded to 3 dims with leading 1
+static void getMaxShape(const std::vector<torch::Tensor>& inputs, int dim, int64_t* max_shape) {
+    for (int d = 0; d < 3; ++d)
+        max_shape[d] = 1;
+    for (int d = 0; d < dim; ++d) {
+        int64_t m = 0;
+        for (const auto& t : inputs)
+            m = std::max(m, t.size(d));
+        max_shape[3 - dim + d] = m;
+    }
+}
+
+static std::vector<torch::Tensor> PadForward(const std::vector<torch::Tensor>& inputs, int dim, int value) {
+    const int64_t n = inputs.size();
+    std::vector<torch::Tensor> contiguous_inputs;
+    for (const auto& t : inputs) {
+        CHECK_CPU(t);
+        TORCH_CHECK(t.dim() == dim, "inputs should have ", dim, " dims, but get ", t.dim());
+        contiguous_inputs.push_back(t.contiguous());
+    }
+    int64_t max_shape[3];
+    getMaxShape(contiguous_inputs, dim, max_shape);
+    const int64_t block_size = max_shape[0] * max_shape[1] * max_shape[2];
+    std::vector<int64_t> out_shape = {n};
+    for (int d = 3 - dim; d < 3; ++d)
+        out_shape.push_back(max_shape[d]);
+
+    auto new_x = at::empty(out_shape, inputs[0].options());
+    auto mask = at::empty(out_shape, inputs[0].options().dtype(at::kInt));
+    float* new_x_ptr = new_x.data_ptr<float>();
+    int* mask_ptr = mask.data_ptr<int>();
+    at::parallel_for(0, n, GetGrainSize(block_size), [&](int64_t begin, int64_t end) {
+        int64_t shape[3];
+        for (int64_t i = begin; i < end; ++i) {
+            getBlockShape(contiguous_inputs[i].sizes().data(), dim, shape);
+            padBlockKernel(contiguous_inputs[i].data_ptr<float>(), shape[0], shape[1], shape[2],
+                    new_x_ptr + i * block_size, mask_ptr + i * block_size,
+                    max_shape[0], max_shape[1], max_shape[2], value);
+        }
+    });
+    return {new_x, mask};
+}
+
+// the padded tensors of all the groups are views of one allocation
+static std::vector<std::vector<torch::Tensor>> GroupPadForward(
+        const std::vector<torch::Tensor>& inputs, int dim, const std::vector<int>& group_cnt,
+        const std::vector<int>& max_shape, const std::vector<int>& group_id, const std::vector<int>& group_idx,
+        int value) {
+    const int64_t n = inputs.size();
+    const int group_num = group_cnt.size();
+    std::vector<torch::Tensor> contiguous_inputs;
+    for (const auto& t : inputs) {
+        CHECK_CPU(t);
+        TORCH_CHECK(t.dim() == dim, "inputs should have ", dim, " dims, but get ", t.dim());
+        contiguous_inputs.push_back(t.contiguous());
+    }
+    // padded block shape and start offset of each group
+    std::vector<int64_t> group_shape(group_num * 3, 1);
+    std::vector<int64_t> group_offset(group_num + 1, 0);
+    int64_t max_block_size = 1;
+    for (int g = 0; g < group_num; ++g) {
+        for (int d = 0; d < dim; ++d)
+            group_shape[g * 3 + 3 - dim + d] = max_shape[g * dim + d];
+        int64_t block_size = group_shape[g * 3] * group_shape[g * 3 + 1] * group_shape[g * 3 + 2];
+        max_block_size = std::max(max_block_size, block_size);
+        group_offset[g + 1] = group_offset[g] + group_cnt[g] * block_size;
+    }
+
+    auto new_x = at::empty({group_offset[group_num]}, inputs[0].options());
+    auto mask = at::empty({group_offset[group_num]}, inputs[0].options().dtype(at::kInt));
+    float* new_x_ptr = new_x.data_ptr<float>();
+    int* mask_ptr = mask.data_ptr<int>();
+    at::parallel_for(0, n, GetGrainSize(max_block_size), [&](int64_t begin, int64_t end) {
+        int64_t shape[3];
+        for (int64_t i = begin; i < end; ++i) {
+            const int gid = group_id[i];
+            const int64_t* cur_max_shape = group_shape.data() + gid * 3;
+            const int64_t block_size = cur_max_shape[0] * cur_max_shape[1] * cur_max_shape[2];
+            const int64_t offset = group_offset[gid] + (i - group_idx[gid]) * block_size;
+            getBlockShape(contiguous_inputs[i].sizes().data(), dim, shape);
+            padBlockKernel(contiguous_inputs[i].data_ptr<float>(), shape[0], shape[1], shape[2],
+                    new_x_ptr + offset, mask_ptr + offset, cur_max_shape[0], cur_max_shape[1], cur_max_shape[2], value);
+        }
+    });
+
+    std::vector<torch::Tensor> new_xs;
+    std::vector<torch::Tensor> masks;
+    for (int g = 0; g < group_num; ++g) {
+        std::vector<int64_t> out_shape = {group_cnt[g]};
+        for (int d = 0; d < dim; ++d)
+            out_shape.push_back(max_shape[g * dim + d]);
+        int64_t len = group_offset[g + 1] - group_offset[g];
+        new_xs.push_back(new_x.narrow(0, group_offset[g], len).view(out_shape));
+        masks.push_back(mask.narrow(0, group_offset[g], len).view(out_shape));
+    }
+    return {new_xs, masks};
+}
+
+// the unpadded tensors are views of one allocation
+static std::vector<torch::Tensor> UnpadForward(const torch::Tensor& inputs, int dim, const std::vector<int>& shape) {
+    CHECK_CPU(inputs);
+    TORCH_CHECK(inputs.dim() == dim + 1, "inputs should have ", dim + 1, " dims, but get ", inputs.dim());
+    const torch::Tensor x = inputs.contiguous();
+    const int64_t n = shape.size() / dim;
+    const float* inputs_ptr = x.data_ptr<float>();
+    int64_t max_shape[3] = {1, 1, 1};
+    for (int d = 0; d < dim; ++d)
+        max_shape[3 - dim + d] = x.size(d + 1);
+    const int64_t block_size = max_shape[0] * max_shape[1] * max_shape[2];
+
+    std::vector<int64_t> offsets(n + 1, 0);
+    std::vector<int64_t> shapes(n * dim);
+    for (int64_t i = 0; i < n; ++i) {
+        int64_t numel = 1;
+        for (int d = 0; d < dim; ++d) {
+            shapes[i * dim + d] = shape[i * dim + d];
+            numel *= shape[i * dim + d];
+        }
+        offsets[i + 1] = offsets[i] + numel;
+    }
+    auto outputs = at::empty({offsets[n]}, x.options());
+    float* outputs_ptr = outputs.data_ptr<float>();
+    at::parallel_for(0, n, GetGrainSize(block_size), [&](int64_t begin, int64_t end) {
+        int64_t cur_shape[3];
+        for (int64_t i = begin; i < end; ++i) {
+            getBlockShape(shapes.data() + i * dim, dim, cur_shape);
+            unpadBlockKernel(inputs_ptr + i * block_size, max_shape[1], max_shape[2],
+                    outputs_ptr + offsets[i], cur_shape[0], cur_shape[1], cur_shape[2]);
+        }
+    });
+
+    std::vector<torch::Tensor> ret;
+    for (int64_t i = 0; i < n; ++i) {
+        ret.push_back(outputs.narrow(0, offsets[i], offsets[i + 1] - offsets[i]).view(
+                    at::IntArrayRef(shapes.data() + i * dim, dim)));
+    }
+    return ret;
+}
+
+std::vector<torch::Tensor> Pad1DForward(const std::vector<torch::Tensor>& inputs, const int& value) {
+    return PadForward(inputs, 1, value);
+}
+
+std::vector<std::vector<torch::Tensor>> GroupPad1DForward(
+    const std::vector<torch::Tensor>& inputs,
+    const std::vector<int>& group_cnt,
+    const std::vector<int>& max_shape,
+    const std::vector<int>& group_id,
+    const std::vector<int>& group_idx,
+    const int& value) {
+    return GroupPadForward(inputs, 1, group_cnt, max_shape, group_id, group_idx, value);
+}
+
+std::vector<torch::Tensor> Unpad1DForward(const torch::Tensor& inputs, const std::vector<int>& shape) {
+    return UnpadForward(inputs, 1, shape);
+}
+
+std::vector<torch::Tensor> Pad2DForward(const std::vector<torch::Tensor>& inputs, const int& value) {
+    return PadForward(inputs, 2, value);
+}
+
+std::vector<std::vector<torch::Tensor>> GroupPad2DForward(
+    const std::vector<torch::Tensor>& inputs,
+    const std::vector<int>& group_cnt,
+    const std::vector<int>& max_shape,
+    const std::vector<int>& group_id,
+    const std::vector<int>& group_idx,
+    const int& value) {
+    return GroupPadForward(inputs, 2, group_cnt, max_shape, group_id, group_idx, value);
+}
+
+std::vector<torch::Tensor> Unpad2DForward(const torch::Tensor& inputs, const std::vector<int>& shape) {
+    return UnpadForward(inputs, 2, shape);
+}
+
+std::vector<torch::Tensor> Pad3DForward(const std::vector<torch::Tensor>& inputs, const int& value) {
+    return PadForward(inputs, 3, value);
+}
+
+std::vector<std::vector<torch::Tensor>> GroupPad3DForward(
+    const std::vector<torch::Tensor>& inputs,
+    const std::vector<int>& group_cnt,
+    const std::vector<int>& max_shape,
+    const std::vector<int>& group_id,
+    const std::vector<int>& group_idx,
+    const int& value) {
+    return GroupPadForward(inputs, 3, group_cnt, max_shape, group_id, group_idx, value);
+}
+
+std::vector<torch::Tensor> Unpad3DForward(const torch::Tensor& inputs, const std::vector<int>& shape) {
+    return UnpadForward(inputs, 3, shape);
+}
+
+std::vector<torch::Tensor> PadRaggedForward(
+    const torch::Tensor& values,
+    const torch::Tensor& offsets,
+    const torch::Tensor& shapes,
+    const int& value) {
+
+    CHECK_CPU(values);
+    TORCH_CHECK(offsets.scalar_type() == at::kLong && shapes.scalar_type() == at::kLong,
+            "offsets and shapes should be int64");
+    TORCH_CHECK(offsets.device() == values.device() && shapes.device() == values.device(),
+            "offsets and shapes should be on the same device as values");
+    const int64_t n = shapes.size(0);
+    const int dim = shapes.size(1);
+    TORCH_CHECK(dim >= 1 && dim <= 3, "ragged padding only supports 1, 2 or 3 dims, but get ", dim);
+    TORCH_CHECK(offsets.numel() == n + 1, "offsets should have ", n + 1, " elements, but get ", offsets.numel());
+    const float* values_ptr = values.data_ptr<float>();
+    const int64_t* offsets_ptr = offsets.data_ptr<int64_t>();
+    const int64_t* shapes_ptr = shapes.data_ptr<int64_t>();
+    host::CheckRagged(offsets_ptr, shapes_ptr, n, dim, values.numel());
+
+    std::vector<int64_t> out_shape = {n};
+    int64_t max_shape[3] = {1, 1, 1};
+    for (int d = 0; d < dim; ++d) {
+        int64_t m = 0;
+        for (int64_t i = 0; i < n; ++i)
+            m = std::max(m, shapes_ptr[i * dim + d]);
+        max_shape[3 - dim + d] = m;
+        out_shape.push_back(m);
+    }
+    const int64_t block_size = max_shape[0] * max_shape[1] * max_shape[2];
+
+    auto new_x = at::empty(out_shape, values.options());
+    auto mask = at::empty(out_shape, values.options().dtype(at::kInt));
+    float* new_x_ptr = new_x.data_ptr<float>();
+    int* mask_ptr = mask.data_ptr<int>();
+    at::parallel_for(0, n, GetGrainSize(block_size), [&](int64_t begin, int64_t end) {
+        int64_t shape[3];
+        for (int64_t i = begin; i < end; ++i) {
+            getBlockShape(shapes_ptr + i * dim, dim, shape);
+            padBlockKernel(values_ptr + offsets_ptr[i], shape[0], shape[1], shape[2],
+                    new_x_ptr + i * block_size, mask_ptr + i * block_size,
+                    max_shape[0], max_shape[1], max_shape[2], value);
+        }
+    });
+    return {new_x, mask};
+}
+
+torch::Tensor UnpadRaggedForward(
+    const torch::Tensor& inputs,
+    const torch::Tensor& offsets,
+    const torch::Tensor& shapes) {
+
+    CHECK_CPU(inputs);
+    TORCH_CHECK(offsets.scalar_type() == at::kLong && shapes.scalar_type() == at::kLong,
+            "offsets and shapes should be int64");
+    TORCH_CHECK(offsets.device() == inputs.device() && shapes.device() == inputs.device(),
+            "offsets and shapes should be on the same device as inputs");
+    const int64_t n = shapes.size(0);
+    const int dim = shapes.size(1);
+    TORCH_CHECK(inputs.dim() == dim + 1, "inputs should have ", dim + 1, " dims, but get ", inputs.dim());
+    TORCH_CHECK(inputs.size(0) == n, "inputs should have ", n, " padded tensors, but get ", inputs.size(0));
+    TORCH_CHECK(offsets.numel() == n + 1, "offsets should have ", n + 1, " elements, but get ", offsets.numel());
+    const float* inputs_ptr = inputs.data_ptr<float>();
+    const int64_t* offsets_ptr = offsets.data_ptr<int64_t>();
+    const int64_t* shapes_ptr = shapes.data_ptr<int64_t>();
+
+    int64_t max_shape[3] = {1, 1, 1};
+    for (int d = 0; d < dim; ++d)
+        max_shape[3 - dim + d] = inputs.size(d + 1);
+    host::CheckRagged(offsets_ptr, shapes_ptr, n, dim, std::numeric_limits<int64_t>::max(), max_shape + 3 - dim);
+    const int64_t block_size = max_shape[0] * max_shape[1] * max_shape[2];
+
+    auto outputs = at::empty({offsets_ptr[n]}, inputs.options());
+    float* outputs_ptr = outputs.data_ptr<float>();
+    at::parallel_for(0, n, GetGrainSize(block_size), [&](int64_t begin, int64_t end) {
+        int64_t shape[3];
+        for (int64_t i = begin; i < end; ++i) {
+            getBlockShape(shapes_ptr + i * dim, dim, shape);
+            unpadBlockKernel(inputs_ptr + i * block_size, max_shape[1], max_shape[2],
+                    outputs_ptr + offsets_ptr[i], shape[0], shape[1], shape[2]);
+        }
+    });
+    return outputs;
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
@@ -0,0 +1,268 @@
+#include "hpc/rll/cpu/rl_utils/entry.h"
+#include "hpc/rll/cpu/rl_utils/ppo_kernel.h"
+#include "hpc/rll/cpu/rl_utils/categorical_kernel.h"
+#include "hpc/rll/cpu/rl_utils/gaussian_kernel.h"
+#include "hpc/rll/cpu/reduce.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+void PPOForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    bool use_value_clip,
+    float clip_ratio,
+    float dual_clip,
+    const std::vector<int64_t>& heads) {
+
+    unsigned int index = 0;
+    const torch::Tensor& logits_new = inputs[index++];
+    const torch::Tensor& logits_old = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    const torch::Tensor& value_new = inputs[index++];
+    const torch::Tensor& value_old = inputs[index++];
+    const torch::Tensor& adv = inputs[index++];
+    const torch::Tensor& return_ = inputs[index++];
+    const torch::Tensor& weight = inputs[index++];
+
+    index = 0;
+    torch::Tensor& logits_new_prob = outputs[index++];
+    torch::Tensor& logits_new_entropy = outputs[index++];
+    torch::Tensor& logits_new_grad_logits = outputs[index++];
+    torch::Tensor& logits_new_grad_prob = outputs[index++];
+    torch::Tensor& logits_new_grad_entropy = outputs[index++];
+    torch::Tensor& logits_old_prob = outputs[index++];
+    torch::Tensor& grad_policy_loss_buf = outputs[index++];
+    torch::Tensor& grad_value_loss_buf = outputs[index++];
+    torch::Tensor& grad_entropy_loss_buf = outputs[index++];
+    torch::Tensor& policy_loss = outputs[index++];
+    torch::Tensor& value_loss = outputs[index++];
+    torch::Tensor& entropy_loss = outputs[index++];
+    torch::Tensor& approx_kl = outputs[index++];
+    torch::Tensor& clipfrac = outputs[index++];
+
+    const unsigned int batch_size = logits_new.size(0);
+    const unsigned int num_output = logits_new.size(1);
+    const std::vector<int64_t> offset = categoricalHeadOffsets(heads, num_output);
+    const unsigned int num_heads = offset.size() - 1;
+
+    const int64_t* action_ptr = (int64_t*)(action.data_ptr());
+    float* new_prob_ptr = (float*)(logits_new_prob.data_ptr());
+    float* new_entropy_ptr = (float*)(logits_new_entropy.data_ptr());
+    float* old_prob_ptr = (float*)(logits_old_prob.data_ptr());
+
+    // the (B, N) logits and grads are float, half or bfloat16, the per sample values and the losses are float
+    std::array<float, 5> sum;
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, logits_new.scalar_type(),
+            "PPOForward", [&] {
+        const scalar_t* logits_new_ptr = (scalar_t*)(logits_new.data_ptr());
+        const scalar_t* logits_old_ptr = (scalar_t*)(logits_old.data_ptr());
+        scalar_t* grad_logits_ptr = (scalar_t*)(logits_new_grad_logits.data_ptr());
+        scalar_t* grad_prob_ptr = (scalar_t*)(logits_new_grad_prob.data_ptr());
+        scalar_t* grad_entropy_ptr = (scalar_t*)(logits_new_grad_entropy.data_ptr());
+        // each sample only depends on its own row, so categorical and loss are fused per sample,
+        // the heads of a row are handled one by one and their log probs and entropies are summed by ppoLoss
+        sum = parallelReduceSum<5>(batch_size, GetGrainSize(num_output), [&](int64_t b, std::array<float, 5>& acc) {
+            unsigned int row = b * num_output;
+            unsigned int head_id = b * num_heads;
+            multiCategoricalProbEntropy(offset, logits_new_ptr + row, action_ptr + head_id,
+                    new_prob_ptr + head_id, new_entropy_ptr + head_id,
+                    grad_logits_ptr + row, grad_prob_ptr + row, grad_entropy_ptr + row);
+            multiCategoricalProb(offset, logits_old_ptr + row, action_ptr + head_id, old_prob_ptr + head_id);
+            ppoLoss(batch_size, num_heads, (float*)(value_new.data_ptr()), (float*)(value_old.data_ptr()),
+                    new_prob_ptr, old_prob_ptr, new_entropy_ptr,
+                    (float*)(adv.data_ptr()), (float*)(return_.data_ptr()), (float*)(weight.data_ptr()),
+                    use_value_clip, clip_ratio, dual_clip,
+                    (float*)(grad_policy_loss_buf.data_ptr()), (float*)(grad_value_loss_buf.data_ptr()),
+                    (float*)(grad_entropy_loss_buf.data_ptr()), acc, b);
+        });
+    });
+
+    // mean
+    float scale = 1.f / batch_size;
+    ((float*)(policy_loss.data_ptr()))[0] = sum[0] * scale;
+    ((float*)(value_loss.data_ptr()))[0] = sum[1] * scale;
+    ((float*)(entropy_loss.data_ptr()))[0] = sum[2] * scale;
+    ((float*)(approx_kl.data_ptr()))[0] = sum[3] * scale;
+    ((float*)(clipfrac.data_ptr()))[0] = sum[4] * scale;
+}
+
+void PPOBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    const std::vector<int64_t>& heads) {
+
+    unsigned int index = 0;
+    const torch::Tensor& grad_policy_loss = inputs[index++];
+    const torch::Tensor& grad_value_loss = inputs[index++];
+    const torch::Tensor& grad_entropy_loss = inputs[index++];
+    const torch::Tensor& grad_policy_loss_buf = inputs[index++];
+    const torch::Tensor& grad_value_loss_buf = inputs[index++];
+    const torch::Tensor& grad_entropy_loss_buf = inputs[index++];
+    const torch::Tensor& logits_new_grad_logits = inputs[index++];
+    const torch::Tensor& logits_new_grad_prob = inputs[index++];
+    const torch::Tensor& logits_new_grad_entropy = inputs[index++];
+
+    index = 0;
+    torch::Tensor& grad_value = outputs[index++];
+    torch::Tensor& grad_logits_new = outputs[index++];
+
+    const unsigned int batch_size = grad_logits_new.size(0);
+    const unsigned int num_output = grad_logits_new.size(1);
+    const std::vector<int64_t> offset = categoricalHeadOffsets(heads, num_output);
+
+    const float grad_policy = ((float*)(grad_policy_loss.data_ptr()))[0];
+    const float grad_value_ = ((float*)(grad_value_loss.data_ptr()))[0];
+    const float grad_entropy = ((float*)(grad_entropy_loss.data_ptr()))[0];
+    const float* policy_buf_ptr = (float*)(grad_policy_loss_buf.data_ptr());
+    const float* value_buf_ptr = (float*)(grad_value_loss_buf.data_ptr());
+    const float* entropy_buf_ptr = (float*)(grad_entropy_loss_buf.data_ptr());
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, grad_logits_new.scalar_type(),
+            "PPOBackward", [&] {
+        const scalar_t* grad_logits_ptr = (scalar_t*)(logits_new_grad_logits.data_ptr());
+        const scalar_t* grad_prob_ptr = (scalar_t*)(logits_new_grad_prob.data_ptr());
+        const scalar_t* grad_entropy_ptr = (scalar_t*)(logits_new_grad_entropy.data_ptr());
+        scalar_t* grad_logits_new_ptr = (scalar_t*)(grad_logits_new.data_ptr());
+        at::parallel_for(0, batch_size, GetGrainSize(num_output), [&](int64_t begin, int64_t end) {
+            for (int64_t b = begin; b < end; ++b) {
+                unsigned int row = b * num_output;
+                ((float*)(grad_value.data_ptr()))[b] = grad_value_ * value_buf_ptr[b];
+                multiCategoricalBackward(offset, grad_entropy * entropy_buf_ptr[b], grad_policy * policy_buf_ptr[b],
+                        grad_logits_ptr + row, grad_prob_ptr + row, grad_entropy_ptr + row,
+                        grad_logits_new_ptr + row);
+            }
+        });
+    });
+}
+
+void PPOContinuousForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    bool use_value_clip,
+    float clip_ratio,
+    float dual_clip) {
+
+    unsigned int index = 0;
+    const torch::Tensor& mu_new = inputs[index++];
+    const torch::Tensor& sigma_new = inputs[index++];
+    const torch::Tensor& mu_old = inputs[index++];
+    const torch::Tensor& sigma_old = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    const torch::Tensor& value_new = inputs[index++];
+    const torch::Tensor& value_old = inputs[index++];
+    const torch::Tensor& adv = inputs[index++];
+    const torch::Tensor& return_ = inputs[index++];
+    const torch::Tensor& weight = inputs[index++];
+
+    index = 0;
+    torch::Tensor& new_prob = outputs[index++];
+    torch::Tensor& new_entropy = outputs[index++];
+    torch::Tensor& grad_mu_prob = outputs[index++];
+    torch::Tensor& grad_sigma_prob = outputs[index++];
+    torch::Tensor& grad_sigma_entropy = outputs[index++];
+    torch::Tensor& old_prob = outputs[index++];
+    torch::Tensor& grad_policy_loss_buf = outputs[index++];
+    torch::Tensor& grad_value_loss_buf = outputs[index++];
+    torch::Tensor& grad_entropy_loss_buf = outputs[index++];
+    torch::Tensor& policy_loss = outputs[index++];
+    torch::Tensor& value_loss = outputs[index++];
+    torch::Tensor& entropy_loss = outputs[index++];
+    torch::Tensor& approx_kl = outputs[index++];
+    torch::Tensor& clipfrac = outputs[index++];
+
+    const unsigned int batch_size = mu_new.size(0);
+    const unsigned int num_output = mu_new.size(1);
+
+    float* new_prob_ptr = (float*)(new_prob.data_ptr());
+    float* new_entropy_ptr = (float*)(new_entropy.data_ptr());
+    float* old_prob_ptr = (float*)(old_prob.data_ptr());
+
+    // the (B, N) mu, sigma, action and grads are float, half or bfloat16, the per sample values and the losses are float
+    std::array<float, 5> sum;
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, mu_new.scalar_type(),
+            "PPOContinuousForward", [&] {
+        const scalar_t* mu_new_ptr = (scalar_t*)(mu_new.data_ptr());
+        const scalar_t* sigma_new_ptr = (scalar_t*)(sigma_new.data_ptr());
+        const scalar_t* mu_old_ptr = (scalar_t*)(mu_old.data_ptr());
+        const scalar_t* sigma_old_ptr = (scalar_t*)(sigma_old.data_ptr());
+        const scalar_t* action_ptr = (scalar_t*)(action.data_ptr());
+        scalar_t* grad_mu_prob_ptr = (scalar_t*)(grad_mu_prob.data_ptr());
+        scalar_t* grad_sigma_prob_ptr = (scalar_t*)(grad_sigma_prob.data_ptr());
+        scalar_t* grad_sigma_entropy_ptr = (scalar_t*)(grad_sigma_entropy.data_ptr());
+        // each sample only depends on its own row, so gaussian and loss are fused per sample
+        sum = parallelReduceSum<5>(batch_size, GetGrainSize(num_output), [&](int64_t b, std::array<float, 5>& acc) {
+            unsigned int offset = b * num_output;
+            gaussianProbEntropy(num_output, mu_new_ptr + offset, sigma_new_ptr + offset, action_ptr + offset,
+                    new_prob_ptr + b, new_entropy_ptr + b,
+                    grad_mu_prob_ptr + offset, grad_sigma_prob_ptr + offset, grad_sigma_entropy_ptr + offset);
+            old_prob_ptr[b] = gaussianProb(num_output, mu_old_ptr + offset, sigma_old_ptr + offset, action_ptr + offset);
+            ppoLoss(batch_size, 1, (float*)(value_new.data_ptr()), (float*)(value_old.data_ptr()),
+                    new_prob_ptr, old_prob_ptr, new_entropy_ptr,
+                    (float*)(adv.data_ptr()), (float*)(return_.data_ptr()), (float*)(weight.data_ptr()),
+                    use_value_clip, clip_ratio, dual_clip,
+                    (float*)(grad_policy_loss_buf.data_ptr()), (float*)(grad_value_loss_buf.data_ptr()),
+                    (float*)(grad_entropy_loss_buf.data_ptr()), acc, b);
+        });
+    });
+
+    // mean
+    float scale = 1.f / batch_size;
+    ((float*)(policy_loss.data_ptr()))[0] = sum[0] * scale;
+    ((float*)(value_loss.data_ptr()))[0] = sum[1] * scale;
+    ((float*)(entropy_loss.data_ptr()))[0] = sum[2] * scale;
+    ((float*)(approx_kl.data_ptr()))[0] = sum[3] * scale;
+    ((float*)(clipfrac.data_ptr()))[0] = sum[4] * scale;
+}
+
+void PPOContinuousBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs) {
+
+    unsigned int index = 0;
+    const torch::Tensor& grad_policy_loss = inputs[index++];
+    const torch::Tensor& grad_value_loss = inputs[index++];
+    const torch::Tensor& grad_entropy_loss = inputs[index++];
+    const torch::Tensor& grad_policy_loss_buf = inputs[index++];
+    const torch::Tensor& grad_value_loss_buf = inputs[index++];
+    const torch::Tensor& grad_entropy_loss_buf = inputs[index++];
+    const torch::Tensor& grad_mu_prob = inputs[index++];
+    const torch::Tensor& grad_sigma_prob = inputs[index++];
+    const torch::Tensor& grad_sigma_entropy = inputs[index++];
+
+    index = 0;
+    torch::Tensor& grad_value = outputs[index++];
+    torch::Tensor& grad_mu_new = outputs[index++];
+    torch::Tensor& grad_sigma_new = outputs[index++];
+
+    const unsigned int batch_size = grad_mu_new.size(0);
+    const unsigned int num_output = grad_mu_new.size(1);
+
+    const float grad_policy = ((float*)(grad_policy_loss.data_ptr()))[0];
+    const float grad_value_ = ((float*)(grad_value_loss.data_ptr()))[0];
+    const float grad_entropy = ((float*)(grad_entropy_loss.data_ptr()))[0];
+    const float* policy_buf_ptr = (float*)(grad_policy_loss_buf.data_ptr());
+    const float* value_buf_ptr = (float*)(grad_value_loss_buf.data_ptr());
+    const float* entropy_buf_ptr = (float*)(grad_entropy_loss_buf.data_ptr());
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, grad_mu_new.scalar_type(),
+            "PPOContinuousBackward", [&] {
+        const scalar_t* grad_mu_prob_ptr = (scalar_t*)(grad_mu_prob.data_ptr());
+        const scalar_t* grad_sigma_prob_ptr = (scalar_t*)(grad_sigma_prob.data_ptr());
+        const scalar_t* grad_sigma_entropy_ptr = (scalar_t*)(grad_sigma_entropy.data_ptr());
+        scalar_t* grad_mu_new_ptr = (scalar_t*)(grad_mu_new.data_ptr());
+        scalar_t* grad_sigma_new_ptr = (scalar_t*)(grad_sigma_new.data_ptr());
+        at::parallel_for(0, batch_size, GetGrainSize(num_output), [&](int64_t begin, int64_t end) {
+            for (int64_t b = begin; b < end; ++b) {
+                unsigned int offset = b * num_output;
+                ((float*)(grad_value.data_ptr()))[b] = grad_value_ * value_buf_ptr[b];
+                gaussianBackward(num_output, grad_entropy * entropy_buf_ptr[b], grad_policy * policy_buf_ptr[b],
+                        grad_mu_prob_ptr + offset, grad_sigma_prob_ptr + offset, grad_sigma_entropy_ptr + offset,
+                        grad_mu_new_ptr + offset, grad_sigma_new_ptr + offset);
+            }
+        });
+    });
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
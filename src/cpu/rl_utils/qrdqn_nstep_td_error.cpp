@@ -0,0 +1,77 @@
+#include "hpc/rll/cpu/rl_utils/entry.h"
+#include "hpc/rll/cpu/rl_utils/qrdqn_nstep_td_error_kernel.h"
+#include "hpc/rll/cpu/reduce.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+void QRDQNNStepTDErrorForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma) {
+
+    unsigned int index = 0;
+    const torch::Tensor& q = inputs[index++];
+    const torch::Tensor& next_n_q = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    const torch::Tensor& next_n_action = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& done = inputs[index++];
+    const torch::Tensor& weight = inputs[index++];
+    const torch::Tensor& value_gamma = inputs[index++];
+    index = 0;
+    torch::Tensor& loss = outputs[index++];
+    torch::Tensor& td_err = outputs[index++];
+    torch::Tensor& bellman_err_buf = outputs[index++];
+    torch::Tensor& quantile_huber_loss_buf = outputs[index++];
+    torch::Tensor& grad_buf = outputs[index++];
+
+    const unsigned int batch_size = q.size(0);
+    const unsigned int action_dim = q.size(1);
+    const unsigned int tau = q.size(2);
+    const unsigned int time_step = reward.size(0);
+
+    const float* weight_ptr = (float*)(weight.data_ptr());
+    float* td_err_ptr = (float*)(td_err.data_ptr());
+    auto sum = parallelReduceSum<1>(batch_size, GetGrainSize(tau * tau), [&](int64_t b, std::array<float, 1>& acc) {
+        td_err_ptr[b] = qrdqnNStepTdErrorKernel(tau, time_step, batch_size, action_dim, gamma,
+                (float*)(q.data_ptr()), (float*)(next_n_q.data_ptr()),
+                (int64_t*)(action.data_ptr()), (int64_t*)(next_n_action.data_ptr()),
+                (float*)(reward.data_ptr()), (float*)(done.data_ptr()), (float*)(value_gamma.data_ptr()),
+                (float*)(bellman_err_buf.data_ptr()), (float*)(quantile_huber_loss_buf.data_ptr()),
+                (float*)(grad_buf.data_ptr()), b);
+        acc[0] += td_err_ptr[b] * weight_ptr[b];
+    });
+    ((float*)(loss.data_ptr()))[0] = sum[0] / batch_size;
+}
+
+void QRDQNNStepTDErrorBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs) {
+
+    unsigned int index = 0;
+    const torch::Tensor& grad_loss = inputs[index++];
+    const torch::Tensor& grad_buf = inputs[index++];
+    const torch::Tensor& weight = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    index = 0;
+    torch::Tensor& grad_q = outputs[index++];
+
+    const unsigned int batch_size = grad_q.size(0);
+    const unsigned int action_dim = grad_q.size(1);
+    const unsigned int tau = grad_q.size(2);
+
+    at::parallel_for(0, batch_size, GetGrainSize(tau * tau), [&](int64_t begin, int64_t end) {
+        for (int64_t b = begin; b < end; ++b) {
+            qrdqnNStepTdErrorBackwardKernel(tau, batch_size, action_dim,
+                    (float*)(grad_loss.data_ptr()), (float*)(grad_buf.data_ptr()),
+                    (float*)(weight.data_ptr()), (int64_t*)(action.data_ptr()),
+                    (float*)(grad_q.data_ptr()), b);
+        }
+    });
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
@@ -0,0 +1,79 @@
+#include "hpc/rll/cpu/rl_utils/entry.h"
+#include "hpc/rll/cpu/rl_utils/retrace_kernel.h"
+#include "hpc/rll/cpu/reduce.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+void RetraceForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    float c_clip_ratio,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& q = inputs[index++];
+    const torch::Tensor& target_q = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& done = inputs[index++];
+    const torch::Tensor& target_prob = inputs[index++];
+    const torch::Tensor& behaviour_prob = inputs[index++];
+    const torch::Tensor& weight = inputs[index++];
+    index = 0;
+    torch::Tensor& q_retrace = outputs[index++];
+    torch::Tensor& td_err = outputs[index++];
+    torch::Tensor& loss = outputs[index++];
+    torch::Tensor& grad_buf = outputs[index++];
+
+    const unsigned int time_step = q.size(0);
+    const unsigned int batch_size = q.size(1);
+    const unsigned int num_output = q.size(2);
+
+    const float* done_ptr = done.numel() > 0 ? (float*)(done.data_ptr()) : nullptr;
+    const float* behaviour_prob_ptr = behaviour_prob.numel() > 0 ? (float*)(behaviour_prob.data_ptr()) : nullptr;
+    std::array<float, 1> sum;
+    dispatchAccumulateMode<float>(accumulate_mode, [&](auto mode) {
+        sum = parallelReduceSum<1>(batch_size, GetGrainSize(time_step * num_output),
+                [&](int64_t b, std::array<float, 1>& acc) {
+            acc[0] += retraceForwardKernel<decltype(mode)>(time_step, batch_size, num_output,
+                    gamma, lambda, c_clip_ratio,
+                    (float*)(q.data_ptr()), (float*)(target_q.data_ptr()), (int64_t*)(action.data_ptr()),
+                    (float*)(reward.data_ptr()), done_ptr, (float*)(target_prob.data_ptr()), behaviour_prob_ptr,
+                    (float*)(weight.data_ptr()), (float*)(q_retrace.data_ptr()), (float*)(td_err.data_ptr()),
+                    (float*)(grad_buf.data_ptr()), b);
+        });
+    });
+    ((float*)(loss.data_ptr()))[0] = sum[0] / (time_step * batch_size);
+}
+
+void RetraceBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs) {
+
+    unsigned int index = 0;
+    const torch::Tensor& grad_loss = inputs[index++];
+    const torch::Tensor& grad_buf = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    index = 0;
+    torch::Tensor& grad_q = outputs[index++];
+
+    const unsigned int time_step = grad_q.size(0);
+    const unsigned int batch_size = grad_q.size(1);
+    const unsigned int num_output = grad_q.size(2);
+
+    at::parallel_for(0, time_step * batch_size, GetGrainSize(num_output), [&](int64_t begin, int64_t end) {
+        for (int64_t tb = begin; tb < end; ++tb) {
+            retraceBackwardKernel(num_output,
+                    (float*)(grad_loss.data_ptr()), (float*)(grad_buf.data_ptr()),
+                    (int64_t*)(action.data_ptr()), (float*)(grad_q.data_ptr()), tb);
+        }
+    });
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
@@ -0,0 +1,64 @@
+#include "hpc/rll/cpu/rl_utils/entry.h"
+#include "hpc/rll/cpu/rl_utils/td_lambda_kernel.h"
+#include "hpc/rll/cpu/reduce.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+void TdLambdaForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& value = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& weight = inputs[index++];
+    index = 0;
+    torch::Tensor& loss = outputs[index++];
+    torch::Tensor& grad_buf = outputs[index++];
+
+    const unsigned int time_step = reward.size(0);
+    const unsigned int batch_size = reward.size(1);
+
+    const float* value_ptr = (float*)(value.data_ptr());
+    const float* reward_ptr = (float*)(reward.data_ptr());
+    const float* weight_ptr = (float*)(weight.data_ptr());
+    float* grad_buf_ptr = (float*)(grad_buf.data_ptr());
+    std::array<float, 1> sum;
+    dispatchAccumulateMode<float>(accumulate_mode, [&](auto mode) {
+        sum = parallelReduceSum<1>(batch_size, GetGrainSize(time_step), [&](int64_t b, std::array<float, 1>& acc) {
+            acc[0] += tdLambdaForwardKernel<decltype(mode)>(time_step, batch_size, gamma, lambda,
+                    value_ptr, reward_ptr, weight_ptr, grad_buf_ptr, b);
+        });
+    });
+    ((float*)(loss.data_ptr()))[0] = 0.5 * sum[0] / (time_step * batch_size);
+}
+
+void TdLambdaBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs) {
+
+    unsigned int index = 0;
+    const torch::Tensor& grad_loss = inputs[index++];
+    const torch::Tensor& grad_buf = inputs[index++];
+    index = 0;
+    torch::Tensor& grad_value = outputs[index++];
+
+    const unsigned int time_step = grad_value.size(0) - 1;
+    const unsigned int batch_size = grad_value.size(1);
+
+    const float* grad_loss_ptr = (float*)(grad_loss.data_ptr());
+    const float* grad_buf_ptr = (float*)(grad_buf.data_ptr());
+    float* grad_value_ptr = (float*)(grad_value.data_ptr());
+    at::parallel_for(0, (time_step + 1) * batch_size, at::internal::GRAIN_SIZE, [&](int64_t begin, int64_t end) {
+        tdLambdaBackwardKernel(time_step, batch_size, grad_loss_ptr, grad_buf_ptr, grad_value_ptr, begin, end);
+    });
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
@@ -0,0 +1,82 @@
+#include "hpc/rll/cpu/rl_utils/entry.h"
+#include "hpc/rll/cpu/rl_utils/upgo_kernel.h"
+#include "hpc/rll/cpu/rl_utils/categorical_kernel.h"
+#include "hpc/rll/cpu/reduce.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+void UpgoForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& target_output = inputs[index++];
+    const torch::Tensor& rho = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& value = inputs[index++];
+    index = 0;
+    torch::Tensor& advantage = outputs[index++];
+    torch::Tensor& metric = outputs[index++];
+    torch::Tensor& loss = outputs[index++];
+    torch::Tensor& grad_buf = outputs[index++];
+
+    const unsigned int time_step = target_output.size(0);
+    const unsigned int batch_size = target_output.size(1);
+    const unsigned int num_output = target_output.size(2);
+
+    float* advantage_ptr = (float*)(advantage.data_ptr());
+    float* metric_ptr = (float*)(metric.data_ptr());
+    dispatchAccumulateMode<float>(accumulate_mode, [&](auto mode) {
+        at::parallel_for(0, batch_size, GetGrainSize(time_step), [&](int64_t begin, int64_t end) {
+            for (int64_t b = begin; b < end; ++b) {
+                upgoAdvantageKernel<decltype(mode)>(time_step, batch_size,
+                        (float*)(rho.data_ptr()), (float*)(reward.data_ptr()), (float*)(value.data_ptr()),
+                        advantage_ptr, b);
+            }
+        });
+    });
+
+    // the advantage is ready, so cross entropy and loss are fused per row
+    const float* target_output_ptr = (float*)(target_output.data_ptr());
+    const int64_t* action_ptr = (int64_t*)(action.data_ptr());
+    float* grad_buf_ptr = (float*)(grad_buf.data_ptr());
+    auto sum = parallelReduceSum<1>(time_step * batch_size, GetGrainSize(num_output),
+            [&](int64_t tb, std::array<float, 1>& acc) {
+        crossEntropy(num_output, target_output_ptr + tb * num_output, action_ptr[tb],
+                metric_ptr + tb, grad_buf_ptr + tb * num_output);
+        acc[0] += advantage_ptr[tb] * metric_ptr[tb];
+    });
+    ((float*)(loss.data_ptr()))[0] = -sum[0] / (time_step * batch_size);
+}
+
+void UpgoBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs) {
+
+    unsigned int index = 0;
+    const torch::Tensor& grad_loss = inputs[index++];
+    const torch::Tensor& grad_buf = inputs[index++];
+    const torch::Tensor& advantage = inputs[index++];
+    index = 0;
+    torch::Tensor& grad_target_output = outputs[index++];
+
+    const unsigned int time_step = grad_target_output.size(0);
+    const unsigned int batch_size = grad_target_output.size(1);
+    const unsigned int num_output = grad_target_output.size(2);
+
+    at::parallel_for(0, time_step * batch_size, GetGrainSize(num_output), [&](int64_t begin, int64_t end) {
+        for (int64_t tb = begin; tb < end; ++tb) {
+            upgoBackwardKernel(time_step, batch_size, num_output,
+                    (float*)(grad_loss.data_ptr()), (float*)(grad_buf.data_ptr()),
+                    (float*)(advantage.data_ptr()), (float*)(grad_target_output.data_ptr()), tb);
+        }
+    });
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
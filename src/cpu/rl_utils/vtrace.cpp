@@ -0,0 +1,215 @@
+#include "hpc/rll/cpu/rl_utils/entry.h"
+#include "hpc/rll/cpu/rl_utils/vtrace_kernel.h"
+#include "hpc/rll/cpu/rl_utils/categorical_kernel.h"
+#include "hpc/rll/cpu/reduce.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+void VTraceForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    float rho_clip_ratio,
+    float c_clip_ratio,
+    float rho_pg_clip_ratio,
+    int accumulate_mode,
+    const std::vector<int64_t>& heads) {
+
+    unsigned int index = 0;
+    const torch::Tensor& target_output = inputs[index++];
+    const torch::Tensor& behaviour_output = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    const torch::Tensor& value = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& weight = inputs[index++];
+    const torch::Tensor& done = inputs[index++];
+    const torch::Tensor& discount = inputs[index++];
+
+    index = 0;
+    torch::Tensor& target_output_prob = outputs[index++];
+    torch::Tensor& target_output_entropy = outputs[index++];
+    torch::Tensor& target_output_grad_logits = outputs[index++];
+    torch::Tensor& target_output_grad_prob = outputs[index++];
+    torch::Tensor& target_output_grad_entropy = outputs[index++];
+    torch::Tensor& behaviour_output_prob = outputs[index++];
+    torch::Tensor& is = outputs[index++];
+    torch::Tensor& ret = outputs[index++];
+    torch::Tensor& adv = outputs[index++];
+    torch::Tensor& pg_loss = outputs[index++];
+    torch::Tensor& value_loss = outputs[index++];
+    torch::Tensor& entropy_loss = outputs[index++];
+
+    const unsigned int time_step = target_output.size(0);
+    const unsigned int batch_size = target_output.size(1);
+    const unsigned int num_output = target_output.size(2);
+    const std::vector<int64_t> offset = categoricalHeadOffsets(heads, num_output);
+    const unsigned int num_heads = offset.size() - 1;
+
+    const float* target_output_ptr = (float*)(target_output.data_ptr());
+    const float* behaviour_output_ptr = (float*)(behaviour_output.data_ptr());
+    const int64_t* action_ptr = (int64_t*)(action.data_ptr());
+    const float* value_ptr = (float*)(value.data_ptr());
+    const float* reward_ptr = (float*)(reward.data_ptr());
+    const float* weight_ptr = (float*)(weight.data_ptr());
+    const float* done_ptr = done.numel() > 0 ? (float*)(done.data_ptr()) : nullptr;
+    const float* discount_ptr = discount.numel() > 0 ? (float*)(discount.data_ptr()) : nullptr;
+    float* prob_ptr = (float*)(target_output_prob.data_ptr());
+    float* entropy_ptr = (float*)(target_output_entropy.data_ptr());
+    float* grad_logits_ptr = (float*)(target_output_grad_logits.data_ptr());
+    float* grad_prob_ptr = (float*)(target_output_grad_prob.data_ptr());
+    float* grad_entropy_ptr = (float*)(target_output_grad_entropy.data_ptr());
+    float* behaviour_prob_ptr = (float*)(behaviour_output_prob.data_ptr());
+    float* is_ptr = (float*)(is.data_ptr());
+    float* ret_ptr = (float*)(ret.data_ptr());
+    float* adv_ptr = (float*)(adv.data_ptr());
+
+    // categorical and importance weights, per row, the joint log prob of the independent heads is the sum over heads
+    at::parallel_for(0, time_step * batch_size, GetGrainSize(num_output), [&](int64_t begin, int64_t end) {
+        for (int64_t tb = begin; tb < end; ++tb) {
+            unsigned int row = tb * num_output;
+            unsigned int head_id = tb * num_heads;
+            multiCategoricalProbEntropy(offset, target_output_ptr + row, action_ptr + head_id,
+                    prob_ptr + head_id, entropy_ptr + head_id,
+                    grad_logits_ptr + row, grad_prob_ptr + row, grad_entropy_ptr + row);
+            multiCategoricalProb(offset, behaviour_output_ptr + row, action_ptr + head_id, behaviour_prob_ptr + head_id);
+            float diff_prob = 0.f;
+            for (unsigned int h = 0; h < num_heads; ++h) {
+                diff_prob += prob_ptr[head_id + h] - behaviour_prob_ptr[head_id + h];
+            }
+            is_ptr[tb] = std::exp(diff_prob);
+        }
+    });
+
+    // return, advantage and loss, per column
+    auto sum = parallelReduceSum<3>(batch_size, GetGrainSize(time_step), [&](int64_t b, std::array<float, 3>& acc) {
+        dispatchAccumulateMode<float>(accumulate_mode, [&](auto mode) {
+            vtraceNStepReturn<decltype(mode)>(time_step, batch_size, gamma, lambda, rho_clip_ratio, c_clip_ratio,
+                    is_ptr, reward_ptr, value_ptr, done_ptr, discount_ptr, ret_ptr, b);
+        });
+        vtraceAdvantage(time_step, batch_size, gamma, rho_pg_clip_ratio,
+                is_ptr, reward_ptr, value_ptr, done_ptr, discount_ptr, ret_ptr, adv_ptr, b);
+        for (unsigned int t = 0; t < time_step; ++t) {
+            unsigned int i = t * batch_size + b;
+            float prob_data = 0.f;
+            float entropy_data = 0.f;
+            for (unsigned int h = 0; h < num_heads; ++h) {
+                prob_data += prob_ptr[i * num_heads + h];
+                entropy_data += entropy_ptr[i * num_heads + h];
+            }
+            acc[0] += -(prob_data * adv_ptr[i] * weight_ptr[i]);
+            float diff = value_ptr[i] - ret_ptr[i];
+            acc[1] += diff * diff * weight_ptr[i];
+            acc[2] += entropy_data * weight_ptr[i];
+        }
+    });
+    ((float*)(pg_loss.data_ptr()))[0] = sum[0] / (time_step * batch_size);
+    ((float*)(value_loss.data_ptr()))[0] = sum[1] / (time_step * batch_size);
+    ((float*)(entropy_loss.data_ptr()))[0] = sum[2] / (time_step * batch_size);
+}
+
+void VTraceBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    const std::vector<int64_t>& heads) {
+
+    unsigned int index = 0;
+    const torch::Tensor& grad_pg_loss = inputs[index++];
+    const torch::Tensor& grad_value_loss = inputs[index++];
+    const torch::Tensor& grad_entropy_loss = inputs[index++];
+    const torch::Tensor& value = inputs[index++];
+    index++;  // action
+    const torch::Tensor& weight = inputs[index++];
+    const torch::Tensor& ret = inputs[index++];
+    const torch::Tensor& adv = inputs[index++];
+    const torch::Tensor& target_output_grad_logits = inputs[index++];
+    const torch::Tensor& target_output_grad_prob = inputs[index++];
+    const torch::Tensor& target_output_grad_entropy = inputs[index++];
+
+    index = 0;
+    torch::Tensor& grad_value = outputs[index++];
+    torch::Tensor& grad_target_output = outputs[index++];
+
+    const unsigned int time_step = grad_target_output.size(0);
+    const unsigned int batch_size = grad_target_output.size(1);
+    const unsigned int num_output = grad_target_output.size(2);
+    const std::vector<int64_t> offset = categoricalHeadOffsets(heads, num_output);
+
+    const float grad_pg = ((float*)(grad_pg_loss.data_ptr()))[0];
+    const float grad_val = ((float*)(grad_value_loss.data_ptr()))[0];
+    const float grad_ent = ((float*)(grad_entropy_loss.data_ptr()))[0];
+    const float grad_mean = 1.f / (time_step * batch_size);
+    const float* value_ptr = (float*)(value.data_ptr());
+    const float* weight_ptr = (float*)(weight.data_ptr());
+    const float* ret_ptr = (float*)(ret.data_ptr());
+    const float* adv_ptr = (float*)(adv.data_ptr());
+    const float* grad_logits_ptr = (float*)(target_output_grad_logits.data_ptr());
+    const float* grad_prob_ptr = (float*)(target_output_grad_prob.data_ptr());
+    const float* grad_entropy_ptr = (float*)(target_output_grad_entropy.data_ptr());
+    float* grad_value_ptr = (float*)(grad_value.data_ptr());
+    float* grad_target_output_ptr = (float*)(grad_target_output.data_ptr());
+
+    at::parallel_for(0, (time_step + 1) * batch_size, at::internal::GRAIN_SIZE, [&](int64_t begin, int64_t end) {
+        for (int64_t i = begin; i < end; ++i) {
+            grad_value_ptr[i] = (i < time_step * batch_size) ?
+                (grad_val * (grad_mean * 2 * (value_ptr[i] - ret_ptr[i]) * weight_ptr[i])) : 0.f;
+        }
+    });
+
+    at::parallel_for(0, time_step * batch_size, GetGrainSize(num_output), [&](int64_t begin, int64_t end) {
+        for (int64_t tb = begin; tb < end; ++tb) {
+            unsigned int row = tb * num_output;
+            // entropy: mean->multiply_weight, pg: mean->multiply_weight->multiply_adv
+            float pre_entropy_grad = grad_ent * grad_mean * weight_ptr[tb];
+            float pre_pg_grad = grad_pg * (-grad_mean) * weight_ptr[tb] * adv_ptr[tb];
+            multiCategoricalBackward(offset, pre_entropy_grad, pre_pg_grad,
+                    grad_logits_ptr + row, grad_prob_ptr + row, grad_entropy_ptr + row,
+                    grad_target_output_ptr + row);
+        }
+    });
+}
+
+void VTraceReturnsForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float lambda,
+    float rho_clip_ratio,
+    float c_clip_ratio,
+    float rho_pg_clip_ratio,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& log_rho = inputs[index++];
+    const torch::Tensor& discount = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& value = inputs[index++];
+    const torch::Tensor& bootstrap = inputs[index++];
+
+    index = 0;
+    torch::Tensor& vs = outputs[index++];
+    torch::Tensor& pg_adv = outputs[index++];
+
+    const unsigned int time_step = value.size(0);
+    const unsigned int batch_size = value.size(1);
+
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, value.scalar_type(),
+            "VTraceReturnsForward", [&] {
+        dispatchAccumulateMode<at::opmath_type<scalar_t>>(accumulate_mode, [&](auto mode) {
+            // each task owns a chunk of contiguous columns
+            int64_t grain_size = std::max(GetGrainSize(time_step), VTRACE_MIN_LANES);
+            at::parallel_for(0, batch_size, grain_size, [&](int64_t begin, int64_t end) {
+                vtraceReturnsKernel<scalar_t, decltype(mode)>(time_step, batch_size,
+                        lambda, rho_clip_ratio, c_clip_ratio, rho_pg_clip_ratio,
+                        (scalar_t*)(log_rho.data_ptr()), (scalar_t*)(discount.data_ptr()),
+                        (scalar_t*)(reward.data_ptr()), (scalar_t*)(value.data_ptr()), (scalar_t*)(bootstrap.data_ptr()),
+                        (scalar_t*)(vs.data_ptr()), (scalar_t*)(pg_adv.data_ptr()), begin, end);
+            });
+        });
+    });
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
@@ -0,0 +1,16 @@
+#include <torch/extension.h>
+#include "hpc/rll/cpu/torch_utils/network/entry.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
+    m.def("LstmForward", &LstmForward, "lstm forward (CPU)");
+    m.def("LstmBackward", &LstmBackward, "lstm backward (CPU)");
+    m.def("LstmInferenceForward", &LstmInferenceForward, "lstm inference forward (CPU)");
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
@@ -0,0 +1,428 @@
+#include <algorithm>
+#include <climits>
+
+#include "hpc/rll/cpu/torch_utils/network/entry.h"
+#include "hpc/rll/cpu/torch_utils/network/lstm_kernel.h"
+
+namespace hpc {
+namespace rll {
+namespace cpu {
+
+// rows x cols matrix starting at offset of the flattened tensor t
+static torch::Tensor MatrixView(const torch::Tensor& t, int64_t offset, int64_t rows, int64_t cols) {
+    return t.view({-1}).narrow(0, offset, rows * cols).view({rows, cols});
+}
+
+// elements [begin, end) of data, which is the output of layer
+static void DropoutForward(float* data, int64_t begin, int64_t end, float dropout_threshold, int64_t seed,
+        unsigned int layer) {
+    float dropout_scale = 1. / (1. - dropout_threshold);
+    uint32_t uint_threshold = static_cast<uint32_t>(UINT_MAX * dropout_threshold);
+    at::parallel_for(begin / 4, (end + 3) / 4, GetGrainSize(4 * 40), [&](int64_t group_begin, int64_t group_end) {
+        dropoutKernel(std::max(group_begin * 4, begin), std::min(group_end * 4, end), uint_threshold, dropout_scale,
+                seed, layer, data);
+    });
+}
+
+
+// the samples [active, batch_size) of a timestep are finished, their state is kept and their output is zero
+static void FreezeState(unsigned int active, unsigned int batch_size, unsigned int hidden_size,
+        const float* pre_h, const float* pre_c, float* h, float* c, float* output) {
+    const int64_t begin = (int64_t)active * hidden_size;
+    const int64_t end = (int64_t)batch_size * hidden_size;
+    if (h != pre_h) {
+        std::copy(pre_h + begin, pre_h + end, h + begin);
+        std::copy(pre_c + begin, pre_c + end, c + begin);
+    }
+    std::fill(output + begin, output + end, 0.f);
+}
+
+// Layer l at timestep s only depends on layer l at timestep s - 1 and layer l - 1 at timestep s, so with several
+// threads the timesteps are scheduled as a wavefront: the (l, s) with the same l + s run as parallel tasks, which
+// keeps several cores busy with the small recurrent gemms of a small batch. The input projection of the first layer is
+// still one gemm of all the timesteps, the other layers project the input of each timestep as soon as the previous
+// layer produces it. With one thread the layers run one by one, each with one input projection gemm.
+void LstmForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float dropout_threshold,
+    int64_t seed,
+    const std::vector<int>& batch_sizes) {
+
+    unsigned int index = 0;
+    const torch::Tensor& x0 = inputs[index++];
+    const torch::Tensor& h0 = inputs[index++];
+    const torch::Tensor& c0 = inputs[index++];
+    const torch::Tensor& wx = inputs[index++];
+    const torch::Tensor& wh = inputs[index++];
+    const torch::Tensor& bias = inputs[index++];
+    const torch::Tensor& ln_gamma = inputs[index++];
+    const torch::Tensor& ln_beta = inputs[index++];
+    index = 0;
+    // xbuf and hbuf hold the normalized projections on cuda, they are fused into the activation here
+    index++;
+    index++;
+    torch::Tensor& hn = outputs[index++];
+    torch::Tensor& cn = outputs[index++];
+    torch::Tensor& ifog = outputs[index++];
+    torch::Tensor& ym = outputs[index++];
+    torch::Tensor& ln_in = outputs[index++];
+    torch::Tensor& ln_mean = outputs[index++];
+    torch::Tensor& ln_rstd = outputs[index++];
+
+    const unsigned int seq_len = x0.size(0);
+    const unsigned int batch_size = x0.size(1);
+    const unsigned int input_size = x0.size(2);
+    const unsigned int num_layers = h0.size(0);
+    const unsigned int hidden_size = h0.size(2);
+    const unsigned int gate_size = hidden_size * 4;
+    const int64_t rows = seq_len * batch_size;
+
+    const float* h0ptr = (float*)(h0.data_ptr());
+    const float* c0ptr = (float*)(c0.data_ptr());
+    const float* biasptr = (float*)(bias.data_ptr());
+    const float* ln_gammaptr = (float*)(ln_gamma.data_ptr());
+    const float* ln_betaptr = (float*)(ln_beta.data_ptr());
+    float* cnptr = (float*)(cn.data_ptr());
+    float* hnptr = (float*)(hn.data_ptr());
+    float* ifogptr = (float*)(ifog.data_ptr());
+    float* outputptr = (float*)(ym.data_ptr());
+    float* ln_in_ptr = (float*)(ln_in.data_ptr());
+    float* ln_mean_ptr = (float*)(ln_mean.data_ptr());
+    float* ln_rstd_ptr = (float*)(ln_rstd.data_ptr());
+
+    std::vector<torch::Tensor> wxlayer(num_layers);
+    std::vector<torch::Tensor> whlayer(num_layers);
+    int64_t wxoffset = 0;
+    for (unsigned int l = 0; l < num_layers; l++) {
+        const unsigned int in_size = (l == 0 ? input_size : hidden_size);
+        wxlayer[l] = MatrixView(wx, wxoffset, in_size, gate_size);
+        whlayer[l] = MatrixView(wh, (int64_t)l * hidden_size * gate_size, hidden_size, gate_size);
+        wxoffset += in_size * gate_size;
+    }
+
+    const bool wavefront = (num_layers > 1 && at::get_num_threads() > 1);
+    // the input projection of all the timesteps of layer l in one gemm
+    auto project_input = [&](unsigned int l) {
+        torch::Tensor ln_x = MatrixView(ln_in, (int64_t)l * rows * gate_size * 2, rows, gate_size);
+        torch::Tensor xlayer = (l == 0 ? x0.view({rows, input_size}) : ym[l - 1].view({rows, hidden_size}));
+        at::mm_out(ln_x, xlayer, wxlayer[l]);
+    };
+
+    auto forward_step = [&](unsigned int l, unsigned int s) {
+        // grad mode is thread local, the worker threads of the wavefront do not inherit it from the autograd function
+        at::NoGradGuard no_grad;
+        const unsigned int active = (batch_sizes.empty() ? batch_size : batch_sizes[s]);
+        const float* biasdata = biasptr + l * gate_size;
+        const float* ln_gamma_x = ln_gammaptr + l * gate_size * 2;
+        const float* ln_gamma_h = ln_gammaptr + l * gate_size * 2 + gate_size;
+        const float* ln_beta_x = ln_betaptr + l * gate_size * 2;
+        const float* ln_beta_h = ln_betaptr + l * gate_size * 2 + gate_size;
+        const int64_t row_start = s * batch_size;
+        const int64_t ln_x_offset = l * rows * gate_size * 2 + row_start * gate_size;
+        const int64_t ln_h_offset = l * rows * gate_size * 2 + rows * gate_size + row_start * gate_size;
+        float* ln_mean_x = ln_mean_ptr + l * rows * 2 + row_start;
+        float* ln_mean_h = ln_mean_ptr + l * rows * 2 + rows + row_start;
+        float* ln_rstd_x = ln_rstd_ptr + l * rows * 2 + row_start;
+        float* ln_rstd_h = ln_rstd_ptr + l * rows * 2 + rows + row_start;
+
+        torch::Tensor preh = (s == 0 ? h0[l] : hn[s - 1][l]).narrow(0, 0, active);
+        const float* prehdata = (s == 0 ? (h0ptr + l * batch_size * hidden_size)
+                : (hnptr + ((s - 1) * num_layers + l) * batch_size * hidden_size));
+        const float* precdata = (s == 0 ? (c0ptr + l * batch_size * hidden_size)
+                : (cnptr + ((s - 1) * num_layers + l) * batch_size * hidden_size));
+        float* hdata = hnptr + (s * num_layers + l) * batch_size * hidden_size;
+        float* cdata = cnptr + (s * num_layers + l) * batch_size * hidden_size;
+        float* ifogdata = ifogptr + (l * seq_len + s) * batch_size * gate_size;
+        float* outputdata = outputptr + (l * seq_len + s) * batch_size * hidden_size;
+
+        if (wavefront && l > 0) {
+            torch::Tensor ln_x_s = MatrixView(ln_in, ln_x_offset, active, gate_size);
+            at::mm_out(ln_x_s, ym[l - 1][s].narrow(0, 0, active), wxlayer[l]);
+        }
+        torch::Tensor ln_h_s = MatrixView(ln_in, ln_h_offset, active, gate_size);
+        at::mm_out(ln_h_s, preh, whlayer[l]);
+
+        const float* ln_x_s_ptr = ln_in_ptr + ln_x_offset;
+        const float* ln_h_s_ptr = ln_in_ptr + ln_h_offset;
+        at::parallel_for(0, active, GetGrainSize(gate_size * 8), [&](int64_t begin, int64_t end) {
+            for (int64_t b = begin; b < end; ++b) {
+                lstmCellForwardKernel(hidden_size, ln_x_s_ptr + b * gate_size, ln_h_s_ptr + b * gate_size,
+                        ln_gamma_x, ln_beta_x, ln_gamma_h, ln_beta_h, biasdata,
+                        precdata + b * hidden_size, ln_mean_x + b, ln_rstd_x + b, ln_mean_h + b, ln_rstd_h + b,
+                        hdata + b * hidden_size, cdata + b * hidden_size, ifogdata + b * gate_size,
+                        outputdata + b * hidden_size);
+            }
+        });
+        if (active < batch_size) {
+            FreezeState(active, batch_size, hidden_size, prehdata, precdata, hdata, cdata, outputdata);
+        }
+
+        // dropout of the output of this timestep, which is the input of the next layer
+        if (dropout_threshold > 0 && l != num_layers - 1) {
+            const int64_t layer_start = (int64_t)l * seq_len * batch_size * hidden_size;
+            DropoutForward(outputptr + layer_start, row_start * hidden_size, (row_start + batch_size) * hidden_size,
+                    dropout_threshold, seed, l);
+        }
+    };
+
+    if (!wavefront) {
+        for (unsigned int l = 0; l < num_layers; l++) {
+            project_input(l);
+            for (unsigned int s = 0; s < seq_len; s++)
+                forward_step(l, s);
+        }
+        return;
+    }
+
+    project_input(0);
+    for (unsigned int d = 0; d < seq_len + num_layers - 1; d++) {
+        const unsigned int first = (d < seq_len ? 0 : d - seq_len + 1);
+        const unsigned int last = std::min(d, num_layers - 1);
+        // a single task keeps the parallelism inside its gemms and kernels
+        at::parallel_for(first, last + 1, 1, [&](int64_t begin, int64_t end) {
+            for (int64_t l = begin; l < end; ++l)
+                forward_step(l, d - l);
+        });
+    }
+}
+
+void LstmBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float dropout_threshold,
+    int64_t seed,
+    const std::vector<int>& batch_sizes) {
+
+    unsigned int index = 0;
+    const torch::Tensor& x0 = inputs[index++];
+    const torch::Tensor& h0 = inputs[index++];
+    const torch::Tensor& c0 = inputs[index++];
+    const torch::Tensor& wx = inputs[index++];
+    const torch::Tensor& wh = inputs[index++];
+    const torch::Tensor& hn = inputs[index++];
+    const torch::Tensor& cn = inputs[index++];
+    const torch::Tensor& ifogbuf = inputs[index++];
+    const torch::Tensor& ym = inputs[index++];
+    const torch::Tensor& ln_in = inputs[index++];
+    const torch::Tensor& ln_mean = inputs[index++];
+    const torch::Tensor& ln_rstd = inputs[index++];
+    const torch::Tensor& ln_gamma = inputs[index++];
+    index = 0;
+    torch::Tensor& dgatebuf = outputs[index++];
+    torch::Tensor& xbuf = outputs[index++];
+    torch::Tensor& hbuf = outputs[index++];
+    torch::Tensor& dx = outputs[index++];
+    torch::Tensor& dwx = outputs[index++];
+    torch::Tensor& dwh = outputs[index++];
+    torch::Tensor& dbias = outputs[index++];
+    torch::Tensor& d_ln_gamma = outputs[index++];
+    torch::Tensor& d_ln_beta = outputs[index++];
+    torch::Tensor& dy = outputs[index++];
+    torch::Tensor& dh = outputs[index++];
+    torch::Tensor& dc = outputs[index++];
+
+    const unsigned int seq_len = x0.size(0);
+    const unsigned int batch_size = x0.size(1);
+    const unsigned int input_size = x0.size(2);
+    const unsigned int num_layers = h0.size(0);
+    const unsigned int hidden_size = h0.size(2);
+    const unsigned int gate_size = hidden_size * 4;
+    const int64_t rows = seq_len * batch_size;
+
+    const float* c0ptr = (float*)(c0.data_ptr());
+    const float* cnptr = (float*)(cn.data_ptr());
+    const float* ifogptr = (float*)(ifogbuf.data_ptr());
+    const float* ln_in_ptr = (float*)(ln_in.data_ptr());
+    const float* ln_mean_ptr = (float*)(ln_mean.data_ptr());
+    const float* ln_rstd_ptr = (float*)(ln_rstd.data_ptr());
+    const float* ln_gammaptr = (float*)(ln_gamma.data_ptr());
+    float* dgatebufptr = (float*)(dgatebuf.data_ptr());
+    float* xbufptr = (float*)(xbuf.data_ptr());
+    float* hbufptr = (float*)(hbuf.data_ptr());
+    float* dyptr = (float*)(dy.data_ptr());
+    float* dhptr = (float*)(dh.data_ptr());
+    float* dcptr = (float*)(dc.data_ptr());
+    float* dbiasptr = (float*)(dbias.data_ptr());
+    float* ln_dgammaptr = (float*)(d_ln_gamma.data_ptr());
+    float* ln_dbetaptr = (float*)(d_ln_beta.data_ptr());
+
+    const int* batch_sizes_ptr = (batch_sizes.empty() ? nullptr : batch_sizes.data());
+    std::vector<int64_t> wxoffset(num_layers + 1, 0);
+    for (unsigned int l = 0; l < num_layers; l++) {
+        wxoffset[l + 1] = wxoffset[l] + (l == 0 ? input_size : hidden_size) * gate_size;
+    }
+
+    for (int l = num_layers - 1; l >= 0; l--) {
+        // dropout, the mask of forward is regenerated from the seed
+        if (dropout_threshold > 0 && l != (int)num_layers - 1) {
+            DropoutForward(dyptr, 0, rows * hidden_size, dropout_threshold, seed, l);
+        }
+
+        const unsigned int in_size = (l == 0 ? input_size : hidden_size);
+        torch::Tensor xlayer = (l == 0 ? x0.view({rows, input_size}) : ym[l - 1].view({rows, hidden_size}));
+        torch::Tensor dxlayer = (l == 0 ? dx.view({rows, input_size}) : dy.view({rows, hidden_size}));
+        torch::Tensor wxlayer = MatrixView(wx, wxoffset[l], in_size, gate_size);
+        torch::Tensor whlayer = MatrixView(wh, (int64_t)l * hidden_size * gate_size, hidden_size, gate_size);
+        torch::Tensor dwxlayer = MatrixView(dwx, wxoffset[l], in_size, gate_size);
+        torch::Tensor dwhlayer = MatrixView(dwh, (int64_t)l * hidden_size * gate_size, hidden_size, gate_size);
+        torch::Tensor xbuflayer = MatrixView(xbuf, 0, rows, gate_size);
+        torch::Tensor hbuf2d = MatrixView(hbuf, 0, batch_size, gate_size);
+        torch::Tensor dh2d = MatrixView(dh, 0, batch_size, hidden_size);
+
+        const float* ln_gamma_x = ln_gammaptr + l * gate_size * 2;
+        const float* ln_gamma_h = ln_gammaptr + l * gate_size * 2 + gate_size;
+        const float* ln_x = ln_in_ptr + l * rows * gate_size * 2;
+        const float* ln_h = ln_x + rows * gate_size;
+        const float* ln_mean_x = ln_mean_ptr + l * rows * 2;
+        const float* ln_mean_h = ln_mean_x + rows;
+        const float* ln_rstd_x = ln_rstd_ptr + l * rows * 2;
+        const float* ln_rstd_h = ln_rstd_x + rows;
+        float* dgatelayer = dgatebufptr + l * rows * gate_size;
+
+        dwhlayer.zero_();
+        dh.zero_();
+        dc.zero_();
+        for (int s = seq_len - 1; s >= 0; s--) {
+            // the finished samples have zero gradient of their gates, their dh and dc are zero as well, since the
+            // samples get active in the reversed order and backward ignores the gradient of the final state
+            const unsigned int active = (batch_sizes.empty() ? batch_size : batch_sizes[s]);
+            torch::Tensor preh = (s == 0 ? h0[l] : hn[s - 1][l]).narrow(0, 0, active);
+            const float* cdata = cnptr + (s * num_layers + l) * batch_size * hidden_size;
+            const float* precdata = (s == 0 ? (c0ptr + l * batch_size * hidden_size)
+                    : (cnptr + ((s - 1) * num_layers + l) * batch_size * hidden_size));
+            const float* ifogdata = ifogptr + (l * seq_len + s) * batch_size * gate_size;
+            const float* dydata = dyptr + s * batch_size * hidden_size;
+            const int64_t row_start = s * batch_size;
+            float* dgatedata = dgatelayer + row_start * gate_size;
+
+            at::parallel_for(0, active, GetGrainSize(gate_size * 8), [&](int64_t begin, int64_t end) {
+                for (int64_t b = begin; b < end; ++b) {
+                    const int64_t r = row_start + b;
+                    lstmCellBackwardKernel(hidden_size, dydata + b * hidden_size, cdata + b * hidden_size,
+                            precdata + b * hidden_size, ifogdata + b * gate_size, dgatedata + b * gate_size,
+                            dhptr + b * hidden_size, dcptr + b * hidden_size);
+                    // xbuf keeps the gradient of the x projection of all the timesteps for the gemms after the loop
+                    layernormBackwardKernel(gate_size, dgatedata + b * gate_size, ln_x + r * gate_size,
+                            ln_mean_x[r], ln_rstd_x[r], ln_gamma_x, xbufptr + r * gate_size);
+                    layernormBackwardKernel(gate_size, dgatedata + b * gate_size, ln_h + r * gate_size,
+                            ln_mean_h[r], ln_rstd_h[r], ln_gamma_h, hbufptr + b * gate_size);
+                }
+            });
+
+            // the rows of the finished samples do not contribute to dwx and dx
+            std::fill(xbufptr + (row_start + active) * gate_size, xbufptr + (row_start + batch_size) * gate_size, 0.f);
+
+            // dwh += torch.matmul(h_t, d_gate)
+            torch::Tensor hbuf_s = hbuf2d.narrow(0, 0, active);
+            torch::Tensor dh_s = dh2d.narrow(0, 0, active);
+            dwhlayer.addmm_(preh.t(), hbuf_s);
+            // dh = torch.matmul(d_gate, wh_t)
+            at::mm_out(dh_s, hbuf_s, whlayer.t());
+        }
+
+        // dwx = torch.matmul(x, d_gate) and dx = torch.matmul(d_gate, wx_t) of all the timesteps in one gemm
+        at::mm_out(dwxlayer, xlayer.t(), xbuflayer);
+        at::mm_out(dxlayer, xbuflayer, wxlayer.t());
+
+        // layernorm parameters, the bias gets the same gradient as beta
+        float* ln_dgamma_x = ln_dgammaptr + l * gate_size * 2;
+        float* ln_dgamma_h = ln_dgamma_x + gate_size;
+        float* ln_dbeta_x = ln_dbetaptr + l * gate_size * 2;
+        float* ln_dbeta_h = ln_dbeta_x + gate_size;
+        float* dbiasdata = dbiasptr + l * gate_size;
+        // at least a cache line of columns per task
+        at::parallel_for(0, gate_size, std::max<int64_t>(GetGrainSize(rows * 8), 16), [&](int64_t begin, int64_t end) {
+            layernormParamBackwardKernel(seq_len, batch_size, batch_sizes_ptr, gate_size, dgatelayer,
+                    ln_x, ln_mean_x, ln_rstd_x, ln_dgamma_x, ln_dbeta_x, begin, end);
+            layernormParamBackwardKernel(seq_len, batch_size, batch_sizes_ptr, gate_size, dgatelayer,
+                    ln_h, ln_mean_h, ln_rstd_h, ln_dgamma_h, ln_dbeta_h, begin, end);
+            for (int64_t i = begin; i < end; ++i)
+                dbiasdata[i] = ln_dbeta_x[i];
+        });
+    }
+}
+
+void LstmInferenceForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    const std::vector<int>& batch_sizes) {
+
+    unsigned int index = 0;
+    const torch::Tensor& x0 = inputs[index++];
+    const torch::Tensor& wx = inputs[index++];
+    const torch::Tensor& wh = inputs[index++];
+    const torch::Tensor& bias = inputs[index++];
+    const torch::Tensor& ln_gamma = inputs[index++];
+    const torch::Tensor& ln_beta = inputs[index++];
+    index = 0;
+    torch::Tensor& h = outputs[index++];
+    torch::Tensor& c = outputs[index++];
+    torch::Tensor& y = outputs[index++];
+    torch::Tensor& xbuf = outputs[index++];
+    torch::Tensor& hbuf = outputs[index++];
+
+    const unsigned int seq_len = x0.size(0);
+    const unsigned int batch_size = x0.size(1);
+    const unsigned int input_size = x0.size(2);
+    const unsigned int num_layers = h.size(0);
+    const unsigned int hidden_size = h.size(2);
+    const unsigned int gate_size = hidden_size * 4;
+    const int64_t rows = seq_len * batch_size;
+
+    const float* biasptr = (float*)(bias.data_ptr());
+    const float* ln_gammaptr = (float*)(ln_gamma.data_ptr());
+    const float* ln_betaptr = (float*)(ln_beta.data_ptr());
+    const float* xbufptr = (float*)(xbuf.data_ptr());
+    const float* hbufptr = (float*)(hbuf.data_ptr());
+    float* hptr = (float*)(h.data_ptr());
+    float* cptr = (float*)(c.data_ptr());
+    float* yptr = (float*)(y.data_ptr());
+
+    torch::Tensor xbuf2d = MatrixView(xbuf, 0, rows, gate_size);
+    torch::Tensor hbuf2d = MatrixView(hbuf, 0, batch_size, gate_size);
+    int64_t wxoffset = 0;
+    for (unsigned int l = 0; l < num_layers; l++) {
+        const unsigned int in_size = (l == 0 ? input_size : hidden_size);
+        // y is the input of the layer until the projection is done, then it is overwritten by the layer's output
+        torch::Tensor xlayer = (l == 0 ? x0.view({rows, input_size}) : y.view({rows, hidden_size}));
+        torch::Tensor wxlayer = MatrixView(wx, wxoffset, in_size, gate_size);
+        torch::Tensor whlayer = MatrixView(wh, (int64_t)l * hidden_size * gate_size, hidden_size, gate_size);
+        wxoffset += in_size * gate_size;
+        at::mm_out(xbuf2d, xlayer, wxlayer);
+
+        const float* biasdata = biasptr + l * gate_size;
+        const float* ln_gamma_x = ln_gammaptr + l * gate_size * 2;
+        const float* ln_gamma_h = ln_gamma_x + gate_size;
+        const float* ln_beta_x = ln_betaptr + l * gate_size * 2;
+        const float* ln_beta_h = ln_beta_x + gate_size;
+        float* hdata = hptr + l * batch_size * hidden_size;
+        float* cdata = cptr + l * batch_size * hidden_size;
+        torch::Tensor hlayer = h[l];
+        for (unsigned int s = 0; s < seq_len; s++) {
+            // the state of the finished samples is kept in place
+            const unsigned int active = (batch_sizes.empty() ? batch_size : batch_sizes[s]);
+            torch::Tensor hbuf_s = hbuf2d.narrow(0, 0, active);
+            at::mm_out(hbuf_s, hlayer.narrow(0, 0, active), whlayer);
+            const float* xbufdata = xbufptr + s * batch_size * gate_size;
+            float* outputdata = yptr + s * batch_size * hidden_size;
+            at::parallel_for(0, active, GetGrainSize(gate_size * 8), [&](int64_t begin, int64_t end) {
+                float mean_x, rstd_x, mean_h, rstd_h;
+                for (int64_t b = begin; b < end; ++b) {
+                    lstmCellForwardKernel(hidden_size, xbufdata + b * gate_size, hbufptr + b * gate_size,
+                            ln_gamma_x, ln_beta_x, ln_gamma_h, ln_beta_h, biasdata,
+                            cdata + b * hidden_size, &mean_x, &rstd_x, &mean_h, &rstd_h,
+                            hdata + b * hidden_size, cdata + b * hidden_size, nullptr,
+                            outputdata + b * hidden_size);
+                }
+            });
+            if (active < batch_size) {
+                FreezeState(active, batch_size, hidden_size, hdata, cdata, hdata, cdata, outputdata);
+            }
+        }
+    }
+}
+
+}  // namespace cpu
+}  // namespace rll
+}  // namespace hpc
@@ -9,11 +9,14 @@ void GaeForward(
     const std::vector<torch::Tensor>& inputs,
     std::vector<torch::Tensor>& outputs,
     float gamma,
-    float lambda) {
+    float lambda,
+    int accumulate_mode) {
 
     unsigned int index = 0;
     const torch::Tensor& value = inputs[index++];
     const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& done = inputs[index++];
+    const torch::Tensor& lengths = inputs[index++];
     index = 0;
     torch::Tensor& adv = outputs[index++];
 
@@ -22,9 +25,65 @@ void GaeForward(
 
     unsigned int block_size = 1 * WARP_SIZE; // single warp to utilize more blocks
     unsigned int grid_size = (batch_size + block_size - 1) / block_size;
-    gaeForwardKernel<<<grid_size, block_size>>>(
-            time_step, batch_size, gamma, lambda,
-            (float*)(value.data_ptr()), (float*)(reward.data_ptr()), (float*)(adv.data_ptr()));
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, value.scalar_type(),
+            "GaeForward", [&] {
+        dispatchAccumulateMode<at::opmath_type<scalar_t>>(accumulate_mode, [&](auto mode) {
+            gaeForwardKernel<scalar_t, decltype(mode)><<<grid_size, block_size>>>(
+                    time_step, batch_size, gamma, lambda,
+                    (scalar_t*)(value.data_ptr()), (scalar_t*)(reward.data_ptr()),
+                    done.numel() > 0 ? (scalar_t*)(done.data_ptr()) : nullptr,
+                    lengths.numel() > 0 ? (int64_t*)(lengths.data_ptr()) : nullptr,
+                    (scalar_t*)(adv.data_ptr()));
+        });
+    });
+}
+
+void GaeNormForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    float eps,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& value = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& done = inputs[index++];
+    const torch::Tensor& lengths = inputs[index++];
+    index = 0;
+    torch::Tensor& adv = outputs[index++];
+    torch::Tensor& ret = outputs[index++];
+    torch::Tensor& norm_adv = outputs[index++];
+    torch::Tensor& stat = outputs[index++];
+
+    // set zero for atomic add
+    checkCudaErr(cudaMemsetAsync((double*)(stat.data_ptr()), 0, 3 * sizeof(double)));
+
+    const unsigned int time_step = reward.size(0);
+    const unsigned int batch_size = reward.size(1);
+    const int64_t* lengths_ptr = lengths.numel() > 0 ? (int64_t*)(lengths.data_ptr()) : nullptr;
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, value.scalar_type(),
+            "GaeNormForward", [&] {
+        {
+            unsigned int block_size = 1 * WARP_SIZE; // single warp to utilize more blocks
+            unsigned int grid_size = (batch_size + block_size - 1) / block_size;
+            dispatchAccumulateMode<at::opmath_type<scalar_t>>(accumulate_mode, [&](auto mode) {
+                gaeReturnKernel<scalar_t, decltype(mode)><<<grid_size, block_size>>>(
+                        time_step, batch_size, gamma, lambda,
+                        (scalar_t*)(value.data_ptr()), (scalar_t*)(reward.data_ptr()),
+                        done.numel() > 0 ? (scalar_t*)(done.data_ptr()) : nullptr, lengths_ptr,
+                        (scalar_t*)(adv.data_ptr()), (scalar_t*)(ret.data_ptr()), (double*)(stat.data_ptr()));
+            });
+        }
+        {
+            unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
+            unsigned int grid_size = (time_step * batch_size + block_size - 1) / block_size;
+            advNormKernel<scalar_t><<<grid_size, block_size>>>(
+                    time_step, batch_size, eps, (scalar_t*)(adv.data_ptr()), lengths_ptr,
+                    (double*)(stat.data_ptr()), (scalar_t*)(norm_adv.data_ptr()));
+        }
+    });
 }
 
 }  // namespace cuda
@@ -0,0 +1,70 @@
+#include "hpc/rll/cuda/rl_utils/entry.h"
+#include "hpc/rll/cuda/rl_utils/lambda_return_kernel.h"
+
+namespace hpc {
+namespace rll {
+namespace cuda {
+
+void LambdaReturnForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& value = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& gammas = inputs[index++];
+    const torch::Tensor& lambdas = inputs[index++];
+    index = 0;
+    torch::Tensor& ret = outputs[index++];
+
+    const unsigned int time_step = reward.size(0);
+    const unsigned int batch_size = reward.size(1);
+
+    unsigned int block_size = 1 * WARP_SIZE; // single warp to utilize more blocks
+    unsigned int grid_size = (batch_size + block_size - 1) / block_size;
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, value.scalar_type(),
+            "LambdaReturnForward", [&] {
+        const scalar_t* gammas_ptr = gammas.numel() > 0 ? (scalar_t*)(gammas.data_ptr()) : nullptr;
+        const scalar_t* lambdas_ptr = lambdas.numel() > 0 ? (scalar_t*)(lambdas.data_ptr()) : nullptr;
+        dispatchAccumulateMode<at::opmath_type<scalar_t>>(accumulate_mode, [&](auto mode) {
+            lambdaReturnForwardKernel<scalar_t, decltype(mode)><<<grid_size, block_size>>>(
+                    time_step, batch_size, gamma, lambda,
+                    (scalar_t*)(value.data_ptr()), (scalar_t*)(reward.data_ptr()), gammas_ptr, lambdas_ptr,
+                    (scalar_t*)(ret.data_ptr()));
+        });
+    });
+}
+
+void LambdaReturnBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda) {
+
+    unsigned int index = 0;
+    const torch::Tensor& grad_ret = inputs[index++];
+    const torch::Tensor& gammas = inputs[index++];
+    const torch::Tensor& lambdas = inputs[index++];
+    index = 0;
+    torch::Tensor& grad_value = outputs[index++];
+
+    const unsigned int time_step = grad_ret.size(0);
+    const unsigned int batch_size = grad_ret.size(1);
+
+    unsigned int block_size = 1 * WARP_SIZE; // single warp to utilize more blocks
+    unsigned int grid_size = (batch_size + block_size - 1) / block_size;
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, grad_value.scalar_type(),
+            "LambdaReturnBackward", [&] {
+        const scalar_t* gammas_ptr = gammas.numel() > 0 ? (scalar_t*)(gammas.data_ptr()) : nullptr;
+        const scalar_t* lambdas_ptr = lambdas.numel() > 0 ? (scalar_t*)(lambdas.data_ptr()) : nullptr;
+        lambdaReturnBackwardKernel<scalar_t><<<grid_size, block_size>>>(time_step, batch_size, gamma, lambda,
+                (scalar_t*)(grad_ret.data_ptr()), gammas_ptr, lambdas_ptr, (scalar_t*)(grad_value.data_ptr()));
+    });
+}
+
+}  // namespace cuda
+}  // namespace rll
+}  // namespace hpc
@@ -0,0 +1,42 @@
+#include "hpc/rll/cuda/rl_utils/entry.h"
+#include "hpc/rll/cuda/rl_utils/nstep_return_kernel.h"
+
+namespace hpc {
+namespace rll {
+namespace cuda {
+
+void NStepReturnForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    int nstep,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& done = inputs[index++];
+    index = 0;
+    torch::Tensor& ret = outputs[index++];
+    torch::Tensor& bootstrap_index = outputs[index++];
+    torch::Tensor& bootstrap_discount = outputs[index++];
+
+    TORCH_CHECK(nstep >= 1, "nstep should be at least 1, but get ", nstep);
+    const unsigned int time_step = reward.size(0);
+    const unsigned int batch_size = reward.size(1);
+
+    unsigned int block_size = 1 * WARP_SIZE; // single warp to utilize more blocks
+    unsigned int grid_size = (batch_size + block_size - 1) / block_size;
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, reward.scalar_type(),
+            "NStepReturnForward", [&] {
+        const scalar_t* done_ptr = done.numel() > 0 ? (scalar_t*)(done.data_ptr()) : nullptr;
+        dispatchAccumulateMode<at::opmath_type<scalar_t>>(accumulate_mode, [&](auto mode) {
+            nstepReturnKernel<scalar_t, decltype(mode)><<<grid_size, block_size>>>(time_step, batch_size, gamma, nstep,
+                    (scalar_t*)(reward.data_ptr()), done_ptr, (scalar_t*)(ret.data_ptr()),
+                    (int64_t*)(bootstrap_index.data_ptr()), (scalar_t*)(bootstrap_discount.data_ptr()));
+        });
+    });
+}
+
+}  // namespace cuda
+}  // namespace rll
+}  // namespace hpc
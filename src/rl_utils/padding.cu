@@ -1,110 +1,27 @@
 #include "hpc/rll/cuda/rl_utils/entry.h"
 #include "hpc/rll/cuda/rl_utils/padding_kernel.h"
+#include "hpc/rll/host/ragged.h"
+#include "hpc/rll/host/split_group.h"
 #include <algorithm>
 
 namespace hpc {
 namespace rll {
 namespace cuda {
-std::vector<std::vector<int>> sample_split_group(const std::vector<torch::Tensor>& x, int group) {
-    int N = x.size();
-    int dim = x[0].sizes().size();
-    std::vector<std::vector<int>> result;
-    std::vector<int> sampled_idx;
-    int last_rand = -1;
-    int now_rand = -1;
-    for(int i = 0; i < group - 1; i++) {
-        while(now_rand == last_rand) {
-            now_rand = (rand() % (N-2)) + 1;
-        }
-        sampled_idx.push_back(now_rand);
-        last_rand = now_rand;
-    }
-    sort(sampled_idx.begin(), sampled_idx.end());
-    sampled_idx.push_back(N-1);
-    std::vector<int> group_idx;
-    int last_idx = -1;
-    for(auto idx : sampled_idx) {
-        std::vector<int> group_shape(dim, -1);
-        for(int i = last_idx + 1; i <= idx; i++) {
-            for(int j = 0; j < dim; j++) {
-                if(x[i].sizes()[j] > group_shape[j])
-                    group_shape[j] = x[i].sizes()[j];
-            }
-        }
-        if(!result.empty() && group_shape == result[result.size() - 1]) 
-            continue;
-        result.push_back(group_shape);
-        group_idx.push_back(last_idx + 1);
-        last_idx = idx;
-    }
-    group_idx.push_back(N);
-    result.push_back(group_idx);
-    return result;
+
+std::vector<std::vector<int>> sample_split_group(const std::vector<torch::Tensor>& x, int group, int64_t seed) {
+    return host::sample_split_group(x, group, seed);
+}
+
+std::vector<std::vector<int>> quantile_split_group(const std::vector<torch::Tensor>& x, int group) {
+    return host::quantile_split_group(x, group);
 }
+
 std::vector<std::vector<int>> oracle_split_group(const std::vector<torch::Tensor>& x, int group) {
-    int N = x.size();
-    int M = group;
-    int dim = x[0].sizes().size();
-    int look_up[dim][N][N];
-    int cost[N+1][M+1];
-    int pos[N+1][M+1];
-    memset(cost, 0, (N+1)*(M+1)*sizeof(int));
-    memset(pos, 0, (N+1)*(M+1)*sizeof(int));
-    memset(look_up, 0, dim*N*N*sizeof(int));
-    for(int d = 0; d < dim; d++) {
-        for(int i = 0; i < N; i++)
-            look_up[d][i][i] = x[i].sizes()[d];
-        for(int i = 0; i < N; i++) {
-            for(int j = i + 1; j < N; j++) {
-                look_up[d][i][j] = (x[j].sizes()[d] > look_up[d][i][j-1]) ? x[j].sizes()[d] : look_up[d][i][j-1];
-            }
-        }
-    }
-    for(int i = 1; i <= N; i++) {
-        for(int j = 1; j <= M; j++) {
-            bool flg = false;
-            int min_cost = 1e8;
-            int start_pos = 0;
-            for(int k = 0; k < i; k++) {
-                if(cost[k][j-1] != 0 || (k == 0 && j == 1)) {
-                    flg = true;
-                    int max_elems = 1;
-                    for(int d = 0; d < dim; d++) max_elems *= look_up[d][k][i-1];
-                    int now_cost = cost[k][j-1] + max_elems * (i - k);
-                    if(now_cost < min_cost) {
-                        min_cost = now_cost;
-                        start_pos = k;
-                    }
-                }
-            }
-            if(flg) {
-                cost[i][j] = min_cost;
-                pos[i][j] = start_pos;
-            }
-        }
-    }
-    int last_pos = N;
-    int last_cnt = M;
-    std::vector<int> positions = {N};
-    while(last_pos > 0) {
-        last_pos = pos[last_pos][last_cnt];
-        last_cnt--;
-        positions.push_back(last_pos);
-    }
-    reverse(positions.begin(), positions.end());
-    std::vector<std::vector<int>> result;
-    int start_id = 0;
-    int end_id = 0;
-    for(int i = 1; i < positions.size(); i++) {
-        end_id = positions[i] - 1;
-        std::vector<int> res;
-        for(int d = 0; d < dim; d++)
-            res.push_back(look_up[d][start_id][end_id]);
-        start_id = end_id + 1;
-        result.push_back(res);
-    }
-    result.push_back(positions);
-    return result;
+    return host::oracle_split_group(x, group);
+}
+
+std::vector<std::vector<int>> fast_oracle_split_group(const std::vector<torch::Tensor>& x, int group) {
+    return host::fast_oracle_split_group(x, group);
 }
 
 
@@ -581,8 +498,78 @@ std::vector<torch::Tensor> Unpad3DForward(const torch::Tensor& inputs, const std
     return outputs;
 }
 
+// the ragged inputs need no pointer table, offsets and shapes are copied back to the host once to check the layout
+// and get the max shape and the total number of values for allocating the outputs
+static std::vector<int> CheckRaggedShapes(const torch::Tensor& offsets, const torch::Tensor& shapes, int64_t numel,
+                                          const int64_t* padded_shape, int64_t* total) {
+    const int64_t n = shapes.size(0);
+    const int dim = shapes.size(1);
+    TORCH_CHECK(dim >= 1 && dim <= 3, "ragged padding only supports 1, 2 or 3 dims, but get ", dim);
+    TORCH_CHECK(offsets.numel() == n + 1, "offsets should have ", n + 1, " elements, but get ", offsets.numel());
+    torch::Tensor offsets_h = offsets.cpu();
+    torch::Tensor shapes_h = shapes.cpu();
+    const int64_t* shapes_ptr = shapes_h.data_ptr<int64_t>();
+    const int64_t* offsets_ptr = offsets_h.data_ptr<int64_t>();
+    host::CheckRagged(offsets_ptr, shapes_ptr, n, dim, numel, padded_shape);
+    *total = offsets_ptr[n];
+    std::vector<int> ret(3, 1);
+    for(int d = 0; d < dim; d++) {
+        int64_t m = 0;
+        for(int64_t i = 0; i < n; i++) {
+            m = std::max(m, shapes_ptr[i * dim + d]);
+        }
+        ret[d] = m;
+    }
+    return ret;
+}
 
+std::vector<torch::Tensor> PadRaggedForward(const torch::Tensor& values, const torch::Tensor& offsets,
+                                            const torch::Tensor& shapes, const int& value) {
+    TORCH_CHECK(offsets.scalar_type() == at::kLong && shapes.scalar_type() == at::kLong,
+            "offsets and shapes should be int64");
+    TORCH_CHECK(offsets.device() == values.device() && shapes.device() == values.device(),
+            "offsets and shapes should be on the same device as values");
+    const int n = shapes.size(0);
+    const int dim = shapes.size(1);
+    int64_t total = 0;
+    std::vector<int> max_shape = CheckRaggedShapes(offsets, shapes, values.numel(), nullptr, &total);
+    std::vector<int64_t> out_shape = {n};
+    for(int i = 0; i < dim; i++) {
+        out_shape.push_back(max_shape[i]);
+    }
+    auto new_x = at::empty(out_shape, values.options());
+    auto mask = at::empty(out_shape, values.options().dtype(at::kInt));
+    dim3 grid(n, 1, 1);
+    dim3 block(GetBlockSize(max_shape[0] * max_shape[1] * max_shape[2]));
+    PadRagged_kernel<<<grid, block>>>(values.data_ptr<float>(), offsets.data_ptr<int64_t>(), shapes.data_ptr<int64_t>(),
+            dim, new_x.data_ptr<float>(), mask.data_ptr<int>(), max_shape[0], max_shape[1], max_shape[2], value);
+    return {new_x, mask};
+}
 
+torch::Tensor UnpadRaggedForward(const torch::Tensor& inputs, const torch::Tensor& offsets, const torch::Tensor& shapes) {
+    TORCH_CHECK(offsets.scalar_type() == at::kLong && shapes.scalar_type() == at::kLong,
+            "offsets and shapes should be int64");
+    TORCH_CHECK(offsets.device() == inputs.device() && shapes.device() == inputs.device(),
+            "offsets and shapes should be on the same device as inputs");
+    const int n = shapes.size(0);
+    const int dim = shapes.size(1);
+    TORCH_CHECK(inputs.dim() == dim + 1, "inputs should have ", dim + 1, " dims, but get ", inputs.dim());
+    TORCH_CHECK(inputs.size(0) == n, "inputs should have ", n, " padded tensors, but get ", inputs.size(0));
+    std::vector<int> max_shape(3, 1);
+    int64_t padded_shape[3];
+    for(int i = 0; i < dim; i++) {
+        max_shape[i] = inputs.size(i + 1);
+        padded_shape[i] = inputs.size(i + 1);
+    }
+    int64_t total = 0;
+    CheckRaggedShapes(offsets, shapes, std::numeric_limits<int64_t>::max(), padded_shape, &total);
+    auto outputs = at::empty({total}, inputs.options());
+    dim3 grid(n, 1, 1);
+    dim3 block(GetBlockSize(max_shape[0] * max_shape[1] * max_shape[2]));
+    UnpadRagged_kernel<<<grid, block>>>(inputs.data_ptr<float>(), offsets.data_ptr<int64_t>(), shapes.data_ptr<int64_t>(),
+            dim, outputs.data_ptr<float>(), max_shape[0], max_shape[1], max_shape[2]);
+    return outputs;
+}
 
 }  // namespace cuda
 }  // namespace rll
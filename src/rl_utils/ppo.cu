@@ -10,7 +10,8 @@ void PPOForward(
     std::vector<torch::Tensor>& outputs,
     bool use_value_clip,
     float clip_ratio,
-    float dual_clip) {
+    float dual_clip,
+    const std::vector<int64_t>& heads) {
 
     unsigned int index = 0;
     const torch::Tensor& logits_new = inputs[index++];
@@ -46,22 +47,26 @@ void PPOForward(
 
     const unsigned int batch_size = logits_new.size(0);
     const unsigned int num_output = logits_new.size(1);
-    {
+    const CategoricalHeads categorical_heads = makeCategoricalHeads(heads, num_output);
+    // the (B, N) logits and grads are float, half or bfloat16, the per sample values and the losses are float
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, logits_new.scalar_type(),
+            "PPOForward", [&] {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
-        unsigned int grid_size = batch_size;
-        categoricalProbEntropy<<<grid_size, block_size>>>(
-                num_output, (float*)(logits_new.data_ptr()), (int64_t*)(action.data_ptr()),
+        dim3 grid_size(batch_size, categorical_heads.num);
+        categoricalProbEntropy<scalar_t><<<grid_size, block_size>>>(
+                num_output, categorical_heads, (scalar_t*)(logits_new.data_ptr()), (int64_t*)(action.data_ptr()),
                 (float*)(logits_new_prob.data_ptr()), (float*)(logits_new_entropy.data_ptr()),
-                (float*)(logits_new_grad_logits.data_ptr()), (float*)(logits_new_grad_prob.data_ptr()),
-                (float*)(logits_new_grad_entropy.data_ptr()));
-        categoricalProb<<<grid_size, block_size>>>(
-                num_output, (float*)(logits_old.data_ptr()), (int64_t*)(action.data_ptr()), (float*)(logits_old_prob.data_ptr()));
-    }
+                (scalar_t*)(logits_new_grad_logits.data_ptr()), (scalar_t*)(logits_new_grad_prob.data_ptr()),
+                (scalar_t*)(logits_new_grad_entropy.data_ptr()));
+        categoricalProb<scalar_t><<<grid_size, block_size>>>(
+                num_output, categorical_heads, (scalar_t*)(logits_old.data_ptr()), (int64_t*)(action.data_ptr()),
+                (float*)(logits_old_prob.data_ptr()));
+    });
     {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
         unsigned int grid_size = (batch_size + block_size - 1) / block_size;
         ppoLoss<<<grid_size, block_size>>>(
-                batch_size, (float*)(value_new.data_ptr()), (float*)(value_old.data_ptr()),
+                batch_size, categorical_heads.num, (float*)(value_new.data_ptr()), (float*)(value_old.data_ptr()),
                 (float*)(logits_new_prob.data_ptr()), (float*)(logits_old_prob.data_ptr()), (float*)(logits_new_entropy.data_ptr()),
                 (float*)(adv.data_ptr()), (float*)(return_.data_ptr()), (float*)(weight.data_ptr()),
                 use_value_clip, clip_ratio, dual_clip,
@@ -74,7 +79,8 @@ void PPOForward(
 
 void PPOBackward(
     const std::vector<torch::Tensor>& inputs,
-    std::vector<torch::Tensor>& outputs) {
+    std::vector<torch::Tensor>& outputs,
+    const std::vector<int64_t>& heads) {
 
     unsigned int index = 0;
     const torch::Tensor& grad_policy_loss = inputs[index++];
@@ -93,21 +99,134 @@ void PPOBackward(
 
     const unsigned int batch_size = grad_logits_new.size(0);
     const unsigned int num_output = grad_logits_new.size(1);
+    const CategoricalHeads categorical_heads = makeCategoricalHeads(heads, num_output);
     {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
         unsigned int grid_size = (batch_size + block_size - 1) / block_size;
         ppoBackwardValueNew<<<grid_size, block_size>>>(
                 batch_size, (float*)(grad_value_loss.data_ptr()), (float*)(grad_value_loss_buf.data_ptr()), (float*)(grad_value.data_ptr()));
     }
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, grad_logits_new.scalar_type(),
+            "PPOBackward", [&] {
+        unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
+        dim3 grid_size(batch_size, categorical_heads.num);
+        ppoBackwardLogitsNew<scalar_t><<<grid_size, block_size>>>(
+                batch_size, num_output, categorical_heads, (float*)(grad_policy_loss.data_ptr()), (float*)(grad_entropy_loss.data_ptr()),
+                (float*)(grad_policy_loss_buf.data_ptr()), (float*)(grad_entropy_loss_buf.data_ptr()),
+                (scalar_t*)(logits_new_grad_logits.data_ptr()), (scalar_t*)(logits_new_grad_prob.data_ptr()),
+                (scalar_t*)(logits_new_grad_entropy.data_ptr()), (scalar_t*)(grad_logits_new.data_ptr()));
+    });
+}
+
+void PPOContinuousForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    bool use_value_clip,
+    float clip_ratio,
+    float dual_clip) {
+
+    unsigned int index = 0;
+    const torch::Tensor& mu_new = inputs[index++];
+    const torch::Tensor& sigma_new = inputs[index++];
+    const torch::Tensor& mu_old = inputs[index++];
+    const torch::Tensor& sigma_old = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    const torch::Tensor& value_new = inputs[index++];
+    const torch::Tensor& value_old = inputs[index++];
+    const torch::Tensor& adv = inputs[index++];
+    const torch::Tensor& return_ = inputs[index++];
+    const torch::Tensor& weight = inputs[index++];
+
+    index = 0;
+    torch::Tensor& new_prob = outputs[index++];
+    torch::Tensor& new_entropy = outputs[index++];
+    torch::Tensor& grad_mu_prob = outputs[index++];
+    torch::Tensor& grad_sigma_prob = outputs[index++];
+    torch::Tensor& grad_sigma_entropy = outputs[index++];
+    torch::Tensor& old_prob = outputs[index++];
+    torch::Tensor& grad_policy_loss_buf = outputs[index++];
+    torch::Tensor& grad_value_loss_buf = outputs[index++];
+    torch::Tensor& grad_entropy_loss_buf = outputs[index++];
+    torch::Tensor& policy_loss = outputs[index++];
+    torch::Tensor& value_loss = outputs[index++];
+    torch::Tensor& entropy_loss = outputs[index++];
+    torch::Tensor& approx_kl = outputs[index++];
+    torch::Tensor& clipfrac = outputs[index++];
+
+    checkCudaErr(cudaMemsetAsync((float*)(policy_loss.data_ptr()), 0, sizeof(float)));
+    checkCudaErr(cudaMemsetAsync((float*)(value_loss.data_ptr()), 0, sizeof(float)));
+    checkCudaErr(cudaMemsetAsync((float*)(entropy_loss.data_ptr()), 0, sizeof(float)));
+    checkCudaErr(cudaMemsetAsync((float*)(approx_kl.data_ptr()), 0, sizeof(float)));
+    checkCudaErr(cudaMemsetAsync((float*)(clipfrac.data_ptr()), 0, sizeof(float)));
+
+    const unsigned int batch_size = mu_new.size(0);
+    const unsigned int num_output = mu_new.size(1);
+    // the (B, N) mu, sigma, action and grads are float, half or bfloat16, the per sample values and the losses are float
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, mu_new.scalar_type(),
+            "PPOContinuousForward", [&] {
+        unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
+        unsigned int grid_size = (batch_size + block_size - 1) / block_size;
+        gaussianProbEntropy<scalar_t><<<grid_size, block_size>>>(
+                batch_size, num_output, (scalar_t*)(mu_new.data_ptr()), (scalar_t*)(sigma_new.data_ptr()),
+                (scalar_t*)(mu_old.data_ptr()), (scalar_t*)(sigma_old.data_ptr()), (scalar_t*)(action.data_ptr()),
+                (float*)(new_prob.data_ptr()), (float*)(new_entropy.data_ptr()), (float*)(old_prob.data_ptr()),
+                (scalar_t*)(grad_mu_prob.data_ptr()), (scalar_t*)(grad_sigma_prob.data_ptr()),
+                (scalar_t*)(grad_sigma_entropy.data_ptr()));
+    });
+    {
+        unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
+        unsigned int grid_size = (batch_size + block_size - 1) / block_size;
+        ppoLoss<<<grid_size, block_size>>>(
+                batch_size, 1, (float*)(value_new.data_ptr()), (float*)(value_old.data_ptr()),
+                (float*)(new_prob.data_ptr()), (float*)(old_prob.data_ptr()), (float*)(new_entropy.data_ptr()),
+                (float*)(adv.data_ptr()), (float*)(return_.data_ptr()), (float*)(weight.data_ptr()),
+                use_value_clip, clip_ratio, dual_clip,
+                (float*)(policy_loss.data_ptr()), (float*)(value_loss.data_ptr()), (float*)(entropy_loss.data_ptr()),
+                (float*)(approx_kl.data_ptr()), (float*)(clipfrac.data_ptr()),
+                (float*)(grad_policy_loss_buf.data_ptr()), (float*)(grad_value_loss_buf.data_ptr()),
+                (float*)(grad_entropy_loss_buf.data_ptr()));
+    }
+}
+
+void PPOContinuousBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs) {
+
+    unsigned int index = 0;
+    const torch::Tensor& grad_policy_loss = inputs[index++];
+    const torch::Tensor& grad_value_loss = inputs[index++];
+    const torch::Tensor& grad_entropy_loss = inputs[index++];
+    const torch::Tensor& grad_policy_loss_buf = inputs[index++];
+    const torch::Tensor& grad_value_loss_buf = inputs[index++];
+    const torch::Tensor& grad_entropy_loss_buf = inputs[index++];
+    const torch::Tensor& grad_mu_prob = inputs[index++];
+    const torch::Tensor& grad_sigma_prob = inputs[index++];
+    const torch::Tensor& grad_sigma_entropy = inputs[index++];
+
+    index = 0;
+    torch::Tensor& grad_value = outputs[index++];
+    torch::Tensor& grad_mu_new = outputs[index++];
+    torch::Tensor& grad_sigma_new = outputs[index++];
+
+    const unsigned int batch_size = grad_mu_new.size(0);
+    const unsigned int num_output = grad_mu_new.size(1);
     {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
-        unsigned int grid_size = batch_size;
-        ppoBackwardLogitsNew<<<grid_size, block_size>>>(
+        unsigned int grid_size = (batch_size + block_size - 1) / block_size;
+        ppoBackwardValueNew<<<grid_size, block_size>>>(
+                batch_size, (float*)(grad_value_loss.data_ptr()), (float*)(grad_value_loss_buf.data_ptr()), (float*)(grad_value.data_ptr()));
+    }
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, grad_mu_new.scalar_type(),
+            "PPOContinuousBackward", [&] {
+        unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
+        unsigned int grid_size = (batch_size * num_output + block_size - 1) / block_size;
+        ppoBackwardMuSigmaNew<scalar_t><<<grid_size, block_size>>>(
                 batch_size, num_output, (float*)(grad_policy_loss.data_ptr()), (float*)(grad_entropy_loss.data_ptr()),
                 (float*)(grad_policy_loss_buf.data_ptr()), (float*)(grad_entropy_loss_buf.data_ptr()),
-                (float*)(logits_new_grad_logits.data_ptr()), (float*)(logits_new_grad_prob.data_ptr()),
-                (float*)(logits_new_grad_entropy.data_ptr()), (float*)(grad_logits_new.data_ptr()));
-    }
+                (scalar_t*)(grad_mu_prob.data_ptr()), (scalar_t*)(grad_sigma_prob.data_ptr()),
+                (scalar_t*)(grad_sigma_entropy.data_ptr()), (scalar_t*)(grad_mu_new.data_ptr()),
+                (scalar_t*)(grad_sigma_new.data_ptr()));
+    });
 }
 
 }  // namespace cuda
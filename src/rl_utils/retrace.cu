@@ -0,0 +1,85 @@
+#include "hpc/rll/cuda/rl_utils/entry.h"
+#include "hpc/rll/cuda/rl_utils/retrace_kernel.h"
+
+namespace hpc {
+namespace rll {
+namespace cuda {
+
+void RetraceForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float gamma,
+    float lambda,
+    float c_clip_ratio,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& q = inputs[index++];
+    const torch::Tensor& target_q = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& done = inputs[index++];
+    const torch::Tensor& target_prob = inputs[index++];
+    const torch::Tensor& behaviour_prob = inputs[index++];
+    const torch::Tensor& weight = inputs[index++];
+    index = 0;
+    torch::Tensor& q_retrace = outputs[index++];
+    torch::Tensor& td_err = outputs[index++];
+    torch::Tensor& loss = outputs[index++];
+    torch::Tensor& grad_buf = outputs[index++];
+
+    checkCudaErr(cudaMemsetAsync((float*)(loss.data_ptr()), 0, sizeof(float)));
+
+    const unsigned int time_step = q.size(0);
+    const unsigned int batch_size = q.size(1);
+    const unsigned int num_output = q.size(2);
+
+    const float* done_ptr = done.numel() > 0 ? (float*)(done.data_ptr()) : nullptr;
+    const float* behaviour_prob_ptr = behaviour_prob.numel() > 0 ? (float*)(behaviour_prob.data_ptr()) : nullptr;
+    {
+        // one warp per step, the expected target value is reduced over the actions
+        unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
+        unsigned int grid_size = (time_step * batch_size + DEFAULT_WARP_NUM - 1) / DEFAULT_WARP_NUM;
+        retraceStepKernel<<<grid_size, block_size>>>(time_step, batch_size, num_output,
+                gamma, lambda, c_clip_ratio,
+                (float*)(target_q.data_ptr()), (int64_t*)(action.data_ptr()), (float*)(reward.data_ptr()),
+                done_ptr, (float*)(target_prob.data_ptr()), behaviour_prob_ptr,
+                (float*)(q_retrace.data_ptr()), (float*)(grad_buf.data_ptr()));
+    }
+    {
+        unsigned int block_size = 1 * WARP_SIZE; // in order to use as many sm processors as possible
+        unsigned int grid_size = (batch_size + block_size - 1) / block_size;
+        dispatchAccumulateMode<float>(accumulate_mode, [&](auto mode) {
+            retraceForwardKernel<decltype(mode)><<<grid_size, block_size>>>(time_step, batch_size, num_output,
+                    (float*)(q.data_ptr()), (int64_t*)(action.data_ptr()), (float*)(weight.data_ptr()),
+                    (float*)(q_retrace.data_ptr()), (float*)(td_err.data_ptr()), (float*)(loss.data_ptr()),
+                    (float*)(grad_buf.data_ptr()));
+        });
+    }
+}
+
+void RetraceBackward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs) {
+
+    unsigned int index = 0;
+    const torch::Tensor& grad_loss = inputs[index++];
+    const torch::Tensor& grad_buf = inputs[index++];
+    const torch::Tensor& action = inputs[index++];
+    index = 0;
+    torch::Tensor& grad_q = outputs[index++];
+
+    const unsigned int time_step = grad_q.size(0);
+    const unsigned int batch_size = grad_q.size(1);
+    const unsigned int num_output = grad_q.size(2);
+
+    unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
+    unsigned int grid_size = (time_step * batch_size * num_output + block_size - 1) / block_size;
+    retraceBackwardKernel<<<grid_size, block_size>>>(time_step, batch_size, num_output,
+            (float*)(grad_loss.data_ptr()), (float*)(grad_buf.data_ptr()),
+            (int64_t*)(action.data_ptr()), (float*)(grad_q.data_ptr()));
+}
+
+}  // namespace cuda
+}  // namespace rll
+}  // namespace hpc
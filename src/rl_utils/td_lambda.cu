@@ -9,7 +9,8 @@ void TdLambdaForward(
     const std::vector<torch::Tensor>& inputs,
     std::vector<torch::Tensor>& outputs,
     float gamma,
-    float lambda) {
+    float lambda,
+    int accumulate_mode) {
 
     unsigned int index = 0;
     const torch::Tensor& value = inputs[index++];
@@ -26,10 +27,12 @@ void TdLambdaForward(
 
     unsigned int block_size = 1 * WARP_SIZE; // in order to use as many sm processors as possible
     unsigned int grid_size = (batch_size + block_size - 1) / block_size;
-    tdLambdaForwardKernel<<<grid_size, block_size>>>(
-            time_step, batch_size, gamma, lambda,
-            (float*)(value.data_ptr()), (float*)(reward.data_ptr()), (float*)(weight.data_ptr()),
-            (float*)(loss.data_ptr()), (float*)(grad_buf.data_ptr()));
+    dispatchAccumulateMode<float>(accumulate_mode, [&](auto mode) {
+        tdLambdaForwardKernel<decltype(mode)><<<grid_size, block_size>>>(
+                time_step, batch_size, gamma, lambda,
+                (float*)(value.data_ptr()), (float*)(reward.data_ptr()), (float*)(weight.data_ptr()),
+                (float*)(loss.data_ptr()), (float*)(grad_buf.data_ptr()));
+    });
 }
 
 void TdLambdaBackward(
@@ -7,7 +7,8 @@ namespace cuda {
 
 void UpgoForward(
     const std::vector<torch::Tensor>& inputs,
-    std::vector<torch::Tensor>& outputs) {
+    std::vector<torch::Tensor>& outputs,
+    int accumulate_mode) {
 
     unsigned int index = 0;
     const torch::Tensor& target_output = inputs[index++];
@@ -29,8 +30,11 @@ void UpgoForward(
     {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
         unsigned int grid_size = (batch_size + block_size - 1) / block_size;
-        upgoAdvantageKernel<<<grid_size, block_size>>>(time_step, batch_size,
-                (float*)(rho.data_ptr()), (float*)(reward.data_ptr()), (float*)(value.data_ptr()), (float*)(advantage.data_ptr()));
+        dispatchAccumulateMode<float>(accumulate_mode, [&](auto mode) {
+            upgoAdvantageKernel<decltype(mode)><<<grid_size, block_size>>>(time_step, batch_size,
+                    (float*)(rho.data_ptr()), (float*)(reward.data_ptr()), (float*)(value.data_ptr()),
+                    (float*)(advantage.data_ptr()));
+        });
     }
     {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
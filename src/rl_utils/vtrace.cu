@@ -12,7 +12,9 @@ void VTraceForward(
     float lambda,
     float rho_clip_ratio,
     float c_clip_ratio,
-    float rho_pg_clip_ratio) {
+    float rho_pg_clip_ratio,
+    int accumulate_mode,
+    const std::vector<int64_t>& heads) {
 
     unsigned int index = 0;
     const torch::Tensor& target_output = inputs[index++];
@@ -21,6 +23,8 @@ void VTraceForward(
     const torch::Tensor& value = inputs[index++];
     const torch::Tensor& reward = inputs[index++];
     const torch::Tensor& weight = inputs[index++];
+    const torch::Tensor& done = inputs[index++];
+    const torch::Tensor& discount = inputs[index++];
 
     index = 0;
     torch::Tensor& target_output_prob = outputs[index++];
@@ -43,29 +47,35 @@ void VTraceForward(
     const unsigned int time_step = target_output.size(0);
     const unsigned int batch_size = target_output.size(1);
     const unsigned int num_output = target_output.size(2);
+    const CategoricalHeads categorical_heads = makeCategoricalHeads(heads, num_output);
+    const float* done_ptr = done.numel() > 0 ? (float*)(done.data_ptr()) : nullptr;
+    const float* discount_ptr = discount.numel() > 0 ? (float*)(discount.data_ptr()) : nullptr;
     {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
-        unsigned int grid_size = time_step * batch_size;
-        categoricalTarget<<<grid_size, block_size>>>(num_output,
+        dim3 grid_size(time_step * batch_size, categorical_heads.num);
+        categoricalTarget<<<grid_size, block_size>>>(num_output, categorical_heads,
                 (float*)(target_output.data_ptr()), (int64_t*)(action.data_ptr()),
                 (float*)(target_output_prob.data_ptr()), (float*)(target_output_entropy.data_ptr()),
                 (float*)(target_output_grad_logits.data_ptr()), (float*)(target_output_grad_prob.data_ptr()),
                 (float*)(target_output_grad_entropy.data_ptr()));
-        categoricalBehaviour<<<grid_size, block_size>>>(num_output,
+        categoricalBehaviour<<<grid_size, block_size>>>(num_output, categorical_heads,
                 (float*)(behaviour_output.data_ptr()), (int64_t*)(action.data_ptr()), (float*)(behaviour_output_prob.data_ptr()));
     }
     {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
         unsigned int grid_size = (time_step * batch_size + block_size - 1) / block_size;
-        computeImportanceWeights<<<grid_size, block_size>>>(time_step, batch_size,
+        computeImportanceWeights<<<grid_size, block_size>>>(time_step, batch_size, categorical_heads.num,
                 (float*)(target_output_prob.data_ptr()), (float*)(behaviour_output_prob.data_ptr()), (float*)(is.data_ptr()));
     }
     {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
         unsigned int grid_size = (batch_size + block_size - 1) / block_size;
-        vtraceNStepReturn<<<grid_size, block_size>>>(
-                time_step, batch_size, gamma, lambda, rho_clip_ratio, c_clip_ratio, 
-                (float*)(is.data_ptr()), (float*)(reward.data_ptr()), (float*)(value.data_ptr()), (float*)(ret.data_ptr()));
+        dispatchAccumulateMode<float>(accumulate_mode, [&](auto mode) {
+            vtraceNStepReturn<decltype(mode)><<<grid_size, block_size>>>(
+                    time_step, batch_size, gamma, lambda, rho_clip_ratio, c_clip_ratio,
+                    (float*)(is.data_ptr()), (float*)(reward.data_ptr()), (float*)(value.data_ptr()),
+                    done_ptr, discount_ptr, (float*)(ret.data_ptr()));
+        });
     }
     {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
@@ -73,12 +83,12 @@ void VTraceForward(
         vtraceAdvantage<<<grid_size, block_size>>>(
                 time_step, batch_size, gamma, rho_pg_clip_ratio,
                 (float*)(is.data_ptr()), (float*)(reward.data_ptr()), (float*)(value.data_ptr()),
-                (float*)(ret.data_ptr()), (float*)(adv.data_ptr()));
+                done_ptr, discount_ptr, (float*)(ret.data_ptr()), (float*)(adv.data_ptr()));
     }
     {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
         unsigned int grid_size = (time_step * batch_size + block_size - 1) / block_size;
-        vtraceLoss<<<grid_size, block_size>>>(time_step, batch_size,
+        vtraceLoss<<<grid_size, block_size>>>(time_step, batch_size, categorical_heads.num,
                 (float*)(value.data_ptr()), (float*)(target_output_prob.data_ptr()), (float*)(target_output_entropy.data_ptr()),
                 (float*)(ret.data_ptr()), (float*)(adv.data_ptr()), (float*)(weight.data_ptr()),
                 (float*)(pg_loss.data_ptr()), (float*)(value_loss.data_ptr()), (float*)(entropy_loss.data_ptr()));
@@ -87,14 +97,15 @@ void VTraceForward(
 
 void VTraceBackward(
     const std::vector<torch::Tensor>& inputs,
-    std::vector<torch::Tensor>& outputs) {
+    std::vector<torch::Tensor>& outputs,
+    const std::vector<int64_t>& heads) {
 
     unsigned int index = 0;
     const torch::Tensor& grad_pg_loss = inputs[index++];
     const torch::Tensor& grad_value_loss = inputs[index++];
     const torch::Tensor& grad_entropy_loss = inputs[index++];
     const torch::Tensor& value = inputs[index++];
-    const torch::Tensor& action = inputs[index++];
+    index++;  // action
     const torch::Tensor& weight = inputs[index++];
     const torch::Tensor& ret = inputs[index++];
     const torch::Tensor& adv = inputs[index++];
@@ -109,6 +120,7 @@ void VTraceBackward(
     const unsigned int time_step = grad_target_output.size(0);
     const unsigned int batch_size = grad_target_output.size(1);
     const unsigned int num_output = grad_target_output.size(2);
+    const CategoricalHeads categorical_heads = makeCategoricalHeads(heads, num_output);
     {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
         unsigned int grid_size = ((time_step + 1) * batch_size + block_size - 1) / block_size;
@@ -118,9 +130,9 @@ void VTraceBackward(
     }
     {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
-        unsigned int grid_size = time_step * batch_size;
+        dim3 grid_size(time_step * batch_size, categorical_heads.num);
         vtraceBackwardTargetOutput<<<grid_size, block_size>>>(
-                time_step, batch_size, num_output,
+                time_step, batch_size, num_output, categorical_heads,
                 (float*)(grad_entropy_loss.data_ptr()), (float*)(grad_pg_loss.data_ptr()),
                 (float*)(target_output_grad_logits.data_ptr()),
                 (float*)(target_output_grad_entropy.data_ptr()),
@@ -129,6 +141,43 @@ void VTraceBackward(
     }
 }
 
+void VTraceReturnsForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    float lambda,
+    float rho_clip_ratio,
+    float c_clip_ratio,
+    float rho_pg_clip_ratio,
+    int accumulate_mode) {
+
+    unsigned int index = 0;
+    const torch::Tensor& log_rho = inputs[index++];
+    const torch::Tensor& discount = inputs[index++];
+    const torch::Tensor& reward = inputs[index++];
+    const torch::Tensor& value = inputs[index++];
+    const torch::Tensor& bootstrap = inputs[index++];
+
+    index = 0;
+    torch::Tensor& vs = outputs[index++];
+    torch::Tensor& pg_adv = outputs[index++];
+
+    const unsigned int time_step = value.size(0);
+    const unsigned int batch_size = value.size(1);
+
+    unsigned int block_size = 1 * WARP_SIZE; // single warp to utilize more blocks
+    unsigned int grid_size = (batch_size + block_size - 1) / block_size;
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, value.scalar_type(),
+            "VTraceReturnsForward", [&] {
+        dispatchAccumulateMode<at::opmath_type<scalar_t>>(accumulate_mode, [&](auto mode) {
+            vtraceReturnsKernel<scalar_t, decltype(mode)><<<grid_size, block_size>>>(time_step, batch_size,
+                    lambda, rho_clip_ratio, c_clip_ratio, rho_pg_clip_ratio,
+                    (scalar_t*)(log_rho.data_ptr()), (scalar_t*)(discount.data_ptr()),
+                    (scalar_t*)(reward.data_ptr()), (scalar_t*)(value.data_ptr()), (scalar_t*)(bootstrap.data_ptr()),
+                    (scalar_t*)(vs.data_ptr()), (scalar_t*)(pg_adv.data_ptr()));
+        });
+    });
+}
+
 }  // namespace cuda
 }  // namespace rll
 }  // namespace hpc
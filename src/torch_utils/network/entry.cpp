@@ -8,6 +8,7 @@ namespace cuda {
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
     m.def("LstmForward", &LstmForward, "lstm forward (CUDA)");
     m.def("LstmBackward", &LstmBackward, "lstm backward (CUDA)");
+    m.def("LstmInferenceForward", &LstmInferenceForward, "lstm inference forward (CUDA)");
     m.def("ScatterConnectionForward", &ScatterConnectionForward, "scatter_connection forward (CUDA)");
     m.def("ScatterConnectionBackward", &ScatterConnectionBackward, "scatter_connection backward (CUDA)");
 }
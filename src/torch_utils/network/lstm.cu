@@ -1,35 +1,37 @@
-#include <unistd.h>
 #include "hpc/rll/cuda/torch_utils/network/entry.h"
 #include "hpc/rll/cuda/torch_utils/network/lstm_kernel.h"
+#include <ATen/cuda/CUDAContext.h>
+#include <map>
 
 namespace hpc {
 namespace rll {
 namespace cuda {
 
-// random seeding, keep up with caffe
-int64_t cluster_seedgen(void) {
-    int64_t s, seed, pid;
-    FILE* f = fopen("/dev/urandom", "rb");
-    if (f && fread(&seed, 1, sizeof(seed), f) == sizeof(seed)) {
-        fclose(f);
-        return seed;
+// events of the wavefront are created once and reused by the later calls, each thread keeps its own per device so
+// concurrent calls never record the same event
+static const std::vector<cudaEvent_t>& WavefrontEvents(unsigned int num) {
+    thread_local std::map<int, std::vector<cudaEvent_t>> cache;
+    int device;
+    checkCudaErr(cudaGetDevice(&device));
+    std::vector<cudaEvent_t>& events = cache[device];
+    while (events.size() < num) {
+        cudaEvent_t event;
+        checkCudaErr(cudaEventCreateWithFlags(&event, cudaEventDisableTiming));
+        events.push_back(event);
     }
-
-    LOG(INFO) << "System entropy source not available, "
-        "using fallback algorithm to generate seed instead.";
-    if (f)
-        fclose(f);
-
-    pid = getpid();
-    s = time(NULL);
-    seed = std::abs(((s * 181) * ((pid - 83) * 359)) % 104729);
-    return seed;
+    return events;
 }
 
+// Layer l at timestep s only depends on layer l at timestep s - 1 and layer l - 1 at timestep s, so each layer runs
+// on its own stream and waits for the event of the previous layer at the same timestep: layer l timestep s runs
+// concurrently with layer l + 1 timestep s - 1, as a wavefront. The input projection of the first layer is one gemm
+// of all the timesteps, the other layers project the input of each timestep when the previous layer produces it.
 void LstmForward(
     const std::vector<torch::Tensor>& inputs,
     std::vector<torch::Tensor>& outputs,
-    float dropout_threshold) {
+    float dropout_threshold,
+    int64_t seed,
+    const std::vector<int>& batch_sizes) {
 
     unsigned int index = 0;
     const torch::Tensor& x0 = inputs[index++];
@@ -50,7 +52,6 @@ void LstmForward(
     torch::Tensor& ln_in = outputs[index++];
     torch::Tensor& ln_mean = outputs[index++];
     torch::Tensor& ln_rstd = outputs[index++];
-    torch::Tensor& dropout_mask = outputs[index++];
 
     const unsigned int seq_len = x0.size(0);
     const unsigned int batch_size = x0.size(1);
@@ -75,21 +76,22 @@ void LstmForward(
     float* ln_in_ptr = (float*)(ln_in.data_ptr());
     float* ln_mean_ptr = (float*)(ln_mean.data_ptr());
     float* ln_rstd_ptr = (float*)(ln_rstd.data_ptr());
-    unsigned int* maskptr = reinterpret_cast<unsigned int*>((int32_t*)(dropout_mask.data_ptr()));
     float onedata = 1;
     float zerodata = 0;
 
-    // create handles
-	cublasHandle_t cublas_handle;
-    checkCublasErr(cublasCreate(&cublas_handle));
-
-    curandGenerator_t gen;
-    if (dropout_threshold > 0) {
-        checkCurandErr(curandCreateGenerator(&gen, CURAND_RNG_PSEUDO_DEFAULT));
-        checkCurandErr(curandSetPseudoRandomGeneratorSeed(gen, cluster_seedgen()));
+    // the handle and one stream per layer come from the torch pools, the layers fork from the current stream
+    cublasHandle_t cublas_handle = at::cuda::getCurrentCUDABlasHandle();
+    cudaStream_t current_stream = at::cuda::getCurrentCUDAStream();
+    std::vector<cudaStream_t> streams(num_layers);
+    const std::vector<cudaEvent_t>& wavefront_events = WavefrontEvents(num_layers + 1);
+    const cudaEvent_t* events = wavefront_events.data();
+    const cudaEvent_t start_event = wavefront_events[num_layers];
+    checkCudaErr(cudaEventRecord(start_event, current_stream));
+    for (int l = 0; l < num_layers; l++) {
+        streams[l] = at::cuda::getStreamFromPool();
+        checkCudaErr(cudaStreamWaitEvent(streams[l], start_event, 0));
     }
 
-    // TODO pay attention to wx shape change
     unsigned int wxidx[num_layers];
     wxidx[0] = input_size;
     for (int l = 0; l < num_layers - 1; l++) {
@@ -101,35 +103,44 @@ void LstmForward(
         wxoffset[l + 1] = wxoffset[l] + wxidx[l] * wxidx[l + 1] * 4;
     }
 
-    for (int l = 0; l < num_layers; l++) {
-        const float* xdata = (l == 0 ? inputptr : (outputptr + (l - 1) * seq_len * batch_size * hidden_size));
-        const float* wxdata = wxptr + wxoffset[l];
-        const float* whdata = whptr + l * hidden_size * (hidden_size * 4);
-        const float* biasdata = biasptr + l * (hidden_size * 4);
-
-        const float* ln_gamma_x = ln_gammaptr + l * hidden_size * 4 * 2;
-        const float* ln_gamma_h = ln_gammaptr + l * hidden_size * 4 * 2 + hidden_size * 4;
-        const float* ln_beta_x = ln_betaptr + l * hidden_size * 4 * 2;
-        const float* ln_beta_h = ln_betaptr + l * hidden_size * 4 * 2 + hidden_size * 4;
-        float* ln_x = ln_in_ptr + l * seq_len * batch_size * hidden_size * 4 * 2;
-        float* ln_h = ln_in_ptr + l * seq_len * batch_size * hidden_size * 4 * 2 + seq_len * batch_size * hidden_size * 4;
-        float* ln_mean_x = ln_mean_ptr + l * seq_len * batch_size * 2;
-        float* ln_mean_h = ln_mean_ptr + l * seq_len * batch_size * 2 + seq_len * batch_size;
-        float* ln_rstd_x = ln_rstd_ptr + l * seq_len * batch_size * 2;
-        float* ln_rstd_h = ln_rstd_ptr + l * seq_len * batch_size * 2 + seq_len * batch_size;
-
-        checkCublasErr(cublasSgemm(cublas_handle, CUBLAS_OP_N, CUBLAS_OP_N,
-                    hidden_size * 4, seq_len * batch_size, wxidx[l],
-                    &onedata, wxdata, hidden_size * 4, xdata, wxidx[l], &zerodata, ln_x, hidden_size * 4));
-
-        // layernorm
+    // the input projection of all the timesteps of the first layer
+    {
         unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
-        unsigned int grid_size = seq_len * batch_size;
-        layernorm<<<grid_size, block_size>>>(
-                hidden_size * 4, ln_x, ln_gamma_x, ln_beta_x, ln_mean_x, ln_rstd_x, xbufptr);
+        checkCublasErr(cublasSetStream(cublas_handle, streams[0]));
+        checkCublasErr(cublasSgemm(cublas_handle, CUBLAS_OP_N, CUBLAS_OP_N,
+                    hidden_size * 4, seq_len * batch_size, input_size,
+                    &onedata, wxptr, hidden_size * 4, inputptr, input_size, &zerodata, ln_in_ptr, hidden_size * 4));
+        layernorm<<<seq_len * batch_size, block_size, 0, streams[0]>>>(
+                hidden_size * 4, ln_in_ptr, ln_gammaptr, ln_betaptr, ln_mean_ptr, ln_rstd_ptr, xbufptr);
+    }
 
-        for (int s = 0; s < seq_len; s++) {
-            const float* xbufdata = xbufptr + s * batch_size * (hidden_size * 4);
+    for (int d = 0; d < seq_len + num_layers - 1; d++) {
+        // the deeper layers are issued first, so the event of layer l - 1 is still the one of timestep s when
+        // layer l waits for it
+        const int first = (d < seq_len ? 0 : d - seq_len + 1);
+        const int last = min(d, (int)num_layers - 1);
+        for (int l = last; l >= first; l--) {
+            const int s = d - l;
+            cudaStream_t stream = streams[l];
+            const unsigned int active = (batch_sizes.empty() ? batch_size : batch_sizes[s]);
+            const float* whdata = whptr + l * hidden_size * (hidden_size * 4);
+            const float* biasdata = biasptr + l * (hidden_size * 4);
+            const float* ln_gamma_x = ln_gammaptr + l * hidden_size * 4 * 2;
+            const float* ln_gamma_h = ln_gammaptr + l * hidden_size * 4 * 2 + hidden_size * 4;
+            const float* ln_beta_x = ln_betaptr + l * hidden_size * 4 * 2;
+            const float* ln_beta_h = ln_betaptr + l * hidden_size * 4 * 2 + hidden_size * 4;
+            float* ln_x_s = ln_in_ptr + l * seq_len * batch_size * hidden_size * 4 * 2
+                + s * batch_size * hidden_size * 4;
+            float* ln_h_s = ln_in_ptr + l * seq_len * batch_size * hidden_size * 4 * 2
+                + seq_len * batch_size * hidden_size * 4 + s * batch_size * hidden_size * 4;
+            float* ln_mean_x_s = ln_mean_ptr + l * seq_len * batch_size * 2 + s * batch_size;
+            float* ln_mean_h_s = ln_mean_ptr + l * seq_len * batch_size * 2 + seq_len * batch_size + s * batch_size;
+            float* ln_rstd_x_s = ln_rstd_ptr + l * seq_len * batch_size * 2 + s * batch_size;
+            float* ln_rstd_h_s = ln_rstd_ptr + l * seq_len * batch_size * 2 + seq_len * batch_size + s * batch_size;
+
+            // xbuf of timestep s is reused by the layers one after another, hbuf is per layer
+            float* xbufdata = xbufptr + s * batch_size * (hidden_size * 4);
+            float* hbufdata = hbufptr + l * batch_size * (hidden_size * 4);
             const float* prehdata = (s == 0 ? (h0ptr + l * batch_size * hidden_size)
                     : (hnptr + (s - 1) * num_layers * batch_size * hidden_size + l * batch_size * hidden_size));
             const float* precdata = (s == 0 ? (c0ptr + l * batch_size * hidden_size)
@@ -138,57 +149,76 @@ void LstmForward(
             float* cdata = cnptr + s * num_layers * batch_size * hidden_size + l * batch_size * hidden_size;
             float* ifogdata = ifogptr + l * seq_len * batch_size * hidden_size * 4 + s * batch_size * hidden_size * 4;
             float* outputdata = outputptr + l * seq_len * batch_size * hidden_size + s * batch_size * hidden_size;
-            float* ln_h_s = ln_h + s * batch_size * hidden_size * 4;
-            float* ln_mean_h_s = ln_mean_h + s * batch_size;
-            float* ln_rstd_h_s = ln_rstd_h + s * batch_size;
-
-            checkCublasErr(cublasSgemm(cublas_handle, CUBLAS_OP_N, CUBLAS_OP_N,
-                        hidden_size * 4, batch_size, hidden_size,
-                        &onedata, whdata, hidden_size * 4, prehdata, hidden_size, &zerodata, ln_h_s, hidden_size * 4));
 
-            // layernorm
-            {
-                unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
-                unsigned int grid_size = batch_size;
-                layernorm<<<grid_size, block_size>>>(
-                        hidden_size * 4, ln_h_s, ln_gamma_h, ln_beta_h, ln_mean_h_s, ln_rstd_h_s, hbufptr);
+            checkCublasErr(cublasSetStream(cublas_handle, stream));
+            if (l > 0) {
+                checkCudaErr(cudaStreamWaitEvent(stream, events[l - 1], 0));
             }
-            {
-                dim3 block_size = {DEFAULT_WARP_NUM * WARP_SIZE, 1, 1};
-                dim3 grid_size = {(hidden_size + block_size.x - 1) / block_size.x, batch_size, 1};
-                activation<<<grid_size, block_size>>>(
-                        batch_size, hidden_size, xbufdata , hbufptr, biasdata,
+            if (active < batch_size) {
+                // the finished samples keep their state and output zero
+                unsigned int frozen = (batch_size - active) * hidden_size;
+                checkCudaErr(cudaMemcpyAsync(hdata + active * hidden_size, prehdata + active * hidden_size,
+                            frozen * sizeof(float), cudaMemcpyDeviceToDevice, stream));
+                checkCudaErr(cudaMemcpyAsync(cdata + active * hidden_size, precdata + active * hidden_size,
+                            frozen * sizeof(float), cudaMemcpyDeviceToDevice, stream));
+                checkCudaErr(cudaMemsetAsync(outputdata + active * hidden_size, 0, frozen * sizeof(float), stream));
+            }
+            if (active > 0) {
+                unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
+                if (l > 0) {
+                    const float* xdata = outputptr + (l - 1) * seq_len * batch_size * hidden_size
+                        + s * batch_size * hidden_size;
+                    checkCublasErr(cublasSgemm(cublas_handle, CUBLAS_OP_N, CUBLAS_OP_N,
+                                hidden_size * 4, active, hidden_size,
+                                &onedata, wxptr + wxoffset[l], hidden_size * 4, xdata, hidden_size,
+                                &zerodata, ln_x_s, hidden_size * 4));
+                    layernorm<<<active, block_size, 0, stream>>>(
+                            hidden_size * 4, ln_x_s, ln_gamma_x, ln_beta_x, ln_mean_x_s, ln_rstd_x_s, xbufdata);
+                }
+
+                checkCublasErr(cublasSgemm(cublas_handle, CUBLAS_OP_N, CUBLAS_OP_N,
+                            hidden_size * 4, active, hidden_size,
+                            &onedata, whdata, hidden_size * 4, prehdata, hidden_size, &zerodata, ln_h_s, hidden_size * 4));
+                layernorm<<<active, block_size, 0, stream>>>(
+                        hidden_size * 4, ln_h_s, ln_gamma_h, ln_beta_h, ln_mean_h_s, ln_rstd_h_s, hbufdata);
+
+                dim3 act_block_size = {DEFAULT_WARP_NUM * WARP_SIZE, 1, 1};
+                dim3 act_grid_size = {(hidden_size + act_block_size.x - 1) / act_block_size.x, active, 1};
+                activation<<<act_grid_size, act_block_size, 0, stream>>>(
+                        active, hidden_size, xbufdata, hbufdata, biasdata,
                         prehdata, precdata, hdata, cdata, ifogdata, outputdata);
             }
-        }
 
-        // dropout
-        if (dropout_threshold > 0 && l != num_layers - 1) {
-            float* dropoutdata = outputptr + l * seq_len * batch_size * hidden_size;
-            unsigned int maskstride = seq_len * batch_size * hidden_size;
-            unsigned int* maskdata = maskptr + l * maskstride;
-            checkCurandErr(curandGenerate(gen, maskdata, maskstride));
+            // dropout of the output of this timestep, which is the input of the next layer
+            if (dropout_threshold > 0 && l != num_layers - 1) {
+                float* dropoutdata = outputptr + l * seq_len * batch_size * hidden_size;
+                unsigned int begin = s * batch_size * hidden_size;
+                unsigned int end = begin + batch_size * hidden_size;
 
-            float dropout_scale = 1. / (1. - dropout_threshold);
-            unsigned int uint_threshold = static_cast<unsigned int>(UINT_MAX * dropout_threshold);
-            unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
-            unsigned int grid_size = (maskstride + block_size - 1) / block_size;
-            dropout<<<grid_size, block_size>>>(
-                    maskstride, uint_threshold, dropout_scale, maskdata, dropoutdata);
+                float dropout_scale = 1. / (1. - dropout_threshold);
+                unsigned int uint_threshold = static_cast<unsigned int>(UINT_MAX * dropout_threshold);
+                unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
+                unsigned int grid_size = ((end + 3) / 4 - begin / 4 + block_size - 1) / block_size;
+                dropout<<<grid_size, block_size, 0, stream>>>(
+                        begin, end, uint_threshold, dropout_scale, seed, l, dropoutdata);
+            }
+            checkCudaErr(cudaEventRecord(events[l], stream));
         }
     }
 
-    // destroy handles
-    checkCublasErr(cublasDestroy(cublas_handle));
-    if (dropout_threshold > 0) {
-        checkCurandErr(curandDestroyGenerator(gen));
+    // join the streams of the layers back to the current stream, which the shared handle is bound to again
+    for (int l = 0; l < num_layers; l++) {
+        checkCudaErr(cudaStreamWaitEvent(current_stream, events[l], 0));
     }
+    checkCublasErr(cublasSetStream(cublas_handle, current_stream));
 }
 
 void LstmBackward(
     const std::vector<torch::Tensor>& inputs,
     std::vector<torch::Tensor>& outputs,
-    float dropout_threshold) {
+    float dropout_threshold,
+    int64_t seed,
+    const std::vector<int>& batch_sizes) {
 
     unsigned int index = 0;
     const torch::Tensor& x0 = inputs[index++];
@@ -204,7 +234,6 @@ void LstmBackward(
     const torch::Tensor& ln_mean = inputs[index++];
     const torch::Tensor& ln_rstd = inputs[index++];
     const torch::Tensor& ln_gamma = inputs[index++];
-    const torch::Tensor& dropout_mask = inputs[index++];
     index = 0;
     torch::Tensor& dgatebuf = outputs[index++];
     torch::Tensor& xbuf = outputs[index++];
@@ -238,7 +267,6 @@ void LstmBackward(
     const float* ln_mean_ptr = (float*)(ln_mean.data_ptr());
     const float* ln_rstd_ptr = (float*)(ln_rstd.data_ptr());
     const float* ln_gammaptr = (float*)(ln_gamma.data_ptr());
-    const unsigned int* maskptr = reinterpret_cast<unsigned int*>((int32_t*)(dropout_mask.data_ptr()));
     float* dgatebufptr = (float*)(dgatebuf.data_ptr());
     float* xbufptr = (float*)(xbuf.data_ptr());
     float* hbufptr = (float*)(hbuf.data_ptr());
@@ -280,16 +308,16 @@ void LstmBackward(
     for (int l = num_layers - 1; l >= 0; l--) {
         // dropout
         if (dropout_threshold > 0 && l != num_layers - 1) {
+            // the mask of forward is regenerated from the seed, the gradient is masked and scaled the same way
             float* dropoutdata = dyptr;
             unsigned int maskstride = seq_len * batch_size * hidden_size;
-            const unsigned int* maskdata = maskptr + l * maskstride;
 
             float dropout_scale = 1. / (1. - dropout_threshold);
             unsigned int uint_threshold = static_cast<unsigned int>(UINT_MAX * dropout_threshold);
             unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
-            unsigned int grid_size = (maskstride + block_size - 1) / block_size;
-            dropout_backward<<<grid_size, block_size>>>(
-                    maskstride, uint_threshold, dropout_scale, maskdata, dropoutdata);
+            unsigned int grid_size = ((maskstride + 3) / 4 + block_size - 1) / block_size;
+            dropout<<<grid_size, block_size>>>(
+                    0, maskstride, uint_threshold, dropout_scale, seed, l, dropoutdata);
         }
 
         // layernorm
@@ -312,6 +340,9 @@ void LstmBackward(
         float* dxlayer = (l == 0 ? dxptr : dyptr);
         const float* xlayer = (l == 0 ? x0ptr : (ymptr + (l - 1) * seq_len * batch_size * hidden_size));
         for (int s = seq_len - 1; s >= 0; s--) {
+            // the finished samples have zero gradient of their gates, their dh and dc are zero as well, since the
+            // samples get active in the reversed order and backward ignores the gradient of the final state
+            const unsigned int active = (batch_sizes.empty() ? batch_size : batch_sizes[s]);
             const float* cdata = cnptr + s * num_layers * batch_size * hidden_size + l * batch_size * hidden_size;
             const float* prehdata = (s == 0 ? (h0ptr + l * batch_size * hidden_size)
                     : (hnptr + (s - 1) * num_layers * batch_size * hidden_size + l * batch_size * hidden_size));
@@ -321,11 +352,17 @@ void LstmBackward(
             const float* dydata = dyptr + s * batch_size * hidden_size;
             const float* xdata = xlayer + s * batch_size * wxidx[l];
             float* dxdata = dxlayer + s * batch_size * wxidx[l];
+            if (active < batch_size) {
+                checkCudaErr(cudaMemsetAsync(dxdata + active * wxidx[l], 0,
+                            (batch_size - active) * wxidx[l] * sizeof(float)));
+            }
+            if (active == 0)
+                continue;
             {
                 dim3 block_size = {DEFAULT_WARP_NUM * WARP_SIZE, 1, 1};
-                dim3 grid_size = {(hidden_size + block_size.x - 1) / block_size.x, batch_size, 1};
+                dim3 grid_size = {(hidden_size + block_size.x - 1) / block_size.x, active, 1};
                 activation_backward<<<grid_size, block_size>>>(
-                        batch_size, hidden_size, dydata, cdata, precdata, ifogdata,
+                        active, hidden_size, dydata, cdata, precdata, ifogdata,
                         dgatebufptr, dhptr, dcptr, dbiasdata);
             }
 
@@ -340,7 +377,7 @@ void LstmBackward(
             const float* ln_rstd_h = ln_rstd_ptr + l * seq_len * batch_size * 2 + seq_len * batch_size + s * batch_size;
             {
                 unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
-                unsigned int grid_size = batch_size;
+                unsigned int grid_size = active;
                 // xbufptr has seq_len blocks(for fp), bp only use the first block
                 layernorm_backward<<<grid_size, block_size>>>(
                         hidden_size * 4, dgatebufptr, ln_x, ln_mean_x, ln_rstd_x, ln_gamma_x, ln_dgamma_x, ln_dbeta_x, xbufptr);
@@ -350,25 +387,25 @@ void LstmBackward(
 
             // dwx += torch.matmul(x_t, d_gate)
             checkCublasErr(cublasSgemm(cublas_handle, CUBLAS_OP_N, CUBLAS_OP_T,
-                        hidden_size * 4, wxidx[l], batch_size,
+                        hidden_size * 4, wxidx[l], active,
                         &onedata, xbufptr, hidden_size * 4, xdata, wxidx[l],
                         &onedata, dwxdata, hidden_size * 4));
 
             // dwh += torch.matmul(h_t, d_gate)
             checkCublasErr(cublasSgemm(cublas_handle, CUBLAS_OP_N, CUBLAS_OP_T,
-                        hidden_size * 4, hidden_size, batch_size,
+                        hidden_size * 4, hidden_size, active,
                         &onedata, hbufptr, hidden_size * 4, prehdata, hidden_size,
                         &onedata, dwhdata, hidden_size * 4));
 
             // dx = torch.matmul(d_gate, wx_t)
             checkCublasErr(cublasSgemm(cublas_handle, CUBLAS_OP_T, CUBLAS_OP_N,
-                        wxidx[l], batch_size, hidden_size * 4,
+                        wxidx[l], active, hidden_size * 4,
                         &onedata, wxdata, hidden_size * 4, xbufptr, hidden_size * 4,
                         &zerodata, dxdata, wxidx[l]));
 
             // dh = torch.matmul(d_gate, wh_t)
             checkCublasErr(cublasSgemm(cublas_handle, CUBLAS_OP_T, CUBLAS_OP_N,
-                        hidden_size, batch_size, hidden_size * 4,
+                        hidden_size, active, hidden_size * 4,
                         &onedata, whdata, hidden_size * 4, hbufptr, hidden_size * 4,
                         &zerodata, dhptr, hidden_size));
         }
@@ -378,6 +415,102 @@ void LstmBackward(
     checkCublasErr(cublasDestroy(cublas_handle));
 }
 
+void LstmInferenceForward(
+    const std::vector<torch::Tensor>& inputs,
+    std::vector<torch::Tensor>& outputs,
+    const std::vector<int>& batch_sizes) {
+
+    unsigned int index = 0;
+    const torch::Tensor& x0 = inputs[index++];
+    const torch::Tensor& wx = inputs[index++];
+    const torch::Tensor& wh = inputs[index++];
+    const torch::Tensor& bias = inputs[index++];
+    const torch::Tensor& ln_gamma = inputs[index++];
+    const torch::Tensor& ln_beta = inputs[index++];
+    index = 0;
+    torch::Tensor& h = outputs[index++];
+    torch::Tensor& c = outputs[index++];
+    torch::Tensor& y = outputs[index++];
+    torch::Tensor& xbuf = outputs[index++];
+    torch::Tensor& hbuf = outputs[index++];
+
+    const unsigned int seq_len = x0.size(0);
+    const unsigned int batch_size = x0.size(1);
+    const unsigned int input_size = x0.size(2);
+    const unsigned int num_layers = h.size(0);
+    const unsigned int hidden_size = h.size(2);
+
+    const float* inputptr = (float*)(x0.data_ptr());
+    const float* wxptr = (float*)(wx.data_ptr());
+    const float* whptr = (float*)(wh.data_ptr());
+    const float* biasptr = (float*)(bias.data_ptr());
+    const float* ln_gammaptr = (float*)(ln_gamma.data_ptr());
+    const float* ln_betaptr = (float*)(ln_beta.data_ptr());
+    float* hptr = (float*)(h.data_ptr());
+    float* cptr = (float*)(c.data_ptr());
+    float* yptr = (float*)(y.data_ptr());
+    float* xbufptr = (float*)(xbuf.data_ptr());
+    float* hbufptr = (float*)(hbuf.data_ptr());
+    float onedata = 1;
+    float zerodata = 0;
+
+    // the shared torch handle is already bound to the current stream, which all the launches below use
+    cublasHandle_t cublas_handle = at::cuda::getCurrentCUDABlasHandle();
+    cudaStream_t stream = at::cuda::getCurrentCUDAStream();
+
+    unsigned int wxoffset = 0;
+    for (int l = 0; l < num_layers; l++) {
+        const unsigned int in_size = (l == 0 ? input_size : hidden_size);
+        // y is the input of the layer until the projection is done, then it is overwritten by the layer's output
+        const float* xdata = (l == 0 ? inputptr : yptr);
+        const float* wxdata = wxptr + wxoffset;
+        const float* whdata = whptr + l * hidden_size * (hidden_size * 4);
+        const float* biasdata = biasptr + l * (hidden_size * 4);
+        const float* ln_gamma_x = ln_gammaptr + l * hidden_size * 4 * 2;
+        const float* ln_gamma_h = ln_gamma_x + hidden_size * 4;
+        const float* ln_beta_x = ln_betaptr + l * hidden_size * 4 * 2;
+        const float* ln_beta_h = ln_beta_x + hidden_size * 4;
+        float* hdata = hptr + l * batch_size * hidden_size;
+        float* cdata = cptr + l * batch_size * hidden_size;
+        wxoffset += in_size * hidden_size * 4;
+
+        checkCublasErr(cublasSgemm(cublas_handle, CUBLAS_OP_N, CUBLAS_OP_N,
+                    hidden_size * 4, seq_len * batch_size, in_size,
+                    &onedata, wxdata, hidden_size * 4, xdata, in_size, &zerodata, xbufptr, hidden_size * 4));
+
+        // layernorm in place, the statistics are not kept
+        unsigned int block_size = DEFAULT_WARP_NUM * WARP_SIZE;
+        layernorm<<<seq_len * batch_size, block_size, 0, stream>>>(
+                hidden_size * 4, xbufptr, ln_gamma_x, ln_beta_x, nullptr, nullptr, xbufptr);
+
+        for (int s = 0; s < seq_len; s++) {
+            // the state of the finished samples is kept in place
+            const unsigned int active = (batch_sizes.empty() ? batch_size : batch_sizes[s]);
+            const float* xbufdata = xbufptr + s * batch_size * (hidden_size * 4);
+            float* outputdata = yptr + s * batch_size * hidden_size;
+            if (active < batch_size) {
+                checkCudaErr(cudaMemsetAsync(outputdata + active * hidden_size, 0,
+                            (batch_size - active) * hidden_size * sizeof(float), stream));
+            }
+            if (active == 0)
+                continue;
+
+            checkCublasErr(cublasSgemm(cublas_handle, CUBLAS_OP_N, CUBLAS_OP_N,
+                        hidden_size * 4, active, hidden_size,
+                        &onedata, whdata, hidden_size * 4, hdata, hidden_size, &zerodata, hbufptr, hidden_size * 4));
+            layernorm<<<active, block_size, 0, stream>>>(
+                    hidden_size * 4, hbufptr, ln_gamma_h, ln_beta_h, nullptr, nullptr, hbufptr);
+            {
+                dim3 block_size = {DEFAULT_WARP_NUM * WARP_SIZE, 1, 1};
+                dim3 grid_size = {(hidden_size + block_size.x - 1) / block_size.x, active, 1};
+                activation<<<grid_size, block_size, 0, stream>>>(
+                        active, hidden_size, xbufdata, hbufptr, biasdata,
+                        hdata, cdata, hdata, cdata, nullptr, outputdata);
+            }
+        }
+    }
+}
+
 }  // namespace cuda
 }  // namespace rll
 }  // namespace hpc
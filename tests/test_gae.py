@@ -1,11 +1,10 @@
 import time
 import torch
 from hpc_rll.origin.gae import gae, gae_data
-from hpc_rll.rl_utils.gae import GAE
+from hpc_rll.rl_utils.gae import GAE, GAENorm
 from testbase import mean_relative_error, times
 
-assert torch.cuda.is_available()
-use_cuda = True
+use_cuda = torch.cuda.is_available()
 
 T = 1024
 B = 64
@@ -28,6 +27,116 @@ def gae_val():
     mre = mean_relative_error(torch.flatten(ori_adv).cpu().detach().numpy(), torch.flatten(hpc_adv).cpu().detach().numpy())
     print("gae mean_relative_error: " + str(mre))
 
+def gae_mask_val():
+    value = torch.randn(T + 1, B)
+    reward = torch.randn(T, B)
+    done = torch.rand(T, B) < 0.01
+    lengths = torch.randint(1, T + 1, (B, ))
+
+    hpc_gae = GAE(T, B)
+
+    if use_cuda:
+        value = value.cuda()
+        reward = reward.cuda()
+        done = done.cuda()
+        lengths = lengths.cuda()
+        hpc_gae = hpc_gae.cuda()
+    ori_adv = gae(gae_data(value, reward), done=done, lengths=lengths)
+    hpc_adv = hpc_gae(value, reward, done=done, lengths=lengths)
+    if use_cuda:
+        torch.cuda.synchronize()
+
+    mre = mean_relative_error(torch.flatten(ori_adv).cpu().detach().numpy(), torch.flatten(hpc_adv).cpu().detach().numpy())
+    print("gae with done and lengths mean_relative_error: " + str(mre))
+
+def gae_norm_val():
+    value = torch.randn(T + 1, B)
+    reward = torch.randn(T, B)
+    lengths = torch.randint(1, T + 1, (B, ))
+    eps = 1e-8
+
+    hpc_gae_norm = GAENorm(T, B)
+
+    if use_cuda:
+        value = value.cuda()
+        reward = reward.cuda()
+        lengths = lengths.cuda()
+        hpc_gae_norm = hpc_gae_norm.cuda()
+    ori_adv = gae(gae_data(value, reward), lengths=lengths)
+    mask = torch.arange(T, device=value.device).unsqueeze(1) < lengths.unsqueeze(0)
+    ori_return = (ori_adv + value[:-1]) * mask
+    valid_adv = ori_adv[mask]
+    ori_norm_adv = (ori_adv - valid_adv.mean()) / (valid_adv.std() + eps) * mask
+    hpc_adv, hpc_return, hpc_norm_adv = hpc_gae_norm(value, reward, lengths=lengths, eps=eps)
+    if use_cuda:
+        torch.cuda.synchronize()
+
+    mre = mean_relative_error(torch.flatten(ori_return).cpu().detach().numpy(), torch.flatten(hpc_return).cpu().detach().numpy())
+    print("gae return mean_relative_error: " + str(mre))
+    mre = mean_relative_error(torch.flatten(ori_norm_adv).cpu().detach().numpy(), torch.flatten(hpc_norm_adv).cpu().detach().numpy())
+    print("gae normalized advantage mean_relative_error: " + str(mre))
+
+def gae_dynamic_shape_val():
+    # one module serves all the batch sizes, the workspace grows and is reused by smaller batches
+    hpc_gae = GAE(T, B)
+    for batch_size in [B, B // 2, B * 2, B // 4]:
+        value = torch.randn(T + 1, batch_size)
+        reward = torch.randn(T, batch_size)
+        if use_cuda:
+            value = value.cuda()
+            reward = reward.cuda()
+        ori_adv = gae(gae_data(value, reward))
+        hpc_adv = hpc_gae(value, reward)
+        if use_cuda:
+            torch.cuda.synchronize()
+
+        mre = mean_relative_error(torch.flatten(ori_adv).cpu().detach().numpy(), torch.flatten(hpc_adv).cpu().detach().numpy())
+        print("gae batch size {} mean_relative_error: {}".format(batch_size, mre))
+    print("gae workspace bytes: {}".format(hpc_gae.workspace.nbytes()))
+
+def gae_mixed_precision_val():
+    # half and bfloat16 inputs keep their dtype, the estimator is accumulated in float
+    value = torch.randn(T + 1, B)
+    reward = torch.randn(T, B)
+    done = torch.rand(T, B) < 0.01
+    if use_cuda:
+        value = value.cuda()
+        reward = reward.cuda()
+        done = done.cuda()
+    hpc_gae = GAE(T, B)
+    for dtype in [torch.float16, torch.bfloat16]:
+        low_value = value.to(dtype)
+        low_reward = reward.to(dtype)
+        ori_adv = gae(gae_data(low_value.float(), low_reward.float()), done=done)
+        hpc_adv = hpc_gae(low_value, low_reward, done=done)
+        if use_cuda:
+            torch.cuda.synchronize()
+        assert hpc_adv.dtype == dtype
+
+        mre = mean_relative_error(torch.flatten(ori_adv).cpu().detach().numpy(), torch.flatten(hpc_adv.float()).cpu().detach().numpy())
+        print("gae {} mean_relative_error: {}".format(dtype, mre))
+
+def gae_precision_val():
+    # long horizon with little discount, the error of the fp32 recursion grows with T,
+    # the float64 reference is the original gae on double inputs, gamma is rounded to float as in the kernels
+    long_T = T * 8
+    gamma = torch.tensor(0.999).item()
+    value = torch.randn(long_T + 1, B)
+    reward = torch.randn(long_T, B)
+    if use_cuda:
+        value = value.cuda()
+        reward = reward.cuda()
+    ref_adv = gae(gae_data(value.double(), reward.double()), gamma, 1.0)
+    for precision in ['float', 'kahan', 'double']:
+        hpc_gae = GAE(long_T, B, precision=precision)
+        hpc_adv = hpc_gae(value, reward, gamma, 1.0)
+        if use_cuda:
+            torch.cuda.synchronize()
+        assert hpc_adv.dtype == torch.float32
+
+        max_err = (hpc_adv.double() - ref_adv).abs().max().item()
+        print("gae precision {} max_abs_error: {}".format(precision, max_err))
+
 def gae_perf():
     value = torch.randn(T + 1, B)
     reward = torch.randn(T, B)
@@ -51,10 +160,32 @@ def gae_perf():
             torch.cuda.synchronize()
         print('epoch: {}, hpc gae cost time: {}'.format(i, time.time() - t))
 
+def gae_precision_perf():
+    # cost of the compensated and float64 accumulation against the plain fp32 recursion
+    value = torch.randn(T + 1, B)
+    reward = torch.randn(T, B)
+    if use_cuda:
+        value = value.cuda()
+        reward = reward.cuda()
+    for precision in ['float', 'kahan', 'double']:
+        hpc_gae = GAE(T, B, precision=precision)
+        for i in range(times):
+            t = time.time()
+            hpc_adv = hpc_gae(value, reward)
+            if use_cuda:
+                torch.cuda.synchronize()
+            print('epoch: {}, hpc gae precision {} cost time: {}'.format(i, precision, time.time() - t))
+
 
 if __name__ == '__main__':
     print("target problem: T = {}, B = {}".format(T, B))
     print("================run gae validation test================")
     gae_val()
+    gae_mask_val()
+    gae_norm_val()
+    gae_dynamic_shape_val()
+    gae_mixed_precision_val()
+    gae_precision_val()
     print("================run gae performance test================")
     gae_perf()
+    gae_precision_perf()
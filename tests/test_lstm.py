@@ -4,8 +4,7 @@ from hpc_rll.origin.rnn import get_lstm
 from hpc_rll.torch_utils.network.rnn import LSTM
 from testbase import mean_relative_error, times
 
-assert torch.cuda.is_available()
-use_cuda = True
+use_cuda = torch.cuda.is_available()
 
 seq_len = 64
 batch_size = 3
@@ -15,11 +14,19 @@ num_layers = 3
 norm_type = 'LN'
 dropout = 0#0.1
 
-# Note: need open load_params for hpc_lstm to validation
+def copy_params(ori_lstm, hpc_lstm):
+    hpc_lstm.wx.data.copy_(torch.cat([torch.flatten(w) for w in ori_lstm.wx]))
+    hpc_lstm.wh.data.copy_(torch.cat([torch.flatten(w) for w in ori_lstm.wh]))
+    hpc_lstm.bias.data.copy_(torch.flatten(ori_lstm.bias))
+    for l in range(num_layers):
+        hpc_lstm.ln_gamma.data[l].copy_(torch.cat((ori_lstm.norm[l * 2].weight, ori_lstm.norm[l * 2 + 1].weight)))
+        hpc_lstm.ln_beta.data[l].copy_(torch.cat((ori_lstm.norm[l * 2].bias, ori_lstm.norm[l * 2 + 1].bias)))
+
 # Note: only used to case of num_layers = 3
 def lstm_val():
     ori_lstm = get_lstm('normal', input_size, hidden_size, num_layers, norm_type, dropout)
     hpc_lstm = LSTM(seq_len, batch_size, input_size, hidden_size, num_layers, norm_type, dropout)
+    copy_params(ori_lstm, hpc_lstm)
 
     ori_x = torch.randn(seq_len, batch_size, input_size)
     ori_h0 = torch.randn(num_layers, batch_size, hidden_size)
@@ -44,7 +51,8 @@ def lstm_val():
     hpc_output, hpc_next_state = hpc_lstm(hpc_x, [hpc_h0, hpc_c0])
     hpc_loss = hpc_output.mean()
     hpc_loss.backward()
-    torch.cuda.synchronize()
+    if use_cuda:
+        torch.cuda.synchronize()
 
     mre = mean_relative_error(torch.flatten(ori_loss).cpu().detach().numpy(), torch.flatten(hpc_loss).cpu().detach().numpy())
     print("lstm fp mean_relative_error: " + str(mre))
@@ -88,6 +96,138 @@ def lstm_val():
     mre = mean_relative_error(torch.flatten(ori_beta_grad).cpu().numpy(), torch.flatten(hpc_beta_grad).cpu().numpy())
     print("ln beta grad mean_relative_error: " + str(mre))
 
+def lstm_dropout_val():
+    hpc_lstm = LSTM(seq_len, batch_size, input_size, hidden_size, num_layers, norm_type, 0.1)
+    x = torch.randn(seq_len, batch_size, input_size)
+    if use_cuda:
+        x = x.cuda()
+        hpc_lstm = hpc_lstm.cuda()
+    x.requires_grad_(True)
+
+    # the dropout masks only depend on the seed, so the same seed gives the same output and gradient
+    results = []
+    for _ in range(2):
+        torch.manual_seed(0)
+        output, _ = hpc_lstm(x, None)
+        output.mean().backward()
+        results.append((output.detach().clone(), x.grad.clone(), hpc_lstm.wx.grad.clone()))
+        x.grad = None
+        hpc_lstm.zero_grad()
+    for a, b in zip(*results):
+        assert torch.equal(a, b)
+    hpc_lstm.eval()
+    output, _ = hpc_lstm(x, None)
+    assert not torch.equal(output, results[0][0])
+    print("lstm dropout reproducible")
+
+def lstm_inference_val():
+    hpc_lstm = LSTM(seq_len, batch_size, input_size, hidden_size, num_layers, norm_type, dropout)
+    x = torch.randn(seq_len, batch_size, input_size)
+    h0 = torch.randn(num_layers, batch_size, hidden_size)
+    c0 = torch.randn(num_layers, batch_size, hidden_size)
+    if use_cuda:
+        x = x.cuda()
+        h0 = h0.cuda()
+        c0 = c0.cuda()
+        hpc_lstm = hpc_lstm.cuda()
+
+    train_y, (train_h, train_c) = hpc_lstm(x, [h0, c0])
+    train_y, train_h, train_c = train_y.detach().clone(), train_h.detach().clone(), train_c.detach().clone()
+    with torch.no_grad():
+        y, (h, c) = hpc_lstm(x, [h0, c0])
+    assert y.grad_fn is None
+    assert torch.allclose(y, train_y, atol=1e-5)
+    assert torch.allclose(h, train_h, atol=1e-5)
+    assert torch.allclose(c, train_c, atol=1e-5)
+
+    # step the sequence one timestep each call, the first two samples start a new episode at timestep 2
+    done = torch.zeros(batch_size, dtype=torch.bool, device=x.device)
+    done[:2] = True
+    hpc_lstm.reset_state(batch_size, x.device)
+    hpc_lstm.state[0].copy_(h0)
+    hpc_lstm.state[1].copy_(c0)
+    outputs = []
+    for s in range(seq_len):
+        outputs.append(hpc_lstm.step(x[s], done if s == 2 else None).clone())
+    step_y = torch.stack(outputs)
+    # the gemms of a single timestep round differently, the error accumulates along the sequence
+    assert not torch.allclose(step_y, train_y, atol=1e-3)
+    assert torch.allclose(step_y[:2], train_y[:2], atol=1e-3)
+    assert torch.allclose(step_y[2:, 2:], train_y[2:, 2:], atol=1e-3)
+    with torch.no_grad():
+        reset_y, _ = hpc_lstm(x[2:, :2].contiguous(), None)
+    assert torch.allclose(step_y[2:, :2], reset_y, atol=1e-3)
+    print("lstm inference and step match training forward")
+
+def lstm_lengths_val():
+    hpc_lstm = LSTM(seq_len, batch_size, input_size, hidden_size, num_layers, norm_type, dropout)
+    # not sorted, and the padding is skipped
+    lengths = [seq_len // 2, seq_len, 5][:batch_size]
+    x = torch.randn(seq_len, batch_size, input_size)
+    h0 = torch.randn(num_layers, batch_size, hidden_size)
+    c0 = torch.randn(num_layers, batch_size, hidden_size)
+    weight = torch.randn(seq_len, batch_size, hidden_size)
+    if use_cuda:
+        x = x.cuda()
+        h0 = h0.cuda()
+        c0 = c0.cuda()
+        weight = weight.cuda()
+        hpc_lstm = hpc_lstm.cuda()
+    params = [hpc_lstm.wx, hpc_lstm.wh, hpc_lstm.bias, hpc_lstm.ln_gamma, hpc_lstm.ln_beta]
+
+    # each sequence alone with its own length, the gemms of batch 1 round differently
+    ref_x = x.clone().requires_grad_(True)
+    ref_y, ref_h, ref_c = [], [], []
+    for b, length in enumerate(lengths):
+        y, (h, c) = hpc_lstm(ref_x[:length, b:b + 1], [h0[:, b:b + 1], c0[:, b:b + 1]])
+        (y * weight[:length, b:b + 1]).sum().backward()
+        ref_y.append(y.detach().clone())
+        ref_h.append(h.detach().clone())
+        ref_c.append(c.detach().clone())
+    ref_grads = [p.grad.clone() for p in params]
+    hpc_lstm.zero_grad()
+
+    x.requires_grad_(True)
+    y, (h, c) = hpc_lstm(x, [h0, c0], lengths)
+    (y * weight).sum().backward()
+    for b, length in enumerate(lengths):
+        assert torch.allclose(y[:length, b:b + 1], ref_y[b], atol=1e-3)
+        assert torch.all(y[length:, b] == 0)
+        assert torch.allclose(h[:, b:b + 1], ref_h[b], atol=1e-3)
+        assert torch.allclose(c[:, b:b + 1], ref_c[b], atol=1e-3)
+        assert torch.all(x.grad[length:, b] == 0)
+    # the gradients are sums over long sequences, so the error is relative to their scale
+    for grad, ref_grad in zip([x.grad] + [p.grad for p in params], [ref_x.grad] + ref_grads):
+        assert (grad - ref_grad).abs().max() <= 1e-3 * ref_grad.abs().max()
+
+    with torch.no_grad():
+        inference_y, (inference_h, _) = hpc_lstm(x, [h0, c0], lengths)
+    assert torch.allclose(inference_y, y, atol=1e-3)
+    assert torch.allclose(inference_h, h, atol=1e-3)
+    print("lstm with lengths matches the sequences run alone")
+
+def lstm_wavefront_val():
+    if use_cuda:
+        # the layers always run as a wavefront on their own streams on cuda
+        return
+    # the cpu backend runs the layers one by one with one thread, and as a wavefront with several threads
+    hpc_lstm = LSTM(seq_len, batch_size, input_size, hidden_size, num_layers, norm_type, 0.1)
+    x = torch.randn(seq_len, batch_size, input_size, requires_grad=True)
+    num_threads = torch.get_num_threads()
+    results = []
+    for threads in [1, 3]:
+        torch.set_num_threads(threads)
+        torch.manual_seed(0)
+        output, (h, c) = hpc_lstm(x, None)
+        output.mean().backward()
+        results.append((output.detach().clone(), h.detach().clone(), x.grad.clone(), hpc_lstm.wx.grad.clone()))
+        x.grad = None
+        hpc_lstm.zero_grad()
+    torch.set_num_threads(num_threads)
+    for a, b in zip(*results):
+        assert torch.allclose(a, b, rtol=1e-4, atol=1e-5)
+    print("lstm wavefront matches layer by layer")
+
 def lstm_perf():
     ori_lstm = get_lstm('normal', input_size, hidden_size, num_layers, norm_type, dropout)
     hpc_lstm = LSTM(seq_len, batch_size, input_size, hidden_size, num_layers, norm_type, dropout)
@@ -118,8 +258,11 @@ def lstm_perf():
 if __name__ == '__main__':
     print("target problem: seq_len = {}, batch_size = {}, input_size = {}, hidden_size = {}, num_layers = {}, norm_type = {}, dropout = {}".format(
         seq_len, batch_size, input_size, hidden_size, num_layers, norm_type, dropout))
-    print("==============lstm has no validation test================")
-    #print("===============run lstm validation test==================")
-    #lstm_val()
+    print("===============run lstm validation test==================")
+    lstm_val()
+    lstm_dropout_val()
+    lstm_inference_val()
+    lstm_lengths_val()
+    lstm_wavefront_val()
     print("===============run lstm performance test=================")
     lstm_perf()
@@ -15,9 +15,8 @@ cuda = torch.cuda.is_available()
 
 
 def test_padding_1D(times=5, scheme={'naive': [Padding1D, UnPadding1D]}):
-    if cuda:
-        import hpc_rll.rl_utils.padding as H
-        scheme['hpc'] = [H.Padding1D, H.UnPadding1D]
+    import hpc_rll.rl_utils.padding as H
+    scheme['hpc'] = [H.Padding1D, H.UnPadding1D]
     # warm up
     for _ in range(10):
         tmp = torch.randn(128, 128)
@@ -32,7 +31,6 @@ def test_padding_1D(times=5, scheme={'naive': [Padding1D, UnPadding1D]}):
     assert len(data) == B
     max_shape = [max(t) for t in list(zip(*shapes))]
     for name, [pad, unpad] in scheme.items():
-        if name == 'hpc': assert cuda
         # with torch.profiler.profile(
         #     schedule=torch.profiler.schedule(wait=2, warmup=2, active=6, repeat=1),
         #     on_trace_ready=torch.profiler.tensorboard_trace_handler(
@@ -58,9 +56,7 @@ def test_padding_1D(times=5, scheme={'naive': [Padding1D, UnPadding1D]}):
     print("test_padding_1D OK")
     
     for name, [pad, unpad] in scheme.items():
-        if name == 'hpc':
-            assert cuda
-        for mode in ['sample', 'oracle']:
+        for mode in ['sample', 'oracle'] + (['quantile', 'fast_oracle'] if name == 'hpc' else []):
             # start_time = time.time()
             # with torch.profiler.profile(
             # schedule=torch.profiler.schedule(wait=2, warmup=2, active=6, repeat=1),
@@ -101,9 +97,8 @@ def test_padding_1D(times=5, scheme={'naive': [Padding1D, UnPadding1D]}):
 
 
 def test_padding_2D(times=5, scheme={'naive': [Padding2D, UnPadding2D]}):
-    if cuda:
-        import hpc_rll.rl_utils.padding as H
-        scheme['hpc'] = [H.Padding2D, H.UnPadding2D]
+    import hpc_rll.rl_utils.padding as H
+    scheme['hpc'] = [H.Padding2D, H.UnPadding2D]
     for _ in range(10):
         tmp = torch.randn(128, 128)
         if cuda:
@@ -120,7 +115,6 @@ def test_padding_2D(times=5, scheme={'naive': [Padding2D, UnPadding2D]}):
     max_shape = [max(t) for t in list(zip(*shapes))]
 
     for name, [pad, unpad] in scheme.items():
-        if name == 'hpc': assert cuda
         for i in range(times):
             t = time.time()
             padding_data, padding_mask, ori_shapes = pad(data)
@@ -134,10 +128,9 @@ def test_padding_2D(times=5, scheme={'naive': [Padding2D, UnPadding2D]}):
     print("test_padding_2D OK")
     
     for name, [pad, unpad] in scheme.items():
-        if name == 'hpc':
-            assert cuda
-        else: continue
-        for mode in ['sample', 'oracle']:
+        if name != 'hpc':
+            continue
+        for mode in ['sample', 'quantile', 'oracle']:
             for i in range(times):
                 t = time.time()
                 padding_data, padding_mask, ori_shapes = pad(data, group=4, group_mode=mode)
@@ -163,9 +156,8 @@ def test_padding_2D(times=5, scheme={'naive': [Padding2D, UnPadding2D]}):
 
 
 def test_padding_3D(times=5, scheme={'naive': [Padding3D, UnPadding3D]}):
-    if cuda:
-        import hpc_rll.rl_utils.padding as H
-        scheme['hpc'] = [H.Padding3D, H.UnPadding3D]
+    import hpc_rll.rl_utils.padding as H
+    scheme['hpc'] = [H.Padding3D, H.UnPadding3D]
     for _ in range(10):
         tmp = torch.randn(128, 128)
         if cuda:
@@ -183,7 +175,6 @@ def test_padding_3D(times=5, scheme={'naive': [Padding3D, UnPadding3D]}):
     assert len(data) == B
     max_shape = [max(t) for t in list(zip(*shapes))]
     for name, [pad, unpad] in scheme.items():
-        if name == 'hpc': assert cuda
         for i in range(times):
             t = time.time()
             padding_data, padding_mask, ori_shapes = pad(data)
@@ -199,10 +190,9 @@ def test_padding_3D(times=5, scheme={'naive': [Padding3D, UnPadding3D]}):
     print("test_padding_3D OK")
     
     for name, [pad, unpad] in scheme.items():
-        if name == 'hpc':
-            assert cuda
-        else: continue
-        for mode in ['sample', 'oracle']:
+        if name != 'hpc':
+            continue
+        for mode in ['sample', 'quantile', 'oracle']:
             for i in range(times):
                 t = time.time()
                 padding_data, padding_mask, ori_shapes = pad(data, group=4, group_mode=mode)
@@ -227,7 +217,115 @@ def test_padding_3D(times=5, scheme={'naive': [Padding3D, UnPadding3D]}):
         print("{} test_padding_3D same data group OK".format(name))
 
 
+def test_split_group_cost(n=1000, group=8):
+    import hpc_rll.rl_utils.padding as H
+    data = [torch.empty(np.random.randint(range_1D[0], range_1D[1])) for _ in range(n)]
+    data = sorted(data, key=lambda t: t.shape[0])
+    costs = {}
+    for mode in ['oracle', 'fast_oracle']:
+        t = time.time()
+        res = getattr(H.rl_utils_backend(data[0]), mode + '_split_group')(data, group)
+        print('1D {} n={} cost time: {}'.format(mode, n, time.time() - t))
+        group_shape, group_idx = res[:-1], res[-1]
+        assert len(group_shape) == group and group_idx[0] == 0 and group_idx[-1] == n
+        costs[mode] = sum([(group_idx[i + 1] - group_idx[i]) * s[0] for i, s in enumerate(group_shape)])
+    assert costs['oracle'] == costs['fast_oracle'], costs
+    # fast_oracle is not optimal for 2D/3D inputs, so it is rejected
+    for pad, ranges in [(H.Padding2D, range_2D), (H.Padding3D, range_3D)]:
+        data = [torch.randn(*[np.random.randint(r[0], r[1]) for r in ranges]) for _ in range(B)]
+        try:
+            pad(data, group=4, group_mode='fast_oracle')
+            assert False, 'fast_oracle should be rejected by {}'.format(pad.__name__)
+        except AssertionError as e:
+            assert 'fast_oracle only supports 1D' in str(e), e
+        try:
+            H.rl_utils_backend(data[0]).fast_oracle_split_group(data, 4)
+            assert False, 'fast_oracle_split_group should reject {}D inputs'.format(len(ranges))
+        except RuntimeError as e:
+            assert 'only supports 1D' in str(e), e
+    print("test_split_group_cost OK")
+
+
+def test_split_group_deterministic():
+    import hpc_rll.rl_utils.padding as H
+    data = [torch.randn(np.random.randint(range_1D[0], range_1D[1])) for _ in range(B)]
+    if cuda:
+        data = [d.cuda() for d in data]
+    for mode in ['sample', 'quantile']:
+        results = []
+        for _ in range(2):
+            padding_data, _, _ = H.Padding1D(data, group=4, group_mode=mode, generator=torch.Generator().manual_seed(0))
+            results.append([t.shape for t in padding_data])
+        assert results[0] == results[1], results
+    # less inputs than groups
+    for n in [1, 2]:
+        for mode in ['sample', 'quantile']:
+            padding_data, _, ori_shapes = H.Padding1D(data[:n], group=4, group_mode=mode)
+            assert sum([len(t) for t in padding_data]) == n
+            unpadding_data = H.UnPadding1D(padding_data, ori_shapes)
+            sorted_data = sorted(data[:n], key=lambda t: t.shape[0])
+            for item, new_item in zip(sorted_data, unpadding_data):
+                assert item.eq(new_item).all()
+    print("test_split_group_deterministic OK")
+
+
+def test_padding_ragged(times=5):
+    import hpc_rll.rl_utils.padding as H
+    devices = ['cpu', 'cuda'] if cuda else ['cpu']
+    cases = [
+        (Padding1D, UnPadding1D, H.Padding1D, H.UnPadding1D, [range_1D]),
+        (Padding2D, UnPadding2D, H.Padding2D, H.UnPadding2D, range_2D),
+        (Padding3D, UnPadding3D, H.Padding3D, H.UnPadding3D, range_3D),
+    ]
+    for origin_pad, origin_unpad, pad, unpad, ranges in cases:
+        shapes = [tuple(np.random.randint(r[0], r[1]) for r in ranges) for _ in range(B)]
+        data = [torch.randn(*s) for s in shapes]
+        origin_data, origin_mask, _ = origin_pad(data)
+        for device in devices:
+            ragged = H.to_ragged([d.to(device) for d in data])
+            for i in range(times):
+                t = time.time()
+                padding_data, padding_mask, ori_shapes = pad(ragged)
+                unpadding_data = unpad(padding_data, ori_shapes)
+                if device == 'cuda': torch.cuda.synchronize()
+                print('epoch: {}, ragged {}D {} cost time: {}'.format(i, len(ranges), device, time.time() - t))
+                assert padding_data.cpu().eq(origin_data).all()
+                assert padding_mask.cpu().eq(origin_mask).all()
+                # unpadding result is one buffer, each tensor is a view of it
+                assert unpadding_data.values.eq(ragged.values).all()
+                views = H.ragged_views(unpadding_data)
+                for item, new_item in zip(data, views):
+                    assert new_item.data_ptr() >= unpadding_data.values.data_ptr()
+                    assert item.eq(new_item.cpu()).all()
+            # non-contiguous values and padded inputs give the same results
+            buf = ragged.values.new_zeros(ragged.values.numel() * 2)
+            buf[::2] = ragged.values
+            padding_data, padding_mask, ori_shapes = pad(H.hpc_ragged(buf[::2], ragged.offsets, ragged.shapes))
+            assert padding_data.cpu().eq(origin_data).all()
+            assert padding_mask.cpu().eq(origin_mask).all()
+            padding_nc = padding_data.new_zeros(*padding_data.shape[:-1], padding_data.shape[-1] * 2)[..., ::2]
+            padding_nc.copy_(padding_data)
+            assert not padding_nc.is_contiguous()
+            unpadding_data = unpad(padding_nc, ori_shapes)
+            assert unpadding_data.values.eq(ragged.values).all()
+            # offsets which do not match the shapes or run past the values are rejected before any copy
+            bad_offsets = ragged.offsets.clone()
+            bad_offsets[1] += 1
+            short_values = ragged.values[:-1]
+            for bad in [H.hpc_ragged(ragged.values, bad_offsets, ragged.shapes),
+                        H.hpc_ragged(short_values, ragged.offsets, ragged.shapes)]:
+                try:
+                    pad(bad)
+                    assert False, 'bad ragged layout should be rejected'
+                except RuntimeError:
+                    pass
+        print("test_padding_ragged {}D OK".format(len(ranges)))
+
+
 if __name__ == "__main__":
     #test_padding_1D()
     #test_padding_2D()
     test_padding_3D()
+    test_padding_ragged()
+    test_split_group_cost()
+    test_split_group_deterministic()
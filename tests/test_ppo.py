@@ -1,15 +1,17 @@
 import time
 import torch
 import torch.nn.functional as F
-from hpc_rll.origin.ppo import ppo_error, ppo_data
-from hpc_rll.rl_utils.ppo import PPO
+from hpc_rll.origin.ppo import ppo_error, ppo_data, ppo_error_continuous, ppo_data_continuous
+from hpc_rll.rl_utils.ppo import PPO, PPOContinuous, PPOInfoAccumulator
+from hpc_rll.workspace import WorkspaceArena
 from testbase import mean_relative_error, times
 
-assert torch.cuda.is_available()
-use_cuda = True
+use_cuda = torch.cuda.is_available()
 
 B = 128
 N = 128
+A = 8 # action dim of the gaussian policy
+HEADS = [3, 5, 16, 40, 64] # multi-discrete action space, sum(HEADS) == N
 clip_ratio = 0.2
 use_value_clip = True
 dual_clip = None
@@ -76,6 +78,203 @@ def ppo_val():
     print("ppo bp value_new mean_relative_error: " + str(mre))
 
 
+def ppo_arena_val():
+    # two modules share one arena, the second forward reuses the scratch buffers given back by the first backward
+    arena = WorkspaceArena()
+    hpc_ppos = [PPO(B, N, arena=arena), PPO(B // 2, N, arena=arena)]
+    for hpc_ppo in hpc_ppos:
+        for batch_size in [B, B // 2]:
+            logits_new = torch.randn(batch_size, N)
+            logits_old = torch.randn(batch_size, N)
+            action = torch.randint(0, N, size=(batch_size, ))
+            value_new = torch.randn(batch_size)
+            value_old = torch.randn(batch_size)
+            adv = torch.randn(batch_size)
+            return_ = torch.randn(batch_size)
+            if use_cuda:
+                logits_new = logits_new.cuda()
+                logits_old = logits_old.cuda()
+                action = action.cuda()
+                value_new = value_new.cuda()
+                value_old = value_old.cuda()
+                adv = adv.cuda()
+                return_ = return_.cuda()
+            ori_logits_new = logits_new.clone().requires_grad_(True)
+            hpc_logits_new = logits_new.clone().requires_grad_(True)
+
+            ori_loss, _ = ppo_error(ppo_data(ori_logits_new, logits_old, action, value_new, value_old, adv, return_, None), clip_ratio, use_value_clip, dual_clip)
+            ori_loss = sum(ori_loss)
+            ori_loss.backward()
+            hpc_loss, _ = hpc_ppo(hpc_logits_new, logits_old, action, value_new, value_old, adv, return_, None, clip_ratio, use_value_clip, dual_clip)
+            hpc_loss = sum(hpc_loss)
+            hpc_loss.backward()
+            if use_cuda:
+                torch.cuda.synchronize()
+
+            mre = mean_relative_error(torch.flatten(ori_logits_new.grad).cpu().detach().numpy(), torch.flatten(hpc_logits_new.grad).cpu().detach().numpy())
+            print("ppo arena batch size {} bp logits_new mean_relative_error: {}".format(batch_size, mre))
+    print("ppo arena free bytes: {}".format(arena.nbytes()))
+
+def ppo_mixed_precision_val():
+    # the (B, N) logits and their grad keep the dtype, the losses are accumulated in float
+    logits_new = torch.randn(B, N)
+    logits_old = torch.randn(B, N)
+    action = torch.randint(0, N, size=(B, ))
+    value_new = torch.randn(B)
+    value_old = torch.randn(B)
+    adv = torch.randn(B)
+    return_ = torch.randn(B)
+    if use_cuda:
+        logits_new = logits_new.cuda()
+        logits_old = logits_old.cuda()
+        action = action.cuda()
+        value_new = value_new.cuda()
+        value_old = value_old.cuda()
+        adv = adv.cuda()
+        return_ = return_.cuda()
+    hpc_ppo = PPO(B, N)
+    for dtype in [torch.float16, torch.bfloat16]:
+        ori_logits_new = logits_new.to(dtype).float().requires_grad_(True)
+        hpc_logits_new = logits_new.to(dtype).requires_grad_(True)
+        ori_loss, _ = ppo_error(ppo_data(ori_logits_new, logits_old.to(dtype).float(), action, value_new, value_old, adv, return_, None), clip_ratio, use_value_clip, dual_clip)
+        ori_loss = sum(ori_loss)
+        ori_loss.backward()
+        hpc_loss, _ = hpc_ppo(hpc_logits_new, logits_old.to(dtype), action, value_new, value_old, adv, return_, None, clip_ratio, use_value_clip, dual_clip)
+        hpc_loss = sum(hpc_loss)
+        hpc_loss.backward()
+        if use_cuda:
+            torch.cuda.synchronize()
+        assert hpc_logits_new.grad.dtype == dtype
+
+        mre = mean_relative_error(torch.flatten(ori_loss).cpu().detach().numpy(), torch.flatten(hpc_loss).cpu().detach().numpy())
+        print("ppo {} fp loss mean_relative_error: {}".format(dtype, mre))
+        mre = mean_relative_error(torch.flatten(ori_logits_new.grad).cpu().detach().numpy(), torch.flatten(hpc_logits_new.grad.float()).cpu().detach().numpy())
+        print("ppo {} bp logits_new mean_relative_error: {}".format(dtype, mre))
+
+def ppo_info_tensor_val():
+    # the info stays on the device for every minibatch, and the running mean is read once at the end
+    hpc_ppo = PPO(B, N, info_tensor=True)
+    accumulator = PPOInfoAccumulator()
+    ori_approx_kl, ori_clipfrac = [], []
+    for _ in range(4):
+        logits_new = torch.randn(B, N)
+        logits_old = torch.randn(B, N)
+        action = torch.randint(0, N, size=(B, ))
+        value_new = torch.randn(B)
+        value_old = torch.randn(B)
+        adv = torch.randn(B)
+        return_ = torch.randn(B)
+        weight = torch.randn(B)
+        if use_cuda:
+            logits_new, logits_old, action = logits_new.cuda(), logits_old.cuda(), action.cuda()
+            value_new, value_old, adv, return_, weight = value_new.cuda(), value_old.cuda(), adv.cuda(), return_.cuda(), weight.cuda()
+        _, ori_info = ppo_error(ppo_data(logits_new, logits_old, action, value_new, value_old, adv, return_, weight), clip_ratio, use_value_clip, dual_clip)
+        ori_approx_kl.append(ori_info.approx_kl)
+        ori_clipfrac.append(ori_info.clipfrac)
+
+        hpc_loss, hpc_info = hpc_ppo(logits_new.requires_grad_(True), logits_old, action, value_new.requires_grad_(True), value_old, adv, return_, weight, clip_ratio, use_value_clip, dual_clip)
+        assert isinstance(hpc_info.approx_kl, torch.Tensor) and hpc_info.approx_kl.device == logits_new.device
+        sum(hpc_loss).backward()
+        accumulator.update(hpc_info)
+    hpc_info = accumulator.read()
+    ori_info = (sum(ori_approx_kl) / len(ori_approx_kl), sum(ori_clipfrac) / len(ori_clipfrac))
+
+    print("ori running info: " + str(ori_info))
+    print("hpc running info: " + str(hpc_info))
+    mre = mean_relative_error(torch.tensor(ori_info).numpy(), torch.tensor(tuple(hpc_info)).numpy())
+    print("ppo running info mean_relative_error: " + str(mre))
+
+def ppo_multi_head_val():
+    logits_new = torch.randn(B, N)
+    logits_old = logits_new + 0.1 * torch.randn(B, N)
+    action = torch.stack([torch.randint(0, n, size=(B, )) for n in HEADS], dim=1)
+    value_new = torch.randn(B)
+    value_old = torch.randn(B)
+    adv = torch.randn(B)
+    return_ = torch.randn(B)
+    weight = torch.randn(B)
+    if use_cuda:
+        logits_new, logits_old, action = logits_new.cuda(), logits_old.cuda(), action.cuda()
+        value_new, value_old, adv, return_, weight = value_new.cuda(), value_old.cuda(), adv.cuda(), return_.cuda(), weight.cuda()
+    hpc_ppo = PPO(B, N, heads=HEADS)
+
+    ori_logits_new = logits_new.clone().requires_grad_(True)
+    ori_value_new = value_new.clone().requires_grad_(True)
+    ori_loss, ori_info = ppo_error(ppo_data(ori_logits_new, logits_old, action, ori_value_new, value_old, adv, return_, weight),
+            clip_ratio, use_value_clip, dual_clip, heads=HEADS)
+    ori_loss = sum(ori_loss)
+    ori_loss.backward()
+
+    hpc_logits_new = logits_new.clone().requires_grad_(True)
+    hpc_value_new = value_new.clone().requires_grad_(True)
+    # the same action in a column-major layout, which is not contiguous
+    hpc_action = action.t().contiguous().t()
+    hpc_loss, hpc_info = hpc_ppo(hpc_logits_new, logits_old, hpc_action, hpc_value_new, value_old, adv, return_, weight,
+            clip_ratio, use_value_clip, dual_clip)
+    hpc_loss = sum(hpc_loss)
+    hpc_loss.backward()
+    if use_cuda:
+        torch.cuda.synchronize()
+
+    print("ori_info: " + str(ori_info))
+    print("hpc_info: " + str(hpc_info))
+    mre = mean_relative_error(torch.flatten(ori_loss).cpu().detach().numpy(), torch.flatten(hpc_loss).cpu().detach().numpy())
+    print("ppo multi head fp loss mean_relative_error: " + str(mre))
+    mre = mean_relative_error(torch.flatten(ori_logits_new.grad).cpu().detach().numpy(), torch.flatten(hpc_logits_new.grad).cpu().detach().numpy())
+    print("ppo multi head bp logits_new mean_relative_error: " + str(mre))
+    mre = mean_relative_error(torch.flatten(ori_value_new.grad).cpu().detach().numpy(), torch.flatten(hpc_value_new.grad).cpu().detach().numpy())
+    print("ppo multi head bp value_new mean_relative_error: " + str(mre))
+
+def ppo_continuous_data():
+    mu_new = torch.randn(B, A)
+    sigma_new = torch.rand(B, A) + 0.5
+    mu_old = mu_new + 0.1 * torch.randn(B, A)
+    sigma_old = sigma_new * (1 + 0.1 * torch.rand(B, A))
+    action = mu_old + sigma_old * torch.randn(B, A)
+    value_new = torch.randn(B)
+    value_old = torch.randn(B)
+    adv = torch.randn(B)
+    return_ = torch.randn(B)
+    weight = torch.randn(B)
+    data = [mu_new, sigma_new, mu_old, sigma_old, action, value_new, value_old, adv, return_, weight]
+    if use_cuda:
+        data = [x.cuda() for x in data]
+    return data
+
+def ppo_continuous_val():
+    mu_new, sigma_new, mu_old, sigma_old, action, value_new, value_old, adv, return_, weight = ppo_continuous_data()
+    hpc_ppo = PPOContinuous(B, A)
+
+    ori_mu_new = mu_new.clone().requires_grad_(True)
+    ori_sigma_new = sigma_new.clone().requires_grad_(True)
+    ori_value_new = value_new.clone().requires_grad_(True)
+    ori_loss, ori_info = ppo_error_continuous(ppo_data_continuous({'mu': ori_mu_new, 'sigma': ori_sigma_new},
+            {'mu': mu_old, 'sigma': sigma_old}, action, ori_value_new, value_old, adv, return_, weight),
+            clip_ratio, use_value_clip, dual_clip)
+    ori_loss = sum(ori_loss)
+    ori_loss.backward()
+
+    hpc_mu_new = mu_new.clone().requires_grad_(True)
+    hpc_sigma_new = sigma_new.clone().requires_grad_(True)
+    hpc_value_new = value_new.clone().requires_grad_(True)
+    hpc_loss, hpc_info = hpc_ppo(hpc_mu_new, hpc_sigma_new, mu_old, sigma_old, action, hpc_value_new, value_old,
+            adv, return_, weight, clip_ratio, use_value_clip, dual_clip)
+    hpc_loss = sum(hpc_loss)
+    hpc_loss.backward()
+    if use_cuda:
+        torch.cuda.synchronize()
+
+    print("ori_info: " + str(ori_info))
+    print("hpc_info: " + str(hpc_info))
+    mre = mean_relative_error(torch.flatten(ori_loss).cpu().detach().numpy(), torch.flatten(hpc_loss).cpu().detach().numpy())
+    print("ppo continuous fp loss mean_relative_error: " + str(mre))
+    mre = mean_relative_error(torch.flatten(ori_mu_new.grad).cpu().detach().numpy(), torch.flatten(hpc_mu_new.grad).cpu().detach().numpy())
+    print("ppo continuous bp mu_new mean_relative_error: " + str(mre))
+    mre = mean_relative_error(torch.flatten(ori_sigma_new.grad).cpu().detach().numpy(), torch.flatten(hpc_sigma_new.grad).cpu().detach().numpy())
+    print("ppo continuous bp sigma_new mean_relative_error: " + str(mre))
+    mre = mean_relative_error(torch.flatten(ori_value_new.grad).cpu().detach().numpy(), torch.flatten(hpc_value_new.grad).cpu().detach().numpy())
+    print("ppo continuous bp value_new mean_relative_error: " + str(mre))
+
 def ppo_perf():
     ori_logits_new = torch.randn(B, N)
     ori_logits_old = torch.randn(B, N)
@@ -138,10 +337,43 @@ def ppo_perf():
             torch.cuda.synchronize()
         print('epoch: {}, hpc ppo cost time: {}'.format(i, time.time() - t))
 
+def ppo_continuous_perf():
+    mu_new, sigma_new, mu_old, sigma_old, action, value_new, value_old, adv, return_, weight = ppo_continuous_data()
+    hpc_ppo = PPOContinuous(B, A)
+    mu_new.requires_grad_(True)
+    sigma_new.requires_grad_(True)
+    value_new.requires_grad_(True)
+    for i in range(times):
+        t = time.time()
+        ori_loss, ori_info = ppo_error_continuous(ppo_data_continuous({'mu': mu_new, 'sigma': sigma_new},
+                {'mu': mu_old, 'sigma': sigma_old}, action, value_new, value_old, adv, return_, weight),
+                clip_ratio, use_value_clip, dual_clip)
+        ori_loss = sum(ori_loss)
+        ori_loss.backward()
+        if use_cuda:
+            torch.cuda.synchronize()
+        print('epoch: {}, origin ppo continuous cost time: {}'.format(i, time.time() - t))
+
+    for i in range(times):
+        t = time.time()
+        hpc_loss, hpc_info = hpc_ppo(mu_new, sigma_new, mu_old, sigma_old, action, value_new, value_old,
+                adv, return_, weight, clip_ratio, use_value_clip, dual_clip)
+        hpc_loss = sum(hpc_loss)
+        hpc_loss.backward()
+        if use_cuda:
+            torch.cuda.synchronize()
+        print('epoch: {}, hpc ppo continuous cost time: {}'.format(i, time.time() - t))
+
 
 if __name__ == '__main__':
     print("target problem: B = {}, N = {}, clip_ratio = {}, use_value_clip = {}, dual_clip = {}".format(B, N, clip_ratio, use_value_clip, dual_clip))
     print("================run ppo validation test================")
     ppo_val()
+    ppo_arena_val()
+    ppo_mixed_precision_val()
+    ppo_info_tensor_val()
+    ppo_multi_head_val()
+    ppo_continuous_val()
     print("================run ppo performance test================")
     ppo_perf()
+    ppo_continuous_perf()
@@ -1,11 +1,10 @@
 import time
 import torch
-from hpc_rll.origin.td import q_nstep_td_error, q_nstep_td_data
-from hpc_rll.rl_utils.td import QNStepTD
+from hpc_rll.origin.td import q_nstep_td_error, q_nstep_td_data, sliding_nstep_return
+from hpc_rll.rl_utils.td import QNStepTD, nstep_returns
 from testbase import mean_relative_error, times
 
-assert torch.cuda.is_available()
-use_cuda = True
+use_cuda = torch.cuda.is_available()
 
 T = 1024
 B = 64
@@ -67,6 +66,26 @@ def qntd_val():
     mre = mean_relative_error(torch.flatten(ori_q.grad).cpu().detach().numpy(), torch.flatten(hpc_q.grad).cpu().detach().numpy())
     print("qntd bp mean_relative_error: " + str(mre))
 
+def nstep_return_val():
+    # the sliding window over a (T, B) trajectory, compared with the windows gathered one by one
+    nstep = 5
+    reward = torch.randn(T, B)
+    done = torch.rand(T, B) < 0.1
+    if use_cuda:
+        reward = reward.cuda()
+        done = done.cuda()
+
+    ori_ret, ori_index, ori_discount = sliding_nstep_return(reward, done, gamma, nstep)
+    hpc_ret, hpc_index, hpc_discount = nstep_returns(reward, done, gamma, nstep)
+    if use_cuda:
+        torch.cuda.synchronize()
+
+    mre = mean_relative_error(torch.flatten(ori_ret).cpu().detach().numpy(), torch.flatten(hpc_ret).cpu().detach().numpy())
+    print("nstep return fp mean_relative_error: " + str(mre))
+    mre = mean_relative_error(torch.flatten(ori_discount).cpu().detach().numpy(), torch.flatten(hpc_discount).cpu().detach().numpy())
+    print("nstep return discount mean_relative_error: " + str(mre))
+    print("nstep return index mismatch: " + str((ori_index != hpc_index).sum().item()))
+
 def qntd_perf():
     ori_q = torch.randn(B, N)
     ori_next_n_q = torch.randn(B, N)
@@ -128,5 +147,6 @@ if __name__ == '__main__':
     print("target problem: T = {}, B = {}, N = {}, gamma = {}".format(T, B, N, gamma))
     print("================run qntd validation test================")
     qntd_val()
+    nstep_return_val()
     print("================run qntd performance test================")
     qntd_perf()
@@ -4,8 +4,7 @@ from hpc_rll.origin.td import q_nstep_td_error_with_rescale, q_nstep_td_data
 from hpc_rll.rl_utils.td import QNStepTDRescale
 from testbase import mean_relative_error, times
 
-assert torch.cuda.is_available()
-use_cuda = True
+use_cuda = torch.cuda.is_available()
 
 T = 1024
 B = 64
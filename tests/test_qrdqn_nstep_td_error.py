@@ -4,8 +4,7 @@ from hpc_rll.origin.td import qrdqn_nstep_td_error, qrdqn_nstep_td_data
 from hpc_rll.rl_utils.td import QRDQNNStepTDError
 from testbase import mean_relative_error, times
 
-assert torch.cuda.is_available()
-use_cuda = True
+use_cuda = torch.cuda.is_available()
 
 tau = 39
 T = 10
@@ -60,14 +59,16 @@ def qrdqn_val():
     if use_cuda:
         torch.cuda.synchronize()
 
-    torch.cuda.cudart().cudaProfilerStart()
+    if use_cuda:
+        torch.cuda.cudart().cudaProfilerStart()
     hpc_q.requires_grad_(True)
     hpc_loss, hpc_ = hpc_qrdqn(hpc_q, hpc_next_n_q, hpc_action, hpc_next_n_action, hpc_reward, hpc_done, gamma, hpc_weight, hpc_value_gamma)
     hpc_loss = hpc_loss.mean()
     hpc_loss.backward()
     if use_cuda:
         torch.cuda.synchronize()
-    torch.cuda.cudart().cudaProfilerStop()
+    if use_cuda:
+        torch.cuda.cudart().cudaProfilerStop()
 
     mre = mean_relative_error(torch.flatten(ori_loss).cpu().detach().numpy(), torch.flatten(hpc_loss).cpu().detach().numpy())
     print("qrdqn fp mean_relative_error: " + str(mre))
@@ -0,0 +1,88 @@
+import time
+import torch
+import torch.nn.functional as F
+from hpc_rll.origin.td import retrace_error, retrace_data
+from hpc_rll.rl_utils.td import Retrace, QLambda
+from testbase import mean_relative_error, times
+
+use_cuda = torch.cuda.is_available()
+
+T = 128
+B = 64
+N = 64
+gamma = 0.95
+lambda_ = 0.9
+
+def generate_data():
+    q = torch.randn(T, B, N)
+    target_q = torch.randn(T + 1, B, N)
+    action = torch.randint(0, N, size=(T, B))
+    reward = torch.randn(T, B)
+    done = torch.rand(T, B) < 0.05
+    target_prob = F.softmax(torch.randn(T + 1, B, N), dim=-1)
+    behaviour_prob = F.softmax(torch.randn(T, B, N), dim=-1)
+    weight = torch.rand(T, B)
+    data = [q, target_q, action, reward, done, target_prob, behaviour_prob, weight]
+    if use_cuda:
+        data = [x.cuda() for x in data]
+    return data
+
+def retrace_val():
+    q, target_q, action, reward, done, target_prob, behaviour_prob, weight = generate_data()
+    hpc_retrace = Retrace(T, B, N)
+    hpc_qlambda = QLambda(T, B, N)
+
+    for name, mu in [('retrace', behaviour_prob), ('qlambda', None)]:
+        ori_q = q.clone().requires_grad_(True)
+        ori_loss, ori_td_err = retrace_error(retrace_data(ori_q, target_q, action, reward, done, target_prob, mu, weight),
+                gamma, lambda_)
+        ori_loss.backward()
+
+        hpc_q = q.clone().requires_grad_(True)
+        if mu is None:
+            hpc_loss, hpc_td_err = hpc_qlambda(hpc_q, target_q, action, reward, target_prob, done, weight, gamma, lambda_)
+        else:
+            hpc_loss, hpc_td_err = hpc_retrace(hpc_q, target_q, action, reward, target_prob, mu, done, weight,
+                    gamma, lambda_)
+        hpc_loss.backward()
+        if use_cuda:
+            torch.cuda.synchronize()
+
+        mre = mean_relative_error(torch.flatten(ori_loss).cpu().detach().numpy(), torch.flatten(hpc_loss).cpu().detach().numpy())
+        print("{} fp mean_relative_error: {}".format(name, mre))
+        mre = mean_relative_error(torch.flatten(ori_td_err).cpu().detach().numpy(), torch.flatten(hpc_td_err).cpu().detach().numpy())
+        print("{} fp td_err mean_relative_error: {}".format(name, mre))
+        mre = mean_relative_error(torch.flatten(ori_q.grad).cpu().detach().numpy(), torch.flatten(hpc_q.grad).cpu().detach().numpy())
+        print("{} bp mean_relative_error: {}".format(name, mre))
+
+def retrace_perf():
+    q, target_q, action, reward, done, target_prob, behaviour_prob, weight = generate_data()
+    hpc_retrace = Retrace(T, B, N)
+
+    ori_q = q.clone().requires_grad_(True)
+    for i in range(times):
+        t = time.time()
+        ori_loss, _ = retrace_error(retrace_data(ori_q, target_q, action, reward, done, target_prob, behaviour_prob, weight),
+                gamma, lambda_)
+        ori_loss.backward()
+        if use_cuda:
+            torch.cuda.synchronize()
+        print('epoch: {}, original retrace cost time: {}'.format(i, time.time() - t))
+
+    hpc_q = q.clone().requires_grad_(True)
+    for i in range(times):
+        t = time.time()
+        hpc_loss, _ = hpc_retrace(hpc_q, target_q, action, reward, target_prob, behaviour_prob, done, weight,
+                gamma, lambda_)
+        hpc_loss.backward()
+        if use_cuda:
+            torch.cuda.synchronize()
+        print('epoch: {}, hpc retrace cost time: {}'.format(i, time.time() - t))
+
+
+if __name__ == '__main__':
+    print("target problem: T = {}, B = {}, N = {}".format(T, B, N))
+    print("================run retrace validation test================")
+    retrace_val()
+    print("================run retrace performance test================")
+    retrace_perf()
@@ -1,11 +1,10 @@
 import time
 import torch
-from hpc_rll.origin.td import td_lambda_error, td_lambda_data
-from hpc_rll.rl_utils.td import TDLambda
+from hpc_rll.origin.td import td_lambda_error, td_lambda_data, generalized_lambda_returns
+from hpc_rll.rl_utils.td import TDLambda, lambda_returns
 from testbase import mean_relative_error, times
 
-assert torch.cuda.is_available()
-use_cuda = True
+use_cuda = torch.cuda.is_available()
 
 T = 1024
 B = 64
@@ -49,6 +48,62 @@ def td_val():
     mre = mean_relative_error(torch.flatten(ori_value.grad).cpu().detach().numpy(), torch.flatten(hpc_value.grad).cpu().detach().numpy())
     print("td bp mean_relative_error: " + str(mre))
 
+def td_precision_val():
+    # the float64 reference is the original td lambda on double inputs, gamma and lambda are rounded to float
+    # as in the kernels
+    gamma, lambda_ = torch.tensor(0.999).item(), torch.tensor(0.99).item()
+    value = torch.randn(T + 1, B)
+    reward = torch.randn(T, B)
+    weight = torch.randn(T, B)
+    if use_cuda:
+        value = value.cuda()
+        reward = reward.cuda()
+        weight = weight.cuda()
+    ref_value = value.double().requires_grad_(True)
+    ref_loss = td_lambda_error(td_lambda_data(ref_value, reward.double(), weight.double()), gamma, lambda_)
+    ref_loss.backward()
+    for precision in ['float', 'kahan', 'double']:
+        hpc_td = TDLambda(T, B, precision=precision)
+        hpc_value = value.clone().requires_grad_(True)
+        hpc_loss = hpc_td(hpc_value, reward, weight, gamma, lambda_)
+        hpc_loss.backward()
+        if use_cuda:
+            torch.cuda.synchronize()
+
+        max_err = (hpc_value.grad.double() - ref_value.grad).abs().max().item()
+        print("td precision {} bp max_abs_error: {}".format(precision, max_err))
+
+def lambda_return_val():
+    value = torch.randn(T + 1, B)
+    reward = torch.randn(T, B)
+    gammas = 0.99 * (torch.rand(T, B) > 0.05).float()
+    lambdas = torch.rand(T, B) > 0.3
+    grad = torch.randn(T, B)
+    if use_cuda:
+        value = value.cuda()
+        reward = reward.cuda()
+        gammas = gammas.cuda()
+        lambdas = lambdas.cuda()
+        grad = grad.cuda()
+
+    for gamma, lambda_ in [(0.9, 0.8), (gammas, lambdas)]:
+        ori_value = value.clone().requires_grad_(True)
+        ori_ret = generalized_lambda_returns(ori_value, reward, gamma,
+                lambda_.float() if isinstance(lambda_, torch.Tensor) else lambda_)
+        ori_ret.backward(grad)
+
+        hpc_value = value.clone().requires_grad_(True)
+        hpc_ret = lambda_returns(hpc_value, reward, gamma, lambda_)
+        hpc_ret.backward(grad)
+        if use_cuda:
+            torch.cuda.synchronize()
+
+        name = 'tensor' if isinstance(gamma, torch.Tensor) else 'scalar'
+        mre = mean_relative_error(torch.flatten(ori_ret).cpu().detach().numpy(), torch.flatten(hpc_ret).cpu().detach().numpy())
+        print("lambda return {} fp mean_relative_error: {}".format(name, mre))
+        mre = mean_relative_error(torch.flatten(ori_value.grad).cpu().detach().numpy(), torch.flatten(hpc_value.grad).cpu().detach().numpy())
+        print("lambda return {} bp mean_relative_error: {}".format(name, mre))
+
 def td_perf():
     ori_value = torch.randn(T + 1, B)
     ori_reward = torch.randn(T, B)
@@ -94,5 +149,7 @@ if __name__ == '__main__':
     print("target problem: T = {}, B = {}".format(T, B))
     print("================run td validation test================")
     td_val()
+    lambda_return_val()
+    td_precision_val()
     print("================run td performance test================")
     td_perf()
@@ -4,8 +4,7 @@ from hpc_rll.origin.upgo import upgo_loss
 from hpc_rll.rl_utils.upgo import UPGO
 from testbase import mean_relative_error, times
 
-assert torch.cuda.is_available()
-use_cuda = True
+use_cuda = torch.cuda.is_available()
 
 T = 256
 B = 256
@@ -58,6 +57,29 @@ def upgo_val():
     mre = mean_relative_error(torch.flatten(ori_target_output.grad).cpu().detach().numpy(), torch.flatten(hpc_target_output.grad).cpu().detach().numpy())
     print("upgo bp mean_relative_error: " + str(mre))
 
+def upgo_precision_val():
+    # the float64 reference is the original upgo loss on double inputs
+    target_output = torch.randn(T, B, N)
+    rhos = torch.randn(T, B)
+    action = torch.randint(0, N, size=(T, B, ))
+    rewards = torch.randn(T, B)
+    bootstrap_values = torch.randn(T + 1, B)
+    if use_cuda:
+        target_output = target_output.cuda()
+        rhos = rhos.cuda()
+        action = action.cuda()
+        rewards = rewards.cuda()
+        bootstrap_values = bootstrap_values.cuda()
+    ref_loss = upgo_loss(target_output.double(), rhos.double(), action, rewards.double(), bootstrap_values.double())
+    for precision in ['float', 'kahan', 'double']:
+        hpc_upgo = UPGO(T, B, N, precision=precision)
+        hpc_loss = hpc_upgo(target_output, rhos, action, rewards, bootstrap_values)
+        if use_cuda:
+            torch.cuda.synchronize()
+
+        mre = mean_relative_error(torch.flatten(ref_loss).cpu().detach().numpy(), torch.flatten(hpc_loss).cpu().detach().numpy())
+        print("upgo precision {} fp mean_relative_error: {}".format(precision, mre))
+
 def upgo_perf():
     ori_target_output = torch.randn(T, B, N)
     ori_rhos = torch.randn(T, B)
@@ -110,5 +132,6 @@ if __name__ == '__main__':
     print("target problem: T = {}, B = {}, N = {}".format(T, B, N))
     print("================run upgo validation test================")
     upgo_val()
+    upgo_precision_val()
     print("================run upgo performance test================")
     upgo_perf()
@@ -1,16 +1,16 @@
 import time
 import torch
 import torch.nn.functional as F
-from hpc_rll.origin.vtrace import vtrace_error, vtrace_data
-from hpc_rll.rl_utils.vtrace import VTrace
+from hpc_rll.origin.vtrace import vtrace_error, vtrace_data, vtrace_returns as ori_vtrace_returns
+from hpc_rll.rl_utils.vtrace import VTrace, vtrace_returns
 from testbase import mean_relative_error, times
 
-assert torch.cuda.is_available()
-use_cuda = True
+use_cuda = torch.cuda.is_available()
 
 T = 128
 B = 128
 N = 128
+HEADS = [3, 5, 16, 40, 64] # multi-discrete action space, sum(HEADS) == N
 
 def vtrace_val():
     ori_target_output = torch.randn(T, B, N)
@@ -60,6 +60,139 @@ def vtrace_val():
     print("vtrace bp value mean_relative_error: " + str(mre))
 
 
+def vtrace_precision_val():
+    # the float64 reference is the original vtrace on double inputs, the value gradient depends on the returns,
+    # gamma is rounded to float as in the kernels
+    gamma = torch.tensor(0.999).item()
+    target_output = torch.randn(T, B, N)
+    behaviour_output = torch.randn(T, B, N)
+    action = torch.randint(0, N, size=(T, B, ))
+    value = torch.randn(T + 1, B)
+    reward = torch.randn(T, B)
+    if use_cuda:
+        target_output = target_output.cuda()
+        behaviour_output = behaviour_output.cuda()
+        action = action.cuda()
+        value = value.cuda()
+        reward = reward.cuda()
+    ref_value = value.double().requires_grad_(True)
+    ref_loss = vtrace_error(vtrace_data(target_output.double(), behaviour_output.double(), action, ref_value, reward.double(), None),
+            gamma=gamma, lambda_=1.0)
+    sum(ref_loss).backward()
+    for precision in ['float', 'kahan', 'double']:
+        hpc_vtrace = VTrace(T, B, N, precision=precision)
+        hpc_value = value.clone().requires_grad_(True)
+        hpc_loss = hpc_vtrace(target_output, behaviour_output, action, hpc_value, reward, gamma=gamma, lambda_=1.0)
+        sum(hpc_loss).backward()
+        if use_cuda:
+            torch.cuda.synchronize()
+
+        max_err = (hpc_value.grad.double() - ref_value.grad).abs().max().item()
+        print("vtrace precision {} bp value max_abs_error: {}".format(precision, max_err))
+
+
+def vtrace_multi_head_val():
+    target_output = torch.randn(T, B, N)
+    behaviour_output = target_output + 0.1 * torch.randn(T, B, N)
+    action = torch.stack([torch.randint(0, n, size=(T, B)) for n in HEADS], dim=2)
+    value = torch.randn(T + 1, B)
+    reward = torch.randn(T, B)
+    if use_cuda:
+        target_output = target_output.cuda()
+        behaviour_output = behaviour_output.cuda()
+        action = action.cuda()
+        value = value.cuda()
+        reward = reward.cuda()
+    hpc_vtrace = VTrace(T, B, N, heads=HEADS)
+
+    ori_target_output = target_output.clone().requires_grad_(True)
+    ori_value = value.clone().requires_grad_(True)
+    ori_loss = vtrace_error(vtrace_data(ori_target_output, behaviour_output, action, ori_value, reward, None), heads=HEADS)
+    ori_loss = sum(ori_loss)
+    ori_loss.backward()
+
+    hpc_target_output = target_output.clone().requires_grad_(True)
+    hpc_value = value.clone().requires_grad_(True)
+    hpc_loss = hpc_vtrace(hpc_target_output, behaviour_output, action, hpc_value, reward)
+    hpc_loss = sum(hpc_loss)
+    hpc_loss.backward()
+    if use_cuda:
+        torch.cuda.synchronize()
+
+    mre = mean_relative_error(torch.flatten(ori_loss).cpu().detach().numpy(), torch.flatten(hpc_loss).cpu().detach().numpy())
+    print("vtrace multi head fp mean_relative_error: " + str(mre))
+    mre = mean_relative_error(torch.flatten(ori_target_output.grad).cpu().detach().numpy(), torch.flatten(hpc_target_output.grad).cpu().detach().numpy())
+    print("vtrace multi head bp target_output mean_relative_error: " + str(mre))
+    mre = mean_relative_error(torch.flatten(ori_value.grad).cpu().detach().numpy(), torch.flatten(hpc_value.grad).cpu().detach().numpy())
+    print("vtrace multi head bp value mean_relative_error: " + str(mre))
+
+
+def vtrace_done_val():
+    # unrolls that cross episode resets, with per step discount
+    target_output = torch.randn(T, B, N)
+    behaviour_output = torch.randn(T, B, N)
+    action = torch.randint(0, N, size=(T, B, ))
+    value = torch.randn(T + 1, B)
+    reward = torch.randn(T, B)
+    done = torch.rand(T, B) < 0.05
+    discount = 0.9 + 0.1 * torch.rand(T, B)
+    if use_cuda:
+        target_output = target_output.cuda()
+        behaviour_output = behaviour_output.cuda()
+        action = action.cuda()
+        value = value.cuda()
+        reward = reward.cuda()
+        done = done.cuda()
+        discount = discount.cuda()
+    hpc_vtrace = VTrace(T, B, N)
+
+    ori_target_output = target_output.clone().requires_grad_(True)
+    ori_value = value.clone().requires_grad_(True)
+    ori_loss = vtrace_error(vtrace_data(ori_target_output, behaviour_output, action, ori_value, reward, None),
+            done=done, discount=discount)
+    ori_loss = sum(ori_loss)
+    ori_loss.backward()
+
+    hpc_target_output = target_output.clone().requires_grad_(True)
+    hpc_value = value.clone().requires_grad_(True)
+    hpc_loss = hpc_vtrace(hpc_target_output, behaviour_output, action, hpc_value, reward, done=done, discount=discount)
+    hpc_loss = sum(hpc_loss)
+    hpc_loss.backward()
+    if use_cuda:
+        torch.cuda.synchronize()
+
+    mre = mean_relative_error(torch.flatten(ori_loss).cpu().detach().numpy(), torch.flatten(hpc_loss).cpu().detach().numpy())
+    print("vtrace done fp mean_relative_error: " + str(mre))
+    mre = mean_relative_error(torch.flatten(ori_target_output.grad).cpu().detach().numpy(), torch.flatten(hpc_target_output.grad).cpu().detach().numpy())
+    print("vtrace done bp target_output mean_relative_error: " + str(mre))
+    mre = mean_relative_error(torch.flatten(ori_value.grad).cpu().detach().numpy(), torch.flatten(hpc_value.grad).cpu().detach().numpy())
+    print("vtrace done bp value mean_relative_error: " + str(mre))
+
+def vtrace_returns_val():
+    log_rhos = 0.5 * torch.randn(T, B)
+    discounts = 0.99 * (torch.rand(T, B) > 0.05).float()
+    rewards = torch.randn(T, B)
+    values = torch.randn(T, B)
+    bootstrap = torch.randn(B)
+    if use_cuda:
+        log_rhos = log_rhos.cuda()
+        discounts = discounts.cuda()
+        rewards = rewards.cuda()
+        values = values.cuda()
+        bootstrap = bootstrap.cuda()
+
+    ori_vs, ori_adv = ori_vtrace_returns(log_rhos, discounts, rewards, values, bootstrap, 0.95, 1.0, 1.0, 1.0)
+    with torch.no_grad():
+        hpc_vs, hpc_adv = vtrace_returns(log_rhos, discounts, rewards, values, bootstrap, 0.95, 1.0, 1.0, 1.0)
+    if use_cuda:
+        torch.cuda.synchronize()
+
+    mre = mean_relative_error(torch.flatten(ori_vs).cpu().detach().numpy(), torch.flatten(hpc_vs).cpu().detach().numpy())
+    print("vtrace returns vs mean_relative_error: " + str(mre))
+    mre = mean_relative_error(torch.flatten(ori_adv).cpu().detach().numpy(), torch.flatten(hpc_adv).cpu().detach().numpy())
+    print("vtrace returns pg_advantages mean_relative_error: " + str(mre))
+
+
 def vtrace_perf():
     ori_target_output = torch.randn(T, B, N)
     ori_behaviour_output = torch.randn(T, B, N)
@@ -115,5 +248,9 @@ if __name__ == '__main__':
     print("target problem: T = {}, B = {}, N = {}".format(T, B, N))
     print("================run vtrace validation test================")
     vtrace_val()
+    vtrace_precision_val()
+    vtrace_multi_head_val()
+    vtrace_done_val()
+    vtrace_returns_val()
     print("================run vtrace performance test================")
     vtrace_perf()